@@ -0,0 +1,197 @@
+"""
+Materialized per-scan aggregates
+Keeps counts, sizes, type distribution and a size histogram next to the file rows
+so detail and summary endpoints never need COUNT(*) over a scan
+"""
+from bisect import bisect_left
+
+# Upper bounds (inclusive) of the size histogram buckets; the last bucket is open
+SIZE_BUCKET_BOUNDS = [0, 1024, 64 * 1024, 1024 ** 2, 16 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3]
+SIZE_BUCKET_LABELS = ['0 B', '<= 1 KB', '<= 64 KB', '<= 1 MB', '<= 16 MB', '<= 256 MB', '<= 1 GB', '> 1 GB']
+
+
+def init_tables(cursor):
+    """Create the aggregate tables (in files.db, so they commit with the file rows)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_stats (
+            scan_id TEXT PRIMARY KEY,
+            total_files INTEGER NOT NULL DEFAULT 0,
+            total_size INTEGER NOT NULL DEFAULT 0,
+            ocr_eligible_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_type_counts (
+            scan_id TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_count INTEGER NOT NULL DEFAULT 0,
+            total_size INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scan_id, file_type)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_size_buckets (
+            scan_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            file_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scan_id, bucket)
+        )
+    ''')
+
+
+def size_bucket(size):
+    """Histogram bucket index for a file size"""
+    return bisect_left(SIZE_BUCKET_BOUNDS, size or 0)
+
+
+def size_bucket_sql(column):
+    """SQL CASE expression computing size_bucket() for a column"""
+    whens = ' '.join(
+        f"WHEN COALESCE({column}, 0) <= {bound} THEN {i}"
+        for i, bound in enumerate(SIZE_BUCKET_BOUNDS)
+    )
+    return f"CASE {whens} ELSE {len(SIZE_BUCKET_BOUNDS)} END"
+
+
+class ScanAggregator:
+    """
+    Accumulates aggregates for one batch of records
+
+    Args:
+        type_of: Callable giving the distribution key of a record
+        is_ocr: Callable giving whether a record is OCR eligible
+    """
+
+    def __init__(self, type_of, is_ocr):
+        self.type_of = type_of
+        self.is_ocr = is_ocr
+        self.reset()
+
+    def reset(self):
+        self.total_files = 0
+        self.total_size = 0
+        self.ocr_count = 0
+        self.types = {}
+        self.buckets = {}
+
+    def add(self, record):
+        size = record.get('file_size') or 0
+        self.total_files += 1
+        self.total_size += size
+        if self.is_ocr(record):
+            self.ocr_count += 1
+
+        ftype = self.type_of(record)
+        count, type_size = self.types.get(ftype, (0, 0))
+        self.types[ftype] = (count + 1, type_size + size)
+
+        bucket = size_bucket(size)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def save(self, conn, scan_id):
+        """Add the accumulated batch onto the stored aggregates (caller commits)"""
+        if not self.total_files:
+            return
+        conn.execute('''
+            INSERT INTO scan_stats (scan_id, total_files, total_size, ocr_eligible_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(scan_id) DO UPDATE SET
+                total_files = total_files + excluded.total_files,
+                total_size = total_size + excluded.total_size,
+                ocr_eligible_count = ocr_eligible_count + excluded.ocr_eligible_count
+        ''', (scan_id, self.total_files, self.total_size, self.ocr_count))
+        conn.executemany('''
+            INSERT INTO scan_type_counts (scan_id, file_type, file_count, total_size)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(scan_id, file_type) DO UPDATE SET
+                file_count = file_count + excluded.file_count,
+                total_size = total_size + excluded.total_size
+        ''', [(scan_id, ftype, count, size) for ftype, (count, size) in self.types.items()])
+        conn.executemany('''
+            INSERT INTO scan_size_buckets (scan_id, bucket, file_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT(scan_id, bucket) DO UPDATE SET
+                file_count = file_count + excluded.file_count
+        ''', [(scan_id, bucket, count) for bucket, count in self.buckets.items()])
+
+
+def rebuild(conn, scan_id, table, type_sql, ocr_sql):
+    """
+    Recompute a scan's aggregates from its file rows in one pass per table
+
+    Used for scans written before aggregates existed. type_sql and ocr_sql are
+    SQL expressions over the files table giving the distribution key and OCR flag.
+    A scan with no file rows gets an empty scan_stats row, so it is not rebuilt again.
+    """
+    conn.execute("DELETE FROM scan_stats WHERE scan_id = ?", (scan_id,))
+    conn.execute("DELETE FROM scan_type_counts WHERE scan_id = ?", (scan_id,))
+    conn.execute("DELETE FROM scan_size_buckets WHERE scan_id = ?", (scan_id,))
+    conn.execute(f'''
+        INSERT INTO scan_stats (scan_id, total_files, total_size, ocr_eligible_count)
+        SELECT ?, COUNT(*), COALESCE(SUM(file_size), 0), COALESCE(SUM(CASE WHEN {ocr_sql} THEN 1 ELSE 0 END), 0)
+        FROM {table} WHERE scan_id = ?
+    ''', (scan_id, scan_id))
+    conn.execute(f'''
+        INSERT INTO scan_type_counts (scan_id, file_type, file_count, total_size)
+        SELECT ?, {type_sql}, COUNT(*), COALESCE(SUM(file_size), 0)
+        FROM {table} WHERE scan_id = ? GROUP BY {type_sql}
+    ''', (scan_id, scan_id))
+    conn.execute(f'''
+        INSERT INTO scan_size_buckets (scan_id, bucket, file_count)
+        SELECT ?, {size_bucket_sql('file_size')}, COUNT(*)
+        FROM {table} WHERE scan_id = ? GROUP BY 2
+    ''', (scan_id, scan_id))
+
+
+def load(conn, scan_id):
+    """Read a scan's aggregates, or None if none are stored"""
+    row = conn.execute(
+        "SELECT total_files, total_size, ocr_eligible_count FROM scan_stats WHERE scan_id = ?",
+        (scan_id,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    types = conn.execute(
+        "SELECT file_type, file_count, total_size FROM scan_type_counts WHERE scan_id = ? "
+        "ORDER BY file_count DESC",
+        (scan_id,)
+    ).fetchall()
+    buckets = dict(conn.execute(
+        "SELECT bucket, file_count FROM scan_size_buckets WHERE scan_id = ?", (scan_id,)
+    ).fetchall())
+
+    return {
+        'total_files': row[0],
+        'total_size': row[1],
+        'ocr_eligible_count': row[2],
+        'file_type_distribution': {ftype: count for ftype, count, _ in types},
+        'file_type_sizes': {ftype: size for ftype, _, size in types},
+        'size_histogram': [
+            {'bucket': label, 'file_count': buckets.get(i, 0)}
+            for i, label in enumerate(SIZE_BUCKET_LABELS)
+        ]
+    }
+
+
+def load_or_rebuild(db_path, scans_db, scan_id, table, type_sql, ocr_sql):
+    """
+    Read a scan's aggregates, rebuilding them from the file rows if missing
+
+    Returns None, without queuing a rebuild on the writer, for a scan that
+    is not in catalog_scans (of scans_db).
+    """
+    # db imports this module (ScanAggregator)
+    from .db import database
+    db = database(db_path)
+    with db.read() as conn:
+        stats = load(conn, scan_id)
+    if stats is None:
+        with database(scans_db).read() as conn:
+            if conn.execute("SELECT 1 FROM catalog_scans WHERE id = ?", (scan_id,)).fetchone() is None:
+                return None
+        def rebuild_and_load(conn):
+            rebuild(conn, scan_id, table, type_sql, ocr_sql)
+            return load(conn, scan_id)
+        stats = db.write(rebuild_and_load)
+    return stats
@@ -4,40 +4,70 @@ FastAPI backend for scanning local folders, Azure Blob Storage, and Shared direc
 """
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uuid
 from datetime import datetime
 import os
+import asyncio
 import threading
 from dotenv import load_dotenv
 load_dotenv()
 
-# Global dictionary to track active scans and their stop flags
-active_scans = {}
-active_scans_lock = threading.Lock()
+# Resume scans left running by a previous server process (else mark them failed)
+RESUME_ON_STARTUP = os.getenv("SCAN_RESUME_ON_STARTUP", "true").lower() == "true"
+
+# Run Azure scans on the shared event loop (aio clients) instead of a thread each
+AZURE_ASYNC_SCANS = os.getenv("AZURE_ASYNC_SCANS", "false").lower() == "true"
 
 # Import Local connector
 from .local_connector import (
     init_db, create_scan, save_files, complete_scan, fail_scan,
-    get_all_scans, get_scan_files, get_total_files_count,
-    scan_folder, get_summary
+    get_scan_files, get_total_files_count, get_scan_stats,
+    get_scan, open_snapshots, open_sniffer, finalize_incremental_scan,
+    open_checkpoint, get_interrupted_scans, prepare_resume,
+    iter_folder, get_summary, export_files, freeze_scan, search_files, diff_scans,
+    hash_files, find_duplicates
 )
 # Import Azure connector
 from .azure_connector import (
-    scan_azure_blob, get_summary as azure_get_summary,
+    iter_azure_blob, get_summary as azure_get_summary,
     create_scan as azure_create_scan, save_files as azure_save_files,
     complete_scan as azure_complete_scan, fail_scan as azure_fail_scan,
     get_all_scans as azure_get_all_scans, get_scan_files as azure_get_scan_files,
-    init_db as azure_init_db, get_total_files_count as azure_get_total_files_count
+    init_db as azure_init_db, get_total_files_count as azure_get_total_files_count,
+    get_scan_stats as azure_get_scan_stats, get_scan as azure_get_scan,
+    get_interrupted_scans as azure_get_interrupted_scans,
+    open_checkpoint as azure_open_checkpoint, prepare_resume as azure_prepare_resume,
+    get_latest_scan as azure_get_latest_scan, open_delta as azure_open_delta,
+    finalize_delta_scan as azure_finalize_delta_scan, export_files as azure_export_files,
+    freeze_scan as azure_freeze_scan, search_files as azure_search_files,
+    diff_scans as azure_diff_scans,
+    aiter_azure_blob, ScanLoop
 )
 # Import Shared Directory connector
 from .shared_connector import (
-    scan_shared_directory, get_summary as shared_get_summary,
+    iter_shared_directory, get_summary as shared_get_summary,
     create_scan as shared_create_scan, save_files as shared_save_files,
     complete_scan as shared_complete_scan, fail_scan as shared_fail_scan,
     get_all_scans as shared_get_all_scans, get_scan_files as shared_get_scan_files,
-    init_db as shared_init_db, get_total_files_count as shared_get_total_files_count
+    init_db as shared_init_db, get_total_files_count as shared_get_total_files_count,
+    get_scan_stats as shared_get_scan_stats, get_scan as shared_get_scan,
+    get_interrupted_scans as shared_get_interrupted_scans,
+    open_checkpoint as shared_open_checkpoint, prepare_resume as shared_prepare_resume,
+    open_error_log as shared_open_error_log, get_scan_errors as shared_get_scan_errors,
+    export_files as shared_export_files, freeze_scan as shared_freeze_scan,
+    search_files as shared_search_files, diff_scans as shared_diff_scans,
+    hash_files as shared_hash_files, find_duplicates as shared_find_duplicates
 )
+from .pipeline import ingest, ingest_async
+from .db import database, next_cursor
+from .local_connector import database as local_db
+from .progress import ProgressBus
+from . import progress as live_progress
+from .scan_state import open_store, HEARTBEAT_INTERVAL
+from .scheduler import ScanScheduler, share_resource
+from . import catalog, columnar, diff, export
 # Create FastAPI app
 app = FastAPI(
     title="Universal Data Scanner",
@@ -57,92 +87,591 @@ async def startup():
     init_db()
     azure_init_db()
     shared_init_db()
+    # Take over the scans of workers that are gone, now and with every heartbeat
+    scan_states.heartbeat()
+    recover_scans()
+    threading.Thread(target=keep_alive, daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Start no more queued scans (they are saved, and queued again on the next start)
+    scheduler.close()
+    # Hand this worker's scans over to the others at once
+    heartbeat_stop.set()
+    scan_states.leave()
+    # Cancel async Azure scans (committed batches and checkpoints are kept)
+    scan_loop.close()
+
+# ========== SCAN THREADS ==========
+
+# Event loop (and HTTP connection pool) shared by all async Azure scans
+scan_loop = ScanLoop()
+
+# Live counters of the scans run by this process (GET /api/scan/{scan_id}/events)
+progress_bus = ProgressBus()
+
+# Status, stop flags and results of queued and running scans, shared by every API worker
+scan_states = open_store()
+
+# Set at shutdown to end the heartbeat thread
+heartbeat_stop = threading.Event()
+
+def scan_stopped(scan_id):
+    """Stop flag passed to the scanners (raised through any worker)"""
+    return scan_states.stop_requested(scan_id)
+
+
+def set_scan_state(scan_id, **fields):
+    """Update the tracked state of a scan (with its latest counters)"""
+    progress = progress_bus.get(scan_id)
+    counters = {'progress': progress.counters()} if progress is not None else {}
+    scan_states.update(scan_id, **fields, **counters)
+    progress_bus.publish(scan_id, **fields)
+
+
+def save_progress(scan_id):
+    """Checkpoint hook: share a scan's counters with the other workers (status and events)"""
+    progress = progress_bus.get(scan_id)
+    if progress is not None:
+        scan_states.update(scan_id, progress=progress.counters())
+
+
+def scan_progress(scan_id, base_scan_id=None):
+    """ScanProgress of a scan thread (None if not started by this app), expecting its base scan's file count"""
+    progress = progress_bus.get(scan_id)
+    if progress is not None and base_scan_id:
+        progress.expected_files = (catalog.get_scan(base_scan_id) or {}).get('total_files')
+    return progress
+
+
+def start_queued_scan(scan_id):
+    """Scheduler hook: a worker is starting the scan (its progress counts from now)"""
+    # Stopped through another worker while it was queued
+    if scan_stopped(scan_id):
+        set_scan_state(scan_id, status="stopped")
+        return False
+    progress_bus.start(scan_id)
+    set_scan_state(scan_id, status="scanning")
+
+
+# Bounded pool of scan workers; jobs wait in a saved queue, by priority, within per-resource limits
+scheduler = ScanScheduler(on_start=start_queued_scan)
+
+
+def queue_scan(scan_id, scan_type, kind, args, resource, priority=0, persist=True):
+    """Track a scan and queue it on the scheduler (status queued until a worker starts it)"""
+    scan_states.start(scan_id, scan_type, "queued")
+    progress_bus.start(scan_id)
+    progress_bus.publish(scan_id, status="queued")
+    scheduler.submit(scan_id, kind, list(args), resource, priority, persist)
+
+
+def queue_azure_scan(scan_id, kind, args, priority=0):
+    """
+    Queue an Azure scan; args[2] is its connection string
+    
+    Connection strings are not stored: a job using the one in .env is saved
+    without it (the scan reads it again), any other is kept in memory only.
+    """
+    args = list(args)
+    from_env = args[2] == os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    if from_env:
+        args[2] = None
+    queue_scan(scan_id, "azure", kind, args, "azure", priority, persist=from_env)
+
+
+def cancel_queued_scan(scan_id):
+    """Drop a scan still waiting for a worker (marked stopped)"""
+    if scheduler.cancel(scan_id):
+        set_scan_state(scan_id, status="stopped")
+
+
+def run_local_scan(scan_id, name, folder_path, walk_workers=None, processes=None,
+                   base_scan_id=None, resume=False, hash_contents=False, sniff=False):
+    """Scan thread for a local folder (new, or resumed from its checkpoint)"""
+    start_time = datetime.now()
+    try:
+        if resume:
+            # Drop rows of directories not finished at the last checkpoint
+            files_committed = prepare_resume(scan_id)
+        else:
+            create_scan(scan_id, name, folder_path, base_scan_id)
+            files_committed = 0
+        
+        # Stream the folder into the database in batches while it is walked.
+        # The directory snapshot (what the next incremental scan compares to,
+        # and the frontier a resume continues from) is committed with each batch.
+        snapshots = open_snapshots(scan_id, base_scan_id, resume)
+        # Optional content sniffing on the listing threads; its cache rows are
+        # written with each batch too
+        sniffer = open_sniffer(walk_workers) if sniff else None
+        checkpoint = open_checkpoint(scan_id, on_commit=[snapshots.commit] + ([sniffer.commit] if sniffer else [])
+                                     + [lambda: save_progress(scan_id)])
+        checkpoint.files_committed = files_committed
+        progress = scan_progress(scan_id, base_scan_id)
+        try:
+            files = iter_folder(
+                folder_path,
+                stop_flag=lambda: scan_stopped(scan_id),
+                workers=walk_workers,
+                processes=processes,
+                snapshots=snapshots,
+                sniffer=sniffer,
+                progress=progress
+            )
+            summary = ingest(scan_id, files, checkpoint.wrap(save_files), get_summary, progress=progress)
+            # Directories finished after the last batch
+            checkpoint.commit()
+        finally:
+            snapshots.close()
+            if sniffer is not None:
+                sniffer.close()
+        
+        # Check if stopped (batches already committed are kept, and can be resumed)
+        if scan_stopped(scan_id):
+            fail_scan(scan_id)
+            set_scan_state(scan_id, status="stopped")
+            return
+        
+        # Totals cover carried-forward directories and rows kept from before a resume
+        if base_scan_id:
+            summary = finalize_incremental_scan(scan_id) or get_summary([])
+        elif resume:
+            summary = get_scan_stats(scan_id) or get_summary([])
+        
+        # Optional duplicate detection (hashes committed before a stop are kept)
+        hashed = None
+        if hash_contents:
+            set_scan_state(scan_id, status="hashing")
+            hashed = hash_files(scan_id, stop_flag=lambda: scan_stopped(scan_id))
+            if scan_stopped(scan_id):
+                fail_scan(scan_id)
+                set_scan_state(scan_id, status="stopped")
+                return
+        
+        # Complete scan
+        complete_scan(scan_id, summary['total_files'], summary['total_size'])
+        
+        # Calculate duration
+        duration = (datetime.now() - start_time).total_seconds()
+        
+        # Store result
+        result = {
+            "success": True,
+            "scan_id": scan_id,
+            "scan_name": name,
+            "folder_path": folder_path,
+            "total_files": summary['total_files'],
+            "total_size": summary['total_size'],
+            "duration_seconds": duration,
+            "file_type_distribution": summary['file_type_distribution'],
+            "ocr_eligible_count": summary['ocr_eligible_count'],
+            "base_scan_id": base_scan_id,
+            "resumed": resume,
+            "directories_listed": snapshots.listed_count,
+            "directories_carried": snapshots.carried_count,
+            "sniffing": sniffer.counts if sniffer else None,
+            "hashing": hashed
+        }
+        set_scan_state(scan_id, status="completed", result=result)
+        
+    except Exception as e:
+        fail_scan(scan_id)
+        set_scan_state(scan_id, status="failed", error=str(e))
+
+
+def run_azure_scan(scan_id, name, conn_string, container_name, storage_acc,
+                   list_workers=None, prefixes=None, resume=False, base_scan_id=None):
+    """Scan thread for an Azure container (new, or resumed from its checkpoint)"""
+    start_time = datetime.now()
+    # Saved jobs leave out the connection string from .env
+    conn_string = conn_string or os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    try:
+        checkpoint = azure_open_checkpoint(scan_id)
+        checkpoint.on_commit.append(lambda: save_progress(scan_id))
+        if resume:
+            # Drop rows listed after the last checkpointed page (or outside finished shards)
+            checkpoint.files_committed = azure_prepare_resume(scan_id, checkpoint.state)
+        else:
+            azure_create_scan(scan_id, name, container_name, storage_acc, base_scan_id)
+        
+        # Delta scans only write blobs whose etag changed since the base scan;
+        # blobs found deleted are committed with each batch
+        delta = None
+        if base_scan_id:
+            delta = azure_open_delta(scan_id, base_scan_id, checkpoint.state.get('last_blob'))
+            checkpoint.on_commit.append(delta.commit)
+        
+        # Stream the container listing into the database in batches, saving the
+        # continuation token of the last fully committed page with each batch
+        progress = scan_progress(scan_id, base_scan_id)
+        try:
+            files = iter_azure_blob(
+                conn_string, container_name,
+                stop_flag=lambda: scan_stopped(scan_id),
+                checkpoint=checkpoint,
+                workers=list_workers,
+                prefixes=prefixes,
+                delta=delta
+            )
+            summary = ingest(scan_id, files, checkpoint.wrap(azure_save_files), azure_get_summary, progress=progress)
+            if delta is not None and not scan_stopped(scan_id):
+                # Base blobs after the last one listed are gone too
+                delta.finish()
+            checkpoint.commit()
+        finally:
+            if delta is not None:
+                delta.close()
+        
+        # Check if stopped (batches already committed are kept, and can be resumed)
+        if scan_stopped(scan_id):
+            azure_fail_scan(scan_id)
+            set_scan_state(scan_id, status="stopped")
+            return
+        
+        # Totals cover blobs read from the base and rows kept from before a resume
+        if base_scan_id:
+            summary = azure_finalize_delta_scan(scan_id) or azure_get_summary([])
+        elif resume:
+            summary = azure_get_scan_stats(scan_id) or azure_get_summary([])
+        
+        # Complete scan
+        azure_complete_scan(scan_id, summary['total_files'], summary['total_size'])
+        
+        # Calculate duration
+        duration = (datetime.now() - start_time).total_seconds()
+        
+        # Store result
+        result = {
+            "success": True,
+            "scan_id": scan_id,
+            "scan_name": name,
+            "storage_type": "azure_blob",
+            "container_name": container_name,
+            "total_files": summary['total_files'],
+            "total_size": summary['total_size'],
+            "duration_seconds": duration,
+            "file_type_distribution": summary['file_type_distribution'],
+            "ocr_eligible_count": summary['ocr_eligible_count'],
+            "resumed": resume,
+            "base_scan_id": base_scan_id
+        }
+        if delta is not None:
+            result.update(
+                blobs_written=delta.written_count,
+                blobs_unchanged=delta.unchanged_count,
+                blobs_deleted=delta.deleted_count
+            )
+        set_scan_state(scan_id, status="completed", result=result)
+        
+    except Exception as e:
+        azure_fail_scan(scan_id)
+        set_scan_state(scan_id, status="failed", error=str(e))
+
+
+async def run_azure_scan_async(scan_id, name, conn_string, container_name, storage_acc, resume=False):
+    """
+    Scan task for an Azure container on the shared scan loop (new, or resumed)
+    
+    Same flow as run_azure_scan, listing with the aio client from the loop's
+    shared pool. Database calls run on worker threads. Cancelling the task
+    (POST /api/scan/azure/{scan_id}/stop) stops the scan at once; the batch
+    listed so far is committed with its checkpoint, so it can be resumed.
+    """
+    start_time = datetime.now()
+    # Saved jobs leave out the connection string from .env
+    conn_string = conn_string or os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    try:
+        checkpoint = await asyncio.to_thread(azure_open_checkpoint, scan_id)
+        checkpoint.on_commit.append(lambda: save_progress(scan_id))
+        if resume:
+            # Drop rows listed after the last checkpointed page
+            checkpoint.files_committed = await asyncio.to_thread(azure_prepare_resume, scan_id, checkpoint.state)
+        else:
+            await asyncio.to_thread(azure_create_scan, scan_id, name, container_name, storage_acc)
+        
+        files = aiter_azure_blob(
+            conn_string, container_name,
+            stop_flag=lambda: scan_stopped(scan_id),
+            checkpoint=checkpoint,
+            pool=scan_loop.pool
+        )
+        summary = await ingest_async(
+            scan_id, files, checkpoint.wrap(azure_save_files), azure_get_summary, progress=scan_progress(scan_id)
+        )
+        await asyncio.to_thread(checkpoint.commit)
+        
+        # Check if stopped (batches already committed are kept, and can be resumed)
+        if scan_stopped(scan_id):
+            await asyncio.to_thread(azure_fail_scan, scan_id)
+            await asyncio.to_thread(set_scan_state, scan_id, status="stopped")
+            return
+        
+        # Totals include rows kept from before a resume
+        if resume:
+            summary = await asyncio.to_thread(azure_get_scan_stats, scan_id) or azure_get_summary([])
+        
+        await asyncio.to_thread(azure_complete_scan, scan_id, summary['total_files'], summary['total_size'])
+        
+        duration = (datetime.now() - start_time).total_seconds()
+        
+        result = {
+            "success": True,
+            "scan_id": scan_id,
+            "scan_name": name,
+            "storage_type": "azure_blob",
+            "container_name": container_name,
+            "total_files": summary['total_files'],
+            "total_size": summary['total_size'],
+            "duration_seconds": duration,
+            "file_type_distribution": summary['file_type_distribution'],
+            "ocr_eligible_count": summary['ocr_eligible_count'],
+            "resumed": resume
+        }
+        await asyncio.to_thread(set_scan_state, scan_id, status="completed", result=result)
+    
+    except asyncio.CancelledError:
+        await asyncio.to_thread(azure_fail_scan, scan_id)
+        await asyncio.to_thread(set_scan_state, scan_id, status="stopped")
+        raise
+    except Exception as e:
+        await asyncio.to_thread(azure_fail_scan, scan_id)
+        await asyncio.to_thread(set_scan_state, scan_id, status="failed", error=str(e))
+
+
+def run_shared_scan(scan_id, name, path, share_name, resume=False, walk_workers=None, hash_contents=False):
+    """Scan thread for a shared directory (new, or resumed from its checkpoint)"""
+    start_time = datetime.now()
+    try:
+        # Skipped, failed and slow directories are saved with each batch
+        error_log = shared_open_error_log(scan_id)
+        checkpoint = shared_open_checkpoint(scan_id, on_commit=[error_log.commit, lambda: save_progress(scan_id)])
+        if resume:
+            # Drop rows read after the last checkpointed directory
+            checkpoint.files_committed = checkpoint.state.get('files_listed', 0)
+            shared_prepare_resume(scan_id, checkpoint.files_committed)
+        else:
+            shared_create_scan(scan_id, name, path, share_name)
+        
+        # Stream the share into the database in batches while it is walked,
+        # saving the last finished directory with each batch
+        progress = scan_progress(scan_id)
+        files = iter_shared_directory(
+            path, share_name,
+            stop_flag=lambda: scan_stopped(scan_id),
+            checkpoint=checkpoint,
+            workers=walk_workers,
+            on_error=error_log.add,
+            progress=progress
+        )
+        summary = ingest(
+            scan_id, files, checkpoint.wrap(shared_save_files),
+            lambda batch: shared_get_summary(batch, top_n=None), top_n=10, progress=progress
+        )
+        checkpoint.commit()
+        
+        # Check if stopped (batches already committed are kept, and can be resumed)
+        if scan_stopped(scan_id):
+            shared_fail_scan(scan_id)
+            set_scan_state(scan_id, status="stopped")
+            return
+        
+        # Totals include rows kept from before a resume
+        if resume:
+            summary = shared_get_scan_stats(scan_id) or shared_get_summary([])
+            # Stored distribution is ordered by count; keep the top 10 like a new scan
+            summary['file_type_distribution'] = dict(list(summary['file_type_distribution'].items())[:10])
+        
+        # Optional duplicate detection (hashes committed before a stop are kept)
+        hashed = None
+        if hash_contents:
+            set_scan_state(scan_id, status="hashing")
+            hashed = shared_hash_files(scan_id, stop_flag=lambda: scan_stopped(scan_id))
+            if scan_stopped(scan_id):
+                shared_fail_scan(scan_id)
+                set_scan_state(scan_id, status="stopped")
+                return
+        
+        # Complete scan
+        shared_complete_scan(scan_id, summary['total_files'], summary['total_size'])
+        
+        # Calculate duration
+        duration = (datetime.now() - start_time).total_seconds()
+        
+        # Store result
+        result = {
+            "success": True,
+            "scan_id": scan_id,
+            "scan_name": name,
+            "storage_type": "shared_directory",
+            "share_path": path,
+            "share_name": share_name,
+            "total_files": summary['total_files'],
+            "total_size": summary['total_size'],
+            "duration_seconds": duration,
+            "file_type_distribution": summary['file_type_distribution'],
+            "ocr_eligible_count": summary['ocr_eligible_count'],
+            "resumed": resume,
+            "walk_errors": error_log.counts,
+            "hashing": hashed
+        }
+        set_scan_state(scan_id, status="completed", result=result)
+        
+    except Exception as e:
+        shared_fail_scan(scan_id)
+        set_scan_state(scan_id, status="failed", error=str(e))
+
+def run_azure_scan_on_loop(scan_id, *args):
+    """Scheduler target of an async Azure scan: starts it on the scan loop and returns its future (the worker is free at once)"""
+    return scan_loop.submit(scan_id, run_azure_scan_async(scan_id, *args))
+
+
+# Scheduler job kinds: target, and the scan type it is tracked as
+scheduler.register("local", run_local_scan)
+scheduler.register("azure", run_azure_scan)
+scheduler.register("azure_async", run_azure_scan_on_loop)
+scheduler.register("shared", run_shared_scan)
+SCAN_KINDS = {"local": "local", "azure": "azure", "azure_async": "azure", "shared": "shared"}
+
+
+def queue_resume(scan_id, scan_type, scan, connection_string=None, priority=0):
+    """Queue a scan to resume from its checkpoint"""
+    if scan_type == "local":
+        queue_scan(
+            scan_id, "local", "local",
+            [scan_id, scan['name'], scan['folder_path'], None, None, scan.get('base_scan_id'), True],
+            "local", priority
+        )
+    elif (scan_type == "azure" and AZURE_ASYNC_SCANS and not scan.get('base_scan_id')
+            and not azure_open_checkpoint(scan_id).state.get('partitioned')):
+        queue_azure_scan(
+            scan_id, "azure_async",
+            [scan_id, scan['name'], connection_string, scan['container_name'], scan['storage_account'], True],
+            priority
+        )
+    elif scan_type == "azure":
+        queue_azure_scan(
+            scan_id, "azure",
+            [scan_id, scan['name'], connection_string, scan['container_name'], scan['storage_account'],
+             None, None, True, scan.get('base_scan_id')],
+            priority
+        )
+    else:
+        queue_scan(
+            scan_id, "shared", "shared",
+            [scan_id, scan['scan_name'], scan['share_path'], scan['share_name'], True],
+            share_resource(scan['share_path']), priority
+        )
+
+
+def recover_interrupted_scans():
+    """
+    Handle scans still marked running whose worker is gone
+    
+    Their scan threads died with that worker (or the previous server). Each
+    is claimed first, so only one of the live workers takes it over. With
+    SCAN_RESUME_ON_STARTUP it is resumed from its last checkpoint (Azure
+    scans only when AZURE_STORAGE_CONNECTION_STRING is set, since connection
+    strings are not stored); otherwise it is marked failed and can be
+    resumed later with POST /api/scan/{scan_id}/resume.
+    """
+    conn_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    interrupted = (
+        ("local", get_interrupted_scans, fail_scan, True),
+        ("azure", azure_get_interrupted_scans, azure_fail_scan, bool(conn_string)),
+        ("shared", shared_get_interrupted_scans, shared_fail_scan, True),
+    )
+    for scan_type, get_scans, fail, resumable in interrupted:
+        for scan in get_scans():
+            if not scan_states.claim(scan['id'], scan_type):
+                continue
+            # Its saved job (if any) is replaced by the resume, or dropped
+            scheduler.forget(scan['id'])
+            # A browser upload has no server-side folder to scan again
+            browser = (scan_states.get(scan['id']) or {}).get('type') == "browser"
+            if RESUME_ON_STARTUP and resumable and not browser:
+                queue_resume(scan['id'], scan_type, scan, conn_string if scan_type == "azure" else None)
+            else:
+                fail(scan['id'])
+                scan_states.update(scan['id'], status="failed", error="Interrupted with its worker")
+
+
+def recover_scans():
+    """Take over the interrupted scans and the saved queued jobs of workers that are gone"""
+    recover_interrupted_scans()
+    for job in scheduler.saved_jobs():
+        if not scan_states.claim(job.scan_id, SCAN_KINDS[job.kind]):
+            continue
+        if job.status == "running":
+            # Started, but its scan never got as far as being created
+            scheduler.forget(job.scan_id)
+            scan_states.update(job.scan_id, status="failed", error="Interrupted before it started")
+        else:
+            queue_scan(job.scan_id, SCAN_KINDS[job.kind], job.kind, job.args, job.resource, job.priority)
+
+
+def keep_alive():
+    """Heartbeat thread: renew this worker's scans and take over those of workers that stopped beating"""
+    while not heartbeat_stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            scan_states.heartbeat()
+            recover_scans()
+        except Exception as e:
+            print(f"Warning: scan state heartbeat failed: {e}")
+
+async def on_scans_db(fn, *args, **kwargs):
+    """Await a blocking scanner.db call (scan records, catalog, scan state, queue) off the event loop"""
+    return await database(catalog.SCANS_DB).run(fn, *args, **kwargs)
+
+
+async def on_files_db(fn, *args, **kwargs):
+    """Await a blocking files.db call (file rows, aggregates, search, diffs) off the event loop"""
+    return await database(local_db.FILES_DB).run(fn, *args, **kwargs)
 
 # ========== API ENDPOINTS ==========
 
 @app.post("/api/scan")
 async def start_scan(
     folder_path: str = Query(..., description="Folder path to scan"),
-    scan_name: str = Query(None, description="Optional scan name")
+    scan_name: str = Query(None, description="Optional scan name"),
+    walk_workers: int = Query(None, ge=1, description="Optional: directory listing threads (default SCAN_WALK_WORKERS)"),
+    processes: int = Query(None, ge=1, description="Optional: scan processes for very large trees (default SCAN_PROCESSES)"),
+    base_scan_id: str = Query(None, description="Optional: completed scan of the same folder to re-scan incrementally"),
+    hash_contents: bool = Query(False, description="Optional: hash files sharing a size, for duplicate detection"),
+    sniff: bool = Query(False, description="Optional: classify files by their first bytes as well as their extension"),
+    priority: int = Query(0, description="Optional: queue priority (higher starts first)")
 ):
     """Start scanning a folder"""
+    if base_scan_id:
+        base = await on_scans_db(get_scan, base_scan_id)
+        if not base or base['status'] != 'completed':
+            raise HTTPException(status_code=400, detail="Base scan not found or not completed")
+        if os.path.normpath(base['folder_path']) != os.path.normpath(folder_path):
+            raise HTTPException(status_code=400, detail="Base scan is of a different folder")
+        if processes and processes > 1:
+            raise HTTPException(status_code=400, detail="Incremental scans run in a single process")
+        # Walk with the base's exact path so snapshot paths line up
+        folder_path = base['folder_path']
+    if sniff and processes and processes > 1:
+        raise HTTPException(status_code=400, detail="Sniffing scans run in a single process")
+    
     scan_id = str(uuid.uuid4())
     name = scan_name or f"Scan {datetime.now().strftime('%m/%d/%Y, %I:%M:%S %p')}"
-    start_time = datetime.now()
     
-    # Initialize scan tracking
-    with active_scans_lock:
-        active_scans[scan_id] = {
-            "stop": False, 
-            "type": "local",
-            "status": "scanning",
-            "result": None,
-            "error": None
-        }
-    
-    def scan_thread():
-        try:
-            # Create scan record
-            create_scan(scan_id, name, folder_path)
-            
-            # Scan the folder with stop flag
-            files = scan_folder(folder_path, stop_flag=lambda: active_scans.get(scan_id, {}).get("stop", False))
-            
-            # Check if stopped
-            if active_scans.get(scan_id, {}).get("stop", False):
-                fail_scan(scan_id)
-                with active_scans_lock:
-                    if scan_id in active_scans:
-                        active_scans[scan_id]["status"] = "stopped"
-                return
-            
-            # Save files
-            save_files(scan_id, files)
-            
-            # Get summary
-            summary = get_summary(files)
-            
-            # Complete scan
-            complete_scan(scan_id, summary['total_files'], summary['total_size'])
-            
-            # Calculate duration
-            duration = (datetime.now() - start_time).total_seconds()
-            
-            # Store result
-            result = {
-                "success": True,
-                "scan_id": scan_id,
-                "scan_name": name,
-                "folder_path": folder_path,
-                "total_files": summary['total_files'],
-                "total_size": summary['total_size'],
-                "duration_seconds": duration,
-                "file_type_distribution": summary['file_type_distribution'],
-                "ocr_eligible_count": summary['ocr_eligible_count']
-            }
-            
-            with active_scans_lock:
-                if scan_id in active_scans:
-                    active_scans[scan_id]["status"] = "completed"
-                    active_scans[scan_id]["result"] = result
-            
-        except Exception as e:
-            fail_scan(scan_id)
-            with active_scans_lock:
-                if scan_id in active_scans:
-                    active_scans[scan_id]["status"] = "failed"
-                    active_scans[scan_id]["error"] = str(e)
-    
-    # Start scan in background thread
-    thread = threading.Thread(target=scan_thread, daemon=True)
-    thread.start()
+    # Queue the scan for a scan worker
+    await on_scans_db(
+        queue_scan, scan_id, "local", "local",
+        [scan_id, name, folder_path, walk_workers, processes, base_scan_id, False, hash_contents, sniff],
+        "local", priority
+    )
     
     return {
         "success": True,
         "scan_id": scan_id,
         "scan_name": name,
         "folder_path": folder_path,
-        "message": "Scan started in background"
+        "queue_position": scheduler.position(scan_id),
+        "message": "Scan queued in background"
     }
 
 @app.post("/api/scan/browser")
@@ -156,14 +685,21 @@ async def save_browser_scan(data: dict):
         total_files = data.get('total_files', 0)
         total_size = data.get('total_size', 0)
         
-        # Create scan record
-        create_scan(scan_id, scan_name, folder_path)
-        
-        # Save files
-        save_files(scan_id, files)
-        
-        # Complete scan
-        complete_scan(scan_id, total_files, total_size)
+        # Tracked first, so no worker takes the upload for an interrupted scan
+        await on_scans_db(scan_states.start, scan_id, "browser", "scanning")
+        try:
+            # Create scan record
+            await on_scans_db(create_scan, scan_id, scan_name, folder_path)
+            
+            # Save files
+            await on_files_db(save_files, scan_id, files)
+            
+            # Complete scan (indexes the new names in files.db)
+            await on_files_db(complete_scan, scan_id, total_files, total_size)
+        except Exception as e:
+            await on_scans_db(scan_states.update, scan_id, status="failed", error=str(e))
+            raise
+        await on_scans_db(scan_states.update, scan_id, status="completed")
         
         return {
             "success": True,
@@ -174,44 +710,32 @@ async def save_browser_scan(data: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/scans")
-async def get_scans():
-    """Get all scans from all storage types (local, azure, shared)"""
-    local_scans = get_all_scans()
-    azure_scans = azure_get_all_scans()
-    shared_scans = shared_get_all_scans()
-    
-    # Add storage_type to each scan and normalize field names
-    for scan in local_scans:
-        scan['storage_type'] = 'local'
-    
-    for scan in azure_scans:
-        scan['storage_type'] = 'azure'
-    
-    for scan in shared_scans:
-        scan['storage_type'] = 'shared'
-        # Normalize field names for shared scans (created_at -> start_time, scan_name -> name)
-        if 'created_at' in scan:
-            scan['start_time'] = scan['created_at']
-        if 'scan_name' in scan:
-            scan['name'] = scan['scan_name']
-    
-    # Combine all scans
-    all_scans = local_scans + azure_scans + shared_scans
-    
-    # Sort by start_time descending (most recent first)
-    all_scans.sort(key=lambda x: x.get('start_time', ''), reverse=True)
+async def get_scans(
+    storage_type: str = Query(None, description="Optional: local, azure or shared"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Get scans from all storage types (local, azure, shared), newest first, a page at a time (see next_offset)"""
+    # One indexed query over the unified catalog (same fields for every source)
+    all_scans = await on_scans_db(catalog.get_all_scans, storage_type, limit, offset)
+    total = await on_scans_db(catalog.count_scans, storage_type)
     
     return {
         "success": True,
         "count": len(all_scans),
+        "total": total,
+        "next_offset": offset + len(all_scans) if offset + len(all_scans) < total else None,
         "scans": all_scans
     }
 
 @app.get("/api/scan/{scan_id}")
-async def get_scan_details(scan_id: str, limit: int = 100, offset: int = 0):
-    """Get scan details and files with pagination"""
-    files = get_scan_files(scan_id, limit, offset)
-    total_count = get_total_files_count(scan_id)
+async def get_scan_details(scan_id: str, limit: int = 100, offset: int = 0, cursor: str = None, under: str = None):
+    """Get scan details and files with pagination (pass next_cursor back as cursor for keyset paging; under limits it to a directory's subtree)"""
+    try:
+        files = await on_files_db(get_scan_files, scan_id, limit, offset, cursor, under)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total_count = await on_files_db(get_total_files_count, scan_id)
     
     if total_count == 0:
         raise HTTPException(status_code=404, detail="Scan not found")
@@ -223,21 +747,247 @@ async def get_scan_details(scan_id: str, limit: int = 100, offset: int = 0):
         "limit": limit,
         "offset": offset,
         "returned_count": len(files),
+        "next_cursor": next_cursor(files, limit),
         "files": files
     }
 
+@app.get("/api/scan/{scan_id}/summary")
+async def get_scan_summary(scan_id: str):
+    """Get scan aggregates (counts, sizes, type distribution, size histogram)"""
+    stats = await on_files_db(get_scan_stats, scan_id)
+    
+    if not stats:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    return {
+        "success": True,
+        "scan_id": scan_id,
+        **stats
+    }
+
+@app.get("/api/scan/{scan_id}/files")
+async def search_scan_files(
+    scan_id: str,
+    file_type: str = Query(None),
+    extension: str = Query(None, description="With or without the dot"),
+    min_size: int = Query(None, ge=0, description="Bytes"),
+    max_size: int = Query(None, ge=0, description="Bytes"),
+    modified_after: str = Query(None, description="ISO date or timestamp"),
+    modified_before: str = Query(None, description="ISO date or timestamp"),
+    ocr: bool = Query(None, description="OCR eligibility"),
+    path: str = Query(None, description="Directory whose subtree is searched"),
+    name: str = Query(None, description="Name substring (case-insensitive) or glob (*, ?, [...])"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: str = None
+):
+    """Files of a scan (local, Azure or shared) matching server-side filters, in file name order"""
+    searchers = {'local': search_files, 'azure': azure_search_files, 'shared': shared_search_files}
+    source_type = await on_scans_db(catalog.get_source_type, scan_id)
+    if source_type is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    filters = {
+        'file_type': file_type, 'extension': extension, 'min_size': min_size, 'max_size': max_size,
+        'modified_after': modified_after, 'modified_before': modified_before, 'ocr': ocr,
+        'path': path, 'name': name
+    }
+    filters = {key: value for key, value in filters.items() if value is not None}
+    try:
+        files = await on_files_db(searchers[source_type], scan_id, filters, limit, offset, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "scan_id": scan_id,
+        "filters": filters,
+        "limit": limit,
+        "offset": offset,
+        "returned_count": len(files),
+        "next_cursor": next_cursor(files, limit),
+        "files": files
+    }
+
+@app.get("/api/scan/{scan_id}/export")
+async def export_scan(
+    scan_id: str,
+    format: str = Query("csv", description="csv, ndjson or parquet"),
+    gzip: bool = Query(False, description="Gzip the file")
+):
+    """Stream every file of a scan (local, Azure or shared) as a download, in fixed-size chunks"""
+    exporters = {'local': export_files, 'azure': azure_export_files, 'shared': shared_export_files}
+    source_type = await on_scans_db(catalog.get_source_type, scan_id)
+    if source_type is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    try:
+        media_type, extension = export.check_format(format, gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    return StreamingResponse(
+        exporters[source_type](scan_id, format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="scan-{scan_id}.{extension}"'}
+    )
+
+@app.post("/api/scan/{scan_id}/freeze")
+async def freeze_scan_snapshot(scan_id: str):
+    """Write a completed scan (any source) to a columnar Parquet snapshot for the analytics endpoints"""
+    freezers = {'local': freeze_scan, 'azure': azure_freeze_scan, 'shared': shared_freeze_scan}
+    scan = await on_scans_db(catalog.get_scan, scan_id)
+    if scan is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    if scan['status'] != 'completed':
+        raise HTTPException(status_code=400, detail="Only completed scans can be frozen")
+    try:
+        # A long batch job: off the database executors, so it holds none of their threads
+        snapshot = await asyncio.to_thread(freezers[scan['storage_type']], scan_id)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return {"success": True, **snapshot}
+
+def _analytics(scan_id, result):
+    """Response of an analytics endpoint, or 404 if the scan was never frozen"""
+    if result is None:
+        raise HTTPException(status_code=404, detail="No columnar snapshot for this scan (POST /api/scan/{scan_id}/freeze first)")
+    return {"success": True, "scan_id": scan_id, "results": result}
+
+@app.get("/api/scan/{scan_id}/analytics/size")
+async def get_scan_size_by(scan_id: str, by: str = Query("file_type", description="file_type, extension or mime_type")):
+    """File count and total size per type, extension or mime type (from the columnar snapshot)"""
+    try:
+        result = await asyncio.to_thread(columnar.size_by, scan_id, by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return _analytics(scan_id, result)
+
+@app.get("/api/scan/{scan_id}/analytics/largest")
+async def get_scan_largest(scan_id: str, n: int = Query(100, ge=1, le=10000)):
+    """The n largest files (from the columnar snapshot)"""
+    try:
+        result = await asyncio.to_thread(columnar.largest, scan_id, n)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return _analytics(scan_id, result)
+
+@app.get("/api/scan/{scan_id}/analytics/age")
+async def get_scan_age_histogram(scan_id: str):
+    """File count and total size per last-modified age bucket (from the columnar snapshot)"""
+    try:
+        result = await asyncio.to_thread(columnar.age_histogram, scan_id)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return _analytics(scan_id, result)
+
+async def _hashing_source(scan_id):
+    """Source type of a local or shared scan, or 404 / 400 (Azure blobs are not read)"""
+    source_type = await on_scans_db(catalog.get_source_type, scan_id)
+    if source_type is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    if source_type == 'azure':
+        raise HTTPException(status_code=400, detail="Content hashing is only available for local and shared scans")
+    return source_type
+
+@app.post("/api/scan/{scan_id}/hash")
+async def hash_scan_files(scan_id: str):
+    """Hash the files of a completed local or shared scan that share a size with another file"""
+    hashers = {'local': hash_files, 'shared': shared_hash_files}
+    source_type = await _hashing_source(scan_id)
+    if (await on_scans_db(catalog.get_scan, scan_id))['status'] != 'completed':
+        raise HTTPException(status_code=400, detail="Only completed scans can be hashed")
+    # Reads every candidate file: off the database executors, like freezing
+    hashed = await asyncio.to_thread(hashers[source_type], scan_id)
+    return {"success": True, "scan_id": scan_id, **hashed}
+
+@app.get("/api/scan/{scan_id}/duplicates")
+async def get_scan_duplicates(
+    scan_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Groups of identical files in a hashed scan, by wasted bytes (size x extra copies)"""
+    finders = {'local': find_duplicates, 'shared': shared_find_duplicates}
+    source_type = await _hashing_source(scan_id)
+    duplicates = await on_files_db(finders[source_type], scan_id, limit, offset)
+    return {"success": True, "scan_id": scan_id, "limit": limit, "offset": offset, **duplicates}
+
+async def _scan_diff(base, target):
+    """ScanDiff of two scans of the same source type, or 404 / 400"""
+    differs = {'local': diff_scans, 'azure': azure_diff_scans, 'shared': shared_diff_scans}
+    source_types = [await on_scans_db(catalog.get_source_type, scan_id) for scan_id in (base, target)]
+    if None in source_types:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    if source_types[0] != source_types[1]:
+        raise HTTPException(status_code=400, detail="Scans of different source types cannot be compared")
+    return differs[source_types[0]](base, target)
+
+@app.get("/api/scans/diff")
+async def get_scans_diff(
+    base: str = Query(..., description="Older scan"),
+    target: str = Query(..., description="Newer scan of the same source type"),
+    change: str = Query(None, description="Optional: added, removed or modified"),
+    format: str = Query("json", description="json (one page) or ndjson (every change, streamed)"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str = None
+):
+    """Files added, removed and modified between two scans, in path order (pass next_cursor back as cursor)"""
+    scan_diff = await _scan_diff(base, target)
+    if format == "ndjson":
+        if change is not None and change not in diff.CHANGES:
+            raise HTTPException(status_code=400, detail=f"Unknown change: {change}")
+        return StreamingResponse(
+            scan_diff.stream(change),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="diff-{base}-{target}.ndjson"'}
+        )
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format} (expected json or ndjson)")
+    try:
+        changes, cursor = await on_files_db(scan_diff.page, limit, cursor, change)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "base": base,
+        "target": target,
+        "limit": limit,
+        "returned_count": len(changes),
+        "next_cursor": cursor,
+        "changes": changes
+    }
+
+@app.get("/api/scans/diff/summary")
+async def get_scans_diff_summary(
+    base: str = Query(..., description="Older scan"),
+    target: str = Query(..., description="Newer scan of the same source type")
+):
+    """Counts (and bytes) of files added, removed, modified and unchanged between two scans"""
+    scan_diff = await _scan_diff(base, target)
+    summary = await on_files_db(scan_diff.summary)
+    return {"success": True, **summary}
+
 # ========== AZURE ENDPOINTS ==========
 @app.post("/api/scan/azure")
 async def scan_azure(
     container_name: str = Query(..., description="Container name to scan"),
     storage_account: str = Query(None, description="Storage account name"),
     scan_name: str = Query(None, description="Optional scan name"),
-    connection_string: str = Query(None, description="Optional: Azure connection string (if not in .env)")
+    connection_string: str = Query(None, description="Optional: Azure connection string (if not in .env)"),
+    list_workers: int = Query(None, ge=1, description="Optional: parallel listing threads (default AZURE_LIST_WORKERS)"),
+    prefixes: str = Query(None, description="Optional: comma-separated, non-overlapping prefix shards to list in parallel"),
+    use_async: bool = Query(None, description="Optional: run on the shared event loop with the aio client (default AZURE_ASYNC_SCANS)"),
+    delta: bool = Query(False, description="Optional: only store blobs changed since the last completed scan of this container"),
+    base_scan_id: str = Query(None, description="Optional: completed scan of this container to run a delta scan against"),
+    priority: int = Query(0, description="Optional: queue priority (higher starts first)")
 ):
     """Scan Azure Blob Storage container"""
     scan_id = str(uuid.uuid4())
     name = scan_name or f"Azure Scan {datetime.now().strftime('%m/%d/%Y, %I:%M:%S %p')}"
-    start_time = datetime.now()
     
     # Get connection string from parameter or environment variable
     conn_string = connection_string or os.getenv("AZURE_STORAGE_CONNECTION_STRING")
@@ -251,86 +1001,62 @@ async def scan_azure(
     # Get storage account from parameter or extract from connection string
     storage_acc = storage_account or os.getenv("AZURE_STORAGE_ACCOUNT", "unknown")
     
-    # Initialize scan tracking
-    with active_scans_lock:
-        active_scans[scan_id] = {
-            "stop": False,
-            "type": "azure",
-            "status": "scanning",
-            "result": None,
-            "error": None
-        }
+    # Caller-supplied prefix shards (default: discover top-level virtual directories)
+    shards = [prefix.strip() for prefix in prefixes.split(',') if prefix.strip()] if prefixes else None
     
-    def scan_thread():
-        try:
-            # Create scan record
-            azure_create_scan(scan_id, name, container_name, storage_acc)
-            
-            # Scan Azure container with stop flag
-            files = scan_azure_blob(conn_string, container_name, stop_flag=lambda: active_scans.get(scan_id, {}).get("stop", False))
-            
-            # Check if stopped
-            if active_scans.get(scan_id, {}).get("stop", False):
-                azure_fail_scan(scan_id)
-                with active_scans_lock:
-                    if scan_id in active_scans:
-                        active_scans[scan_id]["status"] = "stopped"
-                return
-            
-            # Save files
-            azure_save_files(scan_id, files)
-            
-            # Get summary
-            summary = azure_get_summary(files)
-            
-            # Complete scan
-            azure_complete_scan(scan_id, summary['total_files'], summary['total_size'])
-            
-            # Calculate duration
-            duration = (datetime.now() - start_time).total_seconds()
-            
-            # Store result
-            result = {
-                "success": True,
-                "scan_id": scan_id,
-                "scan_name": name,
-                "storage_type": "azure_blob",
-                "container_name": container_name,
-                "total_files": summary['total_files'],
-                "total_size": summary['total_size'],
-                "duration_seconds": duration,
-                "file_type_distribution": summary['file_type_distribution'],
-                "ocr_eligible_count": summary['ocr_eligible_count']
-            }
-            
-            with active_scans_lock:
-                if scan_id in active_scans:
-                    active_scans[scan_id]["status"] = "completed"
-                    active_scans[scan_id]["result"] = result
-            
-        except Exception as e:
-            azure_fail_scan(scan_id)
-            with active_scans_lock:
-                if scan_id in active_scans:
-                    active_scans[scan_id]["status"] = "failed"
-                    active_scans[scan_id]["error"] = str(e)
+    # Delta scans compare against a completed scan of the same container
+    if base_scan_id:
+        base = await on_scans_db(azure_get_scan, base_scan_id)
+        if not base or base['status'] != 'completed':
+            raise HTTPException(status_code=400, detail="Base scan not found or not completed")
+        if base['container_name'] != container_name or base['storage_account'] != storage_acc:
+            raise HTTPException(status_code=400, detail="Base scan is of a different container")
+    elif delta:
+        # First scan of a container is a full scan (the base of the next delta)
+        base = await on_scans_db(azure_get_latest_scan, container_name, storage_acc)
+        base_scan_id = base['id'] if base else None
     
-    # Start scan in background thread
-    thread = threading.Thread(target=scan_thread, daemon=True)
-    thread.start()
+    # Partitioned listing runs on threads; async scans list one paged stream each.
+    # Delta scans merge a name-ordered listing, so they list sequentially on a thread.
+    partitioned = (list_workers or 1) > 1 or bool(shards)
+    if base_scan_id and partitioned:
+        raise HTTPException(status_code=400, detail="Delta scans do not support list_workers or prefixes")
+    if use_async and (partitioned or base_scan_id):
+        raise HTTPException(status_code=400, detail="Async scans do not support list_workers, prefixes or delta")
+    if (AZURE_ASYNC_SCANS if use_async is None else use_async) and not (partitioned or base_scan_id):
+        await on_scans_db(
+            queue_azure_scan, scan_id, "azure_async", [scan_id, name, conn_string, container_name, storage_acc], priority
+        )
+        return {
+            "success": True,
+            "scan_id": scan_id,
+            "scan_name": name,
+            "container_name": container_name,
+            "queue_position": scheduler.position(scan_id),
+            "message": "Azure scan queued for the scan loop"
+        }
+    
+    # Queue the scan for a scan worker
+    await on_scans_db(
+        queue_azure_scan, scan_id, "azure",
+        [scan_id, name, conn_string, container_name, storage_acc, list_workers, shards, False, base_scan_id],
+        priority
+    )
     
     return {
         "success": True,
         "scan_id": scan_id,
         "scan_name": name,
         "container_name": container_name,
-        "message": "Azure scan started in background"
+        "base_scan_id": base_scan_id,
+        "queue_position": scheduler.position(scan_id),
+        "message": "Azure scan queued in background"
     }
 
 @app.get("/api/scans/azure")
 async def get_azure_scans():
     """Get all Azure scans"""
-    scans = azure_get_all_scans()
+    scans = await on_scans_db(azure_get_all_scans)
     return {
         "success": True,
         "count": len(scans),
@@ -338,10 +1064,13 @@ async def get_azure_scans():
     }
 
 @app.get("/api/scan/azure/{scan_id}")
-async def get_azure_scan_details(scan_id: str, limit: int = 100, offset: int = 0):
-    """Get Azure scan details and files with pagination"""
-    files = azure_get_scan_files(scan_id, limit, offset)
-    total_count = azure_get_total_files_count(scan_id)
+async def get_azure_scan_details(scan_id: str, limit: int = 100, offset: int = 0, cursor: str = None):
+    """Get Azure scan details and files with pagination (pass next_cursor back as cursor for keyset paging)"""
+    try:
+        files = await on_files_db(azure_get_scan_files, scan_id, limit, offset, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total_count = await on_files_db(azure_get_total_files_count, scan_id)
     
     if total_count == 0:
         raise HTTPException(status_code=404, detail="Scan not found")
@@ -353,21 +1082,38 @@ async def get_azure_scan_details(scan_id: str, limit: int = 100, offset: int = 0
         "limit": limit,
         "offset": offset,
         "returned_count": len(files),
+        "next_cursor": next_cursor(files, limit),
         "files": files
     }
 
+@app.get("/api/scan/azure/{scan_id}/summary")
+async def get_azure_scan_summary(scan_id: str):
+    """Get Azure scan aggregates (counts, sizes, type distribution, size histogram)"""
+    stats = await on_files_db(azure_get_scan_stats, scan_id)
+    
+    if not stats:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    return {
+        "success": True,
+        "scan_id": scan_id,
+        **stats
+    }
+
 # ========== SHARED DIRECTORY ENDPOINTS ==========
 
 @app.post("/api/scan/shared")
 async def scan_shared(
     share_path: str = Query(None, description="UNC path to shared folder (e.g., \\\\192.168.1.100\\Share)"),
     share_name: str = Query(..., description="Shared folder name/identifier"),
-    scan_name: str = Query(None, description="Optional scan name")
+    scan_name: str = Query(None, description="Optional scan name"),
+    walk_workers: int = Query(None, ge=1, description="Optional: parallel listing threads (default SHARED_WALK_WORKERS)"),
+    hash_contents: bool = Query(False, description="Optional: hash files sharing a size, for duplicate detection"),
+    priority: int = Query(0, description="Optional: queue priority (higher starts first)")
 ):
     """Scan a shared directory (SMB/CIFS share)"""
     scan_id = str(uuid.uuid4())
     name = scan_name or f"Shared Scan {datetime.now().strftime('%m/%d/%Y, %I:%M:%S %p')}"
-    start_time = datetime.now()
     
     # Get share path from parameter or environment variable
     path = share_path or os.getenv("SHARED_DIRECTORY_PATH")
@@ -378,88 +1124,27 @@ async def scan_shared(
             detail="Shared directory path not provided. Set SHARED_DIRECTORY_PATH in .env file or pass share_path as a parameter."
         )
     
-    # Initialize scan tracking
-    with active_scans_lock:
-        active_scans[scan_id] = {
-            "stop": False,
-            "type": "shared",
-            "status": "scanning",
-            "result": None,
-            "error": None
-        }
-    
-    def scan_thread():
-        try:
-            # Create scan record
-            shared_create_scan(scan_id, name, path, share_name)
-            
-            # Scan shared directory with stop flag
-            files = scan_shared_directory(path, share_name, stop_flag=lambda: active_scans.get(scan_id, {}).get("stop", False))
-            
-            # Check if stopped
-            if active_scans.get(scan_id, {}).get("stop", False):
-                shared_fail_scan(scan_id)
-                with active_scans_lock:
-                    if scan_id in active_scans:
-                        active_scans[scan_id]["status"] = "stopped"
-                return
-            
-            # Save files
-            shared_save_files(scan_id, files)
-            
-            # Get summary
-            summary = shared_get_summary(files)
-            
-            # Complete scan
-            shared_complete_scan(scan_id, summary['total_files'], summary['total_size'])
-            
-            # Calculate duration
-            duration = (datetime.now() - start_time).total_seconds()
-            
-            # Store result
-            result = {
-                "success": True,
-                "scan_id": scan_id,
-                "scan_name": name,
-                "storage_type": "shared_directory",
-                "share_path": path,
-                "share_name": share_name,
-                "total_files": summary['total_files'],
-                "total_size": summary['total_size'],
-                "duration_seconds": duration,
-                "file_type_distribution": summary['file_type_distribution'],
-                "ocr_eligible_count": summary['ocr_eligible_count']
-            }
-            
-            with active_scans_lock:
-                if scan_id in active_scans:
-                    active_scans[scan_id]["status"] = "completed"
-                    active_scans[scan_id]["result"] = result
-            
-        except Exception as e:
-            shared_fail_scan(scan_id)
-            with active_scans_lock:
-                if scan_id in active_scans:
-                    active_scans[scan_id]["status"] = "failed"
-                    active_scans[scan_id]["error"] = str(e)
-    
-    # Start scan in background thread
-    thread = threading.Thread(target=scan_thread, daemon=True)
-    thread.start()
+    # Queue the scan for a scan worker (scans of one server share its limit)
+    await on_scans_db(
+        queue_scan, scan_id, "shared", "shared",
+        [scan_id, name, path, share_name, False, walk_workers, hash_contents],
+        share_resource(path), priority
+    )
     
     return {
         "success": True,
         "scan_id": scan_id,
         "scan_name": name,
         "share_path": path,
-        "message": "Shared scan started in background"
+        "queue_position": scheduler.position(scan_id),
+        "message": "Shared scan queued in background"
     }
 
 
 @app.get("/api/scans/shared")
 async def get_shared_scans():
     """Get all shared directory scans"""
-    scans = shared_get_all_scans()
+    scans = await on_scans_db(shared_get_all_scans)
     return {
         "success": True,
         "count": len(scans),
@@ -468,10 +1153,13 @@ async def get_shared_scans():
 
 
 @app.get("/api/scan/shared/{scan_id}")
-async def get_shared_scan_details(scan_id: str, limit: int = 100, offset: int = 0):
-    """Get shared directory scan details and files with pagination"""
-    files = shared_get_scan_files(scan_id, limit, offset)
-    total_count = shared_get_total_files_count(scan_id)
+async def get_shared_scan_details(scan_id: str, limit: int = 100, offset: int = 0, cursor: str = None, under: str = None):
+    """Get shared directory scan details and files with pagination (pass next_cursor back as cursor for keyset paging; under limits it to a directory's subtree)"""
+    try:
+        files = await on_files_db(shared_get_scan_files, scan_id, limit, offset, cursor, under)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total_count = await on_files_db(shared_get_total_files_count, scan_id)
     
     if total_count == 0:
         raise HTTPException(status_code=404, detail="Scan not found")
@@ -483,63 +1171,169 @@ async def get_shared_scan_details(scan_id: str, limit: int = 100, offset: int =
         "limit": limit,
         "offset": offset,
         "returned_count": len(files),
+        "next_cursor": next_cursor(files, limit),
         "files": files
     }
 
+@app.get("/api/scan/shared/{scan_id}/summary")
+async def get_shared_scan_summary(scan_id: str):
+    """Get shared directory scan aggregates (distribution by extension)"""
+    stats = await on_files_db(shared_get_scan_stats, scan_id)
+    
+    if not stats:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    return {
+        "success": True,
+        "scan_id": scan_id,
+        **stats
+    }
+
+@app.get("/api/scan/shared/{scan_id}/errors")
+async def get_shared_scan_errors(
+    scan_id: str,
+    kind: str = Query(None, description="Optional: timeout, error or slow"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Directories a shared scan skipped (timeout/error) or found slow"""
+    if not await on_scans_db(shared_get_scan, scan_id):
+        raise HTTPException(status_code=404, detail="Scan not found")
+
+    errors = await on_files_db(shared_get_scan_errors, scan_id, kind, limit, offset)
+    return {
+        "success": True,
+        "scan_id": scan_id,
+        "errors": errors,
+        "count": len(errors)
+    }
+
 # ========== SCAN STATUS ENDPOINTS ==========
 
 @app.get("/api/scan/{scan_id}/status")
 async def get_scan_status(scan_id: str):
     """Get the status of an active scan"""
-    with active_scans_lock:
-        if scan_id in active_scans:
-            scan_info = active_scans[scan_id]
-            response = {
-                "scan_id": scan_id,
-                "status": scan_info["status"],
-                "type": scan_info["type"]
+    scan_info = await on_scans_db(scan_states.get, scan_id)
+    if scan_info is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    response = {
+        "scan_id": scan_id,
+        "status": scan_info["status"],
+        "type": scan_info["type"]
+    }
+    
+    if scan_info["status"] == "completed" and scan_info["result"]:
+        response["result"] = scan_info["result"]
+    elif scan_info["status"] == "failed" and scan_info["error"]:
+        response["error"] = scan_info["error"]
+    elif scan_info["status"] == "queued":
+        # Known to the worker that queued it only
+        response["queue_position"] = scheduler.position(scan_id)
+    
+    # Live counters if this worker runs the scan, else those saved with its last checkpoint
+    progress = progress_bus.get(scan_id)
+    if progress is not None:
+        response["progress"] = progress.counters()
+    elif scan_info["progress"]:
+        response["progress"] = scan_info["progress"]
+    return response
+
+@app.get("/api/scan/{scan_id}/events")
+async def scan_events(scan_id: str):
+    """Server-Sent Events of a scan's live progress, one per SCAN_PROGRESS_TICK seconds, until it ends"""
+    if progress_bus.get(scan_id) is not None:
+        events = progress_bus.events(scan_id)
+    elif await on_scans_db(scan_states.get, scan_id) is not None:
+        # Run by another worker: stream the state it saves with each checkpoint
+        async def saved_snapshot():
+            state = await on_scans_db(scan_states.get, scan_id)
+            if state is None:
+                # Forgotten while streaming (e.g. state cleared): end the stream
+                return {"status": "failed", "result": None, "error": "Scan state is no longer available"}
+            return {
+                "status": state["status"], "result": state["result"], "error": state["error"],
+                **(state["progress"] or {})
             }
-            
-            if scan_info["status"] == "completed" and scan_info["result"]:
-                response["result"] = scan_info["result"]
-            elif scan_info["status"] == "failed" and scan_info["error"]:
-                response["error"] = scan_info["error"]
-            
-            return response
-        else:
-            raise HTTPException(status_code=404, detail="Scan not found")
+        events = live_progress.stream(saved_snapshot)
+    else:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # No caching, and no proxy buffering of the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ========== RESUME SCAN ENDPOINT ==========
+
+@app.post("/api/scan/{scan_id}/resume")
+async def resume_scan(
+    scan_id: str,
+    connection_string: str = Query(None, description="Azure scans only: connection string (if not in .env)"),
+    priority: int = Query(0, description="Optional: queue priority (higher starts first)")
+):
+    """Resume an interrupted, stopped or failed scan (local, Azure or shared) from its last checkpoint"""
+    state = await on_scans_db(scan_states.get, scan_id)
+    if state and state["status"] in ("queued", "scanning", "hashing"):
+        raise HTTPException(status_code=409, detail="Scan is still running")
+    
+    scan_type = await on_scans_db(catalog.get_source_type, scan_id)
+    lookup = {"local": get_scan, "azure": azure_get_scan, "shared": shared_get_scan}.get(scan_type)
+    scan = await on_scans_db(lookup, scan_id) if lookup else None
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    if scan['status'] == 'completed':
+        raise HTTPException(status_code=400, detail="Scan already completed")
+    
+    conn_string = None
+    if scan_type == "azure":
+        conn_string = connection_string or os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+        if not conn_string:
+            raise HTTPException(
+                status_code=400,
+                detail="Azure connection string not provided. Set AZURE_STORAGE_CONNECTION_STRING in .env file or pass it as a parameter."
+            )
+    
+    await on_scans_db(queue_resume, scan_id, scan_type, scan, conn_string, priority)
+    
+    return {
+        "success": True,
+        "scan_id": scan_id,
+        "type": scan_type,
+        "queue_position": scheduler.position(scan_id),
+        "message": "Scan queued to resume in background"
+    }
 
 # ========== STOP SCAN ENDPOINTS ==========
 
 @app.post("/api/scan/{scan_id}/stop")
 async def stop_scan(scan_id: str):
     """Stop an active local scan"""
-    with active_scans_lock:
-        if scan_id in active_scans and active_scans[scan_id]["type"] == "local":
-            active_scans[scan_id]["stop"] = True
-            return {"success": True, "message": "Stop signal sent to local scan"}
-        else:
-            raise HTTPException(status_code=404, detail="Active local scan not found")
+    if not await on_scans_db(scan_states.request_stop, scan_id, "local"):
+        raise HTTPException(status_code=404, detail="Active local scan not found")
+    await on_scans_db(cancel_queued_scan, scan_id)
+    return {"success": True, "message": "Stop signal sent to local scan"}
 
 @app.post("/api/scan/azure/{scan_id}/stop")
 async def stop_azure_scan(scan_id: str):
-    """Stop an active Azure scan"""
-    with active_scans_lock:
-        if scan_id in active_scans and active_scans[scan_id]["type"] == "azure":
-            active_scans[scan_id]["stop"] = True
-            return {"success": True, "message": "Stop signal sent to Azure scan"}
-        else:
-            raise HTTPException(status_code=404, detail="Active Azure scan not found")
+    """Stop an active Azure scan (async scans are cancelled at once)"""
+    if not await on_scans_db(scan_states.request_stop, scan_id, "azure"):
+        raise HTTPException(status_code=404, detail="Active Azure scan not found")
+    # Async scans run by this worker; others see the flag at their next poll
+    scan_loop.cancel(scan_id)
+    await on_scans_db(cancel_queued_scan, scan_id)
+    return {"success": True, "message": "Stop signal sent to Azure scan"}
 
 @app.post("/api/scan/shared/{scan_id}/stop")
 async def stop_shared_scan(scan_id: str):
     """Stop an active shared directory scan"""
-    with active_scans_lock:
-        if scan_id in active_scans and active_scans[scan_id]["type"] == "shared":
-            active_scans[scan_id]["stop"] = True
-            return {"success": True, "message": "Stop signal sent to shared scan"}
-        else:
-            raise HTTPException(status_code=404, detail="Active shared scan not found")
+    if not await on_scans_db(scan_states.request_stop, scan_id, "shared"):
+        raise HTTPException(status_code=404, detail="Active shared scan not found")
+    await on_scans_db(cancel_queued_scan, scan_id)
+    return {"success": True, "message": "Stop signal sent to shared scan"}
 
 @app.get("/api/health")
 async def health_check():
@@ -1,15 +1,24 @@
 """
 Azure Blob Storage Connector
 """
-from .scanner import scan_azure_blob, get_summary
+from .scanner import scan_azure_blob, iter_azure_blob, get_summary
+from .aio_scanner import aiter_azure_blob, scan_azure_blob_async, ClientPool, ScanLoop
 from .database import (
     init_db, create_scan, save_files, complete_scan, fail_scan,
-    get_all_scans, get_scan_files, get_total_files_count
+    get_all_scans, get_scan_files, get_total_files_count, get_scan_stats,
+    get_scan, get_interrupted_scans, open_checkpoint, prepare_resume,
+    get_latest_scan, open_delta, finalize_delta_scan, export_files, freeze_scan,
+    search_files, diff_scans
 )
 
 __all__ = [
     'scan_azure_blob',
+    'iter_azure_blob',
     'get_summary',
+    'aiter_azure_blob',
+    'scan_azure_blob_async',
+    'ClientPool',
+    'ScanLoop',
     'init_db',
     'create_scan',
     'save_files',
@@ -17,5 +26,17 @@ __all__ = [
     'fail_scan',
     'get_all_scans',
     'get_scan_files',
-    'get_total_files_count'
+    'get_total_files_count',
+    'get_scan_stats',
+    'get_scan',
+    'get_interrupted_scans',
+    'open_checkpoint',
+    'prepare_resume',
+    'get_latest_scan',
+    'open_delta',
+    'finalize_delta_scan',
+    'export_files',
+    'freeze_scan',
+    'search_files',
+    'diff_scans'
 ]
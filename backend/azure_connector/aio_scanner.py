@@ -0,0 +1,217 @@
+"""
+Async Azure Blob Storage Scanner
+Lists containers with the SDK's aio clients so many scans share one event loop
+and one HTTP connection pool instead of a thread each
+"""
+import asyncio
+import os
+import threading
+from .scanner import build_blob_record
+
+# Max open HTTP connections shared by all async scans - overridable from the environment
+MAX_CONNECTIONS = int(os.getenv("AZURE_MAX_CONNECTIONS", "100"))
+
+
+class ClientPool:
+    """
+    Async BlobServiceClients sharing one aiohttp session (one connection pool)
+
+    One service client is kept per connection string; all of them send
+    through the same session, so concurrent scans of many containers are
+    bounded by max_connections in total. Must be used from a single event loop.
+
+    Args:
+        max_connections: Max open connections (defaults to AZURE_MAX_CONNECTIONS)
+    """
+
+    def __init__(self, max_connections=None):
+        self.max_connections = max_connections or MAX_CONNECTIONS
+        self._session = None
+        self._clients = {}
+
+    def _transport(self):
+        """Transport over the shared session (created on first use, inside the loop)"""
+        try:
+            import aiohttp
+            from azure.core.pipeline.transport import AioHttpTransport
+        except ImportError:
+            raise ImportError("aiohttp not installed. Run: pip install aiohttp")
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+        return AioHttpTransport(session=self._session, session_owner=False)
+
+    def service_client(self, connection_string):
+        """Shared async BlobServiceClient for connection_string"""
+        client = self._clients.get(connection_string)
+        if client is None:
+            from azure.storage.blob.aio import BlobServiceClient
+            client = BlobServiceClient.from_connection_string(
+                connection_string, transport=self._transport()
+            )
+            self._clients[connection_string] = client
+        return client
+
+    async def close(self):
+        """Close every client, then the shared session"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+async def aiter_azure_blob(connection_string, container_name, stop_flag=None, checkpoint=None, pool=None):
+    """
+    Scan Azure Blob Storage container and yield file metadata page by page (async)
+
+    Async counterpart of iter_azure_blob's sequential listing. Checkpoints use
+    the same state (continuation token of the last fully handed-over page), so
+    either scanner can resume a scan started by the other.
+
+    Args:
+        connection_string: Azure storage account connection string
+        container_name: Name of blob container to scan
+        stop_flag: Callable that returns True if scan should stop
+        checkpoint: Optional Checkpoint; listing starts at its continuation
+            token, and progress is marked after each fully handed-over page
+        pool: ClientPool to take the service client from (default: a private
+            pool, closed when the listing ends)
+
+    Yields:
+        File dictionaries with metadata
+    """
+    try:
+        from azure.storage.blob.aio import BlobServiceClient  # noqa: F401
+    except ImportError:
+        raise ImportError("Azure SDK not installed. Run: pip install azure-storage-blob aiohttp")
+
+    own_pool = pool is None
+    if own_pool:
+        pool = ClientPool()
+
+    count = 0
+    token = None
+    try:
+        container_client = pool.service_client(connection_string).get_container_client(container_name)
+
+        if checkpoint is not None:
+            if checkpoint.state.get('finished'):
+                return
+            count = checkpoint.state.get('files_listed', 0)
+            token = checkpoint.state.get('continuation_token')
+
+        pager = container_client.list_blobs().by_page(continuation_token=token)
+        async for page in pager:
+            async for blob in page:
+                # Check stop flag periodically (every 10 files)
+                if stop_flag and stop_flag() and count % 10 == 0:
+                    print(f"Azure scan stopped by user after processing {count} files")
+                    return
+
+                # Skip if it's a directory
+                if blob.name.endswith('/'):
+                    continue
+
+                count += 1
+                yield build_blob_record(blob, container_name)
+
+            if checkpoint is not None:
+                # Every blob of the page has been handed over: resume after it
+                checkpoint.mark(
+                    continuation_token=pager.continuation_token,
+                    files_listed=count,
+                    finished=not pager.continuation_token
+                )
+
+    except Exception as e:
+        raise Exception(f"Failed to scan Azure container: {str(e)}")
+    finally:
+        if own_pool:
+            await pool.close()
+
+
+async def scan_azure_blob_async(connection_string, container_name, stop_flag=None, pool=None):
+    """
+    Scan Azure Blob Storage container and return file metadata (async)
+
+    Args:
+        connection_string: Azure storage account connection string
+        container_name: Name of blob container to scan
+        stop_flag: Callable that returns True if scan should stop
+        pool: Optional shared ClientPool
+
+    Returns:
+        List of file dictionaries with metadata
+    """
+    return [
+        record async for record in aiter_azure_blob(connection_string, container_name, stop_flag, pool=pool)
+    ]
+
+
+class ScanLoop:
+    """
+    One event loop on a background thread that runs every async scan
+
+    The loop thread and its ClientPool are started on first submit. Scans are
+    tracked by key so they can be cancelled; cancelling interrupts the scan at
+    its current await (mid page fetch included) rather than at the next blob.
+
+    Args:
+        max_connections: Connection limit of the shared ClientPool
+    """
+
+    def __init__(self, max_connections=None):
+        self.max_connections = max_connections
+        self.loop = None
+        self.pool = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def _start(self):
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.pool = ClientPool(self.max_connections)
+                self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+                self._thread.start()
+        return self.loop
+
+    def submit(self, key, coro):
+        """Run coro on the loop; returns its concurrent.futures.Future"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._start())
+        with self._lock:
+            self._futures[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+    def cancel(self, key):
+        """Cancel the scan submitted under key; False if it is not running"""
+        with self._lock:
+            future = self._futures.get(key)
+        return future is not None and future.cancel()
+
+    def close(self, timeout=10):
+        """Cancel running scans, close the shared pool and stop the loop"""
+        with self._lock:
+            loop, self.loop = self.loop, None
+            futures = list(self._futures.values())
+        if loop is None:
+            return
+        for future in futures:
+            future.cancel()
+        try:
+            asyncio.run_coroutine_threadsafe(self.pool.close(), loop).result(timeout)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(timeout)
+            loop.close()
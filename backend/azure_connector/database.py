@@ -1,169 +1,380 @@
 """
 Database operations for Azure scan metadata
 """
+import heapq
+import json
 import sqlite3
 import os
 from datetime import datetime
+from itertools import islice
+from .. import aggregates, catalog, checkpoints, columnar, diff, export, search
+from ..db import BulkWriter, database, decode_cursor, trim_scan_files
+from . import delta
+from .delta import BlobDelta, EFFECTIVE_FILES_SQL, SUPERSEDED_SQL
 
 # Database paths - separated for scans and files
 SCANS_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scanner.db')
 FILES_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files.db')
 
+# azure_scans / azure_files (views over the catalog) column -> catalog column
+SCAN_COLUMNS = (
+    ('id', 'id'),
+    ('name', 'name'),
+    ('container_name', 'location'),
+    ('storage_account', 'account'),
+    ('status', 'status'),
+    ('total_files', 'total_files'),
+    ('total_size', 'total_size'),
+    ('start_time', 'start_time'),
+    ('end_time', 'end_time'),
+    ('base_scan_id', 'base_scan_id'),
+)
+FILE_COLUMNS = (
+    ('id', 'id'),
+    ('scan_id', 'scan_id'),
+    ('file_name', 'file_name'),
+    ('blob_path', 'file_path'),
+    ('file_type', 'type_id'),
+    ('mime_type', 'mime_id'),
+    ('file_size', 'file_size'),
+    ('last_modified', 'last_modified'),
+    ('container_name', 'container_id'),
+    ('eligible_for_ocr', 'eligible_for_ocr'),
+    ('etag', 'etag'),
+)
+
+# Record keys -> catalog_files columns, resolved once
+FILES_WRITER = BulkWriter('catalog_files', [
+    ('file_name', 'file_name'),
+    ('file_path', 'blob_path'),
+    ('type_id', 'file_type'),
+    ('mime_id', 'mime_type'),
+    ('file_size', 'file_size'),
+    ('last_modified', 'last_modified'),
+    ('container_id', 'container'),
+    ('eligible_for_ocr', 'eligible_for_ocr'),
+    ('etag', 'etag', None),
+    ('dir_id', lambda f: f['blob_path'].rpartition('/')[0]),
+    ('ext_id', lambda f: catalog.extension_of(f['file_name'])),
+], aggregate=(
+    lambda f: f.get('file_type') or 'other',
+    lambda f: bool(f.get('eligible_for_ocr'))
+), dictionaries=catalog.DICTIONARIES, trees=catalog.TREES)
+
+# SQL equivalents of the aggregate keys, for rebuilding older scans
+STATS_TYPE_SQL = "COALESCE(file_type, 'other')"
+STATS_OCR_SQL = "eligible_for_ocr"
+
 
 def init_db():
     """Initialize database and create tables"""
     # Initialize scans database
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
-    
-    # Create azure_scans table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS azure_scans (
-            id TEXT PRIMARY KEY,
-            name TEXT,
-            container_name TEXT,
-            storage_account TEXT,
-            status TEXT,
-            total_files INTEGER,
-            total_size INTEGER,
-            start_time TEXT,
-            end_time TEXT
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    database(SCANS_DB).write(_init_scans)
     
     # Initialize files database
-    conn = sqlite3.connect(FILES_DB)
+    database(FILES_DB).write(_init_files)
+    print("✅ Azure Database initialized")
+
+
+def _init_scans(conn):
     cursor = conn.cursor()
     
-    # Create azure_files table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS azure_files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            scan_id TEXT,
-            file_name TEXT,
-            blob_path TEXT,
-            file_type TEXT,
-            mime_type TEXT,
-            file_size INTEGER,
-            last_modified TEXT,
-            container_name TEXT,
-            eligible_for_ocr BOOLEAN,
-            FOREIGN KEY (scan_id) REFERENCES azure_scans(id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    print("✅ Azure Database initialized")
+    # Scans live in the unified catalog; azure_scans is a view of the Azure ones
+    catalog.init_scans(cursor)
+    catalog.migrate_table(cursor, 'azure_scans', 'catalog_scans', SCAN_COLUMNS, {'source_type': 'azure'})
+    catalog.replace_view(cursor, 'azure_scans', catalog.view_sql('catalog_scans', SCAN_COLUMNS, "source_type = 'azure'"))
 
 
-def create_scan(scan_id, name, container_name, storage_account):
-    """Create a new Azure scan record"""
-    conn = sqlite3.connect(SCANS_DB)
+def _init_files(conn):
     cursor = conn.cursor()
     
-    cursor.execute('''
-        INSERT INTO azure_scans (id, name, container_name, storage_account, status, start_time)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (scan_id, name, container_name, storage_account, 'running', datetime.now().isoformat()))
+    # Same for file rows: azure_files is a view decoding the catalog's dictionaries
+    catalog.init_files(cursor)
+    catalog.migrate_table(cursor, 'azure_files', 'catalog_files', FILE_COLUMNS)
+    catalog.replace_view(cursor, 'azure_files', catalog.view_sql('catalog_files', FILE_COLUMNS, 't.container_id IS NOT NULL'))
     
-    conn.commit()
-    conn.close()
+    # Materialized per-scan aggregates
+    aggregates.init_tables(cursor)
+    
+    # Server-side search (unified view, file name index)
+    search.init_tables(cursor)
+    
+    # Delta scans (sources, deleted blobs) and resume checkpoints
+    delta.init_tables(cursor)
+    checkpoints.init_tables(cursor)
 
 
-def save_files(scan_id, files):
-    """Save files to database"""
-    conn = sqlite3.connect(FILES_DB)
-    cursor = conn.cursor()
+def create_scan(scan_id, name, container_name, storage_account, base_scan_id=None):
+    """
+    Create a new Azure scan record
     
-    for file in files:
-        cursor.execute('''
-            INSERT INTO azure_files (
-                scan_id, file_name, blob_path, file_type, mime_type, 
-                file_size, last_modified, container_name, eligible_for_ocr
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            scan_id,
-            file['file_name'],
-            file['blob_path'],
-            file['file_type'],
-            file['mime_type'],
-            file['file_size'],
-            file['last_modified'],
-            file['container'],
-            file['eligible_for_ocr']
-        ))
-    
-    conn.commit()
-    conn.close()
+    With base_scan_id the scan is a delta: only blobs new or changed since
+    the base scan get rows of their own, the rest are read from the base.
+    """
+    database(SCANS_DB).execute('''
+        INSERT INTO catalog_scans (id, source_type, name, location, account, status, start_time, base_scan_id)
+        VALUES (?, 'azure', ?, ?, ?, ?, ?, ?)
+    ''', (scan_id, name, container_name, storage_account, 'running', datetime.now().isoformat(), base_scan_id))
+    
+    if base_scan_id:
+        database(FILES_DB).write(delta.add_sources, scan_id, base_scan_id)
+
+
+def save_files(scan_id, files):
+    """Save files to database in one batched transaction"""
+    FILES_WRITER.write(FILES_DB, scan_id, files)
 
 
 def complete_scan(scan_id, total_files, total_size):
-    """Mark Azure scan as completed"""
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE azure_scans 
+    """Mark Azure scan as completed (its checkpoint is no longer needed)"""
+    database(SCANS_DB).execute('''
+        UPDATE catalog_scans 
         SET status = 'completed', total_files = ?, total_size = ?, end_time = ?
-        WHERE id = ?
+        WHERE id = ? AND source_type = 'azure'
     ''', (total_files, total_size, datetime.now().isoformat(), scan_id))
-    
-    conn.commit()
-    conn.close()
+    checkpoints.clear(FILES_DB, scan_id)
+    # Name search reads its rows from the trigram index from now on
+    search.index_names(FILES_DB)
 
 
 def fail_scan(scan_id):
     """Mark Azure scan as failed"""
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE azure_scans SET status = 'failed', end_time = ? WHERE id = ?
+    database(SCANS_DB).execute('''
+        UPDATE catalog_scans SET status = 'failed', end_time = ? WHERE id = ? AND source_type = 'azure'
     ''', (datetime.now().isoformat(), scan_id))
+
+
+def get_scan(scan_id):
+    """Get one Azure scan record, or None"""
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        row = conn.execute("SELECT * FROM azure_scans WHERE id = ?", (scan_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def get_latest_scan(container_name, storage_account):
+    """Most recent completed scan of a container (the base of a delta scan), or None"""
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        row = conn.execute('''
+            SELECT * FROM azure_scans
+            WHERE container_name = ? AND storage_account = ? AND status = 'completed'
+            ORDER BY start_time DESC LIMIT 1
+        ''', (container_name, storage_account)).fetchone()
+    return dict(row) if row else None
+
+
+def open_delta(scan_id, base_scan_id, after=None):
+    """Change detector for a delta scan (pass to iter_azure_blob)"""
+    return BlobDelta(FILES_DB, scan_id, base_scan_id, after)
+
+
+def finalize_delta_scan(scan_id):
+    """
+    Rebuild a delta scan's aggregates over its effective file rows
     
-    conn.commit()
-    conn.close()
+    Returns:
+        The scan's stats (see get_scan_stats)
+    """
+    def rebuild(conn):
+        aggregates.rebuild(conn, scan_id, EFFECTIVE_FILES_SQL, STATS_TYPE_SQL, STATS_OCR_SQL)
+        return aggregates.load(conn, scan_id)
+    
+    return database(FILES_DB).write(rebuild)
+
+
+def get_interrupted_scans():
+    """Azure scans still marked running (their scan thread died with the server)"""
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        rows = conn.execute("SELECT * FROM azure_scans WHERE status = 'running'").fetchall()
+    return [dict(row) for row in rows]
+
+
+def open_checkpoint(scan_id, on_commit=()):
+    """Checkpoint for an Azure scan, continuing from any saved one"""
+    return checkpoints.Checkpoint.resume(FILES_DB, scan_id, 'azure', on_commit)
+
+
+def prepare_resume(scan_id, state):
+    """
+    Roll an Azure scan back to its last checkpoint and mark it running again
+    
+    Sequential listings keep the rows listed up to the checkpointed page;
+    partitioned listings keep the rows of finished shards; delta scans keep
+    the rows and deleted blobs up to the last blob of the checkpointed page.
+    The aggregates are then rebuilt.
+    
+    Args:
+        scan_id: Scan to resume
+        state: Checkpoint state
+    
+    Returns:
+        Number of file rows kept
+    """
+    def roll_back(conn):
+        if delta.scan_sources(conn, scan_id):
+            # Rows (and deleted blobs) merged after the checkpointed page
+            for table, path in (('catalog_files', 'file_path'), ('azure_deleted', 'blob_path')):
+                if state.get('last_blob') is None:
+                    conn.execute(f"DELETE FROM {table} WHERE scan_id = ?", (scan_id,))
+                else:
+                    conn.execute(
+                        f"DELETE FROM {table} WHERE scan_id = ? AND {path} > ?",
+                        (scan_id, state['last_blob'])
+                    )
+        elif state.get('partitioned'):
+            # The root shard ('') holds the blobs with no virtual directory
+            conn.execute('''
+                DELETE FROM catalog_files WHERE scan_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM json_each(?) AS shard
+                    WHERE CASE WHEN shard.value = ''
+                        THEN instr(catalog_files.file_path, '/') = 0
+                        ELSE substr(catalog_files.file_path, 1, length(shard.value)) = shard.value
+                    END
+                )
+            ''', (scan_id, json.dumps(state.get('shards_done', []))))
+        else:
+            trim_scan_files(conn, 'catalog_files', scan_id, state.get('files_listed', 0))
+        aggregates.rebuild(conn, scan_id, 'azure_files', STATS_TYPE_SQL, STATS_OCR_SQL)
+        return aggregates.load(conn, scan_id)
+    
+    stats = database(FILES_DB).write(roll_back)
+    database(SCANS_DB).execute(
+        "UPDATE catalog_scans SET status = 'running', end_time = NULL WHERE id = ? AND source_type = 'azure'",
+        (scan_id,)
+    )
+    return stats['total_files'] if stats else 0
 
 
 def get_all_scans():
     """Get all Azure scans"""
-    conn = sqlite3.connect(SCANS_DB)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM azure_scans ORDER BY start_time DESC LIMIT 10")
-    scans = [dict(row) for row in cursor.fetchall()]
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        rows = conn.execute("SELECT * FROM azure_scans ORDER BY start_time DESC LIMIT 10").fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_scan_files(scan_id, limit=100, offset=0, cursor=None):
+    """
+    Get files for an Azure scan with pagination
     
-    conn.close()
-    return scans
+    When cursor (from a previous page) is given, offset is ignored and the
+    page is read by seeking the (scan_id, file_name, id) index.
+    """
+    with database(FILES_DB).read(sqlite3.Row) as conn:
+        sources = delta.scan_sources(conn, scan_id)
+        if sources:
+            return _get_delta_scan_files(conn, scan_id, sources, limit, offset, cursor)
+        
+        if cursor:
+            file_name, row_id = decode_cursor(cursor)
+            rows = conn.execute('''
+                SELECT * FROM azure_files
+                WHERE scan_id = ? AND (file_name, id) > (?, ?)
+                ORDER BY file_name, id LIMIT ?
+            ''', (scan_id, file_name, row_id, limit)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM azure_files WHERE scan_id = ? ORDER BY file_name, id LIMIT ? OFFSET ?", 
+                                (scan_id, limit, offset)).fetchall()
+    return [dict(row) for row in rows]
 
 
-def get_scan_files(scan_id, limit=100, offset=0):
-    """Get files for an Azure scan with pagination"""
-    conn = sqlite3.connect(FILES_DB)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def scan_sources(scan_id):
+    """delta.scan_sources on a pooled read connection"""
+    with database(FILES_DB).read() as conn:
+        return delta.scan_sources(conn, scan_id)
+
+
+def _get_delta_scan_files(conn, scan_id, sources, limit, offset, cursor):
+    """
+    One page of a delta scan's files
+    
+    Reads a page from each source scan (its rows not superseded by a newer
+    source) and merges them in (file_name, id) order.
+    """
+    after = list(decode_cursor(cursor)) if cursor else []
+    keyset = "AND (f.file_name, f.id) > (?, ?)" if cursor else ""
+    start = 0 if cursor else offset
     
-    cursor.execute("SELECT * FROM azure_files WHERE scan_id = ? ORDER BY file_name LIMIT ? OFFSET ?", 
-                   (scan_id, limit, offset))
-    files = [dict(row) for row in cursor.fetchall()]
+    pages = []
+    for source, _ in sources:
+        rows = conn.execute(f'''
+            SELECT f.* FROM azure_scan_sources s
+            JOIN azure_files f ON f.scan_id = s.source_scan_id
+            WHERE s.scan_id = ? AND s.source_scan_id = ? {keyset} AND NOT {SUPERSEDED_SQL}
+            ORDER BY f.file_name, f.id LIMIT ?
+        ''', [scan_id, source] + after + [start + limit]).fetchall()
+        pages.append([dict(row) for row in rows])
     
-    conn.close()
+    merged = heapq.merge(*pages, key=lambda f: (f['file_name'], f['id']))
+    files = list(islice(merged, start, start + limit))
+    for file in files:
+        file['scan_id'] = scan_id
     return files
 
 
-def get_total_files_count(scan_id):
-    """Get total file count for an Azure scan"""
-    conn = sqlite3.connect(FILES_DB)
-    cursor = conn.cursor()
+def export_queries(scan_id):
+    """
+    (sql, params) reading every file row of an Azure scan in (file_name, id) order
     
-    cursor.execute("SELECT COUNT(*) as count FROM azure_files WHERE scan_id = ?", (scan_id,))
-    result = cursor.fetchone()
+    A delta scan gets one query per source scan (less superseded rows),
+    whose rows are merged (see export.iter_chunks), like its pages.
+    """
+    sources = scan_sources(scan_id)
+    if not sources:
+        queries = [("SELECT * FROM azure_files WHERE scan_id = ? ORDER BY file_name, id", [scan_id])]
+    else:
+        queries = [(f'''
+            SELECT f.* FROM azure_scan_sources s
+            JOIN azure_files f ON f.scan_id = s.source_scan_id
+            WHERE s.scan_id = ? AND s.source_scan_id = ? AND NOT {SUPERSEDED_SQL}
+            ORDER BY f.file_name, f.id
+        ''', [scan_id, source]) for source, _ in sources]
+    return queries
+
+
+def export_files(scan_id, fmt, compress=False):
+    """Stream every file row of an Azure scan in an export format (see export.stream)"""
+    return export.stream(FILES_DB, export_queries(scan_id), fmt, scan_id, compress)
+
+
+def freeze_scan(scan_id):
+    """Write a completed Azure scan's columnar snapshot (see columnar.freeze)"""
+    return columnar.freeze(FILES_DB, export_queries(scan_id), scan_id, {'blob_path': 'file_path'})
+
+
+def search_files(scan_id, filters, limit=100, offset=0, cursor=None):
+    """
+    One page of an Azure scan's files matching server-side filters (see search.search_files)
     
-    conn.close()
-    return result[0] if result else 0
+    A delta scan is searched in each source scan, less its superseded
+    rows, like its pages. Blob paths are returned as file_path.
+    """
+    sources = scan_sources(scan_id)
+    superseded = delta.superseded_sql('?', '?', 'f.file_path')
+    scopes = [(source, f"NOT {superseded}", [scan_id, depth]) for source, depth in sources]
+    return search.search_files(FILES_DB, scan_id, filters, scopes, sep='/', limit=limit, offset=offset, cursor=cursor)
+
+
+def _diff_rows(conn, scan_id, after=None):
+    """A scan's effective blobs in blob_path order for a diff, keyed by blob_path"""
+    return delta.iter_effective(conn, scan_id, ('blob_path', 'blob_path', 'file_size', 'last_modified', 'etag'), after)
+
+
+def diff_scans(base_scan_id, target_scan_id):
+    """
+    Blobs added, removed and modified (by etag, else size and last_modified)
+    between two Azure scans (see diff.ScanDiff)
+    
+    Delta scans are read as their effective rows, like their pages.
+    """
+    return diff.ScanDiff(FILES_DB, _diff_rows, base_scan_id, target_scan_id)
+
+
+def get_scan_stats(scan_id):
+    """Get materialized aggregates for an Azure scan, or None if there is no such scan"""
+    table = EFFECTIVE_FILES_SQL if scan_sources(scan_id) else 'azure_files'
+    return aggregates.load_or_rebuild(FILES_DB, SCANS_DB, scan_id, table, STATS_TYPE_SQL, STATS_OCR_SQL)
+
+
+def get_total_files_count(scan_id):
+    """Get total file count for an Azure scan (from the aggregates, not COUNT(*))"""
+    stats = get_scan_stats(scan_id)
+    return stats['total_files'] if stats else 0
@@ -0,0 +1,198 @@
+"""
+Azure Delta Scans
+ETag / last_modified change detection against a base scan, so a re-scan of a
+container only writes the blobs that changed
+"""
+import heapq
+from ..db import connect, database
+
+
+def init_tables(cursor):
+    """Create the delta tables (in files.db, next to the file rows)"""
+    # Scans whose rows a delta scan reads, newest first (depth 0 is the scan itself)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS azure_scan_sources (
+            scan_id TEXT NOT NULL,
+            source_scan_id TEXT NOT NULL,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (scan_id, source_scan_id)
+        )
+    ''')
+    # Blobs of the base that a delta scan no longer found
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS azure_deleted (
+            scan_id TEXT NOT NULL,
+            blob_path TEXT NOT NULL,
+            PRIMARY KEY (scan_id, blob_path)
+        )
+    ''')
+    # Name-ordered reads of a scan's rows (merge-join, newer-row lookups) use
+    # the catalog's (scan_id, file_path) index, file_path being the blob path
+
+
+def superseded_sql(scan_id='s.scan_id', depth='s.depth', blob_path='f.blob_path'):
+    """
+    Condition true for a source's row that a newer source of the same scan
+    wrote or deleted, given SQL expressions for the scan, the source's depth
+    and the row's blob path
+    """
+    return f'''EXISTS (
+    SELECT 1 FROM azure_scan_sources n
+    WHERE n.scan_id = {scan_id} AND n.depth < {depth} AND (
+        EXISTS (SELECT 1 FROM azure_files g WHERE g.scan_id = n.source_scan_id AND g.blob_path = {blob_path})
+        OR EXISTS (SELECT 1 FROM azure_deleted t WHERE t.scan_id = n.source_scan_id AND t.blob_path = {blob_path})
+    )
+)'''
+
+
+# s is the source (an azure_scan_sources row), f the row
+SUPERSEDED_SQL = superseded_sql()
+
+# File rows of a delta scan: for each blob, the row of the newest source that listed it
+EFFECTIVE_FILES_SQL = f'''(
+    SELECT s.scan_id AS scan_id, f.file_size AS file_size,
+           f.file_type AS file_type, f.eligible_for_ocr AS eligible_for_ocr
+    FROM azure_scan_sources s
+    JOIN azure_files f ON f.scan_id = s.source_scan_id
+    WHERE NOT {SUPERSEDED_SQL}
+)'''
+
+
+def add_sources(conn, scan_id, base_scan_id):
+    """Make scan_id a delta of base_scan_id (its sources: itself, the base, and the base's sources)"""
+    conn.execute('''
+        INSERT OR IGNORE INTO azure_scan_sources (scan_id, source_scan_id, depth)
+        SELECT ?, ?, 0 UNION ALL SELECT ?, ?, 1
+        UNION ALL SELECT ?, source_scan_id, depth + 1 FROM azure_scan_sources WHERE scan_id = ?
+    ''', (scan_id, scan_id, scan_id, base_scan_id, scan_id, base_scan_id))
+
+
+def scan_sources(conn, scan_id):
+    """(source_scan_id, depth) of a delta scan, newest first (empty for a full scan)"""
+    return conn.execute(
+        "SELECT source_scan_id, depth FROM azure_scan_sources WHERE scan_id = ? ORDER BY depth",
+        (scan_id,)
+    ).fetchall()
+
+
+def iter_effective(conn, scan_id, columns, after=None):
+    """
+    Yield a scan's effective rows in blob_path order
+
+    Each source is read in blob_path order from the (scan_id, blob_path)
+    index, without its superseded rows, and the sources are merged.
+
+    Args:
+        conn: Connection to files.db
+        scan_id: Full or delta scan
+        columns: Columns of azure_files to select (blob_path must come first)
+        after: Only rows with blob_path greater than this
+    """
+    select = ', '.join(f'f.{column}' for column in columns)
+    keyset = "AND f.blob_path > ?" if after is not None else ""
+    extra = [after] if after is not None else []
+
+    sources = scan_sources(conn, scan_id)
+    if not sources:
+        return iter(conn.execute(
+            f"SELECT {select} FROM azure_files f WHERE f.scan_id = ? {keyset} ORDER BY f.blob_path",
+            [scan_id] + extra
+        ))
+
+    streams = [
+        conn.execute(f'''
+            SELECT {select} FROM azure_scan_sources s
+            JOIN azure_files f ON f.scan_id = s.source_scan_id
+            WHERE s.scan_id = ? AND s.source_scan_id = ? {keyset} AND NOT {SUPERSEDED_SQL}
+            ORDER BY f.blob_path
+        ''', [scan_id, source] + extra)
+        for source, _ in sources
+    ]
+    return heapq.merge(*streams, key=lambda row: row[0])
+
+
+class BlobDelta:
+    """
+    Merge-join of a name-ordered container listing against a base scan
+
+    The Blob service lists a container in blob name order, and the base
+    scan's effective rows are read in the same order, so the two are compared
+    in one pass with constant memory. A listed blob is written only if it is
+    new or its etag differs (for base rows without an etag, its last_modified
+    or size). Base blobs the listing passes over are recorded as deleted.
+
+    changed() is called from the consumer side of the scanner generator, so
+    last_blob is the last blob handed over. commit() writes the deleted blobs
+    found so far; it runs as a checkpoint on_commit hook, after each batch.
+
+    Args:
+        db_path: Path of files.db
+        scan_id: Delta scan being recorded
+        base_scan_id: Scan compared against
+        after: Blob the listing resumes after (from the checkpoint)
+    """
+
+    def __init__(self, db_path, scan_id, base_scan_id, after=None):
+        self.db_path = db_path
+        self.scan_id = scan_id
+        self.base_scan_id = base_scan_id
+        self.last_blob = after
+        self.unchanged_count = 0
+        self.written_count = 0
+        self.deleted_count = 0
+        self._deleted = []
+
+        self._conn = connect(db_path, check_same_thread=False)
+        self._base = iter_effective(
+            self._conn, base_scan_id, ('blob_path', 'etag', 'last_modified', 'file_size'), after
+        )
+        self._next = next(self._base, None)
+
+    def changed(self, record):
+        """Whether a listed blob must be written (new or changed since the base)"""
+        path = record['blob_path']
+        while self._next is not None and self._next[0] < path:
+            self._delete(self._next[0])
+        self.last_blob = path
+
+        if self._next is not None and self._next[0] == path:
+            _, etag, last_modified, file_size = self._next
+            self._next = next(self._base, None)
+            if self._same(record, etag, last_modified, file_size):
+                self.unchanged_count += 1
+                return False
+
+        self.written_count += 1
+        return True
+
+    @staticmethod
+    def _same(record, etag, last_modified, file_size):
+        if etag and record.get('etag'):
+            return etag == record['etag']
+        return last_modified == record['last_modified'] and file_size == record['file_size']
+
+    def _delete(self, path):
+        self._deleted.append((self.scan_id, path))
+        self.deleted_count += 1
+        self._next = next(self._base, None)
+
+    def finish(self):
+        """The listing is complete: every base blob not reached was deleted"""
+        while self._next is not None:
+            self._delete(self._next[0])
+
+    def state(self):
+        """Checkpoint state to resume the merge from"""
+        return {'last_blob': self.last_blob}
+
+    def commit(self):
+        """Write the deleted blobs found so far"""
+        deleted, self._deleted = self._deleted, []
+        if not deleted:
+            return
+        database(self.db_path).execute_many(
+            "INSERT OR IGNORE INTO azure_deleted (scan_id, blob_path) VALUES (?, ?)", deleted
+        )
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,176 @@
+"""
+Partitioned Azure Listing
+Lists a container as prefix shards across a thread pool so throughput is not
+bound by the round-trip latency of one sequential paged stream
+"""
+import os
+import queue
+import threading
+
+# Default listing threads (1 = one sequential listing) - overridable from the environment
+LIST_WORKERS = int(os.getenv("AZURE_LIST_WORKERS", "1"))
+
+# Shard of the blobs directly under the container root; listing it also
+# discovers the top-level virtual directories
+ROOT_SHARD = ''
+
+
+class PartitionedLister:
+    """
+    List a container as prefix shards on a pool of threads and yield blobs
+
+    Without caller-supplied prefixes, the root shard is listed hierarchically
+    (walk_blobs with a delimiter): blobs directly under the root are yielded
+    and every top-level virtual directory is queued as a shard as soon as it
+    is found. Each shard is then listed flat (list_blobs(name_starts_with=...))
+    by whichever worker is free. Pages go through a bounded queue, so a slow
+    consumer holds back the listing threads.
+
+    Directory marker blobs (names ending with the delimiter) are skipped.
+
+    With a checkpoint, a shard is marked done once all of its blobs have been
+    handed to the consumer, and shards already done are not listed again.
+
+    Args:
+        container_client: Sync ContainerClient (shared by the listing threads)
+        workers: Number of listing threads (defaults to AZURE_LIST_WORKERS)
+        prefixes: Shards to list (must not overlap); None discovers them
+        stop_flag: Callable that returns True if the listing should stop
+        checkpoint: Optional Checkpoint to resume from and mark progress on
+        delimiter: Virtual directory separator
+        max_pending_pages: Bound on pages waiting for the consumer (backpressure)
+    """
+
+    def __init__(self, container_client, workers=None, prefixes=None, stop_flag=None,
+                 checkpoint=None, delimiter='/', max_pending_pages=64):
+        self.container_client = container_client
+        self.workers = max(1, workers or LIST_WORKERS)
+        self.stop_flag = stop_flag
+        self.checkpoint = checkpoint
+        self.delimiter = delimiter
+
+        state = checkpoint.state if checkpoint is not None and checkpoint.state.get('partitioned') else {}
+        self.shards_done = set(state.get('shards_done', []))
+        if prefixes:
+            self.shards = [prefix for prefix in prefixes if prefix]
+        else:
+            # Known once the root shard is done; until then it is rediscovered
+            self.shards = state.get('shards') if ROOT_SHARD in self.shards_done else None
+        self.files_listed = checkpoint.files_committed if checkpoint is not None else 0
+
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._closed = threading.Event()
+        self._results = queue.Queue(maxsize=max_pending_pages)
+
+    def __iter__(self):
+        if self.shards is None:
+            self._push(ROOT_SHARD)
+        else:
+            for shard in self.shards:
+                if shard not in self.shards_done:
+                    self._push(shard)
+        if not self._pending:
+            return
+
+        threads = [
+            threading.Thread(target=self._worker, daemon=True)
+            for _ in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                try:
+                    item = self._results.get(timeout=0.1)
+                except queue.Empty:
+                    if self.stop_flag and self.stop_flag():
+                        break
+                    continue
+                if item is None:
+                    break
+                if type(item) is tuple:
+                    self._shard_done(*item)
+                    continue
+                self.files_listed += len(item)
+                yield from item
+        finally:
+            self._closed.set()
+            for _ in threads:
+                self._tasks.put(None)
+            for thread in threads:
+                thread.join()
+
+    def _shard_done(self, shard, found, error):
+        """Consumer side: every blob of shard has been handed over (or it failed)"""
+        if error is not None:
+            raise error
+        self.shards_done.add(shard)
+        if found is not None:
+            self.shards = found
+        if self.checkpoint is not None:
+            self.checkpoint.mark(
+                partitioned=True,
+                workers=self.workers,
+                shards=self.shards,
+                shards_done=sorted(self.shards_done),
+                files_listed=self.files_listed
+            )
+
+    def _push(self, shard):
+        with self._lock:
+            self._pending += 1
+        self._tasks.put(shard)
+
+    def _worker(self):
+        while not self._closed.is_set():
+            shard = self._tasks.get()
+            if shard is None:
+                return
+            try:
+                if not (self.stop_flag and self.stop_flag()):
+                    self._list_shard(shard)
+            except Exception as e:
+                self._emit((shard, None, e))
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    finished = self._pending == 0
+                if finished:
+                    self._emit(None)
+
+    def _list_shard(self, shard):
+        found = None
+        if shard == ROOT_SHARD:
+            found = []
+            pages = self.container_client.walk_blobs(delimiter=self.delimiter).by_page()
+        else:
+            pages = self.container_client.list_blobs(name_starts_with=shard).by_page()
+
+        for page in pages:
+            if self.stop_flag and self.stop_flag():
+                return
+            blobs = []
+            for item in page:
+                if item.name.endswith(self.delimiter):
+                    # A virtual directory (hierarchical listing) or a marker blob
+                    if found is not None:
+                        found.append(item.name)
+                        if item.name not in self.shards_done:
+                            self._push(item.name)
+                    continue
+                blobs.append(item)
+            if blobs:
+                self._emit(blobs)
+
+        self._emit((shard, found, None))
+
+    def _emit(self, item):
+        while not self._closed.is_set():
+            try:
+                self._results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
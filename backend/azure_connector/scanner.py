@@ -4,6 +4,7 @@ Scans Azure Blob Storage containers and collects file metadata
 """
 from datetime import datetime
 import mimetypes
+from .listing import LIST_WORKERS, PartitionedLister
 
 
 def get_file_type(filename):
@@ -37,68 +38,139 @@ def is_ocr_eligible(file_type):
     return file_type in ['pdf', 'image', 'office']
 
 
-def scan_azure_blob(connection_string, container_name, stop_flag=None):
+def iter_azure_blob(connection_string, container_name, stop_flag=None, checkpoint=None,
+                    workers=None, prefixes=None, delta=None):
     """
-    Scan Azure Blob Storage container and return file metadata
+    Scan Azure Blob Storage container and yield file metadata page by page
+    
+    With workers > 1 or prefixes, the container is listed as prefix shards
+    in parallel (see listing.PartitionedLister); blobs then arrive in no
+    particular order.
+    
+    With a delta (see delta.BlobDelta), only blobs new or changed since its
+    base scan are yielded. The merge against the base needs blobs in name
+    order, so delta scans are always listed sequentially.
     
     Args:
         connection_string: Azure storage account connection string
         container_name: Name of blob container to scan
         stop_flag: Callable that returns True if scan should stop
+        checkpoint: Optional Checkpoint; listing starts at its continuation
+            token (or skips finished shards), and progress is marked after
+            each fully handed-over page (or shard)
+        workers: Number of listing threads (defaults to AZURE_LIST_WORKERS)
+        prefixes: Optional non-overlapping prefix shards (default: discover
+            the top-level virtual directories)
+        delta: Optional BlobDelta filtering out blobs unchanged since its base scan
         
-    Returns:
-        List of file dictionaries with metadata
+    Yields:
+        File dictionaries with metadata
     """
     try:
         from azure.storage.blob import BlobServiceClient
     except ImportError:
         raise ImportError("Azure SDK not installed. Run: pip install azure-storage-blob")
     
-    files = []
+    count = 0
     
     try:
         # Connect to blob service
         blob_service_client = BlobServiceClient.from_connection_string(connection_string)
         container_client = blob_service_client.get_container_client(container_name)
         
+        # Resumed partitioned listings stay partitioned
+        resumed = checkpoint.state if checkpoint is not None else {}
+        workers = workers or resumed.get('workers') or LIST_WORKERS
+        if delta is None and (workers > 1 or prefixes or resumed.get('partitioned')):
+            listing = iter(PartitionedLister(container_client, workers, prefixes, stop_flag, checkpoint))
+            for blob in listing:
+                # Check stop flag periodically (every 10 files)
+                if stop_flag and stop_flag() and count % 10 == 0:
+                    print(f"Azure scan stopped by user after processing {count} files")
+                    listing.close()
+                    return
+                
+                count += 1
+                yield build_blob_record(blob, container_name)
+            return
+        
         # List all blobs
         blobs = container_client.list_blobs()
         
-        for blob in blobs:
-            # Check stop flag periodically (every 10 files)
-            if stop_flag and stop_flag() and len(files) % 10 == 0:
-                print(f"Azure scan stopped by user after processing {len(files)} files")
-                return files
+        pager = None
+        pages = [blobs]
+        if checkpoint is not None:
+            if checkpoint.state.get('finished'):
+                return
+            count = checkpoint.state.get('files_listed', 0)
+            pager = blobs.by_page(continuation_token=checkpoint.state.get('continuation_token'))
+            pages = pager
+        
+        for page in pages:
+            for blob in page:
+                # Check stop flag periodically (every 10 files)
+                if stop_flag and stop_flag() and count % 10 == 0:
+                    print(f"Azure scan stopped by user after processing {count} files")
+                    return
+                    
+                # Skip if it's a directory
+                if blob.name.endswith('/'):
+                    continue
                 
-            # Skip if it's a directory
-            if blob.name.endswith('/'):
-                continue
-            
-            # Get file type
-            file_type = get_file_type(blob.name)
-            mime_type = get_mime_type(blob.name)
-            ocr_eligible = is_ocr_eligible(file_type)
+                count += 1
+                record = build_blob_record(blob, container_name)
+                if delta is not None and not delta.changed(record):
+                    continue
+                yield record
             
-            # Create file record
-            file_record = {
-                'file_name': blob.name.split('/')[-1],
-                'file_path': f"azure://{container_name}/{blob.name}",
-                'blob_path': blob.name,
-                'file_type': file_type,
-                'mime_type': mime_type,
-                'file_size': blob.size,
-                'last_modified': blob.last_modified.isoformat() if blob.last_modified else None,
-                'storage_type': 'azure_blob',
-                'eligible_for_ocr': ocr_eligible,
-                'container': container_name
-            }
-            
-            files.append(file_record)
+            if pager is not None:
+                # Every blob of the page has been handed over: resume after it
+                checkpoint.mark(
+                    continuation_token=pager.continuation_token,
+                    files_listed=count,
+                    finished=not pager.continuation_token,
+                    **(delta.state() if delta is not None else {})
+                )
         
     except Exception as e:
         raise Exception(f"Failed to scan Azure container: {str(e)}")
+
+
+def build_blob_record(blob, container_name):
+    """Create a file record from a listed blob"""
+    # Get file type
+    file_type = get_file_type(blob.name)
+    mime_type = get_mime_type(blob.name)
+    ocr_eligible = is_ocr_eligible(file_type)
     
-    return files
+    return {
+        'file_name': blob.name.split('/')[-1],
+        'file_path': f"azure://{container_name}/{blob.name}",
+        'blob_path': blob.name,
+        'file_type': file_type,
+        'mime_type': mime_type,
+        'file_size': blob.size,
+        'last_modified': blob.last_modified.isoformat() if blob.last_modified else None,
+        'etag': getattr(blob, 'etag', None),
+        'storage_type': 'azure_blob',
+        'eligible_for_ocr': ocr_eligible,
+        'container': container_name
+    }
+
+
+def scan_azure_blob(connection_string, container_name, stop_flag=None):
+    """
+    Scan Azure Blob Storage container and return file metadata
+    
+    Args:
+        connection_string: Azure storage account connection string
+        container_name: Name of blob container to scan
+        stop_flag: Callable that returns True if scan should stop
+        
+    Returns:
+        List of file dictionaries with metadata
+    """
+    return list(iter_azure_blob(connection_string, container_name, stop_flag))
 
 
 def get_summary(files):
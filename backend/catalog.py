@@ -0,0 +1,380 @@
+"""
+Unified File Catalog
+One scans table and one files table for every source (local, Azure, shared),
+with the strings repeated on every file row stored once in dictionary tables
+"""
+import os
+import sqlite3
+from .db import add_column, database, tree_ids
+
+# Same scanner.db the connectors keep their scan records in
+SCANS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scanner.db')
+
+# Dictionary-encoded catalog_files columns -> side table holding their strings
+DICTIONARIES = {
+    'dir_id': 'catalog_dirs',
+    'type_id': 'catalog_file_types',
+    'ext_id': 'catalog_extensions',
+    'mime_id': 'catalog_mime_types',
+    'storage_id': 'catalog_storage_types',
+    'container_id': 'catalog_containers',
+}
+
+# Dictionaries holding paths as a directory tree (see db.tree_ids)
+TREES = {'catalog_dirs'}
+
+# Directory separator of local and shared paths (Azure blob paths always use '/')
+SEP = os.sep
+
+
+def init_scans(cursor):
+    """Create the unified scans table (in scanner.db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_scans (
+            id TEXT PRIMARY KEY,
+            source_type TEXT NOT NULL,
+            name TEXT,
+            location TEXT,
+            account TEXT,
+            status TEXT,
+            total_files INTEGER,
+            total_size INTEGER,
+            start_time TEXT,
+            end_time TEXT,
+            base_scan_id TEXT
+        )
+    ''')
+    # Newest-first listings, across sources or of one source
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_scans_start
+        ON catalog_scans (start_time)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_scans_source_start
+        ON catalog_scans (source_type, start_time)
+    ''')
+
+
+def init_files(cursor):
+    """Create the unified files table and its dictionaries (in files.db)"""
+    # Directories from before the tree get linked (and their files' paths
+    # compacted) once, when the tree columns are added
+    upgrade = _is_table(cursor, 'catalog_dirs') and not _has_column(cursor, 'catalog_dirs', 'parent_id')
+    for table in DICTIONARIES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                value TEXT NOT NULL UNIQUE
+            )
+        ''')
+    # Directory tree: each directory links to its parent and keeps its own
+    # name; value (the full path, stored once per directory rather than once
+    # per file) makes a subtree one range of the UNIQUE index
+    add_column(cursor, 'catalog_dirs', 'parent_id', 'INTEGER')
+    add_column(cursor, 'catalog_dirs', 'name', 'TEXT')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_dirs_parent
+        ON catalog_dirs (parent_id, name)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_id TEXT,
+            file_name TEXT,
+            file_path TEXT,
+            dir_id INTEGER,
+            type_id INTEGER,
+            ext_id INTEGER,
+            mime_id INTEGER,
+            storage_id INTEGER,
+            container_id INTEGER,
+            file_size INTEGER,
+            last_modified TEXT,
+            eligible_for_ocr BOOLEAN,
+            etag TEXT
+        )
+    ''')
+    # Full content hash of files that may have duplicates (see hashing.py)
+    add_column(cursor, 'catalog_files', 'content_hash', 'TEXT')
+    # Per-scan listing in file_name order (keyset pagination)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_scan_name
+        ON catalog_files (scan_id, file_name, id)
+    ''')
+    # Per-directory lookups (incremental scans)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_scan_dir
+        ON catalog_files (scan_id, dir_id)
+    ''')
+    # Path-ordered reads of an Azure scan (delta merge-joins, newer-row lookups);
+    # partial, so local and shared rows do not pay for it. Queries must filter
+    # on container_id IS NOT NULL (the azure_files view does) to use it.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_scan_path
+        ON catalog_files (scan_id, file_path) WHERE container_id IS NOT NULL
+    ''')
+    # Server-side filters (see search.py): the rows of one type, extension,
+    # size range or modified-date range of a scan are one index range
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_scan_type
+        ON catalog_files (scan_id, type_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_scan_ext
+        ON catalog_files (scan_id, ext_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_scan_size
+        ON catalog_files (scan_id, file_size)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_scan_modified
+        ON catalog_files (scan_id, last_modified)
+    ''')
+    # Duplicate groups of a scan; partial, as most rows are never hashed
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_catalog_files_scan_hash
+        ON catalog_files (scan_id, content_hash) WHERE content_hash IS NOT NULL
+    ''')
+    if upgrade:
+        link_dirs(cursor)
+        compact_paths(cursor)
+
+
+def extension_of(file_name):
+    """Lowercase extension without the dot ('unknown' if there is none), as shared scans record it"""
+    return os.path.splitext(file_name or '')[1].lower().lstrip('.') or 'unknown'
+
+
+def stored_path(file_path, dir_path, file_name):
+    """
+    file_path as stored in catalog_files: None when the view rebuilds it
+    exactly from its directory and name, else the path itself (e.g. a
+    browser-relative path with no directory)
+    """
+    if None not in (file_path, dir_path, file_name) and dir_path.rstrip(SEP) + SEP + file_name == file_path:
+        return None
+    return file_path
+
+
+# Inverse of stored_path, over the view's catalog_dirs join
+REBUILT_PATH_SQL = f"COALESCE(t.file_path, rtrim(d_dir_id.value, '{SEP}') || '{SEP}' || t.file_name)"
+
+
+def view_sql(table, columns, where=None, rebuild_paths=False):
+    """
+    SELECT presenting catalog columns under a connector's own column names
+
+    Dictionary-encoded catalog_files columns (see DICTIONARIES) are decoded
+    through LEFT JOINs on their side table's primary key; SQLite drops the
+    joins a query does not use, so reads through the view cost the same as
+    reads of the catalog table.
+
+    Args:
+        table: catalog_scans or catalog_files
+        columns: Sequence of (connector column, catalog column)
+        where: Optional filter (e.g. the source_type of a scans view)
+        rebuild_paths: file_path is rebuilt from the directory and file name
+            where it is not stored (see stored_path)
+    """
+    selects, joins = [], []
+    for name, column in columns:
+        side = DICTIONARIES.get(column) if table == 'catalog_files' else None
+        if side:
+            selects.append(f"d_{column}.value AS {name}")
+        elif column == 'file_path' and rebuild_paths:
+            side = DICTIONARIES['dir_id']
+            column = 'dir_id'
+            selects.append(f"{REBUILT_PATH_SQL} AS {name}")
+        else:
+            selects.append(f"t.{column} AS {name}")
+            continue
+        join = f"LEFT JOIN {side} d_{column} ON d_{column}.id = t.{column}"
+        if join not in joins:
+            joins.append(join)
+    sql = f"SELECT {', '.join(selects)} FROM {table} t {' '.join(joins)}"
+    return f"{sql} WHERE {where}" if where else sql
+
+
+def replace_view(cursor, name, select_sql):
+    """(Re)create a view, so a changed definition takes effect on the next start"""
+    cursor.execute(f"DROP VIEW IF EXISTS {name}")
+    cursor.execute(f"CREATE VIEW {name} AS {select_sql}")
+
+
+def subtree_filter(scan_id, dir_path, sep=SEP, id_column='id'):
+    """
+    WHERE clause (and params) selecting a scan's rows under dir_path, in
+    place of a view's scan_id = ? filter
+
+    The directories are one range of catalog_dirs' value index (dir_path up
+    to the next possible prefix, less look-alike siblings such as
+    dir_path + '-old'), and each one's files a seek on (scan_id, dir_id), so
+    the cost follows the size of the subtree, not of the scan.
+
+    Args:
+        scan_id: Scan the rows are read from
+        dir_path: Root of the subtree
+        sep: Path separator of the scan's source
+        id_column: The view's row id column (qualified if needed)
+    """
+    base = dir_path.rstrip(sep)
+    # CROSS JOIN keeps the directory range as the outer loop
+    sql = f'''{id_column} IN (
+        SELECT sf.id FROM catalog_dirs sd
+        CROSS JOIN catalog_files sf ON sf.scan_id = ? AND sf.dir_id = sd.id
+        WHERE sd.value >= ? AND sd.value < ? AND (sd.value = ? OR substr(sd.value, ?, 1) = ?)
+    )'''
+    return sql, [scan_id, base, base + chr(ord(sep) + 1), base, len(base) + 1, sep]
+
+
+def _is_table(cursor, name):
+    row = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def _has_column(cursor, table, column):
+    return any(row[1] == column for row in cursor.execute(f"PRAGMA table_info({table})"))
+
+
+def link_dirs(cursor):
+    """Link catalog_dirs rows added as plain values (no name yet) into the tree"""
+    paths = [row[0] for row in cursor.execute("SELECT value FROM catalog_dirs WHERE name IS NULL").fetchall()]
+    for path in paths:
+        parent = os.path.dirname(path)
+        parent_id = None if parent == path else tree_ids(cursor, 'catalog_dirs', [parent])[parent]
+        cursor.execute(
+            "UPDATE catalog_dirs SET parent_id = ?, name = ? WHERE value = ?",
+            (parent_id, os.path.basename(path) or path, path)
+        )
+
+
+def compact_paths(cursor):
+    """Drop the stored file_path of local and shared rows the views can rebuild"""
+    cursor.execute(f'''
+        UPDATE catalog_files SET file_path = NULL
+        WHERE container_id IS NULL AND file_path IS NOT NULL AND file_path = (
+            SELECT rtrim(d.value, '{SEP}') || '{SEP}' || catalog_files.file_name
+            FROM catalog_dirs d WHERE d.id = catalog_files.dir_id
+        )
+    ''')
+
+
+def migrate_table(cursor, table, catalog_table, columns, fixed=None):
+    """
+    Move a connector's legacy table into the catalog, then drop it
+
+    Runs once: afterwards the connector's name is a view. Legacy columns the
+    old table never got (older schema versions) are left NULL. Dictionary
+    columns are encoded in SQL, and rows keep their relative insert order.
+
+    Args:
+        cursor: Cursor on the database holding both tables
+        table: Legacy table (nothing happens if it is not a table)
+        catalog_table: catalog_scans or catalog_files
+        columns: Sequence of (legacy column, catalog column), as for view_sql
+        fixed: Optional {catalog column: value} set on every moved row
+
+    Returns:
+        True if rows were moved
+    """
+    if not _is_table(cursor, table):
+        return False
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    targets, selects, params = [], [], []
+    for legacy, column in columns:
+        if legacy not in existing or (catalog_table == 'catalog_files' and column == 'id'):
+            continue
+        side = DICTIONARIES.get(column) if catalog_table == 'catalog_files' else None
+        if side:
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO {side} (value)
+                SELECT DISTINCT {legacy} FROM {table} WHERE {legacy} IS NOT NULL
+            ''')
+            selects.append(f"(SELECT id FROM {side} WHERE value = legacy.{legacy})")
+        else:
+            selects.append(f"legacy.{legacy}")
+        targets.append(column)
+    for column, value in (fixed or {}).items():
+        targets.append(column)
+        selects.append('?')
+        params.append(value)
+
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO {catalog_table} ({', '.join(targets)})
+        SELECT {', '.join(selects)} FROM {table} legacy ORDER BY legacy.rowid
+    ''', params)
+    cursor.execute(f"DROP TABLE {table}")
+    if catalog_table == 'catalog_files':
+        link_dirs(cursor)
+        compact_paths(cursor)
+    return True
+
+
+# Fields of a scan as get_all_scans / get_scan return them
+SCAN_FIELDS = '''id, source_type AS storage_type, name, location, account, status,
+               total_files, total_size, start_time, end_time, base_scan_id'''
+
+# Keys each source's scans were returned with before the catalog, and the field each copies
+LEGACY_SCAN_FIELDS = {
+    'local': {'folder_path': 'location'},
+    'azure': {'container_name': 'location', 'storage_account': 'account'},
+    'shared': {'scan_name': 'name', 'share_path': 'location', 'share_name': 'account',
+               'created_at': 'start_time', 'completed_at': 'end_time'},
+}
+
+
+def _scan_dict(row):
+    """Scan dictionary of a row, with its source's legacy keys too"""
+    scan = dict(row)
+    for legacy, field in LEGACY_SCAN_FIELDS.get(scan['storage_type'], {}).items():
+        scan[legacy] = scan[field]
+    return scan
+
+
+def get_all_scans(source_type=None, limit=100, offset=0):
+    """
+    Scans of every source (or of one), newest first, in one indexed query
+
+    Returns:
+        List of scan dictionaries with the same fields for every source:
+        storage_type, location (folder, container or share path) and account
+        (storage account or share name), plus the keys the source's scans
+        had before (LEGACY_SCAN_FIELDS, e.g. folder_path or share_name)
+    """
+    query = f"SELECT {SCAN_FIELDS} FROM catalog_scans"
+    params = []
+    if source_type:
+        query += " WHERE source_type = ?"
+        params.append(source_type)
+    query += " ORDER BY start_time DESC LIMIT ? OFFSET ?"
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        rows = conn.execute(query, params + [limit, offset]).fetchall()
+    return [_scan_dict(row) for row in rows]
+
+
+def count_scans(source_type=None):
+    """Number of scans of every source (or of one)"""
+    query = "SELECT COUNT(*) FROM catalog_scans"
+    params = []
+    if source_type:
+        query += " WHERE source_type = ?"
+        params.append(source_type)
+    with database(SCANS_DB).read() as conn:
+        return conn.execute(query, params).fetchone()[0]
+
+
+def get_scan(scan_id):
+    """One scan of any source (fields as for get_all_scans), or None"""
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        row = conn.execute(f"SELECT {SCAN_FIELDS} FROM catalog_scans WHERE id = ?", (scan_id,)).fetchone()
+    return _scan_dict(row) if row else None
+
+
+def get_source_type(scan_id):
+    """Source of a scan ('local', 'azure' or 'shared'), or None if it does not exist"""
+    with database(SCANS_DB).read() as conn:
+        row = conn.execute("SELECT source_type FROM catalog_scans WHERE id = ?", (scan_id,)).fetchone()
+    return row[0] if row else None
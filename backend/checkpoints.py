@@ -0,0 +1,107 @@
+"""
+Scan checkpoints
+Progress saved with each committed batch so an interrupted scan can resume
+"""
+import json
+from datetime import datetime
+from .db import database
+
+
+def init_tables(cursor):
+    """Create the checkpoint table (in files.db, next to the file rows)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_checkpoints (
+            scan_id TEXT PRIMARY KEY,
+            source_type TEXT NOT NULL,
+            state TEXT,
+            files_committed INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+    ''')
+
+
+def load(db_path, scan_id):
+    """Read a scan's checkpoint, or None if it has none"""
+    with database(db_path).read() as conn:
+        row = conn.execute(
+            "SELECT source_type, state, files_committed, updated_at FROM scan_checkpoints WHERE scan_id = ?",
+            (scan_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {
+        'scan_id': scan_id,
+        'source_type': row[0],
+        'state': json.loads(row[1]) if row[1] else {},
+        'files_committed': row[2],
+        'updated_at': row[3]
+    }
+
+
+def clear(db_path, scan_id):
+    """Drop a scan's checkpoint once it has completed"""
+    database(db_path).execute("DELETE FROM scan_checkpoints WHERE scan_id = ?", (scan_id,))
+
+
+class Checkpoint:
+    """
+    Scan progress, saved after every committed batch
+
+    The scanner calls mark() at points it could resume from (a finished listing
+    page, a finished directory). It does so from the consumer side of its
+    generator, after yielding every record before that point, so once the
+    pipeline commits the current batch the marked state is safe to resume
+    from. wrap() gives ingest a save_files that commits the batch, runs the
+    on_commit hooks and then saves the checkpoint.
+
+    Args:
+        db_path: Path of files.db
+        scan_id: Scan being checkpointed
+        source_type: 'local', 'azure' or 'shared'
+        state: State to resume from (from a previous checkpoint)
+        files_committed: Rows committed before a resume
+        on_commit: Callables run after each committed batch, before the checkpoint is saved
+    """
+
+    def __init__(self, db_path, scan_id, source_type, state=None, files_committed=0, on_commit=()):
+        self.db_path = db_path
+        self.scan_id = scan_id
+        self.source_type = source_type
+        self.state = dict(state or {})
+        self.files_committed = files_committed
+        self.on_commit = list(on_commit)
+        self._marked = dict(self.state)
+
+    @classmethod
+    def resume(cls, db_path, scan_id, source_type, on_commit=()):
+        """Checkpoint continuing from the one saved for scan_id (empty if none was saved)"""
+        saved = load(db_path, scan_id) or {}
+        return cls(
+            db_path, scan_id, source_type,
+            state=saved.get('state'),
+            files_committed=saved.get('files_committed', 0),
+            on_commit=on_commit
+        )
+
+    def mark(self, **state):
+        """Record a resumable point; saved with the next committed batch"""
+        self._marked = state
+
+    def wrap(self, save_files):
+        """save_files(scan_id, batch) that checkpoints after committing the batch"""
+        def save_batch(scan_id, batch):
+            save_files(scan_id, batch)
+            self.commit(len(batch))
+        return save_batch
+
+    def commit(self, count=0):
+        """Save the checkpoint after count more rows were committed"""
+        self.files_committed += count
+        for hook in self.on_commit:
+            hook()
+        self.state = self._marked
+        database(self.db_path).execute('''
+            INSERT OR REPLACE INTO scan_checkpoints (scan_id, source_type, state, files_committed, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (self.scan_id, self.source_type, json.dumps(self.state),
+              self.files_committed, datetime.now().isoformat()))
@@ -0,0 +1,229 @@
+"""
+Columnar Scan Snapshots
+Freezes a completed scan into a Parquet file next to files.db, so analytics over it
+(size by type, largest files, age histograms) are vectorized scans of a few columns
+"""
+import os
+from datetime import datetime, timedelta
+from . import catalog, export
+
+# Snapshot directory (default: beside files.db)
+SNAPSHOT_DIR = os.getenv("COLUMNAR_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'columnar')
+
+# Columns a snapshot can be grouped by (all dictionary-encoded)
+GROUP_COLUMNS = ('file_type', 'extension', 'mime_type')
+
+# Upper bounds (inclusive, in days) of the age histogram buckets; the last bucket is open
+AGE_BUCKET_DAYS = [30, 90, 180, 365, 730, 1825]
+AGE_BUCKET_LABELS = ['<= 30 days', '<= 90 days', '<= 6 months', '<= 1 year', '<= 2 years', '<= 5 years', '> 5 years']
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("pyarrow not installed. Run: pip install pyarrow")
+    return pyarrow, pyarrow.compute, pyarrow.parquet
+
+
+def _schema(pa):
+    strings = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('file_name', pa.string()),
+        ('file_path', pa.string()),
+        ('file_type', strings),
+        ('extension', strings),
+        ('mime_type', strings),
+        ('file_size', pa.int64()),
+        ('last_modified', pa.timestamp('us')),
+        ('eligible_for_ocr', pa.bool_()),
+    ])
+
+
+def snapshot_path(scan_id):
+    return os.path.join(SNAPSHOT_DIR, f"{scan_id}.parquet")
+
+
+def has_snapshot(scan_id):
+    return os.path.exists(snapshot_path(scan_id))
+
+
+def _timestamp(value):
+    """ISO timestamp -> naive local datetime (None if missing or unparseable)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def _table(pa, schema, columns, chunk):
+    """One chunk of export rows -> a table in the snapshot schema"""
+    values = dict(zip(columns, zip(*chunk)))
+    count = len(chunk)
+    names = values['file_name']
+    if 'extension' in values:
+        extensions = [(e or '').lower().lstrip('.') or 'unknown' for e in values['extension']]
+    else:
+        extensions = [catalog.extension_of(name) for name in names]
+    arrays = {
+        'file_name': names,
+        'file_path': values.get('file_path', [None] * count),
+        'file_type': values.get('file_type', [None] * count),
+        'extension': extensions,
+        'mime_type': values.get('mime_type', [None] * count),
+        'file_size': values.get('file_size', [None] * count),
+        'last_modified': [_timestamp(v) for v in values.get('last_modified', [None] * count)],
+        'eligible_for_ocr': [None if v is None else bool(v) for v in values.get('eligible_for_ocr', [None] * count)],
+    }
+    return pa.Table.from_arrays([
+        pa.array(arrays[field.name], type=pa.string()).dictionary_encode()
+        if pa.types.is_dictionary(field.type) else pa.array(arrays[field.name], type=field.type)
+        for field in schema
+    ], schema=schema)
+
+
+def freeze(files_db, queries, scan_id, rename=None):
+    """
+    Write a scan's file rows to its Parquet snapshot
+
+    The rows are read a chunk at a time (one row group each) into a
+    temporary file, which then replaces any earlier snapshot, so readers
+    never see a partial one. Only completed scans should be frozen: the
+    snapshot is not updated when the rows change.
+
+    Args:
+        files_db: Database the queries run against
+        queries: The connector's export queries (see export.iter_chunks)
+        scan_id: Scan to freeze
+        rename: Optional {connector column: snapshot column} (e.g. blob_path -> file_path)
+
+    Returns:
+        {'scan_id', 'rows', 'bytes'} of the snapshot written
+    """
+    pa, _, pq = _pyarrow()
+    schema = _schema(pa)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(scan_id)
+    partial = f"{path}.partial"
+
+    chunks = export.iter_chunks(files_db, queries, scan_id)
+    columns = [(rename or {}).get(column, column) for column in next(chunks)]
+    rows = 0
+    writer = pq.ParquetWriter(partial, schema)
+    try:
+        for chunk in chunks:
+            writer.write_table(_table(pa, schema, columns, chunk))
+            rows += len(chunk)
+        writer.close()
+    except Exception:
+        writer.close()
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return {'scan_id': scan_id, 'rows': rows, 'bytes': os.path.getsize(path)}
+
+
+def _load(scan_id, columns, filters=None):
+    """Columns of a scan's snapshot, or None if it has not been frozen"""
+    if not has_snapshot(scan_id):
+        return None
+    _, _, pq = _pyarrow()
+    return pq.read_table(snapshot_path(scan_id), columns=columns, filters=filters)
+
+
+def size_by(scan_id, column='file_type'):
+    """
+    File count and total size per value of a dictionary column, largest total first
+
+    Returns:
+        List of {column: value, 'file_count', 'total_size'}, or None if the
+        scan has no snapshot
+    """
+    if column not in GROUP_COLUMNS:
+        raise ValueError(f"Cannot group by {column} (expected one of {', '.join(GROUP_COLUMNS)})")
+    table = _load(scan_id, [column, 'file_size'])
+    if table is None:
+        return None
+    pa, pc, _ = _pyarrow()
+    # Each row group has its own dictionary; grouping needs one
+    grouped = table.unify_dictionaries().group_by(column).aggregate([
+        ('file_size', 'count', pc.CountOptions(mode='all')),
+        ('file_size', 'sum'),
+    ]).sort_by([('file_size_sum', 'descending')])
+    return [
+        {column: row[column] or 'unknown', 'file_count': row['file_size_count'], 'total_size': row['file_size_sum'] or 0}
+        for row in grouped.to_pylist()
+    ]
+
+
+def largest(scan_id, n=100):
+    """
+    The n largest files, largest first
+
+    Only the size column is read in full: the other columns are read from
+    the row groups whose size statistics reach the n-th largest size.
+
+    Returns:
+        List of file dictionaries, or None if the scan has no snapshot
+    """
+    sizes = _load(scan_id, ['file_size'])
+    if sizes is None:
+        return None
+    if n <= 0 or sizes.num_rows == 0:
+        return []
+    pa, pc, _ = _pyarrow()
+    top = pc.select_k_unstable(sizes, n, sort_keys=[('file_size', 'descending')])
+    threshold = pc.min(sizes['file_size'].take(top)).as_py()
+
+    table = _load(
+        scan_id, ['file_name', 'file_path', 'file_type', 'file_size', 'last_modified'],
+        filters=[('file_size', '>=', threshold)] if threshold is not None else None
+    )
+    table = table.take(pc.select_k_unstable(table, n, sort_keys=[('file_size', 'descending')]))
+    files = table.sort_by([('file_size', 'descending'), ('file_path', 'ascending')]).to_pylist()
+    for file in files:
+        if file['last_modified'] is not None:
+            file['last_modified'] = file['last_modified'].isoformat()
+    return files
+
+
+def age_histogram(scan_id, now=None):
+    """
+    File count and total size per last-modified age bucket (see AGE_BUCKET_DAYS)
+
+    Files with no modification time are counted under 'unknown'.
+
+    Returns:
+        List of {'bucket', 'file_count', 'total_size'}, or None if the scan
+        has no snapshot
+    """
+    table = _load(scan_id, ['last_modified', 'file_size'])
+    if table is None:
+        return None
+    pa, pc, _ = _pyarrow()
+    age = pc.subtract(pa.scalar(now or datetime.now(), pa.timestamp('us')), table['last_modified'])
+    # Bucket index = number of bounds the age exceeds (null when the age is)
+    bucket = None
+    for days in AGE_BUCKET_DAYS:
+        exceeds = pc.cast(pc.greater(age, pa.scalar(timedelta(days=days), pa.duration('us'))), pa.int8())
+        bucket = exceeds if bucket is None else pc.add(bucket, exceeds)
+    grouped = pa.table({'bucket': bucket, 'file_size': table['file_size']}).group_by('bucket').aggregate([
+        ('file_size', 'count', pc.CountOptions(mode='all')),
+        ('file_size', 'sum'),
+    ])
+    counts = {row['bucket']: row for row in grouped.to_pylist()}
+
+    histogram = []
+    for i, label in enumerate(AGE_BUCKET_LABELS + ['unknown']):
+        row = counts.get(None if label == 'unknown' else i, {})
+        histogram.append({
+            'bucket': label,
+            'file_count': row.get('file_size_count', 0),
+            'total_size': row.get('file_size_sum') or 0
+        })
+    return histogram
@@ -0,0 +1,447 @@
+"""
+Shared SQLite helpers used by all connector databases
+"""
+import asyncio
+import base64
+import functools
+import json
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from operator import itemgetter
+from .aggregates import ScanAggregator
+
+# Dictionary ids remembered per side table by each BulkWriter (cleared when exceeded)
+DICTIONARY_CACHE_SIZE = 100000
+
+# Read connections kept open per database file - overridable from the environment
+READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL", "4"))
+
+# Write requests a database's writer thread commits in one transaction
+WRITE_BATCH = int(os.getenv("SQLITE_WRITE_BATCH", "64"))
+
+# Applied to every connection that writes file records, and to the pooled ones
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",  # 64 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT', '30000'))}",  # ms
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+)
+
+
+def connect(db_path, **options):
+    """Open a connection with the tuned PRAGMAs applied"""
+    conn = sqlite3.connect(db_path, **options)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class Database:
+    """
+    One SQLite file, shared by every thread of the process
+
+    Writes go through a single writer thread: write(fn) queues fn(conn) and
+    waits for its result. The writer runs every request queued meanwhile
+    (up to WRITE_BATCH) in one transaction, each in a savepoint so a failing
+    request is rolled back alone, and answers them once it has committed.
+    Threads never contend for the file lock, and a burst of small writes
+    costs one commit. A request must not commit (no conn.commit() or
+    `with conn`): its changes commit with the batch.
+
+    Reads use a pool of query-only connections (read()), opened once with
+    PRAGMAS; in WAL mode they do not wait for the writer.
+
+    Async code awaits blocking calls on the database through run(), on a
+    thread pool of its own sized like the read pool: a slow query holds one
+    of those threads, never the event loop, and never a thread serving
+    another database.
+
+    Args:
+        db_path: Path of the database file
+        pool_size: Read connections kept open (defaults to READ_POOL_SIZE)
+    """
+
+    def __init__(self, db_path, pool_size=None):
+        self.db_path = db_path
+        self.pool_size = max(1, pool_size or READ_POOL_SIZE)
+
+        self._pool = queue.LifoQueue()
+        self._opened = 0
+        self._requests = queue.Queue()
+        self._writer = None
+        self._executor = None
+        self._lock = threading.Lock()
+        # Opening the first read connection creates the file (WAL from then on)
+        self._pool.put(self._open_reader())
+        self.inode = os.stat(db_path).st_ino
+
+    @contextmanager
+    def read(self, row_factory=None):
+        """A pooled read connection (waits for one while all pool_size are in use)"""
+        conn = self._acquire()
+        conn.row_factory = row_factory
+        try:
+            yield conn
+        finally:
+            conn.row_factory = None
+            self._pool.put(conn)
+
+    def write(self, fn, *args):
+        """Run fn(conn, *args) on the writer thread, in a committed transaction, and return its result"""
+        if threading.current_thread() is self._writer:
+            # Already in the writer's transaction (a request writing more)
+            return fn(self._conn, *args)
+        future = Future()
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, daemon=True)
+                self._writer.start()
+        self._requests.put((future, fn, args))
+        return future.result()
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs), a blocking call using this database, on its executor (at most pool_size at once)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix='sqlite-run')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def execute(self, sql, params=()):
+        """Run one write statement through the writer and return its row count"""
+        return self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    def execute_many(self, sql, rows):
+        """Run one write statement for each row through the writer and return the row count"""
+        return self.write(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def close(self):
+        """Close the idle read connections and stop the writer after the queued requests"""
+        self._requests.put(None)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _open_reader(self):
+        conn = connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+        self._opened += 1
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.pool_size:
+                return self._open_reader()
+        return self._pool.get()
+
+    def _run(self):
+        self._conn = conn = connect(self.db_path, isolation_level=None)
+        try:
+            while True:
+                batch = [self._requests.get()]
+                while batch[-1] is not None and len(batch) < WRITE_BATCH:
+                    try:
+                        batch.append(self._requests.get_nowait())
+                    except queue.Empty:
+                        break
+                closing = batch[-1] is None
+                self._commit([request for request in batch if request is not None])
+                if closing:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, batch):
+        """Run a batch of requests in one transaction, then answer them"""
+        if not batch:
+            return
+        conn = self._conn
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, fn, args in batch:
+                conn.execute("SAVEPOINT request")
+                try:
+                    results.append((future, fn(conn, *args), None))
+                    conn.execute("RELEASE request")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO request")
+                    conn.execute("RELEASE request")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for future, _, _ in batch:
+                future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+# Database per file path, replaced when the file is
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def database(db_path):
+    """The process's Database of a file (a new one if the file was deleted and created again)"""
+    try:
+        inode = os.stat(db_path).st_ino
+    except FileNotFoundError:
+        inode = None
+    with _databases_lock:
+        db = _databases.get(db_path)
+        if db is None or db.inode != inode:
+            if db is not None:
+                db.close()
+            db = _databases[db_path] = Database(db_path)
+        return db
+
+
+class BulkWriter:
+    """
+    Prepared batch insert for one files table
+
+    The record -> column mapping is resolved once when the writer is created,
+    so writing a batch is a single executemany over a row iterator.
+
+    Args:
+        table: Table to insert into (must have a scan_id column)
+        columns: Sequence of (column, record_key) or (column, record_key, default).
+            Columns without a default read the key strictly (KeyError if missing).
+            record_key may also be a callable computing the value from the record.
+        aggregate: Optional (type_of, is_ocr) callables; when given, the scan's
+            materialized aggregates are updated in the same transaction.
+        dictionaries: Optional {column: side table}; those columns' string
+            values are stored as ids of their side table (see dictionary_ids).
+        trees: Side tables holding paths as a directory tree (see tree_ids)
+    """
+
+    def __init__(self, table, columns, aggregate=None, dictionaries=None, trees=()):
+        self.table = table
+        self.aggregate = aggregate
+        self.trees = set(trees)
+        # Plain keys first, so they are read by a single itemgetter
+        plain = [spec for spec in columns if len(spec) == 2 and not callable(spec[1])]
+        computed = [spec for spec in columns if not (len(spec) == 2 and not callable(spec[1]))]
+        columns = plain + computed
+        self.columns = [spec[0] for spec in columns]
+        # Positions in a row tuple (after scan_id) of the dictionary-encoded columns
+        self.encoded = [
+            (i + 1, dictionaries[column]) for i, column in enumerate(self.columns)
+            if dictionaries and column in dictionaries
+        ]
+        # Committed dictionary ids per database file; dictionary rows are never
+        # deleted, so a committed id stays valid for as long as the file exists
+        self._known_ids = {}
+
+        placeholders = ', '.join('?' * (len(self.columns) + 1))
+        self.sql = (
+            f"INSERT INTO {table} (scan_id, {', '.join(self.columns)}) "
+            f"VALUES ({placeholders})"
+        )
+
+        if len(plain) > 1:
+            plain_values = itemgetter(*[spec[1] for spec in plain])
+        elif plain:
+            key = plain[0][1]
+            plain_values = lambda record: (record[key],)
+        else:
+            plain_values = lambda record: ()
+
+        getters = []
+        for spec in computed:
+            if callable(spec[1]):
+                getters.append(spec[1])
+            else:
+                getters.append(lambda record, key=spec[1], default=spec[2]: record.get(key, default))
+
+        if getters:
+            self._values = lambda record: (*plain_values(record), *[getter(record) for getter in getters])
+        else:
+            self._values = plain_values
+
+    def rows(self, scan_id, records, aggregator=None):
+        """Yield parameter tuples for executemany"""
+        values = self._values
+        for record in records:
+            row = (scan_id, *values(record))
+            if aggregator:
+                aggregator.add(record)
+            yield row
+
+    def encode(self, conn, rows, known=None):
+        """
+        Replace the dictionary-encoded values of rows by their ids
+
+        Values in known ({table: {value: id}}, committed ids) are not looked up.
+
+        Returns:
+            (rows, {table: {value: id}} of the ids looked up)
+        """
+        rows = [list(row) for row in rows]
+        found = {}
+        for position, table in self.encoded:
+            cached = known.get(table, {}) if known else {}
+            lookup = tree_ids if table in self.trees else dictionary_ids
+            ids = found[table] = lookup(
+                conn, table, {row[position] for row in rows} - cached.keys() - {None}
+            )
+            for row in rows:
+                value = row[position]
+                if value is not None:
+                    row[position] = cached[value] if value in cached else ids[value]
+        return rows, found
+
+    def _remember(self, known, found):
+        """Cache ids looked up by a committed batch"""
+        for table, ids in found.items():
+            cached = known.setdefault(table, {})
+            if len(cached) + len(ids) > DICTIONARY_CACHE_SIZE:
+                cached.clear()
+            cached.update(ids)
+
+    def write(self, db_path, scan_id, records):
+        """Insert all records in one transaction of the database's writer (see Database) and return the row count"""
+        aggregator = ScanAggregator(*self.aggregate) if self.aggregate else None
+        db = database(db_path)
+        # Keyed by inode too: a recreated database starts with an empty cache
+        known = self._known_ids.setdefault((db_path, db.inode), {}) if self.encoded else None
+
+        def insert(conn):
+            rows = self.rows(scan_id, records, aggregator)
+            found = None
+            if self.encoded:
+                rows, found = self.encode(conn, rows, known)
+            count = conn.executemany(self.sql, rows).rowcount
+            if aggregator:
+                aggregator.save(conn, scan_id)
+            return count, found
+
+        count, found = db.write(insert)
+        # Committed: the ids looked up are valid from now on
+        if self.encoded:
+            self._remember(known, found)
+        return count
+
+
+def dictionary_ids(conn, table, values):
+    """
+    Ids of string values in a dictionary table (id, value UNIQUE), adding the new ones
+
+    Runs in the caller's transaction, so the ids commit with the rows using them.
+    """
+    values = list(values)
+    if not values:
+        return {}
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (value) VALUES (?)", ((value,) for value in values))
+    ids = {}
+    for start in range(0, len(values), 500):
+        chunk = values[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        ids.update(conn.execute(f"SELECT value, id FROM {table} WHERE value IN ({placeholders})", chunk))
+    return ids
+
+
+def tree_ids(conn, table, paths):
+    """
+    Ids of paths in a tree dictionary (id, value UNIQUE, parent_id, name), adding the new ones
+
+    A new path is added along with its missing ancestors, each linked to
+    its parent's id and named by its last component; a path whose parent
+    is itself (a root, or '') has no parent. Runs in the caller's
+    transaction, like dictionary_ids.
+
+    Returns:
+        {path: id}, including any ancestors that were added
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+    ids = {}
+    for start in range(0, len(paths), 500):
+        chunk = paths[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        ids.update(conn.execute(f"SELECT value, id FROM {table} WHERE value IN ({placeholders})", chunk))
+
+    # Shortest first, so siblings find their parent already added
+    for path in sorted(set(paths) - ids.keys(), key=len):
+        missing = []
+        while path not in ids:
+            parent = os.path.dirname(path)
+            missing.append((path, None if parent == path else parent))
+            if parent == path:
+                break
+            path = parent
+            if path not in ids:
+                row = conn.execute(f"SELECT id FROM {table} WHERE value = ?", (path,)).fetchone()
+                if row:
+                    ids[path] = row[0]
+        for path, parent in reversed(missing):
+            ids[path] = conn.execute(
+                f"INSERT INTO {table} (value, parent_id, name) VALUES (?, ?, ?)",
+                (path, ids.get(parent), os.path.basename(path) or path)
+            ).lastrowid
+    return ids
+
+
+def add_column(cursor, table, column, declaration):
+    """Add a column to an existing table if it is missing (schema migration)"""
+    existing = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column not in existing:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def trim_scan_files(conn, table, scan_id, keep):
+    """Delete a scan's rows after the first keep (in insert order), caller commits"""
+    if keep:
+        row = conn.execute(
+            f"SELECT id FROM {table} WHERE scan_id = ? ORDER BY id LIMIT 1 OFFSET ?",
+            (scan_id, keep - 1)
+        ).fetchone()
+        if row is None:
+            return
+        conn.execute(f"DELETE FROM {table} WHERE scan_id = ? AND id > ?", (scan_id, row[0]))
+    else:
+        conn.execute(f"DELETE FROM {table} WHERE scan_id = ?", (scan_id,))
+
+
+def encode_cursor(file_name, row_id):
+    """Build an opaque keyset pagination cursor from the last row of a page"""
+    raw = json.dumps([file_name, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return (file_name, row_id) from a cursor, or raise ValueError"""
+    try:
+        file_name, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(row_id, int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return file_name, row_id
+
+
+def next_cursor(files, limit):
+    """Cursor for the page after files, or None when this was the last page"""
+    if not files or len(files) < limit:
+        return None
+    return encode_cursor(files[-1]['file_name'], files[-1]['id'])
@@ -0,0 +1,205 @@
+"""
+Scan Diff
+Added, removed and modified files between two scans of the same source, found by
+merge-joining both scans' rows in path order: one pass, constant memory
+"""
+import base64
+import heapq
+import json
+from . import catalog
+from .db import connect
+
+# Kinds of change a diff reports (unchanged files are only counted)
+CHANGES = ('added', 'removed', 'modified')
+
+
+def tree_rows(conn, scan_id, after=None, incremental=False):
+    """
+    (key, file_path, file_size, last_modified, etag) of a local or shared
+    scan's files in key order, key being the directory, NUL, the file name
+
+    Directories come in order from catalog_dirs' value index and each one's
+    files are a seek on (scan_id, dir_id), so only one directory's rows are
+    sorted at a time. Files with no directory (stored paths) are merged in
+    as if their directory were ''.
+
+    Args:
+        conn: Connection to files.db
+        scan_id: Scan to read
+        after: Only rows with a greater key (resuming a diff)
+        incremental: Read each directory's rows from the scan its
+            dir_snapshots row names (local incremental scans)
+    """
+    after_dir, after_name = after.split('\0', 1) if after is not None else ('', None)
+    streams = []
+    if not after_dir and not incremental:
+        keyset = "AND t.file_name > ?" if after_name is not None else ""
+        streams.append(conn.execute(f'''
+            SELECT char(0) || t.file_name, t.file_path, t.file_size, t.last_modified, t.etag
+            FROM catalog_files t INDEXED BY idx_catalog_files_scan_dir
+            WHERE t.scan_id = ? AND t.dir_id IS NULL {keyset}
+            ORDER BY t.file_name
+        ''', [scan_id] + ([after_name] if after_name is not None else [])))
+
+    # Aliases as in the views, for REBUILT_PATH_SQL. INDEXED BY: for the ORDER BY
+    # the planner would rather walk (scan_id, file_name) once per directory.
+    if incremental:
+        files = '''CROSS JOIN dir_snapshots s ON s.scan_id = ? AND s.dir_path = d_dir_id.value
+            CROSS JOIN catalog_files t INDEXED BY idx_catalog_files_scan_dir
+                ON t.scan_id = s.source_scan_id AND t.dir_id = d_dir_id.id'''
+    else:
+        files = "CROSS JOIN catalog_files t INDEXED BY idx_catalog_files_scan_dir ON t.scan_id = ? AND t.dir_id = d_dir_id.id"
+    keyset, params = "", [scan_id]
+    if after is not None:
+        keyset = "WHERE d_dir_id.value >= ? AND (d_dir_id.value, t.file_name) > (?, ?)"
+        params += [after_dir, after_dir, after_name]
+    streams.append(conn.execute(f'''
+        SELECT d_dir_id.value || char(0) || t.file_name, {catalog.REBUILT_PATH_SQL},
+               t.file_size, t.last_modified, t.etag
+        FROM catalog_dirs d_dir_id
+        {files}
+        {keyset}
+        ORDER BY d_dir_id.value, t.file_name
+    ''', params))
+    return heapq.merge(*streams, key=lambda row: row[0])
+
+
+def encode_cursor(key):
+    """Opaque cursor resuming a diff after a row key"""
+    return base64.urlsafe_b64encode(json.dumps([key]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Row key of a diff cursor, or raise ValueError"""
+    try:
+        key, = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(key, str):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return key
+
+
+def _same(base, target):
+    """Unchanged: same etag when both rows have one, else same size and last_modified"""
+    if base[4] and target[4]:
+        return base[4] == target[4]
+    return base[2] == target[2] and base[3] == target[3]
+
+
+class ScanDiff:
+    """
+    Changes between two scans of one source
+
+    Both scans' rows are read in the same key order (a path order the
+    indexes give without a full sort) and merge-joined, so a diff of
+    millions of files streams in one pass with constant memory, and a page
+    resumes from its last key on both sides.
+
+    Args:
+        db_path: Path of files.db
+        rows: Callable (conn, scan_id, after) yielding a scan's
+            (key, file_path, file_size, last_modified, etag) rows in key order
+        base_scan_id: Older scan
+        target_scan_id: Newer scan
+    """
+
+    def __init__(self, db_path, rows, base_scan_id, target_scan_id):
+        self.db_path = db_path
+        self.rows = rows
+        self.base_scan_id = base_scan_id
+        self.target_scan_id = target_scan_id
+
+    def _merge(self, after=None):
+        """Yield (change, base row, target row) for every file of either scan, 'unchanged' included"""
+        # Streamed responses may be advanced from different worker threads
+        conn = connect(self.db_path, check_same_thread=False)
+        streams = []
+        try:
+            base = self.rows(conn, self.base_scan_id, after)
+            target = self.rows(conn, self.target_scan_id, after)
+            streams = [base, target]
+            b, t = next(base, None), next(target, None)
+            while b is not None or t is not None:
+                if t is None or (b is not None and b[0] < t[0]):
+                    yield 'removed', b, None
+                    b = next(base, None)
+                elif b is None or t[0] < b[0]:
+                    yield 'added', None, t
+                    t = next(target, None)
+                else:
+                    yield ('unchanged' if _same(b, t) else 'modified'), b, t
+                    b, t = next(base, None), next(target, None)
+        finally:
+            # Merged streams close their cursors, which needs the connection open
+            for stream in streams:
+                getattr(stream, 'close', lambda: None)()
+            conn.close()
+
+    @staticmethod
+    def _item(change, b, t):
+        return {
+            'change': change,
+            'file_path': (t or b)[1],
+            'old_size': b[2] if b else None,
+            'new_size': t[2] if t else None,
+            'old_modified': b[3] if b else None,
+            'new_modified': t[3] if t else None,
+            'old_etag': b[4] if b else None,
+            'new_etag': t[4] if t else None,
+        }
+
+    def changes(self, change=None, after=None):
+        """Yield (key, change dictionary) for each added, removed or modified file (or those of one kind)"""
+        if change is not None and change not in CHANGES:
+            raise ValueError(f"Unknown change: {change} (expected one of {', '.join(CHANGES)})")
+        for kind, b, t in self._merge(after):
+            if kind != 'unchanged' and (change is None or kind == change):
+                yield (t or b)[0], self._item(kind, b, t)
+
+    def page(self, limit=100, cursor=None, change=None):
+        """
+        One page of changes in path order
+
+        Returns:
+            (list of change dictionaries, cursor of the next page or None)
+        """
+        after = decode_cursor(cursor) if cursor else None
+        items, key = [], None
+        for key, item in self.changes(change, after):
+            items.append(item)
+            if len(items) == limit:
+                return items, encode_cursor(key)
+        return items, None
+
+    def summary(self):
+        """Counts (and bytes) of added, removed, modified and unchanged files"""
+        counts = {kind: 0 for kind in CHANGES + ('unchanged',)}
+        added_size = removed_size = size_delta = 0
+        for kind, b, t in self._merge():
+            counts[kind] += 1
+            if kind == 'added':
+                added_size += t[2] or 0
+            elif kind == 'removed':
+                removed_size += b[2] or 0
+            elif kind == 'modified':
+                size_delta += (t[2] or 0) - (b[2] or 0)
+        return {
+            'base': self.base_scan_id,
+            'target': self.target_scan_id,
+            **counts,
+            'added_size': added_size,
+            'removed_size': removed_size,
+            'modified_size_delta': size_delta,
+        }
+
+    def stream(self, change=None):
+        """Yield every change as NDJSON, in chunks of lines"""
+        lines = []
+        for _, item in self.changes(change):
+            lines.append(json.dumps(item, ensure_ascii=False))
+            if len(lines) == 1000:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
@@ -0,0 +1,201 @@
+"""
+Streaming Scan Export
+Writes a scan's file rows as CSV, NDJSON or Parquet straight from SQLite cursors,
+a fixed number of rows at a time, so memory stays flat however large the scan is
+"""
+import csv
+import heapq
+import io
+import json
+import os
+import zlib
+from itertools import islice
+from operator import itemgetter
+from .db import connect
+
+# Rows read from SQLite (and encoded) per chunk; also the Parquet row group size
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+
+# format -> (media type, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Parquet column types (every other column is a string)
+INTEGER_COLUMNS = {'id', 'file_size'}
+BOOLEAN_COLUMNS = {'eligible_for_ocr'}
+
+
+def check_format(fmt, compress=False):
+    """
+    Validate an export format before anything is streamed
+
+    Returns:
+        (media type, file extension) of the export
+
+    Raises:
+        ValueError: Unknown format
+        ImportError: Parquet requested without pyarrow installed
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (expected one of {', '.join(FORMATS)})")
+    if fmt == 'parquet':
+        _pyarrow()
+    media_type, extension = FORMATS[fmt]
+    if compress:
+        return 'application/gzip', f"{extension}.gz"
+    return media_type, extension
+
+
+def stream(db_path, queries, fmt, scan_id=None, compress=False, chunk_rows=None):
+    """
+    Yield an export file as chunks of bytes
+
+    Nothing is read until the first chunk is asked for, and at most
+    chunk_rows rows per query are held at a time.
+
+    Args:
+        db_path: Database the queries run against
+        queries: Sequence of (sql, params), each returning rows in
+            (file_name, id) order with the same columns; several are merged
+            (the source scans of an incremental or delta scan)
+        fmt: 'csv', 'ndjson' or 'parquet'
+        scan_id: Written into the scan_id column of merged rows
+        compress: Gzip the output
+        chunk_rows: Rows per chunk (defaults to EXPORT_CHUNK_ROWS)
+    """
+    encoder = {'csv': _csv, 'ndjson': _ndjson, 'parquet': _parquet}[fmt]
+    chunks = encoder(iter_chunks(db_path, queries, scan_id, chunk_rows))
+    return _gzip(chunks) if compress else chunks
+
+
+def _fetch(cursor, chunk_rows):
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield from rows
+
+
+def iter_chunks(db_path, queries, scan_id=None, chunk_rows=None):
+    """
+    Yield the column names, then lists of up to chunk_rows row tuples
+
+    Arguments as for stream, which encodes these chunks.
+    """
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    # The response iterator may be advanced from different worker threads
+    conn = connect(db_path, check_same_thread=False)
+    try:
+        cursors = [conn.execute(sql, params) for sql, params in queries]
+        columns = [description[0] for description in cursors[0].description]
+        yield columns
+
+        if len(cursors) == 1:
+            rows = _fetch(cursors[0], chunk_rows)
+            scan_index = None
+        else:
+            key = itemgetter(columns.index('file_name'), columns.index('id'))
+            rows = heapq.merge(*[_fetch(cursor, chunk_rows) for cursor in cursors], key=key)
+            scan_index = columns.index('scan_id') if 'scan_id' in columns else None
+
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                return
+            if scan_index is not None:
+                chunk = [row[:scan_index] + (scan_id,) + row[scan_index + 1:] for row in chunk]
+            yield chunk
+    finally:
+        conn.close()
+
+
+def _csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(next(chunks))
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only (empty scan)
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson(chunks):
+    columns = next(chunks)
+    for chunk in chunks:
+        lines = [json.dumps(dict(zip(columns, row)), ensure_ascii=False) for row in chunk]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("pyarrow not installed. Run: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+class _Sink:
+    """Write-only file for ParquetWriter whose bytes are taken after each row group"""
+
+    def __init__(self):
+        self.closed = False
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+
+def _parquet(chunks):
+    pa, pq = _pyarrow()
+    columns = next(chunks)
+    types = [
+        pa.int64() if column in INTEGER_COLUMNS else pa.bool_() if column in BOOLEAN_COLUMNS else pa.string()
+        for column in columns
+    ]
+    schema = pa.schema(list(zip(columns, types)))
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in chunks:
+        arrays = []
+        for values, column_type in zip(zip(*chunk), types):
+            if column_type == pa.bool_():
+                values = [None if value is None else bool(value) for value in values]
+            arrays.append(pa.array(values, type=column_type))
+        # One row group per chunk
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,237 @@
+"""
+Content Hashing
+Duplicate detection for local and shared scans: files are grouped by size,
+then by a hash of their first and last PARTIAL_BYTES, and only files still
+colliding are read whole. Files are read on a thread pool (hashlib releases
+the GIL on large buffers), and full hashes are kept in catalog_files.content_hash.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from . import catalog
+from .db import connect, database
+
+# Hashing threads - overridable from the environment
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "8"))
+
+# Bytes hashed from each end of a file by the partial hash
+PARTIAL_BYTES = 64 * 1024
+
+# Read size of a full hash
+READ_BYTES = 1024 * 1024
+
+# Distinct file sizes read (and hashed) per batch; a batch's hashes are committed together
+BATCH_SIZES = 256
+
+
+def scan_files_sql(incremental=False):
+    """
+    Subquery of a scan's file rows (id, file_path, file_size, content_hash),
+    with the scan id as its one parameter
+
+    Args:
+        incremental: Read each directory's rows from the scan its
+            dir_snapshots row names (local incremental scans)
+    """
+    # Aliases as in the views, for REBUILT_PATH_SQL
+    if incremental:
+        source = '''dir_snapshots s
+            JOIN catalog_dirs d_dir_id ON d_dir_id.value = s.dir_path
+            JOIN catalog_files t ON t.scan_id = s.source_scan_id AND t.dir_id = d_dir_id.id
+            WHERE s.scan_id = ?'''
+    else:
+        source = '''catalog_files t
+            LEFT JOIN catalog_dirs d_dir_id ON d_dir_id.id = t.dir_id
+            WHERE t.scan_id = ?'''
+    return f'''(
+        SELECT t.id AS id, {catalog.REBUILT_PATH_SQL} AS file_path,
+               t.file_size AS file_size, t.content_hash AS content_hash
+        FROM {source}
+    )'''
+
+
+def partial_hash(path, size):
+    """Hash of a file's first and last PARTIAL_BYTES"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_BYTES))
+        f.seek(max(size - PARTIAL_BYTES, PARTIAL_BYTES))
+        digest.update(f.read(PARTIAL_BYTES))
+    return digest.hexdigest()
+
+
+def full_hash(path):
+    """Hash of a file's whole content, read in READ_BYTES blocks into one buffer"""
+    digest = hashlib.blake2b()
+    buffer = bytearray(READ_BYTES)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+    return digest.hexdigest()
+
+
+def _try(fn, *args):
+    """fn(*args), or None if the file cannot be read (moved, deleted, no access)"""
+    try:
+        return fn(*args)
+    except OSError:
+        return None
+
+
+class HashStats:
+    """Counts of one hashing run"""
+
+    def __init__(self):
+        self.candidates = 0
+        self.partial_hashed = 0
+        self.full_hashed = 0
+        self.bytes_read = 0
+        self.errors = 0
+
+    def to_dict(self):
+        return {
+            'candidates': self.candidates,
+            'partial_hashed': self.partial_hashed,
+            'full_hashed': self.full_hashed,
+            'bytes_read': self.bytes_read,
+            'errors': self.errors,
+        }
+
+
+def _hash_group(pool, group, stats):
+    """
+    {id: full hash} for the files of one size that may have duplicates
+
+    Files already hashed (rows carried into an incremental scan, or a
+    rerun) are not read again. Small files are hashed whole at once: their
+    partial hash would read them whole anyway.
+    """
+    size = group[0][2]
+    todo = [row for row in group if row[3] is None]
+    if not todo:
+        return {}
+    if size > 2 * PARTIAL_BYTES:
+        partials = list(pool.map(lambda row: _try(partial_hash, row[1], size), todo))
+        stats.partial_hashed += len(todo)
+        stats.bytes_read += 2 * PARTIAL_BYTES * len(todo)
+        stats.errors += partials.count(None)
+        if len(todo) < len(group):
+            # Compared with known full hashes: every readable file is read whole
+            todo = [row for row, partial in zip(todo, partials) if partial is not None]
+        else:
+            counts = {}
+            for partial in partials:
+                counts[partial] = counts.get(partial, 0) + 1
+            todo = [row for row, partial in zip(todo, partials) if partial is not None and counts[partial] > 1]
+    hashes = list(pool.map(lambda row: _try(full_hash, row[1]), todo))
+    stats.full_hashed += len(todo) - hashes.count(None)
+    stats.bytes_read += size * (len(todo) - hashes.count(None))
+    stats.errors += hashes.count(None)
+    return {row[0]: digest for row, digest in zip(todo, hashes) if digest is not None}
+
+
+def hash_files(db_path, scan_id, incremental=False, workers=None, stop_flag=None):
+    """
+    Hash the files of a scan that share their size with another file
+
+    Sizes are read in order from the (scan_id, file_size) index, BATCH_SIZES
+    at a time; each batch's hashes are committed before the next, so a
+    stopped run resumes where it left off (hashed rows are skipped).
+    Empty files are not hashed.
+
+    Args:
+        db_path: Path of files.db
+        scan_id: Local or shared scan (files must still be readable at their paths)
+        incremental: See scan_files_sql
+        workers: Hashing threads (default HASH_WORKERS)
+        stop_flag: Optional callable, checked between batches
+
+    Returns:
+        HashStats
+    """
+    files = scan_files_sql(incremental)
+    stats = HashStats()
+    after = 0
+    conn = connect(db_path)
+    try:
+        with ThreadPoolExecutor(max_workers=workers or HASH_WORKERS) as pool:
+            while not (stop_flag and stop_flag()):
+                sizes = [row[0] for row in conn.execute(f'''
+                    SELECT file_size FROM {files}
+                    WHERE file_size > ?
+                    GROUP BY file_size HAVING COUNT(*) > 1
+                    ORDER BY file_size LIMIT ?
+                ''', (scan_id, after, BATCH_SIZES))]
+                if not sizes:
+                    break
+                rows = conn.execute(f'''
+                    SELECT id, file_path, file_size, content_hash FROM {files}
+                    WHERE file_size IN ({', '.join('?' * len(sizes))})
+                    ORDER BY file_size
+                ''', [scan_id] + sizes).fetchall()
+                hashes = {}
+                for _, group in groupby(rows, key=lambda row: row[2]):
+                    group = list(group)
+                    stats.candidates += len(group)
+                    hashes.update(_hash_group(pool, group, stats))
+                database(db_path).execute_many(
+                    "UPDATE catalog_files SET content_hash = ? WHERE id = ?",
+                    [(digest, file_id) for file_id, digest in hashes.items()]
+                )
+                after = sizes[-1]
+    finally:
+        conn.close()
+    return stats
+
+
+def find_duplicates(db_path, scan_id, incremental=False, limit=100, offset=0, max_paths=100):
+    """
+    Groups of identical files in a scan (same full hash), most wasted bytes first
+
+    Returns:
+        {'duplicate_groups', 'duplicate_files', 'wasted_bytes' (over all
+        groups), 'groups': [{'content_hash', 'file_size', 'file_count',
+        'wasted_bytes', 'file_paths' (at most max_paths)}]}
+    """
+    files = scan_files_sql(incremental)
+    grouped = f'''
+        SELECT content_hash, file_size, COUNT(*) AS file_count,
+               (COUNT(*) - 1) * file_size AS wasted_bytes
+        FROM {files}
+        WHERE content_hash IS NOT NULL
+        GROUP BY content_hash, file_size HAVING COUNT(*) > 1
+    '''
+    with database(db_path).read() as conn:
+        groups, duplicates, wasted = conn.execute(f'''
+            SELECT COUNT(*), COALESCE(SUM(file_count), 0), COALESCE(SUM(wasted_bytes), 0)
+            FROM ({grouped})
+        ''', (scan_id,)).fetchone()
+        page = conn.execute(f'''
+            SELECT * FROM ({grouped})
+            ORDER BY wasted_bytes DESC, content_hash LIMIT ? OFFSET ?
+        ''', (scan_id, limit, offset)).fetchall()
+        results = []
+        for content_hash, file_size, file_count, wasted_bytes in page:
+            paths = conn.execute(f'''
+                SELECT file_path FROM {files}
+                WHERE content_hash = ? AND file_size = ?
+                ORDER BY file_path LIMIT ?
+            ''', (scan_id, content_hash, file_size, max_paths)).fetchall()
+            results.append({
+                'content_hash': content_hash,
+                'file_size': file_size,
+                'file_count': file_count,
+                'wasted_bytes': wasted_bytes,
+                'file_paths': [row[0] for row in paths],
+            })
+    return {
+        'duplicate_groups': groups,
+        'duplicate_files': duplicates,
+        'wasted_bytes': wasted,
+        'groups': results,
+    }
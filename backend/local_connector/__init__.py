@@ -1,14 +1,18 @@
 """
 Local File Scanner Connector
 """
-from .scanner import scan_folder, get_summary
+from .scanner import scan_folder, iter_folder, get_summary
 from .database import (
     init_db, create_scan, save_files, complete_scan, fail_scan,
-    get_all_scans, get_scan_files, get_total_files_count
+    get_all_scans, get_scan_files, get_total_files_count, get_scan_stats,
+    get_scan, open_snapshots, open_sniffer, finalize_incremental_scan,
+    open_checkpoint, get_interrupted_scans, prepare_resume, export_files, freeze_scan,
+    search_files, diff_scans, hash_files, find_duplicates
 )
 
 __all__ = [
     'scan_folder',
+    'iter_folder',
     'get_summary',
     'init_db',
     'create_scan',
@@ -17,5 +21,19 @@ __all__ = [
     'fail_scan',
     'get_all_scans',
     'get_scan_files',
-    'get_total_files_count'
+    'get_total_files_count',
+    'get_scan_stats',
+    'get_scan',
+    'open_snapshots',
+    'open_sniffer',
+    'finalize_incremental_scan',
+    'open_checkpoint',
+    'get_interrupted_scans',
+    'prepare_resume',
+    'export_files',
+    'freeze_scan',
+    'search_files',
+    'diff_scans',
+    'hash_files',
+    'find_duplicates'
 ]
@@ -1,168 +1,413 @@
 """
 Database operations for scan metadata
 """
+import heapq
 import sqlite3
 import os
 from datetime import datetime
+from itertools import islice
+from .. import aggregates, catalog, checkpoints, columnar, diff, export, hashing, search
+from ..db import BulkWriter, database, decode_cursor
+from . import sniffer, snapshots
+from .sniffer import Sniffer
+from .snapshots import DirSnapshots
+from .walker import WALK_WORKERS
 
 # Database paths - separated for scans and files
 SCANS_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scanner.db')
 FILES_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files.db')
 
+# scans / files (views over the catalog) column -> catalog column
+SCAN_COLUMNS = (
+    ('id', 'id'),
+    ('name', 'name'),
+    ('folder_path', 'location'),
+    ('status', 'status'),
+    ('total_files', 'total_files'),
+    ('total_size', 'total_size'),
+    ('start_time', 'start_time'),
+    ('end_time', 'end_time'),
+    ('base_scan_id', 'base_scan_id'),
+)
+FILE_COLUMNS = (
+    ('id', 'id'),
+    ('scan_id', 'scan_id'),
+    ('file_name', 'file_name'),
+    ('file_path', 'file_path'),
+    ('file_type', 'type_id'),
+    ('mime_type', 'mime_id'),
+    ('file_size', 'file_size'),
+    ('last_modified', 'last_modified'),
+    ('storage_type', 'storage_id'),
+    ('eligible_for_ocr', 'eligible_for_ocr'),
+    ('parent_dir', 'dir_id'),
+)
+
+# Record keys -> catalog_files columns, resolved once
+FILES_WRITER = BulkWriter('catalog_files', [
+    ('file_name', 'file_name'),
+    ('file_path', lambda f: catalog.stored_path(f['file_path'], os.path.dirname(f['file_path']), f['file_name'])),
+    ('type_id', 'file_type'),
+    ('mime_id', 'mime_type'),
+    ('file_size', 'file_size'),
+    ('last_modified', 'last_modified'),
+    ('storage_id', 'storage_type'),
+    ('eligible_for_ocr', 'eligible_for_ocr'),
+    ('dir_id', lambda f: os.path.dirname(f['file_path'])),
+    ('ext_id', lambda f: catalog.extension_of(f['file_name'])),
+], aggregate=(
+    lambda f: f.get('file_type') or 'other',
+    lambda f: bool(f.get('eligible_for_ocr'))
+), dictionaries=catalog.DICTIONARIES, trees=catalog.TREES)
+
+# SQL equivalents of the aggregate keys, for rebuilding older scans
+STATS_TYPE_SQL = "COALESCE(file_type, 'other')"
+STATS_OCR_SQL = "eligible_for_ocr"
+
+# File rows of an incremental scan: each directory's rows live in the scan
+# that last listed it (see snapshots.DirSnapshots). Directories are matched
+# through the dictionary, so each one is an index seek on (scan_id, dir_id).
+EFFECTIVE_FILES_SQL = '''(
+    SELECT d.scan_id AS scan_id, f.file_size AS file_size,
+           t.value AS file_type, f.eligible_for_ocr AS eligible_for_ocr
+    FROM dir_snapshots d
+    JOIN catalog_dirs cd ON cd.value = d.dir_path
+    JOIN catalog_files f ON f.scan_id = d.source_scan_id AND f.dir_id = cd.id
+    LEFT JOIN catalog_file_types t ON t.id = f.type_id
+)'''
+
 
 def init_db():
     """Initialize database and create tables"""
     # Initialize scans database
-    conn = sqlite3.connect(SCANS_DB)
+    database(SCANS_DB).write(_init_scans)
+    
+    # Initialize files database
+    database(FILES_DB).write(_init_files)
+    print("✅ Database initialized")
+
+
+def _init_scans(conn):
     cursor = conn.cursor()
     
-    # Create scans table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scans (
-            id TEXT PRIMARY KEY,
-            name TEXT,
-            folder_path TEXT,
-            status TEXT,
-            total_files INTEGER,
-            total_size INTEGER,
-            start_time TEXT,
-            end_time TEXT
-        )
-    ''')
+    # Scans live in the unified catalog; scans is a view of the local ones
+    catalog.init_scans(cursor)
+    catalog.migrate_table(cursor, 'scans', 'catalog_scans', SCAN_COLUMNS, {'source_type': 'local'})
+    catalog.replace_view(cursor, 'scans', catalog.view_sql('catalog_scans', SCAN_COLUMNS, "source_type = 'local'"))
+
+
+def _init_files(conn):
+    cursor = conn.cursor()
     
-    conn.commit()
-    conn.close()
+    # Same for file rows: files is a view decoding the catalog's dictionaries
+    # and rebuilding each path from its directory
+    catalog.init_files(cursor)
+    catalog.migrate_table(cursor, 'files', 'catalog_files', FILE_COLUMNS)
+    catalog.replace_view(cursor, 'files', catalog.view_sql('catalog_files', FILE_COLUMNS, rebuild_paths=True))
     
-    # Initialize files database
-    conn = sqlite3.connect(FILES_DB)
-    cursor = conn.cursor()
+    # Materialized per-scan aggregates
+    aggregates.init_tables(cursor)
     
-    # Create files table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            scan_id TEXT,
-            file_name TEXT,
-            file_path TEXT,
-            file_type TEXT,
-            mime_type TEXT,
-            file_size INTEGER,
-            last_modified TEXT,
-            storage_type TEXT,
-            eligible_for_ocr BOOLEAN,
-            FOREIGN KEY (scan_id) REFERENCES scans(id)
-        )
-    ''')
+    # Server-side search (unified view, file name index)
+    search.init_tables(cursor)
     
-    conn.commit()
-    conn.close()
-    print("✅ Database initialized")
+    # Directory snapshots for incremental re-scans (also the walk checkpoint)
+    snapshots.init_tables(cursor)
+    checkpoints.init_tables(cursor)
+    
+    # Content types sniffed per file, reused by later scans
+    sniffer.init_tables(cursor)
 
 
-def create_scan(scan_id, name, folder_path):
-    """Create a new scan record"""
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
+def create_scan(scan_id, name, folder_path, base_scan_id=None):
+    """
+    Create a new scan record
     
-    cursor.execute('''
-        INSERT INTO scans (id, name, folder_path, status, start_time)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (scan_id, name, folder_path, 'running', datetime.now().isoformat()))
+    With base_scan_id the scan is incremental: directories unchanged since
+    the base scan keep their file rows in the scan that listed them.
+    """
+    database(SCANS_DB).execute('''
+        INSERT INTO catalog_scans (id, source_type, name, location, status, start_time, base_scan_id)
+        VALUES (?, 'local', ?, ?, ?, ?, ?)
+    ''', (scan_id, name, folder_path, 'running', datetime.now().isoformat(), base_scan_id))
     
-    conn.commit()
-    conn.close()
+    if base_scan_id:
+        # Rows can come from this scan, the base, or anything the base carried
+        database(FILES_DB).execute('''
+            INSERT OR IGNORE INTO scan_sources (scan_id, source_scan_id)
+            SELECT ?, ? UNION SELECT ?, ?
+            UNION SELECT ?, source_scan_id FROM scan_sources WHERE scan_id = ?
+        ''', (scan_id, scan_id, scan_id, base_scan_id, scan_id, base_scan_id))
+
+
+def get_scan(scan_id):
+    """Get one scan record, or None"""
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        row = conn.execute("SELECT * FROM scans WHERE id = ?", (scan_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def open_snapshots(scan_id, base_scan_id=None, resume=False):
+    """Directory snapshot recorder for a scan (pass to iter_folder)"""
+    return DirSnapshots(FILES_DB, scan_id, base_scan_id, resume)
+
+
+def open_sniffer(workers=None):
+    """Content sniffer with its cache (pass to iter_folder; commit it with each checkpoint)"""
+    return Sniffer(FILES_DB, workers or WALK_WORKERS)
+
+
+def open_checkpoint(scan_id, on_commit=()):
+    """Checkpoint for a scan, continuing from any saved one"""
+    return checkpoints.Checkpoint.resume(FILES_DB, scan_id, 'local', on_commit)
+
+
+def get_interrupted_scans():
+    """Scans still marked running (their scan thread died with the server)"""
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        rows = conn.execute("SELECT * FROM scans WHERE status = 'running'").fetchall()
+    return [dict(row) for row in rows]
+
+
+def prepare_resume(scan_id):
+    """
+    Roll a scan back to its last checkpoint and mark it running again
+    
+    Rows of directories the snapshot does not record as finished are
+    deleted (they are listed again), then the aggregates are rebuilt.
+    
+    Returns:
+        Number of file rows kept
+    """
+    def roll_back(conn):
+        conn.execute('''
+            DELETE FROM catalog_files WHERE scan_id = ? AND (dir_id IS NULL OR dir_id NOT IN (
+                SELECT cd.id FROM dir_snapshots d JOIN catalog_dirs cd ON cd.value = d.dir_path
+                WHERE d.scan_id = ? AND d.source_scan_id = ? AND d.entry_count IS NOT NULL
+            ))
+        ''', (scan_id, scan_id, scan_id))
+        aggregates.rebuild(conn, scan_id, 'files', STATS_TYPE_SQL, STATS_OCR_SQL)
+        return aggregates.load(conn, scan_id)
+    
+    stats = database(FILES_DB).write(roll_back)
+    database(SCANS_DB).execute(
+        "UPDATE catalog_scans SET status = 'running', end_time = NULL WHERE id = ? AND source_type = 'local'",
+        (scan_id,)
+    )
+    return stats['total_files'] if stats else 0
 
 
 def save_files(scan_id, files):
-    """Save files to database"""
-    conn = sqlite3.connect(FILES_DB)
-    cursor = conn.cursor()
+    """Save files to database in one batched transaction"""
+    FILES_WRITER.write(FILES_DB, scan_id, files)
+
+
+def finalize_incremental_scan(scan_id):
+    """
+    Rebuild an incremental scan's aggregates over its effective file rows
     
-    for file in files:
-        cursor.execute('''
-            INSERT INTO files (
-                scan_id, file_name, file_path, file_type, mime_type, 
-                file_size, last_modified, storage_type, eligible_for_ocr
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            scan_id,
-            file['file_name'],
-            file['file_path'],
-            file['file_type'],
-            file['mime_type'],
-            file['file_size'],
-            file['last_modified'],
-            file['storage_type'],
-            file['eligible_for_ocr']
-        ))
-    
-    conn.commit()
-    conn.close()
+    Returns:
+        The scan's stats (see get_scan_stats)
+    """
+    def rebuild(conn):
+        aggregates.rebuild(conn, scan_id, EFFECTIVE_FILES_SQL, STATS_TYPE_SQL, STATS_OCR_SQL)
+        return aggregates.load(conn, scan_id)
+    
+    return database(FILES_DB).write(rebuild)
 
 
 def complete_scan(scan_id, total_files, total_size):
-    """Mark scan as completed"""
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE scans 
+    """Mark scan as completed (its checkpoint is no longer needed)"""
+    database(SCANS_DB).execute('''
+        UPDATE catalog_scans 
         SET status = 'completed', total_files = ?, total_size = ?, end_time = ?
-        WHERE id = ?
+        WHERE id = ? AND source_type = 'local'
     ''', (total_files, total_size, datetime.now().isoformat(), scan_id))
-    
-    conn.commit()
-    conn.close()
+    checkpoints.clear(FILES_DB, scan_id)
+    # Name search reads its rows from the trigram index from now on
+    search.index_names(FILES_DB)
 
 
 def fail_scan(scan_id):
     """Mark scan as failed"""
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE scans SET status = 'failed', end_time = ? WHERE id = ?
+    database(SCANS_DB).execute('''
+        UPDATE catalog_scans SET status = 'failed', end_time = ? WHERE id = ? AND source_type = 'local'
     ''', (datetime.now().isoformat(), scan_id))
-    
-    conn.commit()
-    conn.close()
 
 
 def get_all_scans():
     """Get all scans"""
-    conn = sqlite3.connect(SCANS_DB)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM scans ORDER BY start_time DESC LIMIT 10")
-    scans = [dict(row) for row in cursor.fetchall()]
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        rows = conn.execute("SELECT * FROM scans ORDER BY start_time DESC LIMIT 10").fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_scan_files(scan_id, limit=100, offset=0, cursor=None, under=None):
+    """
+    Get files for a scan with pagination
     
-    conn.close()
-    return scans
+    When cursor (from a previous page) is given, offset is ignored and the
+    page is read by seeking the (scan_id, file_name, id) index. With under,
+    only files in that directory or below it are listed.
+    """
+    with database(FILES_DB).read(sqlite3.Row) as conn:
+        sources = _scan_sources(conn, scan_id)
+        if sources:
+            return _get_incremental_scan_files(conn, scan_id, sources, limit, offset, cursor, under)
+        
+        scope, params = catalog.subtree_filter(scan_id, under) if under else ("scan_id = ?", [scan_id])
+        if cursor:
+            file_name, row_id = decode_cursor(cursor)
+            rows = conn.execute(f'''
+                SELECT * FROM files
+                WHERE {scope} AND (file_name, id) > (?, ?)
+                ORDER BY file_name, id LIMIT ?
+            ''', params + [file_name, row_id, limit]).fetchall()
+        else:
+            rows = conn.execute(f"SELECT * FROM files WHERE {scope} ORDER BY file_name, id LIMIT ? OFFSET ?", 
+                                params + [limit, offset]).fetchall()
+    return [dict(row) for row in rows]
 
 
-def get_scan_files(scan_id, limit=100, offset=0):
-    """Get files for a scan with pagination"""
-    conn = sqlite3.connect(FILES_DB)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def _scan_sources(conn, scan_id):
+    """Scans holding file rows of an incremental scan (empty for a full scan)"""
+    rows = conn.execute(
+        "SELECT source_scan_id FROM scan_sources WHERE scan_id = ?", (scan_id,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def scan_sources(scan_id):
+    """_scan_sources on a pooled read connection"""
+    with database(FILES_DB).read() as conn:
+        return _scan_sources(conn, scan_id)
+
+
+def _get_incremental_scan_files(conn, scan_id, sources, limit, offset, cursor, under=None):
+    """
+    One page of an incremental scan's files
     
-    cursor.execute("SELECT * FROM files WHERE scan_id = ? ORDER BY file_name LIMIT ? OFFSET ?", 
-                   (scan_id, limit, offset))
-    files = [dict(row) for row in cursor.fetchall()]
+    Reads a page from each source scan (rows whose directory the snapshot
+    attributes to that source) and merges them in (file_name, id) order.
+    """
+    after = list(decode_cursor(cursor)) if cursor else []
+    keyset = "AND (f.file_name, f.id) > (?, ?)" if cursor else ""
+    start = 0 if cursor else offset
+    
+    pages = []
+    for source in sources:
+        scope, params = (
+            catalog.subtree_filter(source, under, id_column='f.id') if under else ("f.scan_id = ?", [source])
+        )
+        rows = conn.execute(f'''
+            SELECT f.* FROM files f
+            WHERE {scope} {keyset}
+              AND EXISTS (
+                  SELECT 1 FROM dir_snapshots d
+                  WHERE d.scan_id = ? AND d.dir_path = f.parent_dir AND d.source_scan_id = ?
+              )
+            ORDER BY f.file_name, f.id LIMIT ?
+        ''', params + after + [scan_id, source, start + limit]).fetchall()
+        pages.append([dict(row) for row in rows])
     
-    conn.close()
+    merged = heapq.merge(*pages, key=lambda f: (f['file_name'], f['id']))
+    files = list(islice(merged, start, start + limit))
+    for file in files:
+        file['scan_id'] = scan_id
     return files
 
 
-def get_total_files_count(scan_id):
-    """Get total file count for a scan"""
-    conn = sqlite3.connect(FILES_DB)
-    cursor = conn.cursor()
+def export_queries(scan_id):
+    """
+    (sql, params) reading every file row of a scan in (file_name, id) order
+    
+    An incremental scan gets one query per source scan, whose rows are
+    merged (see export.iter_chunks), like its pages.
+    """
+    sources = scan_sources(scan_id)
+    if not sources:
+        queries = [("SELECT * FROM files WHERE scan_id = ? ORDER BY file_name, id", [scan_id])]
+    else:
+        queries = [('''
+            SELECT f.* FROM files f
+            WHERE f.scan_id = ?
+              AND EXISTS (
+                  SELECT 1 FROM dir_snapshots d
+                  WHERE d.scan_id = ? AND d.dir_path = f.parent_dir AND d.source_scan_id = ?
+              )
+            ORDER BY f.file_name, f.id
+        ''', [source, scan_id, source]) for source in sources]
+    return queries
+
+
+def export_files(scan_id, fmt, compress=False):
+    """Stream every file row of a scan in an export format (see export.stream)"""
+    return export.stream(FILES_DB, export_queries(scan_id), fmt, scan_id, compress)
+
+
+def freeze_scan(scan_id):
+    """Write a completed scan's columnar snapshot (see columnar.freeze)"""
+    return columnar.freeze(FILES_DB, export_queries(scan_id), scan_id)
+
+
+def search_files(scan_id, filters, limit=100, offset=0, cursor=None):
+    """
+    One page of a scan's files matching server-side filters (see search.search_files)
+    
+    An incremental scan is searched in each source scan, over the
+    directories the snapshot attributes to it, like its pages.
+    """
+    sources = scan_sources(scan_id)
+    scopes = [(source, '''EXISTS (
+        SELECT 1 FROM dir_snapshots d
+        WHERE d.scan_id = ? AND d.dir_path = f.parent_dir AND d.source_scan_id = ?
+    )''', [scan_id, source]) for source in sources]
+    return search.search_files(FILES_DB, scan_id, filters, scopes, limit=limit, offset=offset, cursor=cursor)
+
+
+def _diff_rows(conn, scan_id, after=None):
+    """A scan's rows in path order for a diff (see diff.tree_rows)"""
+    return diff.tree_rows(conn, scan_id, after, incremental=bool(_scan_sources(conn, scan_id)))
+
+
+def diff_scans(base_scan_id, target_scan_id):
+    """
+    Files added, removed and modified (by size and last_modified) between two
+    scans (see diff.ScanDiff)
     
-    cursor.execute("SELECT COUNT(*) as count FROM files WHERE scan_id = ?", (scan_id,))
-    result = cursor.fetchone()
+    An incremental scan's rows are read from the scan its snapshot
+    attributes each directory to, like its pages.
+    """
+    return diff.ScanDiff(FILES_DB, _diff_rows, base_scan_id, target_scan_id)
+
+
+def hash_files(scan_id, stop_flag=None):
+    """
+    Hash the files of a scan that may have duplicates (see hashing.hash_files)
+    
+    An incremental scan hashes its effective rows; rows carried from a
+    scan that was hashed keep their hashes.
     
-    conn.close()
-    return result[0] if result else 0
+    Returns:
+        Counts of the run (see hashing.HashStats)
+    """
+    incremental = bool(scan_sources(scan_id))
+    return hashing.hash_files(FILES_DB, scan_id, incremental, stop_flag=stop_flag).to_dict()
+
+
+def find_duplicates(scan_id, limit=100, offset=0):
+    """Groups of identical files in a hashed scan, most wasted bytes first (see hashing.find_duplicates)"""
+    incremental = bool(scan_sources(scan_id))
+    return hashing.find_duplicates(FILES_DB, scan_id, incremental, limit, offset)
+
+
+def get_scan_stats(scan_id):
+    """Get materialized aggregates for a scan, or None if there is no such scan"""
+    table = EFFECTIVE_FILES_SQL if scan_sources(scan_id) else 'files'
+    return aggregates.load_or_rebuild(FILES_DB, SCANS_DB, scan_id, table, STATS_TYPE_SQL, STATS_OCR_SQL)
+
+
+def get_total_files_count(scan_id):
+    """Get total file count for a scan (from the aggregates, not COUNT(*))"""
+    stats = get_scan_stats(scan_id)
+    return stats['total_files'] if stats else 0
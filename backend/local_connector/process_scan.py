@@ -0,0 +1,204 @@
+"""
+Multi-process Local Scan
+Partitions the top-level subdirectories of a tree across a process pool so
+classification is not capped at one core by the GIL
+"""
+import multiprocessing
+import os
+import queue
+import time
+from datetime import datetime
+from .scanner import build_file_record, get_file_type, get_mime_type, is_ocr_eligible
+from .walker import ParallelWalker
+
+# Records per batch sent from a scan process to the parent
+PROCESS_BATCH_SIZE = 2000
+
+# Field order of the compact record tuples sent through the result queue
+RECORD_FIELDS = (
+    'file_name', 'file_path', 'file_type', 'mime_type',
+    'file_size', 'last_modified', 'eligible_for_ocr'
+)
+
+
+def compact_record(filename, full_path, stat_info):
+    """Classify a file into a tuple of RECORD_FIELDS (cheap to pickle)"""
+    file_type = get_file_type(filename)
+    return (
+        filename,
+        full_path,
+        file_type,
+        get_mime_type(filename),
+        stat_info.st_size,
+        datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
+        is_ocr_eligible(file_type)
+    )
+
+
+def expand_record(values):
+    """Rebuild a file record dictionary from a compact tuple"""
+    record = dict(zip(RECORD_FIELDS, values))
+    record['storage_type'] = 'local'
+    return record
+
+
+class ListedDirs:
+    """
+    Directory snapshot recorder of a scan process (a full scan: nothing is
+    finished or carried), keeping the rows of the directories it lists
+
+    The walker hands each row back after the directory's files, so rows
+    taken with the records before them can be committed once those are.
+    """
+
+    def __init__(self, scan_id):
+        self.scan_id = scan_id
+        self.rows = []
+
+    def finished(self, path):
+        return None
+
+    def carry(self, path, mtime):
+        return None
+
+    def listed(self, path, mtime, entry_count, subdirs):
+        return (path, mtime, entry_count, time.time(), self.scan_id, subdirs)
+
+    def done(self, row):
+        self.rows.append(row)
+
+    def take(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+
+def _scan_partitions(tasks, results, stop_event, workers, scan_id=None):
+    """
+    Scan process: walk and classify top-level subdirectories pulled from tasks
+
+    Sends (records, directory rows) pairs to results, then None when out of
+    work. records is a list of compact tuples; the snapshot rows of the
+    directories whose files are all in it or earlier pairs are sent with it
+    when scan_id is given (see ListedDirs), else none.
+    """
+    listed = ListedDirs(scan_id) if scan_id else None
+    batch = []
+    try:
+        while not stop_event.is_set():
+            path = tasks.get()
+            if path is None:
+                break
+
+            walker = ParallelWalker(path, workers, stop_flag=stop_event.is_set, snapshots=listed)
+            for filename, full_path, stat_info in walker:
+                try:
+                    batch.append(compact_record(filename, full_path, stat_info))
+                except Exception as e:
+                    print(f"Warning: {filename} - {e}")
+                    continue
+                if len(batch) >= PROCESS_BATCH_SIZE or (listed and len(listed.rows) >= PROCESS_BATCH_SIZE):
+                    results.put((batch, listed.take() if listed else []))
+                    batch = []
+    except Exception as e:
+        print(f"Warning: scan process failed - {e}")
+    finally:
+        rows = listed.take() if listed else []
+        if (batch or rows) and not stop_event.is_set():
+            results.put((batch, rows))
+        results.put(None)
+
+
+def iter_folder_processes(folder_path, processes, stop_flag=None, workers=None, snapshots=None):
+    """
+    Scan a folder with a pool of processes and yield file metadata
+
+    Top-level subdirectories go on a shared task queue, so busy processes
+    pick up fewer of them (load balancing across uneven subtrees). Files
+    directly in folder_path are classified by the parent.
+
+    Args:
+        folder_path: Path to folder
+        processes: Number of scan processes
+        stop_flag: Callable that returns True if scan should stop
+        workers: Directory listing threads inside each process
+        snapshots: Optional DirSnapshots of a full scan; the processes send
+            each listed directory's row back with their records, and it is
+            handed to snapshots.done() once its files have been yielded
+
+    Yields:
+        File dictionaries with metadata
+    """
+    subdirs = []
+    top_files = []
+    entry_count = 0
+    mtime = os.stat(folder_path).st_mtime
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            entry_count += 1
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                else:
+                    top_files.append((entry.name, entry.path, entry.stat()))
+            except OSError:
+                continue
+
+    # Spawn rather than fork: the API process has running threads
+    ctx = multiprocessing.get_context('spawn')
+    tasks = ctx.Queue()
+    results = ctx.Queue(maxsize=processes * 4)
+    stop_event = ctx.Event()
+
+    count = min(processes, len(subdirs))
+    for path in subdirs:
+        tasks.put(path)
+    for _ in range(count):
+        tasks.put(None)
+
+    pool = [
+        ctx.Process(target=_scan_partitions, args=(tasks, results, stop_event, workers,
+                                                   snapshots and snapshots.scan_id), daemon=True)
+        for _ in range(count)
+    ]
+    for process in pool:
+        process.start()
+
+    try:
+        for filename, full_path, stat_info in top_files:
+            yield build_file_record(filename, full_path, stat_info)
+        if snapshots is not None:
+            snapshots.done(snapshots.listed(folder_path, mtime, entry_count, subdirs))
+
+        remaining = count
+        while remaining:
+            if stop_flag and stop_flag():
+                break
+            try:
+                batch = results.get(timeout=0.1)
+            except queue.Empty:
+                # A process that died without its end marker must not hang the scan
+                if not any(process.is_alive() for process in pool) and results.empty():
+                    break
+                continue
+            if batch is None:
+                remaining -= 1
+                continue
+            records, rows = batch
+            for values in records:
+                yield expand_record(values)
+            for row in rows:
+                snapshots.done(row)
+    finally:
+        stop_event.set()
+        # Unblock processes waiting to put into a full result queue
+        try:
+            while True:
+                results.get_nowait()
+        except queue.Empty:
+            pass
+        for process in pool:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
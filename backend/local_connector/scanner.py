@@ -5,6 +5,10 @@ Recursively scans folders and collects file metadata
 import os
 import mimetypes
 from datetime import datetime
+from .walker import ParallelWalker
+
+# Default number of scan processes (1 = threads only) - overridable from the environment
+SCAN_PROCESSES = int(os.getenv("SCAN_PROCESSES", "1"))
 
 
 def get_file_type(filename):
@@ -38,16 +42,55 @@ def is_ocr_eligible(file_type):
     return file_type in ['pdf', 'image', 'office']
 
 
-def scan_folder(folder_path, stop_flag=None):
+def build_file_record(filename, full_path, stat_info, sniffed=None):
+    """Create a file record from a directory listing entry (and its sniffed content type, if any)"""
+    # Get file type
+    file_type = get_file_type(filename)
+    mime_type = get_mime_type(filename)
+    # Content wins over a disagreeing extension. Where they agree the
+    # extension's mime type is kept (more specific), as it is for a zip
+    # named as an office file whose members start past the bytes sniffed.
+    if sniffed and sniffed[0] != file_type and not (file_type == 'office' and sniffed[0] == 'archive'):
+        file_type, mime_type = sniffed
+    ocr_eligible = is_ocr_eligible(file_type)
+    
+    return {
+        'file_name': filename,
+        'file_path': full_path,
+        'file_type': file_type,
+        'mime_type': mime_type,
+        'file_size': stat_info.st_size,
+        'last_modified': datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
+        'storage_type': 'local',
+        'eligible_for_ocr': ocr_eligible
+    }
+
+
+def iter_folder(folder_path, stop_flag=None, workers=None, processes=None, snapshots=None, sniffer=None,
+                progress=None):
     """
-    Scan a folder recursively and return file metadata
+    Scan a folder recursively and yield file metadata as it is found
+    
+    Directories are listed in parallel by a ParallelWalker, so files arrive
+    in no particular order. With processes > 1 the top-level subdirectories
+    are partitioned across a process pool (see process_scan).
     
     Args:
         folder_path: Path to folder
         stop_flag: Callable that returns True if scan should stop
+        workers: Number of directory listing threads (defaults to SCAN_WALK_WORKERS)
+        processes: Number of scan processes (defaults to SCAN_PROCESSES)
+        snapshots: Optional DirSnapshots recording the directory snapshot
+            (also recorded by the process pool of a full scan; incremental
+            and resumed scans run on threads only, so processes is ignored
+            for them)
+        sniffer: Optional Sniffer classifying files by content as well as
+            extension, on the listing threads (threads only, like snapshots)
+        progress: Optional ScanProgress given the walker's directory counts
+            (not reported by the process pool)
         
-    Returns:
-        List of file dictionaries with metadata
+    Yields:
+        File dictionaries with metadata
     """
     if not os.path.exists(folder_path):
         raise FileNotFoundError(f"Folder not found: {folder_path}")
@@ -55,53 +98,53 @@ def scan_folder(folder_path, stop_flag=None):
     if not os.path.isdir(folder_path):
         raise NotADirectoryError(f"Not a directory: {folder_path}")
     
-    files = []
+    processes = processes or SCAN_PROCESSES
+    if processes > 1 and sniffer is None and not (snapshots and (snapshots.base_scan_id or snapshots.resume)):
+        from .process_scan import iter_folder_processes
+        records = iter_folder_processes(folder_path, processes, stop_flag, workers, snapshots)
+    else:
+        # Walker checks the stop flag before listing each directory
+        records = _iter_walked(ParallelWalker(
+            folder_path, workers, stop_flag, snapshots=snapshots, sniffer=sniffer and sniffer.sniff,
+            progress=progress
+        ))
     
-    # Walk through all directories and files
-    for root, dirs, filenames in os.walk(folder_path):
-        # Check stop flag before processing each directory
-        if stop_flag and stop_flag():
-            print(f"Scan stopped by user")
-            break
-            
-        for filename in filenames:
-            # Check stop flag periodically (every 10 files)
-            if stop_flag and stop_flag() and len(files) % 10 == 0:
-                print(f"Scan stopped by user after processing {len(files)} files")
-                return files
-                
-            try:
-                full_path = os.path.join(root, filename)
-                
-                # Get file stats
-                stat_info = os.stat(full_path)
-                
-                # Get file type
-                file_type = get_file_type(filename)
-                mime_type = get_mime_type(filename)
-                ocr_eligible = is_ocr_eligible(file_type)
-                
-                # Create file record
-                file_record = {
-                    'file_name': filename,
-                    'file_path': full_path,
-                    'file_type': file_type,
-                    'mime_type': mime_type,
-                    'file_size': stat_info.st_size,
-                    'last_modified': datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
-                    'storage_type': 'local',
-                    'eligible_for_ocr': ocr_eligible
-                }
-                
-                files.append(file_record)
-                
-            except (PermissionError, OSError):
-                continue
-            except Exception as e:
-                print(f"Warning: {filename} - {e}")
-                continue
+    count = 0
+    for file_record in records:
+        # Check stop flag periodically (every 10 files)
+        if stop_flag and stop_flag() and count % 10 == 0:
+            print(f"Scan stopped by user after processing {count} files")
+            records.close()
+            return
+        
+        count += 1
+        yield file_record
+
+
+def _iter_walked(walker):
+    """Build file records from walker output (stat comes from the directory listing)"""
+    for filename, full_path, stat_info, *sniffed in walker:
+        try:
+            yield build_file_record(filename, full_path, stat_info, *sniffed)
+        except Exception as e:
+            print(f"Warning: {filename} - {e}")
+            continue
+
+
+def scan_folder(folder_path, stop_flag=None, workers=None, processes=None):
+    """
+    Scan a folder recursively and return file metadata
     
-    return files
+    Args:
+        folder_path: Path to folder
+        stop_flag: Callable that returns True if scan should stop
+        workers: Number of directory listing threads (defaults to SCAN_WALK_WORKERS)
+        processes: Number of scan processes (defaults to SCAN_PROCESSES)
+        
+    Returns:
+        List of file dictionaries with metadata
+    """
+    return list(iter_folder(folder_path, stop_flag, workers, processes))
 
 
 def get_summary(files):
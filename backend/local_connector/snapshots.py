@@ -0,0 +1,179 @@
+"""
+Directory Snapshots
+Per-directory (mtime, entry count) records that let a rescan skip unchanged directories
+"""
+import os
+import threading
+import time
+from ..db import connect, database
+
+# A directory whose mtime is this close to when it was listed may have changed
+# within the same mtime tick (1-2 s on some filesystems), so it is always re-listed
+RACY_WINDOW = 2.0
+
+
+def init_tables(cursor):
+    """Create the snapshot tables (in files.db, next to the file rows)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dir_snapshots (
+            scan_id TEXT NOT NULL,
+            dir_path TEXT NOT NULL,
+            parent_path TEXT,
+            mtime REAL,
+            entry_count INTEGER,
+            listed_at REAL,
+            source_scan_id TEXT NOT NULL,
+            PRIMARY KEY (scan_id, dir_path)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_dir_snapshots_parent
+        ON dir_snapshots (scan_id, parent_path)
+    ''')
+    # Scans whose file rows an incremental scan reads through dir_snapshots
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_sources (
+            scan_id TEXT NOT NULL,
+            source_scan_id TEXT NOT NULL,
+            PRIMARY KEY (scan_id, source_scan_id)
+        )
+    ''')
+
+
+class DirSnapshots:
+    """
+    Records the directory snapshot of a scan, which is also its resume checkpoint
+
+    Every finished directory gets one row naming the scan that holds its file
+    rows (source_scan_id). A directory listed by this scan points at this scan;
+    a directory unchanged since the base scan keeps pointing at the scan that
+    last listed it, so its file rows are carried forward without being copied.
+    Subdirectories not finished yet are kept as pending rows (NULL entry_count):
+    together they are the frontier an interrupted scan resumes from.
+
+    finished(), carry() and listed() are called from the walker threads. The rows
+    they return travel through the walker's result queue behind the directory's
+    files; done() receives them in the consumer thread and commit() writes them
+    once the files before them are committed.
+
+    Args:
+        db_path: Path of files.db
+        scan_id: Scan being recorded
+        base_scan_id: Previous scan to compare against (None for a full scan)
+        resume: Skip directories this scan already finished
+    """
+
+    def __init__(self, db_path, scan_id, base_scan_id=None, resume=False):
+        self.db_path = db_path
+        self.scan_id = scan_id
+        self.base_scan_id = base_scan_id
+        self.resume = resume
+        self.listed_count = 0
+        self.carried_count = 0
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._done = []
+
+    def finished(self, path):
+        """Subdirectories of path if this scan finished it before a resume, else None"""
+        if not self.resume:
+            return None
+
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT entry_count FROM dir_snapshots WHERE scan_id = ? AND dir_path = ?",
+            (self.scan_id, path)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return self._subdirs(conn, self.scan_id, path)
+
+    def carry(self, path, mtime):
+        """
+        Check whether path is unchanged since the base scan
+
+        Returns:
+            (subdirectory paths from the base snapshot, snapshot row), or None
+            if path must be listed
+        """
+        if not self.base_scan_id:
+            return None
+
+        conn = self._connection()
+        row = conn.execute('''
+            SELECT mtime, entry_count, listed_at, source_scan_id FROM dir_snapshots
+            WHERE scan_id = ? AND dir_path = ?
+        ''', (self.base_scan_id, path)).fetchone()
+        if row is None:
+            return None
+
+        base_mtime, entry_count, listed_at, source_scan_id = row
+        if base_mtime != mtime or entry_count is None or mtime >= listed_at - RACY_WINDOW:
+            return None
+
+        subdirs = self._subdirs(conn, self.base_scan_id, path)
+        return subdirs, (path, mtime, entry_count, listed_at, source_scan_id, subdirs)
+
+    def listed(self, path, mtime, entry_count, subdirs):
+        """Snapshot row for a directory listed by this scan"""
+        return (path, mtime, entry_count, time.time(), self.scan_id, subdirs)
+
+    def done(self, row):
+        """Queue the row of a directory whose files have all been handed to the pipeline"""
+        self._done.append(row)
+        if row[4] == self.scan_id:
+            self.listed_count += 1
+        else:
+            self.carried_count += 1
+
+    def commit(self):
+        """Write the rows of finished directories and their pending subdirectories"""
+        rows, self._done = self._done, []
+        if not rows:
+            return
+
+        def write(conn):
+            conn.executemany('''
+                INSERT OR REPLACE INTO dir_snapshots (
+                    scan_id, dir_path, parent_path, mtime, entry_count, listed_at, source_scan_id
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (self.scan_id, path, os.path.dirname(path), mtime, entry_count, listed_at, source)
+                for path, mtime, entry_count, listed_at, source, _ in rows
+            ])
+            # A subdirectory may already have finished (its row can overtake its parent's)
+            conn.executemany('''
+                INSERT OR IGNORE INTO dir_snapshots (scan_id, dir_path, parent_path, source_scan_id)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (self.scan_id, subdir, path, self.scan_id)
+                for path, _, _, _, _, subdirs in rows
+                for subdir in subdirs
+            ])
+
+        database(self.db_path).write(write)
+
+    def close(self):
+        """Close every connection opened by the walker threads (uncommitted rows are dropped)"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    def _subdirs(self, conn, scan_id, path):
+        return [r[0] for r in conn.execute(
+            "SELECT dir_path FROM dir_snapshots WHERE scan_id = ? AND parent_path = ?",
+            (scan_id, path)
+        )]
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.db_path, check_same_thread=False)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
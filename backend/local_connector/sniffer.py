@@ -0,0 +1,186 @@
+"""
+Content Sniffing
+Classifies files by their first bytes (magic numbers) as well as their
+extension, so extensionless or renamed PDFs and images are typed (and OCR
+eligible) by what they contain
+"""
+import os
+import queue
+import re
+import threading
+from ..db import connect, database
+
+# Bytes read from the start of each file - overridable from the environment
+SNIFF_BYTES = int(os.getenv("SCAN_SNIFF_BYTES", "8192"))
+
+# (name, pattern at the start of the file, file_type, mime_type), tried in
+# order. file_type uses get_file_type's categories; zip is refined by ZIP_MEMBERS.
+SIGNATURES = (
+    ('pdf', rb'%PDF-', 'pdf', 'application/pdf'),
+    ('jpeg', rb'\xff\xd8\xff', 'image', 'image/jpeg'),
+    ('png', rb'\x89PNG\r\n\x1a\n', 'image', 'image/png'),
+    ('gif', rb'GIF8[79]a', 'image', 'image/gif'),
+    ('tiff', rb'II\*\x00|MM\x00\*', 'image', 'image/tiff'),
+    ('bmp', rb'BM.{4}\x00\x00\x00\x00', 'image', 'image/bmp'),
+    ('webp', rb'RIFF.{4}WEBP', 'image', 'image/webp'),
+    ('ole', rb'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'office', 'application/x-ole-storage'),
+    ('zip', rb'PK\x03\x04', 'archive', 'application/zip'),
+    ('gzip', rb'\x1f\x8b', 'archive', 'application/gzip'),
+    ('rar', rb'Rar!\x1a\x07', 'archive', 'application/vnd.rar'),
+    ('sevenzip', rb"7z\xbc\xaf'\x1c", 'archive', 'application/x-7z-compressed'),
+    ('tar', rb'.{257}ustar', 'archive', 'application/x-tar'),
+)
+
+# One alternation, matched once per file
+SIGNATURE_RE = re.compile(b'|'.join(
+    b'(?P<%s>%s)' % (name.encode(), pattern) for name, pattern, _, _ in SIGNATURES
+), re.DOTALL)
+SIGNATURE_TYPES = {name: (file_type, mime) for name, _, file_type, mime in SIGNATURES}
+
+# Zip containers told apart by the member names near their start
+ZIP_MEMBERS = (
+    (b'word/', 'office', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    (b'xl/', 'office', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    (b'ppt/', 'office', 'application/vnd.openxmlformats-officedocument.presentationml.presentation'),
+    (b'mimetypeapplication/vnd.oasis.opendocument.', 'office', 'application/vnd.oasis.opendocument'),
+)
+
+
+def init_tables(cursor):
+    """Create the sniffing cache (in files.db)"""
+    # One row per file (device, inode); valid while its mtime and size match
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sniff_cache (
+            device INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            file_type TEXT,
+            mime_type TEXT,
+            PRIMARY KEY (device, inode)
+        ) WITHOUT ROWID
+    ''')
+
+
+def match(data):
+    """(file_type, mime_type) of the first bytes of a file, or None if no signature matches"""
+    found = SIGNATURE_RE.match(data)
+    if found is None:
+        return None
+    if found.lastgroup == 'zip':
+        for member, file_type, mime in ZIP_MEMBERS:
+            if member in data:
+                return file_type, mime
+    return SIGNATURE_TYPES[found.lastgroup]
+
+
+class BufferPool:
+    """Fixed set of reusable read buffers shared by the walker threads"""
+
+    def __init__(self, count, size):
+        self.size = size
+        self._free = queue.LifoQueue()
+        for _ in range(count):
+            self._free.put(bytearray(size))
+
+    def read(self, path):
+        """First size bytes of a file (a copy, so the buffer goes straight back)"""
+        buffer = self._free.get()
+        try:
+            with open(path, 'rb', buffering=0) as f:
+                count = f.readinto(buffer)
+            return bytes(memoryview(buffer)[:count])
+        finally:
+            self._free.put(buffer)
+
+
+class Sniffer:
+    """
+    Content classification for a scan, cached per file across scans
+
+    sniff() is called from the walker threads for every file they list, so
+    reads run in parallel with (and as part of) the walk. A file whose
+    (device, inode) is cached with the same mtime and size is not read
+    again, so a rescan only reads new and changed files. New results are
+    queued and written by commit(), with each checkpoint.
+
+    Args:
+        db_path: Path of files.db
+        workers: Walker threads (one read buffer each)
+        sniff_bytes: Bytes read per file (defaults to SNIFF_BYTES)
+    """
+
+    def __init__(self, db_path, workers, sniff_bytes=None):
+        self.db_path = db_path
+        self.read_count = 0
+        self.cached_count = 0
+        self.matched_count = 0
+        self.errors = 0
+
+        self._buffers = BufferPool(workers, sniff_bytes or SNIFF_BYTES)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def sniff(self, path, stat_info):
+        """(file_type, mime_type) from a file's content, or None if it has no known signature"""
+        key = (stat_info.st_dev, stat_info.st_ino)
+        # Some filesystems report no inode numbers: read, do not cache
+        if stat_info.st_ino:
+            row = self._connection().execute(
+                "SELECT mtime_ns, size, file_type, mime_type FROM sniff_cache WHERE device = ? AND inode = ?", key
+            ).fetchone()
+            if row is not None and row[:2] == (stat_info.st_mtime_ns, stat_info.st_size):
+                with self._lock:
+                    self.cached_count += 1
+                return (row[2], row[3]) if row[2] else None
+        try:
+            sniffed = match(self._buffers.read(path))
+        except OSError:
+            with self._lock:
+                self.errors += 1
+            return None
+        with self._lock:
+            self.read_count += 1
+            self.matched_count += sniffed is not None
+            if stat_info.st_ino:
+                self._pending.append(key + (stat_info.st_mtime_ns, stat_info.st_size) + (sniffed or (None, None)))
+        return sniffed
+
+    def commit(self):
+        """Write the cache rows of files sniffed since the last commit"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        database(self.db_path).execute_many('''
+            INSERT OR REPLACE INTO sniff_cache (device, inode, mtime_ns, size, file_type, mime_type)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+    @property
+    def counts(self):
+        return {
+            'read': self.read_count,
+            'cached': self.cached_count,
+            'matched': self.matched_count,
+            'errors': self.errors,
+        }
+
+    def close(self):
+        """Close every connection opened by the walker threads"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.db_path, check_same_thread=False)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
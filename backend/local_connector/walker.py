@@ -0,0 +1,206 @@
+"""
+Parallel Directory Walker
+Lists directories with os.scandir across a thread pool using work-stealing queues
+"""
+import os
+import queue
+import threading
+from collections import deque
+
+# Default number of listing threads - overridable from the environment
+WALK_WORKERS = int(os.getenv("SCAN_WALK_WORKERS", "8"))
+
+# Max files handed to the consumer in one chunk
+CHUNK_SIZE = 1000
+
+
+class ParallelWalker:
+    """
+    Walk a directory tree with several threads and yield (name, path, stat) for files
+
+    Each worker owns a deque of pending directories. It pushes subdirectories it
+    discovers onto its own deque and pops from the same end (depth-first, keeps
+    the listing local); an idle worker steals the oldest directory from another
+    worker's deque. DirEntry.stat() is used so no second path lookup is needed.
+
+    Matches os.walk semantics: symlinked directories are not followed, and
+    unreadable directories or files are skipped (recorded in errors).
+
+    Args:
+        root: Directory to walk
+        workers: Number of listing threads (defaults to SCAN_WALK_WORKERS)
+        stop_flag: Callable that returns True if the walk should stop
+        max_pending_chunks: Bound on chunks waiting for the consumer (backpressure)
+        snapshots: Optional DirSnapshots; directories finished before a resume or
+            unchanged since its base scan are not listed, and each directory's
+            snapshot row is handed back in order after its files
+        sniffer: Optional callable (path, stat) run on each file by the listing
+            thread; its result is yielded as a fourth item, (name, path, stat, sniffed)
+        progress: Optional ScanProgress given the directories pending and listed
+    """
+
+    def __init__(self, root, workers=None, stop_flag=None, max_pending_chunks=64, snapshots=None, sniffer=None,
+                 progress=None):
+        self.root = root
+        self.workers = max(1, workers or WALK_WORKERS)
+        self.stop_flag = stop_flag
+        self.snapshots = snapshots
+        self.sniffer = sniffer
+        self.progress = progress
+        self.errors = []
+
+        self._deques = [deque() for _ in range(self.workers)]
+        self._lock = threading.Lock()
+        self._work_ready = threading.Condition(self._lock)
+        self._pending = 0
+        self._done = threading.Event()
+        self._closed = threading.Event()
+        self._results = queue.Queue(maxsize=max_pending_chunks)
+
+    def __iter__(self):
+        self._push(0, self.root)
+        threads = [
+            threading.Thread(target=self._worker, args=(i,), daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                try:
+                    chunk = self._results.get(timeout=0.1)
+                except queue.Empty:
+                    if self.stop_flag and self.stop_flag():
+                        break
+                    continue
+                # Workers emit before finishing a directory, so the end marker
+                # arrives after every chunk
+                if chunk is None:
+                    break
+                # A directory's snapshot row follows its files: once the consumer
+                # pulls past it, every file of the directory has been handed over
+                if type(chunk) is tuple:
+                    self.snapshots.done(chunk)
+                    continue
+                yield from chunk
+        finally:
+            self._shutdown()
+            for thread in threads:
+                thread.join()
+
+    def _shutdown(self):
+        self._closed.set()
+        with self._lock:
+            self._done.set()
+            self._work_ready.notify_all()
+
+    def _push(self, index, path):
+        with self._lock:
+            self._deques[index].append(path)
+            self._pending += 1
+            if self.progress is not None:
+                self.progress.dirs_pending = self._pending
+            self._work_ready.notify()
+
+    def _next_dir(self, index):
+        """Pop from our own deque, else steal from another worker, else wait"""
+        with self._lock:
+            while not self._done.is_set():
+                own = self._deques[index]
+                if own:
+                    return own.pop()
+                for offset in range(1, self.workers):
+                    victim = self._deques[(index + offset) % self.workers]
+                    if victim:
+                        return victim.popleft()
+                self._work_ready.wait()
+            return None
+
+    def _finish_dir(self):
+        with self._lock:
+            self._pending -= 1
+            if self.progress is not None:
+                self.progress.dirs_pending = self._pending
+                self.progress.dirs_listed = (self.progress.dirs_listed or 0) + 1
+            finished = self._pending == 0
+            if finished:
+                self._done.set()
+                self._work_ready.notify_all()
+        if finished:
+            self._emit(None)
+
+    def _worker(self, index):
+        while True:
+            path = self._next_dir(index)
+            if path is None:
+                return
+            try:
+                # Check stop flag before listing each directory
+                if not (self.stop_flag and self.stop_flag()):
+                    self._list_dir(index, path)
+            except Exception as e:
+                self.errors.append(f"Error listing {path}: {e}")
+            finally:
+                self._finish_dir()
+
+    def _list_dir(self, index, path):
+        mtime = None
+        if self.snapshots is not None:
+            # Finished before a resume, or unchanged since the base scan:
+            # walk on without listing
+            subdirs = self.snapshots.finished(path)
+            if subdirs is None:
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError as e:
+                    self.errors.append(f"Error listing {path}: {e}")
+                    return
+                carried = self.snapshots.carry(path, mtime)
+                if carried is not None:
+                    subdirs, row = carried
+                    self._emit(row)
+            if subdirs is not None:
+                for subdir in subdirs:
+                    self._push(index, subdir)
+                return
+
+        chunk = []
+        subdirs = []
+        entry_count = 0
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    entry_count += 1
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                self._push(index, entry.path)
+                                subdirs.append(entry.path)
+                            continue
+                        if self.sniffer is None:
+                            chunk.append((entry.name, entry.path, entry.stat()))
+                        else:
+                            stat = entry.stat()
+                            chunk.append((entry.name, entry.path, stat, self.sniffer(entry.path, stat)))
+                    except OSError:
+                        continue
+                    if len(chunk) >= CHUNK_SIZE:
+                        self._emit(chunk)
+                        chunk = []
+        except OSError as e:
+            self.errors.append(f"Error listing {path}: {e}")
+            # Not recorded: a partial listing must not be carried forward
+            entry_count = None
+        if chunk:
+            self._emit(chunk)
+        if self.snapshots is not None and entry_count is not None:
+            self._emit(self.snapshots.listed(path, mtime, entry_count, subdirs))
+
+    def _emit(self, chunk):
+        while not self._closed.is_set():
+            try:
+                self._results.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                continue
@@ -0,0 +1,162 @@
+"""
+Streaming Ingestion Pipeline
+Consumes file records from the scanner generators and commits them in bounded batches
+"""
+import asyncio
+import os
+import time
+
+# Batch tuning - overridable from the environment
+BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "1000"))
+FLUSH_INTERVAL = float(os.getenv("SCAN_FLUSH_INTERVAL", "2.0"))
+
+
+def empty_summary():
+    """Return a summary with nothing counted yet"""
+    return {
+        'total_files': 0,
+        'total_size': 0,
+        'file_type_distribution': {},
+        'ocr_eligible_count': 0
+    }
+
+
+def merge_summary(total, summary):
+    """Add a batch summary into a running summary (in place)"""
+    total['total_files'] += summary['total_files']
+    total['total_size'] += summary['total_size']
+    total['ocr_eligible_count'] += summary['ocr_eligible_count']
+
+    distribution = total['file_type_distribution']
+    for ftype, count in summary['file_type_distribution'].items():
+        distribution[ftype] = distribution.get(ftype, 0) + count
+
+    return total
+
+
+def ingest(scan_id, records, save_files, summarize, batch_size=None, flush_interval=None, top_n=None,
+           progress=None):
+    """
+    Commit records to the database in bounded batches while the scan is running
+
+    A batch is flushed when it reaches batch_size records or when flush_interval
+    seconds have passed since the last flush, whichever comes first. Batches
+    already committed stay in the database if the scan is stopped or crashes.
+
+    Args:
+        scan_id: Scan the records belong to
+        records: Iterable of file dictionaries (usually a scanner generator)
+        save_files: Connector save_files(scan_id, files) function
+        summarize: Connector get_summary(files) function, applied per batch
+        batch_size: Max records per batch (defaults to SCAN_BATCH_SIZE)
+        flush_interval: Max seconds between flushes (defaults to SCAN_FLUSH_INTERVAL)
+        top_n: Keep only the N most common types in the final distribution
+        progress: Optional ScanProgress counting every record as it arrives
+
+    Returns:
+        Summary dictionary for everything committed
+    """
+    batch_size = batch_size or BATCH_SIZE
+    flush_interval = FLUSH_INTERVAL if flush_interval is None else flush_interval
+
+    total = empty_summary()
+    batch = []
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal batch, last_flush
+        pending, batch = batch, []
+        if pending:
+            save_files(scan_id, pending)
+            merge_summary(total, summarize(pending))
+        last_flush = time.monotonic()
+
+    try:
+        for record in records:
+            batch.append(record)
+            if progress is not None:
+                progress.add(record)
+            if len(batch) >= batch_size or time.monotonic() - last_flush >= flush_interval:
+                flush()
+    except BaseException:
+        # Commit whatever was collected before a scanner error; if that fails
+        # too, the scanner's error is still the one raised
+        try:
+            flush()
+        except Exception as e:
+            print(f"Warning: could not commit the last batch of scan {scan_id}: {e}")
+        raise
+    # Commit whatever was collected before a stop or the end of the scan
+    flush()
+
+    return top_types(total, top_n)
+
+
+async def ingest_async(scan_id, records, save_files, summarize, batch_size=None, flush_interval=None, top_n=None,
+                       progress=None):
+    """
+    Async counterpart of ingest for async generators (e.g. aiter_azure_blob)
+
+    Batches are flushed by the same rules as ingest. Each commit runs on a
+    worker thread (save_files is a blocking sqlite write), so the event loop
+    keeps serving other scans meanwhile. If the task is cancelled, the batch
+    collected so far is still committed before the cancellation propagates.
+
+    Args:
+        scan_id: Scan the records belong to
+        records: Async iterable of file dictionaries
+        save_files: Connector save_files(scan_id, files) function
+        summarize: Connector get_summary(files) function, applied per batch
+        batch_size: Max records per batch (defaults to SCAN_BATCH_SIZE)
+        flush_interval: Max seconds between flushes (defaults to SCAN_FLUSH_INTERVAL)
+        top_n: Keep only the N most common types in the final distribution
+        progress: Optional ScanProgress counting every record as it arrives
+
+    Returns:
+        Summary dictionary for everything committed
+    """
+    batch_size = batch_size or BATCH_SIZE
+    flush_interval = FLUSH_INTERVAL if flush_interval is None else flush_interval
+
+    total = empty_summary()
+    batch = []
+    last_flush = time.monotonic()
+
+    async def flush():
+        nonlocal batch, last_flush
+        pending, batch = batch, []
+        if pending:
+            await asyncio.to_thread(save_files, scan_id, pending)
+            merge_summary(total, summarize(pending))
+        last_flush = time.monotonic()
+
+    try:
+        async for record in records:
+            batch.append(record)
+            if progress is not None:
+                progress.add(record)
+            if len(batch) >= batch_size or time.monotonic() - last_flush >= flush_interval:
+                await flush()
+    except BaseException:
+        # Commit whatever was collected before a cancellation or a scanner
+        # error; if that fails too, the original error is still the one raised
+        try:
+            await flush()
+        except Exception as e:
+            print(f"Warning: could not commit the last batch of scan {scan_id}: {e}")
+        raise
+    # Commit whatever was collected before a stop or the end of the scan
+    await flush()
+
+    return top_types(total, top_n)
+
+
+def top_types(total, top_n=None):
+    """Keep only the top_n most common types in a summary's distribution (in place)"""
+    if top_n:
+        distribution = total['file_type_distribution']
+        total['file_type_distribution'] = dict(
+            sorted(distribution.items(), key=lambda x: x[1], reverse=True)[:top_n]
+        )
+
+    return total
@@ -0,0 +1,188 @@
+"""
+Scan Progress
+Live counters of running scans (files and bytes seen, directories pending,
+rate and ETA), published by the scan threads and streamed to clients as
+Server-Sent Events, one coalesced event per tick
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Seconds between two events of a scan's stream - overridable from the environment
+PROGRESS_TICK = float(os.getenv("SCAN_PROGRESS_TICK", "1.0"))
+
+# Seconds of history the current rate is measured over
+RATE_WINDOW = 10.0
+
+# Statuses after which a scan publishes nothing more
+FINAL_STATUSES = ('completed', 'failed', 'stopped')
+
+# Seconds a finished scan's progress is kept for late subscribers (then its
+# saved scan state answers them)
+FINISHED_RETAIN = 60.0
+
+
+class ScanProgress:
+    """
+    Counters of one scan run
+
+    add() is called by the ingestion loop for every record and the walkers
+    set the directory counts, all without a lock: each counter has a single
+    writer, and readers only need a recent value. Rate and ETA are worked
+    out when a snapshot is taken, so publishing costs nothing per record.
+
+    Args:
+        expected_files: Files the scan should end with, when known (the base
+            scan of an incremental or delta scan); else the ETA is estimated
+            from the directories still pending
+    """
+
+    def __init__(self, expected_files=None):
+        self.expected_files = expected_files
+        self.files_seen = 0
+        self.bytes_seen = 0
+        self.dirs_pending = None
+        self.dirs_listed = None
+        self.state = {'status': 'scanning', 'result': None, 'error': None}
+        self.finished = None
+
+        self._started = time.monotonic()
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        """Count one record handed to the ingestion loop"""
+        self.files_seen += 1
+        self.bytes_seen += record.get('file_size') or 0
+
+    def snapshot(self):
+        """Event dictionary of the counters now, with the rate over the last RATE_WINDOW seconds"""
+        now = time.monotonic()
+        files, size = self.files_seen, self.bytes_seen
+        with self._lock:
+            samples = self._samples
+            samples.append((now, files, size))
+            while len(samples) > 2 and now - samples[1][0] >= RATE_WINDOW:
+                samples.popleft()
+            then, files_then, size_then = samples[0] if len(samples) > 1 else (self._started, 0, 0)
+        elapsed = now - then
+        files_rate = (files - files_then) / elapsed if elapsed > 0 else 0.0
+        bytes_rate = (size - size_then) / elapsed if elapsed > 0 else 0.0
+        return {
+            **self.state,
+            'files_seen': files,
+            'bytes_seen': size,
+            'dirs_pending': self.dirs_pending,
+            'dirs_listed': self.dirs_listed,
+            'elapsed_seconds': round(now - self._started, 3),
+            'files_per_second': round(files_rate, 1),
+            'bytes_per_second': round(bytes_rate),
+            'eta_seconds': self._eta(files, files_rate),
+        }
+
+    def counters(self):
+        """snapshot() without the status, result and error"""
+        event = self.snapshot()
+        for key in self.state:
+            event.pop(key, None)
+        return event
+
+    def _eta(self, files, files_rate):
+        if files_rate <= 0:
+            return None
+        if self.expected_files:
+            remaining = max(self.expected_files - files, 0)
+        elif self.dirs_pending is not None and self.dirs_listed:
+            # Pending directories at the mean size of those listed (a lower
+            # bound: their subdirectories are not known yet)
+            remaining = self.dirs_pending * files / self.dirs_listed
+        else:
+            return None
+        return round(remaining / files_rate, 1)
+
+
+class ProgressBus:
+    """
+    Progress of every scan run by this process, by scan id
+
+    Scan threads publish to their scan's ScanProgress; subscribers read it
+    once per tick, however many records arrived in between, so a stream
+    costs the same for a scan of ten files or ten million. A scan's progress
+    is dropped FINISHED_RETAIN seconds after its final status, when the next
+    scan starts or publishes.
+    """
+
+    def __init__(self):
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    def start(self, scan_id, expected_files=None):
+        """New ScanProgress of a scan run (replacing that of an earlier run)"""
+        progress = ScanProgress(expected_files)
+        with self._lock:
+            self._expire()
+            self._scans[scan_id] = progress
+        return progress
+
+    def get(self, scan_id):
+        """ScanProgress of a scan, or None if it was not run by this process"""
+        with self._lock:
+            return self._scans.get(scan_id)
+
+    def publish(self, scan_id, **fields):
+        """Update a scan's status, result or error"""
+        progress = self.get(scan_id)
+        if progress is not None:
+            progress.state = {**progress.state, **fields}
+            if progress.state['status'] in FINAL_STATUSES and progress.finished is None:
+                progress.finished = time.monotonic()
+        with self._lock:
+            self._expire()
+
+    def events(self, scan_id, tick=None):
+        """Server-Sent Events of a scan's progress (see stream)"""
+        last = [self.get(scan_id)]
+
+        def snapshot():
+            # Looked up each tick: a queued scan's progress is replaced when
+            # it starts; one dropped meanwhile still ends its stream
+            last[0] = self.get(scan_id) or last[0]
+            return last[0].snapshot()
+        return stream(snapshot, tick)
+
+    def _expire(self):
+        """Drop scans finished more than FINISHED_RETAIN seconds ago (lock held)"""
+        cutoff = time.monotonic() - FINISHED_RETAIN
+        for scan_id in [scan_id for scan_id, progress in self._scans.items()
+                        if progress.finished is not None and progress.finished < cutoff]:
+            del self._scans[scan_id]
+
+
+async def stream(snapshot, tick=None):
+    """
+    Yield snapshot() as a Server-Sent Event each tick until the scan ends
+
+    Events are named 'progress' while the scan runs; the last one is named
+    after its final status and carries the result or error.
+
+    Args:
+        snapshot: Callable returning an event dictionary (status, result,
+            error and counters), or a coroutine function returning one
+        tick: Seconds between events (defaults to PROGRESS_TICK)
+    """
+    tick = PROGRESS_TICK if tick is None else tick
+    while True:
+        event = snapshot()
+        if asyncio.iscoroutine(event):
+            event = await event
+        final = event['status'] in FINAL_STATUSES
+        name = event['status'] if final else 'progress'
+        if not final:
+            event.pop('result', None)
+        yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+        if final:
+            return
+        await asyncio.sleep(tick)
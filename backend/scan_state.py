@@ -0,0 +1,276 @@
+"""
+Scan State
+Status, stop signals, results and last progress of queued and running scans,
+kept in a store every API worker shares, so a status or stop request can
+land on any worker (uvicorn --workers N)
+"""
+import importlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from . import catalog
+from .db import database
+
+# Store of scan state: sqlite (shared by the processes using one scanner.db),
+# memory (this process only) or module:Class of a custom store
+STATE_BACKEND = os.getenv("SCAN_STATE_BACKEND", "sqlite")
+
+# Max seconds a running scan takes to see a stop requested by another worker
+STOP_POLL_INTERVAL = float(os.getenv("SCAN_STOP_POLL", "0.5"))
+
+# Seconds between a worker's heartbeats; a worker silent for 3 is taken as gone
+HEARTBEAT_INTERVAL = float(os.getenv("SCAN_STATE_HEARTBEAT", "5.0"))
+
+# This process, as the owner of the scans it runs
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Fields a scan's state is updated with (result and progress are JSON)
+FIELDS = ('status', 'result', 'error', 'progress')
+JSON_FIELDS = ('result', 'progress')
+
+
+def init_tables(cursor):
+    """Create the scan state and owner heartbeat tables (in scanner.db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_state (
+            scan_id TEXT PRIMARY KEY,
+            scan_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stop INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            progress TEXT,
+            owner TEXT,
+            updated_at TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_owners (
+            owner TEXT PRIMARY KEY,
+            heartbeat REAL NOT NULL
+        )
+    ''')
+
+
+class MemoryStateStore:
+    """Scan state in this process only (a single API worker)"""
+
+    def __init__(self):
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    def start(self, scan_id, scan_type, status):
+        """Track a scan (replacing an earlier run's state), owned by this process"""
+        with self._lock:
+            self._scans[scan_id] = {
+                'scan_id': scan_id, 'type': scan_type, 'status': status, 'stop': False,
+                'result': None, 'error': None, 'progress': None, 'owner': OWNER,
+                'updated_at': datetime.now().isoformat()
+            }
+
+    def update(self, scan_id, **fields):
+        """Set fields of a tracked scan (see FIELDS)"""
+        with self._lock:
+            if scan_id in self._scans:
+                self._scans[scan_id].update(fields, updated_at=datetime.now().isoformat())
+
+    def get(self, scan_id):
+        """State dictionary of a scan, or None if it is not tracked"""
+        with self._lock:
+            state = self._scans.get(scan_id)
+            return dict(state) if state else None
+
+    def request_stop(self, scan_id, scan_type=None):
+        """Raise a scan's stop flag; False if no such scan (of that type) is tracked"""
+        with self._lock:
+            state = self._scans.get(scan_id)
+            if state is None or (scan_type and state['type'] != scan_type):
+                return False
+            state['stop'] = True
+            return True
+
+    def stop_requested(self, scan_id):
+        """Stop flag of a scan (False if it is not tracked)"""
+        state = self._scans.get(scan_id)
+        return bool(state and state['stop'])
+
+    def claim(self, scan_id, scan_type):
+        """Take over a scan left by a process that is gone: here, any scan not tracked yet"""
+        with self._lock:
+            if scan_id in self._scans:
+                return False
+            self._scans[scan_id] = {
+                'scan_id': scan_id, 'type': scan_type, 'status': 'failed', 'stop': False,
+                'result': None, 'error': None, 'progress': None, 'owner': OWNER,
+                'updated_at': datetime.now().isoformat()
+            }
+            return True
+
+    def heartbeat(self):
+        """Nothing to renew in a single process"""
+
+    def leave(self):
+        """Nothing to hand over in a single process"""
+
+    def clear(self):
+        """Forget every scan"""
+        with self._lock:
+            self._scans.clear()
+
+
+class SQLiteStateStore:
+    """
+    Scan state in scanner.db, shared by every process using it
+
+    Each scan is owned by the process running it, and each process renews
+    a heartbeat while it lives; a scan whose owner stopped beating can be
+    claimed by another process (claim() is atomic), so a scan interrupted
+    with its worker is restarted exactly once.
+
+    Writes go through scanner.db's writer thread and reads through its read
+    pool (see db.Database); in WAL mode status reads do not wait for scan
+    writes. A stop flag is read again at most every STOP_POLL_INTERVAL
+    seconds per scan: scanners check it for every file, and a stop
+    requested through another worker reaches them within that time.
+
+    Args:
+        db_path: Path of scanner.db (defaults to the catalog's)
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self._tables_ready = None
+        # scan_id -> (next read, stop flag)
+        self._stops = {}
+
+    def _database(self):
+        db = database(self.db_path or catalog.SCANS_DB)
+        if self._tables_ready is not db:
+            db.write(lambda conn: init_tables(conn.cursor()))
+            self._tables_ready = db
+        return db
+
+    def _execute(self, query, params=()):
+        return self._database().execute(query, params)
+
+    def start(self, scan_id, scan_type, status):
+        """Track a scan (replacing an earlier run's state), owned by this process"""
+        self._stops.pop(scan_id, None)
+        self._execute('''
+            INSERT OR REPLACE INTO scan_state (scan_id, scan_type, status, stop, owner, updated_at)
+            VALUES (?, ?, ?, 0, ?, ?)
+        ''', (scan_id, scan_type, status, OWNER, datetime.now().isoformat()))
+
+    def update(self, scan_id, **fields):
+        """Set fields of a tracked scan (see FIELDS)"""
+        columns = [field for field in FIELDS if field in fields]
+        if not columns:
+            return
+        values = [json.dumps(fields[field]) if field in JSON_FIELDS and fields[field] is not None else fields[field]
+                  for field in columns]
+        self._execute(
+            f"UPDATE scan_state SET {', '.join(f'{column} = ?' for column in columns)}, updated_at = ? WHERE scan_id = ?",
+            values + [datetime.now().isoformat(), scan_id]
+        )
+
+    def get(self, scan_id):
+        """State dictionary of a scan, or None if it is not tracked"""
+        with self._database().read() as conn:
+            row = conn.execute('''
+                SELECT scan_type, status, stop, result, error, progress, owner, updated_at
+                FROM scan_state WHERE scan_id = ?
+            ''', (scan_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'scan_id': scan_id,
+            'type': row[0],
+            'status': row[1],
+            'stop': bool(row[2]),
+            'result': json.loads(row[3]) if row[3] else None,
+            'error': row[4],
+            'progress': json.loads(row[5]) if row[5] else None,
+            'owner': row[6],
+            'updated_at': row[7],
+        }
+
+    def request_stop(self, scan_id, scan_type=None):
+        """Raise a scan's stop flag; False if no such scan (of that type) is tracked"""
+        query = "UPDATE scan_state SET stop = 1 WHERE scan_id = ?"
+        params = [scan_id]
+        if scan_type:
+            query += " AND scan_type = ?"
+            params.append(scan_type)
+        if not self._execute(query, params):
+            return False
+        self._stops[scan_id] = (float('inf'), True)
+        return True
+
+    def stop_requested(self, scan_id):
+        """Stop flag of a scan, read from the database at most every STOP_POLL_INTERVAL seconds"""
+        now = time.monotonic()
+        next_read, stop = self._stops.get(scan_id, (0, False))
+        if now < next_read:
+            return stop
+        with self._database().read() as conn:
+            row = conn.execute("SELECT stop FROM scan_state WHERE scan_id = ?", (scan_id,)).fetchone()
+        stop = bool(row and row[0])
+        # A raised flag stays raised: no need to read it again
+        self._stops[scan_id] = (float('inf') if stop else now + STOP_POLL_INTERVAL, stop)
+        return stop
+
+    def claim(self, scan_id, scan_type):
+        """
+        Take over a scan whose owner is gone
+
+        A scan with no state is not claimed: it is not run by a worker of
+        this store (e.g. a browser upload still being saved).
+
+        Returns:
+            True if this process now owns the scan and should restart (or
+            fail) it; False if it has no state or is owned by this or
+            another live process
+        """
+        cutoff = time.time() - 3 * HEARTBEAT_INTERVAL
+        # The writer's transactions are BEGIN IMMEDIATE: two processes cannot both take it over
+        return bool(self._execute('''
+            UPDATE scan_state SET owner = ?, updated_at = ?
+            WHERE scan_id = ? AND owner IS NOT ?
+              AND owner NOT IN (SELECT owner FROM scan_owners WHERE heartbeat > ?)
+        ''', (OWNER, datetime.now().isoformat(), scan_id, OWNER, cutoff)))
+
+    def heartbeat(self):
+        """Renew this process's ownership of its scans"""
+        self._execute("INSERT OR REPLACE INTO scan_owners (owner, heartbeat) VALUES (?, ?)", (OWNER, time.time()))
+
+    def leave(self):
+        """Give up this process's scans at shutdown (others may claim them at once)"""
+        self._execute("DELETE FROM scan_owners WHERE owner = ?", (OWNER,))
+
+    def clear(self):
+        """Forget every scan"""
+        self._stops.clear()
+        if os.path.exists(self.db_path or catalog.SCANS_DB):
+            self._execute("DELETE FROM scan_state")
+
+
+def open_store(backend=None):
+    """
+    Scan state store of a backend name (defaults to SCAN_STATE_BACKEND)
+
+    A custom backend is given as module:Class; it is created without
+    arguments and must provide the methods of MemoryStateStore.
+    """
+    backend = backend or STATE_BACKEND
+    if backend == 'sqlite':
+        return SQLiteStateStore()
+    if backend == 'memory':
+        return MemoryStateStore()
+    module, _, name = backend.partition(':')
+    if not name:
+        raise ValueError(f"Unknown scan state backend: {backend} (expected sqlite, memory or module:Class)")
+    return getattr(importlib.import_module(module), name)()
@@ -0,0 +1,297 @@
+"""
+Scan Scheduler
+Bounded pool of scan workers fed from a persistent, prioritized job queue,
+with a cap on concurrent scans per resource (local disks, SMB server, Azure)
+"""
+import itertools
+import json
+import os
+import re
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from . import catalog
+from .db import database
+
+# Scans running at once - overridable from the environment
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "8"))
+
+# Concurrent scans per resource: all local folders, one SMB server, all Azure listings
+RESOURCE_LIMITS = {
+    'local': int(os.getenv("SCAN_MAX_LOCAL", "2")),
+    'shared': int(os.getenv("SHARED_MAX_PER_SERVER", "2")),
+    'azure': int(os.getenv("AZURE_MAX_SCANS", "8")),
+}
+
+# Seconds between looks for a slot while queued jobs wait on a full resource
+# (slots freed by other processes do not wake this one's workers)
+SLOT_POLL_INTERVAL = 1.0
+
+
+def init_tables(cursor):
+    """Create the job queue (in scanner.db, next to the scans)"""
+    # seq keeps submission order within a priority
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_id TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            resource TEXT,
+            priority INTEGER NOT NULL DEFAULT 0,
+            args TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            created_at TEXT
+        )
+    ''')
+
+
+def share_resource(path):
+    r"""
+    Resource key of a share: its server for a UNC path (\\server\share or
+    //server/share), else the first two components of a mounted path
+    (/mnt/nas1/share -> /mnt/nas1)
+    """
+    parts = [part for part in re.split(r'[\\/]+', path) if part]
+    if path[:2] in ('\\\\', '//') and parts:
+        return f"shared:{parts[0].lower()}"
+    return f"shared:{'/'.join(parts[:2]).lower()}"
+
+
+class Job:
+    """A queued or running scan: kind names the registered target, args are its JSON arguments"""
+
+    def __init__(self, scan_id, kind, args, resource=None, priority=0, status='queued', persist=True):
+        self.seq = None
+        self.persist = persist
+        self.status = status
+        self.scan_id = scan_id
+        self.kind = kind
+        self.args = args
+        self.resource = resource
+        self.priority = priority
+
+    @property
+    def order(self):
+        """Highest priority first, then first submitted"""
+        return (-self.priority, self.seq)
+
+
+class ScanScheduler:
+    """
+    Runs scans on at most `workers` threads, highest priority first
+
+    Each job names a resource (e.g. 'local', 'shared:nas1', 'azure'); a job
+    is only started while fewer than its limit of jobs on the same resource
+    are running (the limit of 'shared:nas1' is that of 'shared'). A job
+    whose resource is full waits without holding back jobs on other
+    resources behind it. Running jobs are counted in scan_jobs, so the
+    limits hold across every process sharing scanner.db.
+
+    Jobs are saved in scan_jobs when submitted and deleted when they end,
+    so jobs still queued when the server stops can be submitted again on
+    the next start (saved_jobs()). Jobs that were running are listed too,
+    but their scans are resumed from their checkpoints instead.
+
+    Args:
+        workers: Worker threads (defaults to SCAN_WORKERS)
+        limits: Running jobs allowed per resource (defaults to RESOURCE_LIMITS)
+        on_start: Optional callable(scan_id) run as a job is started; the job
+            is dropped instead if it returns False
+        db_path: Path of scanner.db (defaults to the catalog's)
+    """
+
+    def __init__(self, workers=None, limits=None, on_start=None, db_path=None):
+        self.workers = max(1, workers or SCAN_WORKERS)
+        self.limits = dict(RESOURCE_LIMITS if limits is None else limits)
+        self.on_start = on_start
+        self.db_path = db_path
+
+        self._targets = {}
+        self._queued = {}
+        self._running = {}
+        self._order = itertools.count()
+        self._tables_ready = None
+        self._threads = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def register(self, kind, target):
+        """
+        Run jobs of this kind as target(*args)
+
+        A target may start its scan elsewhere (e.g. on an event loop) and
+        return its concurrent.futures.Future: the worker is free at once,
+        and the job holds its resource slot until the future is done.
+        """
+        self._targets[kind] = target
+
+    def submit(self, scan_id, kind, args, resource=None, priority=0, persist=True):
+        """
+        Queue a scan (replacing a job of the same scan still queued)
+
+        Args:
+            scan_id: Scan the job runs
+            kind: Registered target
+            args: JSON-serializable arguments of the target
+            resource: Resource key the job counts against (None: no limit)
+            priority: Higher runs first
+            persist: Save the job to survive a restart (not for jobs with
+                secrets in their arguments, such as a caller's connection string)
+        """
+        if persist:
+            def save(conn):
+                conn.execute("DELETE FROM scan_jobs WHERE scan_id = ?", (scan_id,))
+                conn.execute('''
+                    INSERT INTO scan_jobs (scan_id, kind, resource, priority, args, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (scan_id, kind, resource, priority, json.dumps(args), datetime.now().isoformat()))
+            self._database().write(save)
+        self._enqueue(Job(scan_id, kind, args, resource, priority, persist=persist))
+
+    def saved_jobs(self):
+        """Saved jobs (queued or running, of any process), in submission order"""
+        with self._database().read() as conn:
+            rows = conn.execute(
+                "SELECT scan_id, kind, args, resource, priority, status FROM scan_jobs ORDER BY seq"
+            ).fetchall()
+        return [Job(scan_id, kind, json.loads(args), resource, priority, status)
+                for scan_id, kind, args, resource, priority, status in rows]
+
+    def forget(self, scan_id):
+        """Delete a saved job (one left running by a process that is gone)"""
+        self._delete(scan_id)
+
+    def position(self, scan_id):
+        """1-based place of a queued scan in start order, or None if it is not queued"""
+        with self._lock:
+            job = self._queued.get(scan_id)
+            if job is None:
+                return None
+            return 1 + sum(other.order < job.order for other in self._queued.values())
+
+    def cancel(self, scan_id):
+        """Drop a queued scan; False if it is not queued (already running or unknown)"""
+        with self._lock:
+            job = self._queued.pop(scan_id, None)
+        if job is None:
+            return False
+        self._delete(scan_id)
+        return True
+
+    def counts(self):
+        """Jobs queued and running, in total and per resource"""
+        with self._lock:
+            running = {}
+            for job in self._running.values():
+                running[job.resource] = running.get(job.resource, 0) + 1
+            return {'queued': len(self._queued), 'running': len(self._running), 'running_by_resource': running}
+
+    def close(self):
+        """Stop taking jobs (running scans finish; queued jobs stay saved)"""
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+
+    def _database(self):
+        db = database(self.db_path or catalog.SCANS_DB)
+        if self._tables_ready is not db:
+            db.write(lambda conn: init_tables(conn.cursor()))
+            self._tables_ready = db
+        return db
+
+    def _enqueue(self, job):
+        with self._lock:
+            job.seq = next(self._order)
+            self._queued[job.scan_id] = job
+            if not self._threads:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self._worker, daemon=True)
+                    self._threads.append(thread)
+                    thread.start()
+            self._changed.notify()
+
+    def _limit(self, resource):
+        if resource is None:
+            return None
+        return self.limits.get(resource, self.limits.get(resource.split(':', 1)[0]))
+
+    def _admit(self):
+        """
+        Mark the highest-priority queued job whose resource has room as
+        running and return it (lock held), or None
+
+        The running jobs of every process are counted and the job's row is
+        marked in one writer transaction, so no other process can take the
+        same slot in between. A job kept in memory only gets a row without
+        its arguments while it runs, to be counted too.
+        """
+        jobs = sorted(self._queued.values(), key=lambda job: job.order)
+        if not jobs:
+            return None
+
+        def admit(conn):
+            running = dict(conn.execute(
+                "SELECT resource, COUNT(*) FROM scan_jobs WHERE status = 'running' GROUP BY resource"
+            ).fetchall())
+            for job in jobs:
+                limit = self._limit(job.resource)
+                if limit is not None and running.get(job.resource, 0) >= limit:
+                    continue
+                conn.execute('''
+                    INSERT INTO scan_jobs (scan_id, kind, resource, priority, args, status, created_at)
+                    VALUES (?, ?, ?, ?, ?, 'running', ?)
+                    ON CONFLICT (scan_id) DO UPDATE SET status = 'running'
+                ''', (job.scan_id, job.kind, job.resource, job.priority,
+                      json.dumps(job.args if job.persist else []), datetime.now().isoformat()))
+                return job
+            return None
+
+        return self._database().write(admit)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                job = None
+                while not self._closed:
+                    try:
+                        job = self._admit()
+                    except Exception as e:
+                        print(f"Warning: scan queue unavailable: {e}")
+                    if job is not None:
+                        break
+                    self._changed.wait(SLOT_POLL_INTERVAL if self._queued else None)
+                if job is None:
+                    return
+                del self._queued[job.scan_id]
+                self._running[job.scan_id] = job
+            started = None
+            try:
+                if self.on_start is None or self.on_start(job.scan_id) is not False:
+                    started = self._targets[job.kind](*job.args)
+            except Exception as e:
+                print(f"Scan job {job.scan_id} failed: {e}")
+            finally:
+                if isinstance(started, Future):
+                    started.add_done_callback(lambda future, job=job: self._ended(job, future))
+                else:
+                    self._finish(job)
+
+    def _ended(self, job, future):
+        """Done callback of a job's future: finish it on a thread of its own, off the thread that ran it"""
+        threading.Thread(target=self._finish, args=(job, future), daemon=True).start()
+
+    def _finish(self, job, future=None):
+        if future is not None and not future.cancelled() and future.exception() is not None:
+            print(f"Scan job {job.scan_id} failed: {future.exception()}")
+        # Its row first: the running rows are what a worker checks for room
+        try:
+            self._delete(job.scan_id)
+        finally:
+            with self._lock:
+                self._running.pop(job.scan_id, None)
+                # A slot of this resource (and a worker) is free
+                self._changed.notify_all()
+
+    def _delete(self, scan_id):
+        self._database().execute("DELETE FROM scan_jobs WHERE scan_id = ?", (scan_id,))
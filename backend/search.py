@@ -0,0 +1,283 @@
+"""
+Server-Side File Search
+Filters a scan's files in SQL (type, extension, size and modified ranges, OCR
+eligibility, path prefix, name substring or glob) over composite indexes of the
+catalog and a trigram index of file names
+"""
+import heapq
+import re
+import sqlite3
+from itertools import islice
+from . import catalog
+from .db import database, decode_cursor
+
+# Names added to the trigram index per transaction (one huge insert is many times slower)
+INDEX_BATCH_ROWS = 50000
+
+# A filter matching more rows than this is checked row by row while walking the
+# (scan_id, file_name) index, which then fills a page quickly, instead of its
+# matches being read from their own index and sorted
+SELECTIVE_ROWS = 10000
+
+# search_files (a view over the catalog, the same for every source) column -> catalog column
+SEARCH_COLUMNS = (
+    ('id', 'id'),
+    ('scan_id', 'scan_id'),
+    ('file_name', 'file_name'),
+    ('file_path', 'file_path'),
+    ('parent_dir', 'dir_id'),
+    ('file_type', 'type_id'),
+    ('extension', 'ext_id'),
+    ('mime_type', 'mime_id'),
+    ('file_size', 'file_size'),
+    ('last_modified', 'last_modified'),
+    ('eligible_for_ocr', 'eligible_for_ocr'),
+)
+
+# Filters search_files accepts
+FILTERS = (
+    'file_type', 'extension', 'min_size', 'max_size', 'modified_after', 'modified_before',
+    'ocr', 'path', 'name',
+)
+
+
+def init_tables(cursor):
+    """Create the search view and the file name index (in files.db)"""
+    catalog.replace_view(cursor, 'search_files', catalog.view_sql('catalog_files', SEARCH_COLUMNS, rebuild_paths=True))
+    # Trigram index of file names: substring (LIKE) and GLOB matches are
+    # answered from it. The names themselves are read from catalog_files.
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS catalog_names USING fts5(
+            file_name, content='catalog_files', content_rowid='id',
+            tokenize='trigram', detail='none'
+        )
+    ''')
+    # Rows up to last_id are indexed (ids only grow); newer ones are added
+    # in batches by index_names, off the scan's write path
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_names_indexed (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_id INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO catalog_names_indexed (id, last_id) VALUES (1, 0)")
+    # An external-content index must be told of deleted rows it holds
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS catalog_names_delete AFTER DELETE ON catalog_files
+        WHEN old.id <= (SELECT last_id FROM catalog_names_indexed)
+        BEGIN
+            INSERT INTO catalog_names (catalog_names, rowid, file_name) VALUES ('delete', old.id, old.file_name);
+        END
+    ''')
+
+
+def index_names(db_path):
+    """
+    Add the names of file rows written since the last call to the trigram index
+
+    Called when a scan completes. Searches also match the rows not indexed
+    yet (see _name_filter), so this only keeps them fast.
+
+    Returns:
+        Number of rows indexed
+    """
+    def index_batch(conn):
+        last_id = conn.execute("SELECT last_id FROM catalog_names_indexed").fetchone()[0]
+        upto, count = conn.execute('''
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM catalog_files WHERE id > ? ORDER BY id LIMIT ?
+            )
+        ''', (last_id, INDEX_BATCH_ROWS)).fetchone()
+        if count:
+            conn.execute('''
+                INSERT INTO catalog_names (rowid, file_name)
+                SELECT id, file_name FROM catalog_files WHERE id > ? AND id <= ?
+            ''', (last_id, upto))
+            conn.execute("UPDATE catalog_names_indexed SET last_id = ?", (upto,))
+        return count
+
+    # One writer transaction per batch: it holds the write lock, so no other
+    # writer holds uncommitted ids below ours
+    db = database(db_path)
+    indexed = 0
+    while True:
+        count = db.write(index_batch)
+        if not count:
+            return indexed
+        indexed += count
+
+
+def _longest_literal(pattern, wildcards):
+    return max((len(part) for part in re.split(wildcards, pattern)), default=0)
+
+
+def _is_selective(conn, sql, params):
+    """True if the rows of a subquery (a cheap index read) are at most SELECTIVE_ROWS"""
+    count = conn.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT ?)", params + [SELECTIVE_ROWS + 1]).fetchone()[0]
+    return count <= SELECTIVE_ROWS
+
+
+def _range_filter(conn, source, column, low, high, driven):
+    """
+    Condition (and params) for low <= column <= high (either bound optional),
+    and whether its index drives the query (see _where)
+    """
+    bounds, params = [], []
+    if low is not None:
+        bounds.append(f"{column} >= ?")
+        params.append(low)
+    if high is not None:
+        bounds.append(f"{column} <= ?")
+        params.append(high)
+    selective = not driven and _is_selective(
+        conn, f"SELECT 1 FROM catalog_files WHERE scan_id = ? AND {' AND '.join(bounds)}", [source] + params
+    )
+    prefix = 'f.' if selective else '+f.'
+    return ' AND '.join(prefix + bound for bound in bounds), params, selective
+
+
+def _equal_filter(conn, source, column, catalog_column, value, driven):
+    """Condition (and params) for a dictionary-encoded column = value, and whether its index drives the query"""
+    side = catalog.DICTIONARIES[catalog_column]
+    selective = not driven and _is_selective(
+        conn,
+        f"SELECT 1 FROM catalog_files WHERE scan_id = ? AND {catalog_column} = (SELECT id FROM {side} WHERE value = ?)",
+        [source, value]
+    )
+    return f"{'f.' if selective else '+f.'}{column} = ?", [value], selective
+
+
+def _name_filter(conn, name):
+    """
+    Condition (and params) matching file names, and whether the trigram
+    index drives the query (see _where)
+
+    name is a glob if it has a wildcard (*, ? or [...], case-sensitive),
+    else a case-insensitive substring. The trigram index narrows the rows
+    when the pattern has a run of three literal characters and few names
+    match; rows written after the index was last brought up to date are
+    matched by name directly.
+    """
+    if re.search(r'[*?\[]', name):
+        exact, exact_params = "f.file_name GLOB ?", [name]
+        operator, pattern = 'GLOB', name
+        literal = _longest_literal(name, r'\[[^\]]*\]|[*?]')
+    else:
+        exact, exact_params = "instr(lower(f.file_name), ?) > 0", [name.lower()]
+        # % and _ in the name become wildcards here (a superset), the exact
+        # check above removes the extra rows
+        operator, pattern = 'LIKE', f"%{name}%"
+        literal = _longest_literal(name, r'[%_]')
+    if literal < 3:
+        return exact, exact_params, False
+
+    matches = f'''
+        SELECT rowid FROM catalog_names WHERE file_name {operator} ?
+        UNION ALL
+        SELECT id FROM catalog_files
+        WHERE id > (SELECT last_id FROM catalog_names_indexed) AND file_name {operator} ?
+    '''
+    if not _is_selective(conn, matches, [pattern, pattern]):
+        return exact, exact_params, False
+    return f"f.id IN ({matches}) AND {exact}", [pattern, pattern] + exact_params, True
+
+
+def _where(conn, source, filters, sep):
+    """
+    WHERE clause (and params) selecting a source scan's rows that match the filters
+
+    The first filter matching few rows (the name, a range, the type, the
+    extension) drives the query from its index, and its matches are sorted.
+    The other conditions get a unary + so SQLite cannot pick their indexes
+    instead: its estimates do not know how many rows a value matches. With
+    no such filter the (scan_id, file_name) index is walked in page order,
+    each row checked, which fills a page quickly since many rows match.
+    """
+    clauses, params = [], []
+    by_name = driven = False
+    if filters.get('name'):
+        clause, clause_params, by_name = _name_filter(conn, filters['name'])
+        clauses.append(clause)
+        params.extend(clause_params)
+        driven = by_name
+    for column, low, high in (
+        ('file_size', 'min_size', 'max_size'),
+        ('last_modified', 'modified_after', 'modified_before'),
+    ):
+        if filters.get(low) is not None or filters.get(high) is not None:
+            clause, clause_params, selective = _range_filter(
+                conn, source, column, filters.get(low), filters.get(high), driven
+            )
+            clauses.append(clause)
+            params.extend(clause_params)
+            driven = driven or selective
+    equal = {
+        'file_type': filters.get('file_type'),
+        'extension': filters.get('extension') and (filters['extension'].lower().lstrip('.') or 'unknown'),
+    }
+    for column, catalog_column in (('file_type', 'type_id'), ('extension', 'ext_id')):
+        if equal[column]:
+            clause, clause_params, selective = _equal_filter(
+                conn, source, column, catalog_column, equal[column], driven
+            )
+            clauses.append(clause)
+            params.extend(clause_params)
+            driven = driven or selective
+    if filters.get('ocr') is not None:
+        clauses.append("COALESCE(f.eligible_for_ocr, 0) = ?")
+        params.append(1 if filters['ocr'] else 0)
+
+    # The filter indexes start with scan_id; the name matches are ids
+    path = filters.get('path')
+    if path:
+        scope, scope_params = catalog.subtree_filter(source, path, sep, id_column='+f.id' if driven else 'f.id')
+        if driven and not by_name:
+            scope, scope_params = f"f.scan_id = ? AND {scope}", [source] + scope_params
+    else:
+        scope, scope_params = f"{'+f.' if by_name else 'f.'}scan_id = ?", [source]
+    return ' AND '.join([scope] + clauses), scope_params + params
+
+
+def search_files(db_path, scan_id, filters, scopes=None, sep=catalog.SEP, limit=100, offset=0, cursor=None):
+    """
+    One page of a scan's files matching filters, in (file_name, id) order
+
+    Args:
+        db_path: files.db
+        scan_id: Scan searched (written into the rows' scan_id)
+        filters: {filter: value} with keys from FILTERS; unset or None ones
+            are ignored. Sizes are bytes, dates ISO strings compared with the
+            stored last_modified, path a directory whose subtree is searched.
+        scopes: Sequence of (source scan, condition, params) holding the
+            scan's rows, for incremental and delta scans: each condition
+            (over search_files as f) picks the source's rows that belong to
+            the scan, and their pages are merged. Defaults to all of scan_id's rows.
+        sep: Path separator of the scan's source
+        limit, offset, cursor: As for the connectors' get_scan_files
+    """
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filter: {', '.join(sorted(unknown))}")
+    after = list(decode_cursor(cursor)) if cursor else []
+    keyset = "AND (f.file_name, f.id) > (?, ?)" if cursor else ""
+    start = 0 if cursor else offset
+
+    with database(db_path).read(sqlite3.Row) as conn:
+        pages = []
+        for source, condition, condition_params in scopes or [(scan_id, None, [])]:
+            where, params = _where(conn, source, filters, sep)
+            if condition:
+                where += f" AND {condition}"
+                params += condition_params
+            rows = conn.execute(f'''
+                SELECT f.* FROM search_files f
+                WHERE {where} {keyset}
+                ORDER BY f.file_name, f.id LIMIT ?
+            ''', params + after + [start + limit]).fetchall()
+            pages.append([dict(row) for row in rows])
+
+    merged = heapq.merge(*pages, key=lambda f: (f['file_name'], f['id']))
+    files = list(islice(merged, start, start + limit))
+    for file in files:
+        file['scan_id'] = scan_id
+    return files
@@ -1,11 +1,17 @@
 from .database import (
     init_db, create_scan, save_files, complete_scan, fail_scan,
-    get_all_scans, get_scan_files, get_total_files_count
+    get_all_scans, get_scan_files, get_total_files_count, get_scan_stats,
+    get_scan, get_interrupted_scans, open_checkpoint, prepare_resume,
+    open_error_log, get_scan_errors, export_files, freeze_scan, search_files,
+    diff_scans, hash_files, find_duplicates
 )
-from .scanner import scan_shared_directory, get_summary
+from .scanner import scan_shared_directory, iter_shared_directory, get_summary
 
 __all__ = [
     'init_db', 'create_scan', 'save_files', 'complete_scan', 'fail_scan',
-    'get_all_scans', 'get_scan_files', 'get_total_files_count',
-    'scan_shared_directory', 'get_summary'
+    'get_all_scans', 'get_scan_files', 'get_total_files_count', 'get_scan_stats',
+    'get_scan', 'get_interrupted_scans', 'open_checkpoint', 'prepare_resume',
+    'open_error_log', 'get_scan_errors', 'export_files', 'freeze_scan', 'search_files',
+    'diff_scans', 'hash_files', 'find_duplicates',
+    'scan_shared_directory', 'iter_shared_directory', 'get_summary'
 ]
@@ -4,140 +4,248 @@ Shared Directory Scanner - Database operations
 import sqlite3
 import os
 from datetime import datetime
+from .. import aggregates, catalog, checkpoints, columnar, diff, export, hashing, search
+from ..db import BulkWriter, database, decode_cursor, trim_scan_files
+from .scanner import OCR_EXTENSIONS
+from . import walker
+from .walker import ErrorLog
 
 # Database paths - separated for scans and files
 SCANS_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scanner.db')
 FILES_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files.db')
 
+# shared_scans / shared_scan_files (views over the catalog) column -> catalog column
+SCAN_COLUMNS = (
+    ('id', 'id'),
+    ('scan_name', 'name'),
+    ('share_path', 'location'),
+    ('share_name', 'account'),
+    ('status', 'status'),
+    ('total_files', 'total_files'),
+    ('total_size', 'total_size'),
+    ('created_at', 'start_time'),
+    ('completed_at', 'end_time'),
+)
+FILE_COLUMNS = (
+    ('id', 'id'),
+    ('scan_id', 'scan_id'),
+    ('file_name', 'file_name'),
+    ('file_path', 'file_path'),
+    ('file_size', 'file_size'),
+    ('last_modified', 'last_modified'),
+    ('extension', 'ext_id'),
+    ('file_type', 'type_id'),
+)
+
+def _is_ocr(record):
+    return (record.get('extension') or '').lower().lstrip('.') in OCR_EXTENSIONS
+
+def _dir_of(record):
+    return os.path.dirname(record['file_path']) if record.get('file_path') else None
+
+# Record keys -> catalog_files columns (with defaults), resolved once
+FILES_WRITER = BulkWriter('catalog_files', [
+    ('file_name', 'file_name', None),
+    ('file_path', lambda f: catalog.stored_path(f.get('file_path'), _dir_of(f), f.get('file_name'))),
+    ('file_size', 'file_size', 0),
+    ('last_modified', 'last_modified', None),
+    ('ext_id', 'extension', None),
+    ('type_id', 'file_type', None),
+    ('eligible_for_ocr', _is_ocr),
+    ('dir_id', _dir_of),
+], aggregate=(
+    lambda f: (f.get('extension') or 'unknown').lower().lstrip('.') or 'unknown',
+    _is_ocr
+), dictionaries=catalog.DICTIONARIES, trees=catalog.TREES)
+
+# SQL equivalents of the aggregate keys, for rebuilding older scans
+STATS_TYPE_SQL = "COALESCE(NULLIF(LTRIM(LOWER(extension), '.'), ''), 'unknown')"
+STATS_OCR_SQL = "LTRIM(LOWER(extension), '.') IN ({})".format(', '.join(f"'{ext}'" for ext in OCR_EXTENSIONS))
+
 def init_db():
     """Initialize shared scans database"""
     # Initialize scans database
-    conn = sqlite3.connect(SCANS_DB)
+    database(SCANS_DB).write(_init_scans)
+    
+    # Initialize files database
+    database(FILES_DB).write(_init_files)
+
+def _init_scans(conn):
     cursor = conn.cursor()
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shared_scans (
-            id TEXT PRIMARY KEY,
-            scan_name TEXT NOT NULL,
-            share_path TEXT NOT NULL,
-            share_name TEXT NOT NULL,
-            status TEXT DEFAULT 'running',
-            total_files INTEGER,
-            total_size INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            completed_at TIMESTAMP
-        )
-    ''')
+    # Scans live in the unified catalog; shared_scans is a view of the shared ones
+    catalog.init_scans(cursor)
+    if catalog.migrate_table(cursor, 'shared_scans', 'catalog_scans', SCAN_COLUMNS, {'source_type': 'shared'}):
+        # Legacy timestamps were 'YYYY-MM-DD HH:MM:SS'; sort them with the ISO ones
+        cursor.execute('''
+            UPDATE catalog_scans SET start_time = REPLACE(start_time, ' ', 'T'),
+                                     end_time = REPLACE(end_time, ' ', 'T')
+            WHERE source_type = 'shared'
+        ''')
+    catalog.replace_view(cursor, 'shared_scans', catalog.view_sql('catalog_scans', SCAN_COLUMNS, "source_type = 'shared'"))
+
+def _init_files(conn):
+    cursor = conn.cursor()
     
-    conn.commit()
-    conn.close()
+    # Same for file rows: shared_scan_files is a view decoding the catalog's
+    # dictionaries and rebuilding each path from its directory
+    catalog.init_files(cursor)
+    catalog.migrate_table(cursor, 'shared_scan_files', 'catalog_files', FILE_COLUMNS)
+    catalog.replace_view(cursor, 'shared_scan_files', catalog.view_sql('catalog_files', FILE_COLUMNS, rebuild_paths=True))
     
-    # Initialize files database
-    conn = sqlite3.connect(FILES_DB)
-    cursor = conn.cursor()
+    # Materialized per-scan aggregates
+    aggregates.init_tables(cursor)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shared_scan_files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            scan_id TEXT NOT NULL,
-            file_name TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            file_size INTEGER NOT NULL,
-            last_modified REAL,
-            extension TEXT,
-            file_type TEXT,
-            FOREIGN KEY (scan_id) REFERENCES shared_scans(id)
-        )
-    ''')
+    # Server-side search (unified view, file name index)
+    search.init_tables(cursor)
     
-    conn.commit()
-    conn.close()
+    # Resume checkpoints and per-scan walk errors
+    checkpoints.init_tables(cursor)
+    walker.init_tables(cursor)
 
 def create_scan(scan_id, scan_name, share_path, share_name):
     """Create a new scan record"""
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO shared_scans (id, scan_name, share_path, share_name, created_at)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (scan_id, scan_name, share_path, share_name, datetime.now()))
-    conn.commit()
-    conn.close()
+    database(SCANS_DB).execute('''
+        INSERT INTO catalog_scans (id, source_type, name, location, account, status, start_time)
+        VALUES (?, 'shared', ?, ?, ?, 'running', ?)
+    ''', (scan_id, scan_name, share_path, share_name, datetime.now().isoformat()))
 
 def save_files(scan_id, files):
-    """Save scanned files to database"""
-    conn = sqlite3.connect(FILES_DB)
-    cursor = conn.cursor()
-    for file in files:
-        cursor.execute('''
-            INSERT INTO shared_scan_files 
-            (scan_id, file_name, file_path, file_size, last_modified, extension, file_type)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            scan_id,
-            file.get('file_name'),
-            file.get('file_path'),
-            file.get('file_size', 0),
-            file.get('last_modified'),
-            file.get('extension'),
-            file.get('file_type')
-        ))
-    conn.commit()
-    conn.close()
+    """Save scanned files to database in one batched transaction"""
+    FILES_WRITER.write(FILES_DB, scan_id, files)
 
 def complete_scan(scan_id, total_files, total_size):
-    """Mark scan as complete"""
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE shared_scans 
-        SET status = 'completed', total_files = ?, total_size = ?, completed_at = ?
-        WHERE id = ?
-    ''', (total_files, total_size, datetime.now(), scan_id))
-    conn.commit()
-    conn.close()
+    """Mark scan as complete (its checkpoint is no longer needed)"""
+    database(SCANS_DB).execute('''
+        UPDATE catalog_scans 
+        SET status = 'completed', total_files = ?, total_size = ?, end_time = ?
+        WHERE id = ? AND source_type = 'shared'
+    ''', (total_files, total_size, datetime.now().isoformat(), scan_id))
+    checkpoints.clear(FILES_DB, scan_id)
+    # Name search reads its rows from the trigram index from now on
+    search.index_names(FILES_DB)
 
 def fail_scan(scan_id):
     """Mark scan as failed"""
-    conn = sqlite3.connect(SCANS_DB)
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE shared_scans 
-        SET status = 'failed', completed_at = ?
-        WHERE id = ?
-    ''', (datetime.now(), scan_id))
-    conn.commit()
-    conn.close()
+    database(SCANS_DB).execute('''
+        UPDATE catalog_scans 
+        SET status = 'failed', end_time = ?
+        WHERE id = ? AND source_type = 'shared'
+    ''', (datetime.now().isoformat(), scan_id))
+
+def get_scan(scan_id):
+    """Get one shared scan record, or None"""
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        row = conn.execute("SELECT * FROM shared_scans WHERE id = ?", (scan_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_interrupted_scans():
+    """Shared scans still marked running (their scan thread died with the server)"""
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        rows = conn.execute("SELECT * FROM shared_scans WHERE status = 'running'").fetchall()
+    return [dict(row) for row in rows]
+
+def open_checkpoint(scan_id, on_commit=()):
+    """Checkpoint for a shared scan, continuing from any saved one"""
+    return checkpoints.Checkpoint.resume(FILES_DB, scan_id, 'shared', on_commit)
+
+def open_error_log(scan_id):
+    """Error recorder for a scan's walk (pass its add to iter_shared_directory)"""
+    return ErrorLog(FILES_DB, scan_id)
+
+def get_scan_errors(scan_id, kind=None, limit=100, offset=0):
+    """Directories (and files) a shared scan skipped, failed on or found slow"""
+    query = "SELECT path, kind, message, attempts, elapsed, recorded_at FROM shared_scan_errors WHERE scan_id = ?"
+    params = [scan_id]
+    if kind:
+        query += " AND kind = ?"
+        params.append(kind)
+    query += " ORDER BY id LIMIT ? OFFSET ?"
+    with database(FILES_DB).read(sqlite3.Row) as conn:
+        rows = conn.execute(query, params + [limit, offset]).fetchall()
+    return [dict(row) for row in rows]
+
+def prepare_resume(scan_id, keep):
+    """
+    Roll a shared scan back to its last checkpoint and mark it running again
+    
+    Rows read after the last checkpointed directory (keep = rows read up to
+    it) are deleted, then the aggregates are rebuilt.
+    """
+    def roll_back(conn):
+        trim_scan_files(conn, 'catalog_files', scan_id, keep)
+        aggregates.rebuild(conn, scan_id, 'shared_scan_files', STATS_TYPE_SQL, STATS_OCR_SQL)
+    
+    database(FILES_DB).write(roll_back)
+    database(SCANS_DB).execute(
+        "UPDATE catalog_scans SET status = 'running', end_time = NULL WHERE id = ? AND source_type = 'shared'",
+        (scan_id,)
+    )
 
 def get_all_scans():
     """Get all shared scans"""
-    conn = sqlite3.connect(SCANS_DB)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM shared_scans ORDER BY created_at DESC')
-    scans = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return scans
-
-def get_scan_files(scan_id, limit=100, offset=0):
-    """Get files from a specific scan"""
-    conn = sqlite3.connect(FILES_DB)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM shared_scan_files 
-        WHERE scan_id = ? 
-        LIMIT ? OFFSET ?
-    ''', (scan_id, limit, offset))
-    files = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return files
+    with database(SCANS_DB).read(sqlite3.Row) as conn:
+        rows = conn.execute('SELECT * FROM shared_scans ORDER BY created_at DESC').fetchall()
+    return [dict(row) for row in rows]
+
+def get_scan_files(scan_id, limit=100, offset=0, cursor=None, under=None):
+    """Get files from a specific scan (cursor from a previous page overrides offset), optionally only those under a directory"""
+    scope, params = catalog.subtree_filter(scan_id, under) if under else ("scan_id = ?", [scan_id])
+    with database(FILES_DB).read(sqlite3.Row) as conn:
+        if cursor:
+            file_name, row_id = decode_cursor(cursor)
+            rows = conn.execute(f'''
+                SELECT * FROM shared_scan_files 
+                WHERE {scope} AND (file_name, id) > (?, ?)
+                ORDER BY file_name, id
+                LIMIT ?
+            ''', params + [file_name, row_id, limit]).fetchall()
+        else:
+            rows = conn.execute(f'''
+                SELECT * FROM shared_scan_files 
+                WHERE {scope}
+                ORDER BY file_name, id
+                LIMIT ? OFFSET ?
+            ''', params + [limit, offset]).fetchall()
+    return [dict(row) for row in rows]
+
+def export_queries(scan_id):
+    """(sql, params) reading every file row of a scan in (file_name, id) order"""
+    return [("SELECT * FROM shared_scan_files WHERE scan_id = ? ORDER BY file_name, id", [scan_id])]
+
+def export_files(scan_id, fmt, compress=False):
+    """Stream every file row of a scan in an export format (see export.stream)"""
+    return export.stream(FILES_DB, export_queries(scan_id), fmt, scan_id, compress)
+
+def freeze_scan(scan_id):
+    """Write a completed scan's columnar snapshot (see columnar.freeze)"""
+    return columnar.freeze(FILES_DB, export_queries(scan_id), scan_id)
+
+def search_files(scan_id, filters, limit=100, offset=0, cursor=None):
+    """One page of a shared scan's files matching server-side filters (see search.search_files)"""
+    return search.search_files(FILES_DB, scan_id, filters, limit=limit, offset=offset, cursor=cursor)
+
+
+def diff_scans(base_scan_id, target_scan_id):
+    """Files added, removed and modified (by size and last_modified) between two shared scans (see diff.ScanDiff)"""
+    return diff.ScanDiff(FILES_DB, diff.tree_rows, base_scan_id, target_scan_id)
+
+
+def hash_files(scan_id, stop_flag=None):
+    """Hash the files of a shared scan that may have duplicates (see hashing.hash_files)"""
+    return hashing.hash_files(FILES_DB, scan_id, stop_flag=stop_flag).to_dict()
+
+
+def find_duplicates(scan_id, limit=100, offset=0):
+    """Groups of identical files in a hashed shared scan, most wasted bytes first (see hashing.find_duplicates)"""
+    return hashing.find_duplicates(FILES_DB, scan_id, limit=limit, offset=offset)
+
+
+def get_scan_stats(scan_id):
+    """Get materialized aggregates for a scan (distribution by extension), or None if there is no such scan"""
+    return aggregates.load_or_rebuild(FILES_DB, SCANS_DB, scan_id, 'shared_scan_files', STATS_TYPE_SQL, STATS_OCR_SQL)
 
 def get_total_files_count(scan_id):
-    """Get total file count for a scan"""
-    conn = sqlite3.connect(FILES_DB)
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM shared_scan_files WHERE scan_id = ?', (scan_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    """Get total file count for a scan (from the aggregates, not COUNT(*))"""
+    stats = get_scan_stats(scan_id)
+    return stats['total_files'] if stats else 0
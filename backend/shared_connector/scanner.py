@@ -5,21 +5,42 @@ Scans Windows shared folders accessible via UNC paths
 import os
 from pathlib import Path
 from datetime import datetime
+from .walker import ShareWalker
 
-def scan_shared_directory(share_path, share_name, stop_flag=None):
+# Extensions counted as OCR eligible in shared scan summaries
+OCR_EXTENSIONS = ['pdf', 'png', 'jpg', 'jpeg', 'bmp', 'tiff']
+
+def iter_shared_directory(share_path, share_name, stop_flag=None, checkpoint=None,
+                          workers=None, on_error=None, progress=None):
     r"""
-    Scan a shared directory via UNC path
+    Scan a shared directory via UNC path and yield file metadata as it is found
+    
+    The share is walked by a ShareWalker: directories are listed concurrently
+    with a per-directory timeout and retries, but files still come out in the
+    order of a sorted os.walk.
     
     Args:
         share_path: UNC path (e.g., \\192.168.1.100\Share or \\server\folder)
         share_name: Human-readable share name
         stop_flag: Callable that returns True if scan should stop
+        checkpoint: Optional Checkpoint; the walk skips the directories it
+            already finished and marks each finished one
+        workers: Number of listing threads (defaults to SHARED_WALK_WORKERS)
+        on_error: Callable receiving each skipped, failed or slow directory
+            (and unreadable file) as a dict; default collects them in a list
+        progress: Optional ScanProgress given the walker's directory counts
     
-    Returns:
-        List of file metadata dictionaries
+    Yields:
+        File metadata dictionaries
     """
-    files = []
+    count = 0
     errors = []
+    dirs_done = 0
+    resume_after = None
+    if checkpoint is not None:
+        dirs_done = checkpoint.state.get('dirs_done', 0)
+        count = checkpoint.state.get('files_listed', 0)
+        resume_after = checkpoint.state.get('last_dir')
     
     # Validate path exists and is accessible
     if not os.path.exists(share_path):
@@ -28,47 +49,69 @@ def scan_shared_directory(share_path, share_name, stop_flag=None):
     if not os.access(share_path, os.R_OK):
         raise PermissionError(f"No read permissions on: {share_path}")
     
+    walker = ShareWalker(
+        share_path, workers,
+        stop_flag=stop_flag,
+        on_error=on_error or errors.append,
+        # Older checkpoints only have the number of finished directories
+        skip_dirs=0 if resume_after else dirs_done,
+        resume_after=resume_after,
+        progress=progress
+    )
+    
     try:
-        # Walk through shared directory
-        for root, dirs, filenames in os.walk(share_path):
-            # Check stop flag before processing each directory
-            if stop_flag and stop_flag():
-                print(f"Shared scan stopped by user")
-                break
-                
-            for filename in filenames:
+        # Walker checks the stop flag before each directory
+        for root, filenames in walker:
+            for filename, file_path, stat in filenames:
                 # Check stop flag periodically (every 10 files)
-                if stop_flag and stop_flag() and len(files) % 10 == 0:
-                    print(f"Shared scan stopped by user after processing {len(files)} files")
-                    return files
-                    
-                try:
-                    file_path = os.path.join(root, filename)
-                    stat = os.stat(file_path)
-                    
-                    ext = Path(filename).suffix.lower().lstrip('.')
-                    files.append({
-                        'file_name': filename,
-                        'file_path': file_path,
-                        'file_size': stat.st_size,
-                        # Store as ISO format without extra Z
-                        'last_modified': datetime.fromtimestamp(stat.st_mtime).isoformat() if stat.st_mtime else None,
-                        'is_file': True,
-                        'extension': ext if ext else 'unknown',
-                        'file_type': ext.upper() if ext else 'UNKNOWN',
-                    })
-                except (OSError, IOError) as e:
-                    errors.append(f"Error reading {filename}: {str(e)}")
-                    continue
+                if stop_flag and stop_flag() and count % 10 == 0:
+                    print(f"Shared scan stopped by user after processing {count} files")
+                    return
+                
+                ext = Path(filename).suffix.lower().lstrip('.')
+                file_record = {
+                    'file_name': filename,
+                    'file_path': file_path,
+                    'file_size': stat.st_size,
+                    # Store as ISO format without extra Z
+                    'last_modified': datetime.fromtimestamp(stat.st_mtime).isoformat() if stat.st_mtime else None,
+                    'is_file': True,
+                    'extension': ext if ext else 'unknown',
+                    'file_type': ext.upper() if ext else 'UNKNOWN',
+                }
+                
+                count += 1
+                yield file_record
+            
+            dirs_done += 1
+            if checkpoint is not None:
+                # Every file of the directory has been handed over: resume after it
+                checkpoint.mark(dirs_done=dirs_done, files_listed=count, last_dir=root)
         
-        return files
+        if stop_flag and stop_flag():
+            print(f"Shared scan stopped by user")
     
     except Exception as e:
         raise Exception(f"Failed to scan shared directory {share_path}: {str(e)}")
 
 
-def get_summary(files):
-    """Generate scan summary from file list"""
+def scan_shared_directory(share_path, share_name, stop_flag=None):
+    r"""
+    Scan a shared directory via UNC path
+    
+    Args:
+        share_path: UNC path (e.g., \\192.168.1.100\Share or \\server\folder)
+        share_name: Human-readable share name
+        stop_flag: Callable that returns True if scan should stop
+    
+    Returns:
+        List of file metadata dictionaries
+    """
+    return list(iter_shared_directory(share_path, share_name, stop_flag))
+
+
+def get_summary(files, top_n=10):
+    """Generate scan summary from file list (top_n=None keeps every type)"""
     if not files:
         return {
             'total_files': 0,
@@ -81,19 +124,18 @@ def get_summary(files):
     
     # Count by file type
     file_types = {}
-    ocr_eligible = ['pdf', 'png', 'jpg', 'jpeg', 'bmp', 'tiff']
     ocr_count = 0
     
     for f in files:
         ext = f.get('extension', 'unknown').lower().lstrip('.')
         if ext:
             file_types[ext] = file_types.get(ext, 0) + 1
-        if f.get('extension', '').lower().lstrip('.') in ocr_eligible:
+        if f.get('extension', '').lower().lstrip('.') in OCR_EXTENSIONS:
             ocr_count += 1
     
     return {
         'total_files': len(files),
         'total_size': total_size,
-        'file_type_distribution': dict(sorted(file_types.items(), key=lambda x: x[1], reverse=True)[:10]),
+        'file_type_distribution': dict(sorted(file_types.items(), key=lambda x: x[1], reverse=True)[:top_n]),
         'ocr_eligible_count': ocr_count,
     }
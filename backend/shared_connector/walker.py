@@ -0,0 +1,328 @@
+"""
+Network Share Walker
+Lists a share's directories concurrently with per-directory timeouts and retries,
+so one hung listing on a slow filer cannot stall the whole scan
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from ..db import database
+
+# Walk tuning - overridable from the environment
+WALK_WORKERS = int(os.getenv("SHARED_WALK_WORKERS", "8"))
+LIST_TIMEOUT = float(os.getenv("SHARED_LIST_TIMEOUT", "30"))
+LIST_RETRIES = int(os.getenv("SHARED_LIST_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("SHARED_RETRY_BACKOFF", "1.0"))
+SLOW_LISTING = float(os.getenv("SHARED_SLOW_LISTING", "5"))
+
+# Listing errors that will not go away by asking again
+PERMANENT_ERRORS = (PermissionError, FileNotFoundError, NotADirectoryError)
+
+
+def init_tables(cursor):
+    """Create the per-scan error table (in files.db, next to the file rows)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shared_scan_errors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_id TEXT NOT NULL,
+            path TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            message TEXT,
+            attempts INTEGER,
+            elapsed REAL,
+            recorded_at TEXT,
+            UNIQUE (scan_id, path, kind)
+        )
+    ''')
+
+
+class ErrorLog:
+    """
+    Buffers a scan's walk errors and writes them to shared_scan_errors
+
+    add() is called from the scan's consumer thread; commit() runs as a
+    checkpoint on_commit hook, so errors are saved with each batch. A path
+    recorded again (e.g. after a resume) replaces its earlier entry.
+
+    Args:
+        db_path: Path of files.db
+        scan_id: Scan the errors belong to
+    """
+
+    def __init__(self, db_path, scan_id):
+        self.db_path = db_path
+        self.scan_id = scan_id
+        self.counts = {}
+        self._pending = []
+
+    def add(self, error):
+        self.counts[error['kind']] = self.counts.get(error['kind'], 0) + 1
+        self._pending.append((
+            self.scan_id, error['path'], error['kind'], error.get('message'),
+            error.get('attempts'), error.get('elapsed'), datetime.now().isoformat()
+        ))
+
+    def commit(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        database(self.db_path).write(lambda conn: conn.executemany('''
+            INSERT OR REPLACE INTO shared_scan_errors
+                (scan_id, path, kind, message, attempts, elapsed, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', pending))
+
+
+class _Listing:
+    """One attempt at listing a directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self.started = None
+        self.elapsed = None
+        self.result = None
+        self.error = None
+        self.abandoned = False
+        self.running = threading.Event()
+        self.done = threading.Event()
+
+    def run(self):
+        self.started = time.monotonic()
+        self.running.set()
+        try:
+            self.result = _list_dir(self.path)
+        except Exception as e:
+            self.error = e
+        self.elapsed = time.monotonic() - self.started
+        self.done.set()
+
+
+def _list_dir(path):
+    """(subdirectories, files, file errors) of one directory, each sorted by name"""
+    subdirs, files, errors = [], [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    # Like os.walk: symlinked directories are not followed
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                files.append((entry.name, entry.path, entry.stat()))
+            except OSError as e:
+                errors.append((entry.path, str(e)))
+    subdirs.sort()
+    files.sort(key=lambda f: f[0])
+    return subdirs, files, errors
+
+
+class ShareWalker:
+    """
+    Walk a share top-down in sorted order and yield (dir_path, files) per directory
+
+    Directories come out in the order of a sorted os.walk, but are listed
+    ahead of time by a bounded pool of threads: as soon as a directory is
+    listed its subdirectories are queued, and the pool always takes the
+    queued directory that comes first in walk order. At most max_ahead
+    listings are kept waiting for the consumer.
+
+    Each listing must finish within timeout seconds. A listing that hangs
+    keeps its thread, so a replacement thread is started and the directory
+    is tried again after a backoff (doubling each time), up to retries more
+    times. Directories that still fail are skipped and reported to on_error
+    with kind 'timeout' or 'error'; listings slower than slow_threshold are
+    reported with kind 'slow'. Unreadable files are reported as 'error'.
+
+    Args:
+        root: Directory to walk
+        workers: Listing threads (defaults to SHARED_WALK_WORKERS)
+        timeout: Seconds allowed per listing (defaults to SHARED_LIST_TIMEOUT)
+        retries: Extra attempts per directory (defaults to SHARED_LIST_RETRIES)
+        backoff: Seconds before the first retry (defaults to SHARED_RETRY_BACKOFF)
+        slow_threshold: Seconds after which a listing is reported slow (defaults to SHARED_SLOW_LISTING)
+        stop_flag: Callable that returns True if the walk should stop
+        on_error: Callable receiving an error dict (path, kind, message, attempts, elapsed)
+        skip_dirs: Directories to skip at the start of the walk (resume by count)
+        resume_after: Last directory finished before a resume; directories
+            before it in walk order are skipped, and only its ancestors are listed
+        max_ahead: Bound on listings waiting for the consumer (defaults to 16 per worker)
+        progress: Optional ScanProgress given the directories pending and listed
+    """
+
+    def __init__(self, root, workers=None, timeout=None, retries=None, backoff=None,
+                 slow_threshold=None, stop_flag=None, on_error=None, skip_dirs=0,
+                 resume_after=None, max_ahead=None, progress=None):
+        self.root = root
+        self.workers = max(1, workers or WALK_WORKERS)
+        self.timeout = LIST_TIMEOUT if timeout is None else timeout
+        self.retries = LIST_RETRIES if retries is None else retries
+        self.backoff = RETRY_BACKOFF if backoff is None else backoff
+        self.slow_threshold = SLOW_LISTING if slow_threshold is None else slow_threshold
+        self.stop_flag = stop_flag
+        self.on_error = on_error
+        self.skip_dirs = skip_dirs
+        self.resume_after = self._key(resume_after) if resume_after else None
+        self.max_ahead = max_ahead or self.workers * 16
+        self.progress = progress
+        self.hung_threads = 0
+
+        self._lock = threading.Lock()
+        self._listings = {}
+        self._tasks = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._threads = []
+        self._closed = False
+
+    def _key(self, path):
+        """Position of path in walk order (sorted top-down = component-wise order)"""
+        rel = os.path.relpath(path, self.root)
+        return () if rel == os.curdir else tuple(rel.split(os.sep))
+
+    def _finished(self, path):
+        """Whether path's whole subtree was walked before the resume point"""
+        if self.resume_after is None:
+            return False
+        key = self._key(path)
+        return key <= self.resume_after and self.resume_after[:len(key)] != key
+
+    def __iter__(self):
+        for _ in range(self.workers):
+            self._start_worker()
+        stack = [self.root]
+        try:
+            while stack:
+                if self.stop_flag and self.stop_flag():
+                    break
+                path = stack.pop()
+
+                # Resuming: only the ancestors of the last finished directory are listed again
+                if self._finished(path):
+                    continue
+                files_done = self.resume_after is not None and self._key(path) <= self.resume_after
+
+                listing = self._wait(path)
+                if listing is None:
+                    continue
+                subdirs, files, errors = listing
+                stack.extend(reversed(subdirs))
+                self._prefetch(stack)
+                if self.progress is not None:
+                    self.progress.dirs_pending = len(stack)
+                    self.progress.dirs_listed = (self.progress.dirs_listed or 0) + 1
+
+                if files_done:
+                    continue
+                if self.skip_dirs:
+                    self.skip_dirs -= 1
+                    continue
+                for file_path, message in errors:
+                    self._report(file_path, 'error', message)
+                yield path, files
+        finally:
+            with self._lock:
+                self._closed = True
+                self._listings.clear()
+            for _ in self._threads:
+                self._tasks.put(((), next(self._order), None))
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._worker, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _worker(self):
+        while True:
+            _, _, listing = self._tasks.get()
+            if listing is None:
+                return
+            if self._closed:
+                continue
+            listing.run()
+            with self._lock:
+                # Abandoned after a timeout: a replacement took over this slot
+                if listing.abandoned:
+                    self.hung_threads -= 1
+                    return
+            # Fan out: queue the subdirectories while there is room ahead
+            if listing.result is not None:
+                self._submit_many(listing.result[0])
+
+    def _submit(self, path):
+        """Queue a listing of path (unless one is already queued or done)"""
+        with self._lock:
+            if self._closed or path in self._listings:
+                return self._listings.get(path)
+            listing = self._listings[path] = _Listing(path)
+        self._tasks.put((self._key(path), next(self._order), listing))
+        return listing
+
+    def _submit_many(self, paths):
+        for path in paths:
+            if self._finished(path):
+                continue
+            with self._lock:
+                if len(self._listings) >= self.max_ahead:
+                    return
+            self._submit(path)
+
+    def _prefetch(self, stack):
+        """Queue the next directories in walk order (top of the stack) while there is room"""
+        self._submit_many(reversed(stack[-self.max_ahead:]))
+
+    def _wait(self, path):
+        """Listing of path, retried with backoff; None (reported) if it keeps failing"""
+        for attempt in range(1, self.retries + 2):
+            listing = self._submit(path)
+            if listing is None:
+                return None
+            # The clock starts when a thread picks the listing up
+            listing.running.wait()
+            remaining = self.timeout - (time.monotonic() - listing.started)
+            listing.done.wait(max(remaining, 0))
+            with self._lock:
+                self._listings.pop(path, None)
+                finished = listing.done.is_set()
+                if not finished:
+                    listing.abandoned = True
+                    self.hung_threads += 1
+
+            if not finished:
+                self._start_worker()
+                kind, message = 'timeout', f"No listing after {self.timeout:g}s"
+            elif listing.error is None:
+                if listing.elapsed >= self.slow_threshold:
+                    self._report(path, 'slow', f"Listed in {listing.elapsed:.1f}s", attempt, listing.elapsed)
+                return listing.result
+            else:
+                kind, message = 'error', str(listing.error)
+                if isinstance(listing.error, PERMANENT_ERRORS):
+                    break
+
+            if attempt <= self.retries and not self._sleep(self.backoff * 2 ** (attempt - 1)):
+                # Stopped while backing off: not a failure of the directory
+                return None
+
+        self._report(path, kind, message, attempt, self.timeout if kind == 'timeout' else listing.elapsed)
+        return None
+
+    def _sleep(self, seconds):
+        """Back off before a retry; False if the walk was stopped meanwhile"""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if self.stop_flag and self.stop_flag():
+                return False
+            time.sleep(min(0.1, deadline - time.monotonic()))
+        return not (self.stop_flag and self.stop_flag())
+
+    def _report(self, path, kind, message, attempts=1, elapsed=None):
+        if self.on_error:
+            self.on_error({
+                'path': path,
+                'kind': kind,
+                'message': message,
+                'attempts': attempts,
+                'elapsed': elapsed
+            })
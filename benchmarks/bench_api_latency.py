@@ -0,0 +1,154 @@
+"""
+Benchmark: /api/health and /api/scans latency while heavy files.db queries run
+
+Writes one local scan, serves the API with uvicorn, and keeps --heavy
+clients paging deep into the scan (large-offset pages) while one client
+times /api/health and /api/scans. Run once with the database calls on the
+event loop (as handlers made them before Database.run) and once on the
+databases' executors.
+
+Usage:
+    python benchmarks/bench_api_latency.py --rows 200000 --heavy 8
+"""
+import argparse
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import httpx
+import uvicorn
+
+from backend import catalog
+from backend.app import app
+from backend.db import Database
+from backend.local_connector import database as local_db
+
+SCAN_ID = 'bench'
+
+
+def make_records(count):
+    for i in range(count):
+        name = f'file{i}.txt'
+        yield {
+            'file_name': name,
+            'file_path': f'/data/dept{i % 100}/{name}',
+            'file_type': 'text',
+            'mime_type': 'text/plain',
+            'file_size': i,
+            'last_modified': '2024-01-01T00:00:00',
+            'storage_type': 'local',
+            'eligible_for_ocr': False
+        }
+
+
+def populate(rows):
+    local_db.init_db()
+    local_db.create_scan(SCAN_ID, SCAN_ID, '/data')
+    records = make_records(rows)
+    while True:
+        batch = [r for _, r in zip(range(10000), records)]
+        if not batch:
+            break
+        local_db.save_files(SCAN_ID, batch)
+    local_db.complete_scan(SCAN_ID, rows, 0)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(samples, p):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def measure(base_url, rows, heavy, seconds):
+    """Latencies (ms) of the light endpoints while heavy clients page deep into the scan"""
+    done = threading.Event()
+    heavy_count = [0]
+
+    def page_deep():
+        with httpx.Client(base_url=base_url, timeout=None) as client:
+            while not done.is_set():
+                client.get(f'/api/scan/{SCAN_ID}', params={'limit': 100, 'offset': rows - 100})
+                heavy_count[0] += 1
+
+    threads = [threading.Thread(target=page_deep) for _ in range(heavy)]
+    for thread in threads:
+        thread.start()
+    latencies = {'/api/health': [], '/api/scans': []}
+    try:
+        with httpx.Client(base_url=base_url, timeout=None) as client:
+            time.sleep(0.5)
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                for path, samples in latencies.items():
+                    start = time.perf_counter()
+                    client.get(path)
+                    samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+    return latencies, heavy_count[0]
+
+
+def report(label, latencies, pages_per_second=None):
+    print(label + (f"  ({pages_per_second:,.1f} heavy pages/sec)" if pages_per_second is not None else ''))
+    for path, samples in latencies.items():
+        print(f"  {path:<14} {len(samples):>6} requests  "
+              f"p50 {statistics.median(samples):8.2f} ms  p99 {percentile(samples, 0.99):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--heavy', type=int, default=8, help='Concurrent clients running heavy queries')
+    parser.add_argument('--seconds', type=float, default=10.0, help='Measurement time per mode')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local_db.SCANS_DB = catalog.SCANS_DB = os.path.join(tmp, 'scanner.db')
+        local_db.FILES_DB = os.path.join(tmp, 'files.db')
+        populate(args.rows)
+
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        base_url = f'http://127.0.0.1:{port}'
+
+        try:
+            idle, _ = measure(base_url, args.rows, 0, min(args.seconds, 2.0))
+            report('idle', idle)
+
+            on_executor = Database.run
+
+            async def on_loop(self, fn, *args):
+                return fn(*args)
+
+            Database.run = on_loop
+            try:
+                latencies, count = measure(base_url, args.rows, args.heavy, args.seconds)
+            finally:
+                Database.run = on_executor
+            report(f'on the event loop, {args.heavy} heavy clients', latencies, count / args.seconds)
+
+            latencies, count = measure(base_url, args.rows, args.heavy, args.seconds)
+            report(f'on the database executors, {args.heavy} heavy clients', latencies, count / args.seconds)
+        finally:
+            server.should_exit = True
+            thread.join()
+
+
+if __name__ == '__main__':
+    main()
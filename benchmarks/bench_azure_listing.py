@@ -0,0 +1,105 @@
+"""
+Benchmark: sequential Azure listing vs prefix-partitioned listing across N threads
+
+By default runs against an in-process fake container that sleeps --latency
+seconds per listing page (a round trip), so the numbers show how much of the
+round-trip latency the partitioned mode hides. Pass --connection-string and
+--container to list a real container or an Azurite emulator instead.
+
+Usage:
+    python benchmarks/bench_azure_listing.py --workers 1 4 8 16 --latency 0.05
+    python benchmarks/bench_azure_listing.py --connection-string "UseDevelopmentStorage=true" --container test
+"""
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.azure_connector.listing import PartitionedLister
+
+FakeBlob = namedtuple('FakeBlob', 'name size last_modified')
+
+# Max results per page of the Blob service
+PAGE_SIZE = 5000
+
+
+class FakePaged:
+    """Listing result paged like the SDK's ItemPaged, with latency per page"""
+
+    def __init__(self, items, latency):
+        self.items = items
+        self.latency = latency
+
+    def by_page(self, continuation_token=None):
+        for start in range(0, len(self.items), PAGE_SIZE):
+            time.sleep(self.latency)
+            yield iter(self.items[start:start + PAGE_SIZE])
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+
+class FakeContainer:
+    """Container client over prefixes * blobs_per_prefix synthetic blobs"""
+
+    def __init__(self, prefixes, blobs_per_prefix, latency):
+        self.latency = latency
+        self.shards = {
+            f'dir{p:04d}/': [FakeBlob(f'dir{p:04d}/file{b}.pdf', 1024, None) for b in range(blobs_per_prefix)]
+            for p in range(prefixes)
+        }
+
+    def list_blobs(self, name_starts_with=None):
+        if name_starts_with:
+            return FakePaged(self.shards[name_starts_with], self.latency)
+        return FakePaged([blob for blobs in self.shards.values() for blob in blobs], self.latency)
+
+    def walk_blobs(self, delimiter='/'):
+        return FakePaged([FakeBlob(prefix, 0, None) for prefix in self.shards], self.latency)
+
+
+def list_sequential(container):
+    return sum(1 for blob in container.list_blobs() if not blob.name.endswith('/'))
+
+
+def list_partitioned(container, workers):
+    return sum(1 for _ in PartitionedLister(container, workers=workers))
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {count:>10,} blobs  {elapsed:8.2f}s  {count / elapsed:>12,.0f} blobs/sec")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--connection-string', help='List a real container or Azurite instead of the fake')
+    parser.add_argument('--container', help='Container name (with --connection-string)')
+    parser.add_argument('--prefixes', type=int, default=32, help='Fake top-level virtual directories')
+    parser.add_argument('--blobs-per-prefix', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake seconds per listing page')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    if args.connection_string:
+        from azure.storage.blob import BlobServiceClient
+        container = BlobServiceClient.from_connection_string(args.connection_string) \
+            .get_container_client(args.container)
+    else:
+        container = FakeContainer(args.prefixes, args.blobs_per_prefix, args.latency)
+
+    base = timed('sequential list_blobs', lambda: list_sequential(container))
+    for workers in args.workers:
+        elapsed = timed(f'partitioned x{workers}', lambda: list_partitioned(container, workers))
+        print(f"{'':<22} speedup {base / elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark: per-row INSERT loop vs BulkWriter executemany
+
+The per-row baseline writes the old files table (every string on every row);
+the bulk writer writes the catalog (dictionary-encoded strings, paths
+rebuilt from the directory tree), so the bytes per row printed for each
+also show the catalog's size saving.
+
+Usage:
+    python benchmarks/bench_bulk_insert.py --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.local_connector import database as local_db
+
+
+def make_records(count):
+    """Generate synthetic local file records"""
+    for i in range(count):
+        yield {
+            'file_name': f'file{i}.pdf',
+            'file_path': f'/data/dept{i % 100}/project{i % 1000}/file{i}.pdf',
+            'file_type': 'pdf',
+            'mime_type': 'application/pdf',
+            'file_size': i * 17,
+            'last_modified': '2024-01-01T00:00:00',
+            'storage_type': 'local',
+            'eligible_for_ocr': True
+        }
+
+
+def save_files_per_row(scan_id, files):
+    """The previous save_files implementation: one execute per record, into the old files table"""
+    conn = sqlite3.connect(local_db.FILES_DB)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS legacy_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_id TEXT,
+            file_name TEXT,
+            file_path TEXT,
+            file_type TEXT,
+            mime_type TEXT,
+            file_size INTEGER,
+            last_modified TEXT,
+            storage_type TEXT,
+            eligible_for_ocr BOOLEAN,
+            parent_dir TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_legacy_files_scan_name ON legacy_files (scan_id, file_name, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_legacy_files_scan_parent ON legacy_files (scan_id, parent_dir)")
+
+    for file in files:
+        cursor.execute('''
+            INSERT INTO legacy_files (
+                scan_id, file_name, file_path, file_type, mime_type,
+                file_size, last_modified, storage_type, eligible_for_ocr, parent_dir
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            scan_id,
+            file['file_name'],
+            file['file_path'],
+            file['file_type'],
+            file['mime_type'],
+            file['file_size'],
+            file['last_modified'],
+            file['storage_type'],
+            file['eligible_for_ocr'],
+            os.path.dirname(file['file_path'])
+        ))
+
+    conn.commit()
+    conn.close()
+
+
+def run(label, save_files, rows, batch_size):
+    """Time save_files over rows records in batches and print rows/sec"""
+    with tempfile.TemporaryDirectory() as tmp:
+        local_db.SCANS_DB = os.path.join(tmp, 'scanner.db')
+        local_db.FILES_DB = os.path.join(tmp, 'files.db')
+        local_db.init_db()
+
+        # Only the save_files calls are timed, not record generation
+        records = make_records(rows)
+        elapsed = 0.0
+        while True:
+            batch = [r for _, r in zip(range(batch_size), records)]
+            if not batch:
+                break
+            start = time.perf_counter()
+            save_files('bench', batch)
+            elapsed += time.perf_counter() - start
+
+        conn = sqlite3.connect(local_db.FILES_DB)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        size = os.path.getsize(local_db.FILES_DB)
+
+    print(f"{label:<12} {rows:>10,} rows  {elapsed:8.2f}s  {rows / elapsed:>12,.0f} rows/sec  {size / rows:6.0f} bytes/row")
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    before = run('per-row', save_files_per_row, args.rows, args.batch_size)
+    after = run('bulk', local_db.save_files, args.rows, args.batch_size)
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: scan analytics over SQLite rows vs the columnar (Parquet) snapshot
+
+Writes one local scan, freezes it, then times size-by-type, top-N largest
+and the age histogram both as SQLite queries over the files view and as
+vectorized scans of the snapshot.
+
+Usage:
+    python benchmarks/bench_columnar.py --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import columnar
+from backend.local_connector import database as local_db
+from bench_bulk_insert import make_records
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f}s")
+    return elapsed
+
+
+def sqlite_queries(now):
+    """The same three aggregates as SQL over the row store"""
+    age_days = "julianday(?) - julianday(last_modified)"
+    buckets = ' '.join(f"WHEN {age_days} <= {days} THEN {i}" for i, days in enumerate(columnar.AGE_BUCKET_DAYS))
+    return {
+        'size by type': ("SELECT file_type, COUNT(*), SUM(file_size) FROM files WHERE scan_id = 'bench' "
+                         "GROUP BY file_type ORDER BY 3 DESC", []),
+        'top 100 largest': ("SELECT file_name, file_path, file_size FROM files WHERE scan_id = 'bench' "
+                            "ORDER BY file_size DESC LIMIT 100", []),
+        'age histogram': (f"SELECT CASE WHEN last_modified IS NULL THEN NULL {buckets} "
+                          f"ELSE {len(columnar.AGE_BUCKET_DAYS)} END, COUNT(*), SUM(file_size) "
+                          "FROM files WHERE scan_id = 'bench' GROUP BY 1",
+                          [now.isoformat()] * len(columnar.AGE_BUCKET_DAYS)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    now = datetime.now()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local_db.SCANS_DB = os.path.join(tmp, 'scanner.db')
+        local_db.FILES_DB = os.path.join(tmp, 'files.db')
+        columnar.SNAPSHOT_DIR = os.path.join(tmp, 'columnar')
+        local_db.init_db()
+        records = make_records(args.rows)
+        while True:
+            batch = [r for _, r in zip(range(10000), records)]
+            if not batch:
+                break
+            local_db.save_files('bench', batch)
+
+        timed(f"freeze ({args.rows:,} rows)", lambda: local_db.freeze_scan('bench'))
+        print(f"snapshot size: {os.path.getsize(columnar.snapshot_path('bench')) / 1024 ** 2:.1f} MB")
+
+        conn = sqlite3.connect(local_db.FILES_DB)
+        for label, (sql, params) in sqlite_queries(now).items():
+            timed(f"sqlite   {label}", lambda: conn.execute(sql, params).fetchall())
+        conn.close()
+
+        timed("columnar size by type", lambda: columnar.size_by('bench'))
+        timed("columnar top 100 largest", lambda: columnar.largest('bench', 100))
+        timed("columnar age histogram", lambda: columnar.age_histogram('bench', now))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark: streaming scan export (CSV, NDJSON, Parquet) throughput and memory
+
+Writes one local scan, then streams it in every format (plain and gzipped)
+into a byte counter. Peak RSS growth stays flat as --rows grows, since
+only EXPORT_CHUNK_ROWS rows are held at a time.
+
+Usage:
+    python benchmarks/bench_export.py --rows 1000000
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.local_connector import database as local_db
+from bench_bulk_insert import make_records
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(fmt, compress, rows):
+    """Stream the scan in one format and print rows/sec, output size and RSS growth"""
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in local_db.export_files('bench', fmt, compress))
+    elapsed = time.perf_counter() - start
+    label = f"{fmt}{'.gz' if compress else ''}"
+    print(f"{label:<12} {rows:>10,} rows  {elapsed:8.2f}s  {rows / elapsed:>12,.0f} rows/sec  "
+          f"{size / 1024 ** 2:8.1f} MB  +{peak_rss_mb() - before:6.1f} MB peak RSS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--formats', default='csv,ndjson,parquet')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local_db.SCANS_DB = os.path.join(tmp, 'scanner.db')
+        local_db.FILES_DB = os.path.join(tmp, 'files.db')
+        local_db.init_db()
+        records = make_records(args.rows)
+        while True:
+            batch = [r for _, r in zip(range(10000), records)]
+            if not batch:
+                break
+            local_db.save_files('bench', batch)
+
+        for fmt in args.formats.split(','):
+            for compress in (False, True):
+                run(fmt, compress, args.rows)
+
+
+if __name__ == '__main__':
+    main()
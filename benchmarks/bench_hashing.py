@@ -0,0 +1,79 @@
+"""
+Benchmark: duplicate detection with the size / partial-hash prefilter vs hashing every file
+
+Writes a folder of files where many share a size but few are true copies,
+scans it, then compares bytes read and time of hashing.hash_files against
+reading every file whole on the same thread pool.
+
+Usage:
+    python benchmarks/bench_hashing.py --files 2000 --size-mb 4 --copies 0.05 --workers 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import hashing
+from backend.local_connector import database as local_db
+from backend.local_connector.scanner import iter_folder
+
+
+def make_files(folder, count, size, copies, seed=1):
+    """count files of a few sizes around size; a fraction are copies of an earlier file"""
+    rng = random.Random(seed)
+    sizes = [size + i for i in range(10)]
+    written = []
+    for i in range(count):
+        sub = os.path.join(folder, f'dir{i % 20}')
+        os.makedirs(sub, exist_ok=True)
+        if written and rng.random() < copies:
+            with open(rng.choice(written), 'rb') as f:
+                data = f.read()
+        else:
+            data = os.urandom(rng.choice(sizes))
+        path = os.path.join(sub, f'file{i}.bin')
+        with open(path, 'wb') as f:
+            f.write(data)
+        written.append(path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--size-mb', type=float, default=4)
+    parser.add_argument('--copies', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=hashing.HASH_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, 'tree')
+        paths = make_files(folder, args.files, int(args.size_mb * 2 ** 20), args.copies)
+        local_db.SCANS_DB = os.path.join(tmp, 'scanner.db')
+        local_db.FILES_DB = os.path.join(tmp, 'files.db')
+        local_db.init_db()
+        local_db.create_scan('bench', 'bench', folder)
+        local_db.save_files('bench', list(iter_folder(folder)))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            total = sum(os.path.getsize(p) for p, _ in zip(paths, pool.map(hashing.full_hash, paths)))
+        naive = time.perf_counter() - start
+        print(f"hash every file      {naive:8.2f}s  {total / 2 ** 20:10.1f} MiB read")
+
+        start = time.perf_counter()
+        stats = hashing.hash_files(local_db.FILES_DB, 'bench', workers=args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"prefiltered          {elapsed:8.2f}s  {stats.bytes_read / 2 ** 20:10.1f} MiB read  "
+              f"({stats.partial_hashed} partial, {stats.full_hashed} full)")
+        duplicates = hashing.find_duplicates(local_db.FILES_DB, 'bench')
+        print(f"{duplicates['duplicate_groups']} groups, {duplicates['wasted_bytes'] / 2 ** 20:.1f} MiB wasted")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: server-side search latency per filter
+
+Writes one local scan of varied files, indexes its names (as completing the
+scan does), then times the first page of each filter alone and combined.
+
+Usage:
+    python benchmarks/bench_search.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import search
+from backend.local_connector import database as local_db
+
+TYPES = ['pdf', 'doc', 'image', 'video', 'audio', 'archive', 'code', 'text', 'sheet', 'other']
+EXTENSIONS = [f'e{i}' for i in range(50)]
+
+FILTERS = [
+    {},
+    {'file_type': 'pdf'},
+    {'extension': 'e3'},
+    {'min_size': 999_000_000},
+    {'min_size': 500_000_000},
+    {'modified_after': '2024-03', 'modified_before': '2024-04'},
+    {'ocr': True},
+    {'name': '12345'},
+    {'name': 'report'},
+    {'name': '*12345*.e1'},
+    {'path': '/data/dept7'},
+    {'path': '/data/dept7', 'name': '12345'},
+    {'file_type': 'pdf', 'min_size': 999_000_000},
+]
+
+
+def make_records(count, seed=1):
+    """Generate synthetic local file records with varied types, sizes and dates"""
+    rng = random.Random(seed)
+    for i in range(count):
+        ext = rng.choice(EXTENSIONS)
+        name = f"{rng.choice(['report', 'notes', 'scan', 'img'])}{rng.randrange(10 ** 9)}_{i}.{ext}"
+        yield {
+            'file_name': name,
+            'file_path': f'/data/dept{i % 100}/project{i % 1000}/{name}',
+            'file_type': rng.choice(TYPES),
+            'mime_type': 'application/octet-stream',
+            'file_size': rng.randrange(10 ** 9),
+            'last_modified': f'20{rng.randrange(10, 25)}-{rng.randrange(1, 13):02d}-15T00:00:00',
+            'storage_type': 'local',
+            'eligible_for_ocr': rng.random() < 0.3
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local_db.SCANS_DB = os.path.join(tmp, 'scanner.db')
+        local_db.FILES_DB = os.path.join(tmp, 'files.db')
+        local_db.init_db()
+        records = make_records(args.rows)
+        while True:
+            batch = [r for _, r in zip(range(10000), records)]
+            if not batch:
+                break
+            local_db.save_files('bench', batch)
+
+        start = time.perf_counter()
+        indexed = search.index_names(local_db.FILES_DB)
+        print(f"name index: {indexed:,} rows in {time.perf_counter() - start:.2f}s")
+
+        for filters in FILTERS:
+            start = time.perf_counter()
+            files = local_db.search_files('bench', filters)
+            elapsed = time.perf_counter() - start
+            print(f"{str(filters):<58} {len(files):>4} rows  {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: os.walk + os.stat vs ParallelWalker (os.scandir, N threads),
+and full iter_folder record building across N scan processes
+
+Point --path at a real tree (ideally on NFS/SMB, where listing latency
+dominates) or let the script build a synthetic tree in a temp directory.
+
+Usage:
+    python benchmarks/bench_walker.py --path /mnt/nas/share --workers 1 4 8 16 --processes 1 4 16
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.local_connector.scanner import iter_folder
+from backend.local_connector.walker import ParallelWalker
+
+
+def build_tree(root, dirs, files_per_dir):
+    """Create a synthetic tree of dirs directories (10 per level)"""
+    for d in range(dirs):
+        folder = os.path.join(root, f'l1_{d % 10}', f'l2_{d // 10 % 10}', f'dir{d}')
+        os.makedirs(folder, exist_ok=True)
+        for f in range(files_per_dir):
+            open(os.path.join(folder, f'file{f}.txt'), 'w').close()
+
+
+def walk_baseline(path):
+    """The previous scan_folder walk: os.walk then os.stat per file"""
+    count = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                os.stat(os.path.join(root, filename))
+                count += 1
+            except OSError:
+                continue
+    return count
+
+
+def walk_parallel(path, workers):
+    return sum(1 for _ in ParallelWalker(path, workers=workers))
+
+
+def scan_records(path, processes):
+    return sum(1 for _ in iter_folder(path, processes=processes))
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {count:>10,} files  {elapsed:8.2f}s  {count / elapsed:>12,.0f} files/sec")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--path', help='Existing tree to walk (default: synthetic tree)')
+    parser.add_argument('--dirs', type=int, default=2000)
+    parser.add_argument('--files-per-dir', type=int, default=50)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.path
+    if not path:
+        tmp = tempfile.mkdtemp()
+        build_tree(tmp, args.dirs, args.files_per_dir)
+        path = tmp
+
+    try:
+        base = timed('os.walk + os.stat', lambda: walk_baseline(path))
+        for workers in args.workers:
+            elapsed = timed(f'scandir x{workers}', lambda: walk_parallel(path, workers))
+            print(f"{'':<22} speedup {base / elapsed:.1f}x")
+
+        # Listing + classification + record building, as a scan does it
+        single = None
+        for processes in args.processes:
+            elapsed = timed(f'iter_folder p={processes}', lambda: scan_records(path, processes))
+            single = single or elapsed
+            print(f"{'':<22} speedup {single / elapsed:.1f}x")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,7 @@ echo "================================================"
 echo ""
 
 # Run pytest with verbose output and coverage
-echo "Running all 49 test cases..."
+echo "Running all 115 test cases..."
 echo ""
 
 pytest tests/ -v --tb=short --color=yes
@@ -17,10 +17,9 @@ def test_data_dir():
 
 @pytest.fixture(autouse=True)
 def reset_active_scans():
-    """Reset active scans before each test"""
+    """Reset tracked scan state before each test"""
     try:
-        from backend.app import active_scans, active_scans_lock
-        with active_scans_lock:
-            active_scans.clear()
+        from backend.app import scan_states
+        scan_states.clear()
     except ImportError:
         pass
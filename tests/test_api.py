@@ -1,12 +1,21 @@
 """
 API Tests - EDGE CASES ONLY
 
-4 edge case tests covering API endpoint boundary conditions
+8 edge case tests covering API endpoint boundary conditions
 """
 
 import pytest
+import asyncio
+import httpx
+import json
+import time
+import os
 from fastapi.testclient import TestClient
 from backend.app import app
+from backend import app as app_module, catalog, progress
+from backend.azure_connector import database as azure_db
+from backend.shared_connector import database as shared_db
+from backend.local_connector import database as local_db
 
 client = TestClient(app)
 
@@ -53,3 +62,121 @@ class TestAPIEdgeCases:
             data = response.json()
             # Should indicate the scan doesn't exist
             assert "success" in data or "error" in data
+    
+    def test_scan_events_stream_until_scan_ends(self, monkeypatch, tmp_path):
+        """Test GET /api/scan/{scan_id}/events streams progress and ends with the final status"""
+        monkeypatch.setattr(progress, 'PROGRESS_TICK', 0.05)
+        monkeypatch.setattr(local_db, 'SCANS_DB', str(tmp_path / "scanner.db"))
+        monkeypatch.setattr(local_db, 'FILES_DB', str(tmp_path / "files.db"))
+        monkeypatch.setattr(catalog, 'SCANS_DB', str(tmp_path / "scanner.db"))
+        local_db.init_db()
+        assert client.get("/api/scan/nonexistent-scan-id-12345/events").status_code == 404
+        
+        folder = tmp_path / "data"
+        for d in range(3):
+            os.makedirs(folder / f'd{d}')
+            for i in range(10):
+                (folder / f'd{d}' / f'f{i}.txt').write_text('x' * i)
+        scan_id = client.post("/api/scan", params={"folder_path": str(folder)}).json()["scan_id"]
+        
+        response = client.get(f"/api/scan/{scan_id}/events")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            (block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+            for block in response.text.strip().split('\n\n')
+        ]
+        
+        # Only the last event is final, and it has the whole scan's counts
+        assert all(name == 'progress' for name, _ in events[:-1])
+        name, last = events[-1]
+        assert name == 'completed'
+        assert last['files_seen'] == 30
+        assert last['bytes_seen'] == 3 * sum(range(10))
+        assert last['dirs_listed'] == 4 and last['dirs_pending'] == 0
+        assert last['result']['total_files'] == 30
+
+    
+    def test_health_answers_during_slow_query(self, monkeypatch, tmp_path):
+        """Test /api/health answers while a slow files.db query of another request is running"""
+        monkeypatch.setattr(local_db, 'SCANS_DB', str(tmp_path / "scanner.db"))
+        monkeypatch.setattr(local_db, 'FILES_DB', str(tmp_path / "files.db"))
+        monkeypatch.setattr(catalog, 'SCANS_DB', str(tmp_path / "scanner.db"))
+        local_db.init_db()
+        def slow_stats(scan_id):
+            time.sleep(0.5)
+            return {'total_files': 0}
+        monkeypatch.setattr('backend.app.get_scan_stats', slow_stats)
+        
+        async def main():
+            async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+                summary = asyncio.create_task(async_client.get("/api/scan/slow/summary"))
+                await asyncio.sleep(0.1)
+                start = time.perf_counter()
+                health = await async_client.get("/api/health")
+                waited = time.perf_counter() - start
+                return health, waited, summary.done(), await summary
+        
+        health, waited, summary_done, summary = asyncio.run(main())
+        assert health.status_code == 200
+        assert waited < 0.3 and not summary_done
+        assert summary.json() == {"success": True, "scan_id": "slow", "total_files": 0}
+    
+    def test_browser_upload_is_never_recovered(self, monkeypatch, tmp_path):
+        """Test a running scan with no state (an upload being saved) is left alone by recovery, and uploads end tracked"""
+        for module in (local_db, azure_db, shared_db, catalog):
+            monkeypatch.setattr(module, 'SCANS_DB', str(tmp_path / "scanner.db"))
+        for module in (local_db, azure_db, shared_db):
+            monkeypatch.setattr(module, 'FILES_DB', str(tmp_path / "files.db"))
+        monkeypatch.setattr(app_module, 'RESUME_ON_STARTUP', True)
+        local_db.init_db()
+        azure_db.init_db()
+        shared_db.init_db()
+        files = [
+            {'file_name': f'f{i}.txt', 'file_path': f'/client/f{i}.txt', 'file_type': 'text', 'mime_type': 'text/plain',
+             'file_size': i, 'last_modified': '2024-01-01T00:00:00', 'storage_type': 'local', 'eligible_for_ocr': False}
+            for i in range(5)
+        ]
+        
+        # Mid-upload: scan created and rows saved, not completed yet
+        local_db.create_scan('upload', 'upload', '/client')
+        local_db.save_files('upload', files)
+        app_module.recover_interrupted_scans()
+        assert local_db.get_scan('upload')['status'] == 'running'
+        assert local_db.get_total_files_count('upload') == 5
+        assert app_module.scan_states.get('upload') is None
+        
+        response = client.post("/api/scan/browser", json={
+            'scan_id': 'browser-1', 'scan_name': 'b', 'folder_path': '/client',
+            'files': files, 'total_files': 5, 'total_size': 10
+        })
+        assert response.status_code == 200
+        state = app_module.scan_states.get('browser-1')
+        assert (state['type'], state['status']) == ('browser', 'completed')
+        assert local_db.get_total_files_count('browser-1') == 5
+    
+    def test_scans_list_pages_with_legacy_keys(self, monkeypatch, tmp_path):
+        """Test GET /api/scans reports the total and next_offset of a page, and keeps each source's legacy keys"""
+        for module in (local_db, azure_db, shared_db, catalog):
+            monkeypatch.setattr(module, 'SCANS_DB', str(tmp_path / "scanner.db"))
+        for module in (local_db, azure_db, shared_db):
+            monkeypatch.setattr(module, 'FILES_DB', str(tmp_path / "files.db"))
+        local_db.init_db()
+        azure_db.init_db()
+        shared_db.init_db()
+        local_db.create_scan('local-1', 'Local', '/data')
+        azure_db.create_scan('azure-1', 'Azure', 'container', 'account')
+        shared_db.create_scan('shared-1', 'Shared', '//server/share', 'Share')
+        
+        first = client.get("/api/scans", params={"limit": 2}).json()
+        assert (first["count"], first["total"], first["next_offset"]) == (2, 3, 2)
+        rest = client.get("/api/scans", params={"limit": 2, "offset": first["next_offset"]}).json()
+        assert (rest["count"], rest["total"], rest["next_offset"]) == (1, 3, None)
+        
+        scans = {scan["id"]: scan for scan in first["scans"] + rest["scans"]}
+        assert scans["local-1"]["folder_path"] == "/data"
+        assert (scans["azure-1"]["container_name"], scans["azure-1"]["storage_account"]) == ("container", "account")
+        shared = scans["shared-1"]
+        assert (shared["scan_name"], shared["share_path"], shared["share_name"]) == ("Shared", "//server/share", "Share")
+        assert shared["created_at"] == shared["start_time"]
+        assert client.get("/api/scans", params={"storage_type": "azure"}).json()["total"] == 1
@@ -1,9 +1,11 @@
 """
 Azure Scanner Tests - EDGE CASES ONLY
 
-13 edge case tests covering Azure Blob Storage boundary conditions
+18 edge case tests covering Azure Blob Storage boundary conditions
 """
 
+import asyncio
+import time
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 from backend.azure_connector.scanner import get_summary
@@ -241,6 +243,234 @@ class TestAzureConnectionEdgeCases:
             scan_azure_blob('test-connection-string', 'test-container')
 
 
+class FakePager:
+    """Listing pager over fixed pages, with tokens 't1', 't2', ..."""
+    
+    def __init__(self, pages, token):
+        self.pages = pages
+        self.index = int(token[1:]) if token else 0
+        self.continuation_token = token
+    
+    def __iter__(self):
+        while self.index < len(self.pages):
+            page = self.pages[self.index]
+            self.index += 1
+            self.continuation_token = f"t{self.index}" if self.index < len(self.pages) else None
+            yield iter(page)
+
+
+class FakeCheckpoint:
+    """Checkpoint stand-in recording marked states"""
+    
+    def __init__(self, state=None, files_committed=0):
+        self.state = state or {}
+        self.files_committed = files_committed
+        self.marks = []
+    
+    def mark(self, **state):
+        self.marks.append(state)
+
+
+class TestAzureCheckpointEdgeCases:
+    """Edge cases for checkpointed Azure listings"""
+    
+    @patch('azure.storage.blob.BlobServiceClient')
+    def test_resume_from_continuation_token(self, mock_blob_client_class):
+        """Test each handed-over page is marked and a resume starts at its token"""
+        from backend.azure_connector.scanner import iter_azure_blob
+        
+        pages = [
+            [create_mock_blob('a/1.txt', 1), create_mock_blob('a/', 0)],
+            [create_mock_blob('b/2.txt', 2), create_mock_blob('b/3.txt', 3)],
+            [create_mock_blob('c/4.txt', 4)]
+        ]
+        mock_container = Mock()
+        mock_container.list_blobs.return_value.by_page.side_effect = (
+            lambda continuation_token=None: FakePager(pages, continuation_token)
+        )
+        mock_blob_service = Mock()
+        mock_blob_service.get_container_client.return_value = mock_container
+        mock_blob_client_class.from_connection_string.return_value = mock_blob_service
+        
+        checkpoint = FakeCheckpoint()
+        names = [f['blob_path'] for f in iter_azure_blob('conn', 'box', checkpoint=checkpoint)]
+        
+        assert names == ['a/1.txt', 'b/2.txt', 'b/3.txt', 'c/4.txt']
+        assert checkpoint.marks == [
+            {'continuation_token': 't1', 'files_listed': 1, 'finished': False},
+            {'continuation_token': 't2', 'files_listed': 3, 'finished': False},
+            {'continuation_token': None, 'files_listed': 4, 'finished': True}
+        ]
+        
+        resumed = FakeCheckpoint(checkpoint.marks[0])
+        names = [f['blob_path'] for f in iter_azure_blob('conn', 'box', checkpoint=resumed)]
+        
+        assert names == ['b/2.txt', 'b/3.txt', 'c/4.txt']
+        assert resumed.marks[-1]['files_listed'] == 4
+        assert list(iter_azure_blob('conn', 'box', checkpoint=FakeCheckpoint(checkpoint.marks[-1]))) == []
+
+
+class FakeItems(list):
+    """Listing result whose by_page() splits it into pages of 2"""
+    
+    def by_page(self, continuation_token=None):
+        return iter([self[i:i + 2] for i in range(0, len(self), 2)])
+
+
+class FakeContainer:
+    """Container client over a fixed set of blob names"""
+    
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.listed = []
+    
+    def list_blobs(self, name_starts_with=None):
+        self.listed.append(name_starts_with)
+        return FakeItems(create_mock_blob(n, 1) for n in self.names if n.startswith(name_starts_with or ''))
+    
+    def walk_blobs(self, delimiter='/'):
+        items, prefixes = FakeItems(), set()
+        for name in self.names:
+            if delimiter not in name:
+                items.append(create_mock_blob(name, 1))
+                continue
+            prefix = name.split(delimiter)[0] + delimiter
+            if prefix not in prefixes:
+                prefixes.add(prefix)
+                items.append(create_mock_blob(prefix, 0))
+        return items
+
+
+PARTITIONED_BLOBS = ['root.txt', 'a/', 'a/1.txt', 'a/b/2.txt', 'b/3.txt', 'c/4.txt', 'c/5.txt', 'c/6.txt']
+
+
+class TestAzurePartitionedListingEdgeCases:
+    """Edge cases for prefix-partitioned parallel listing"""
+    
+    @patch('azure.storage.blob.BlobServiceClient')
+    def test_discovered_shards_cover_container(self, mock_blob_client_class):
+        """Test discovery plus parallel shards yields every blob once and marks every shard"""
+        from backend.azure_connector.scanner import iter_azure_blob
+        
+        container = FakeContainer(PARTITIONED_BLOBS)
+        mock_blob_client_class.from_connection_string.return_value.get_container_client.return_value = container
+        
+        checkpoint = FakeCheckpoint()
+        paths = [f['blob_path'] for f in iter_azure_blob('conn', 'box', checkpoint=checkpoint, workers=3)]
+        
+        assert sorted(paths) == [n for n in sorted(PARTITIONED_BLOBS) if not n.endswith('/')]
+        assert sorted(container.listed) == ['a/', 'b/', 'c/']
+        assert checkpoint.marks[-1]['shards_done'] == ['', 'a/', 'b/', 'c/']
+        assert checkpoint.marks[-1]['files_listed'] == 7
+    
+    @patch('azure.storage.blob.BlobServiceClient')
+    def test_resume_lists_only_unfinished_shards(self, mock_blob_client_class):
+        """Test a resumed partitioned listing skips the root and the shards already done"""
+        from backend.azure_connector.scanner import iter_azure_blob
+        
+        container = FakeContainer(PARTITIONED_BLOBS)
+        mock_blob_client_class.from_connection_string.return_value.get_container_client.return_value = container
+        
+        state = {'partitioned': True, 'workers': 2, 'shards': ['a/', 'b/', 'c/'],
+                 'shards_done': ['', 'a/'], 'files_listed': 3}
+        checkpoint = FakeCheckpoint(state, files_committed=3)
+        paths = [f['blob_path'] for f in iter_azure_blob('conn', 'box', checkpoint=checkpoint)]
+        
+        assert sorted(paths) == ['b/3.txt', 'c/4.txt', 'c/5.txt', 'c/6.txt']
+        assert sorted(container.listed) == ['b/', 'c/']
+        assert checkpoint.marks[-1]['files_listed'] == 7
+
+
+class FakeAsyncPage:
+    """Async-iterable listing page"""
+    
+    def __init__(self, blobs):
+        self.blobs = blobs
+    
+    async def __aiter__(self):
+        for blob in self.blobs:
+            yield blob
+
+
+class FakeAsyncPager(FakePager):
+    """Async listing pager over fixed pages; a page of None never arrives"""
+    
+    async def __aiter__(self):
+        for page in FakePager.__iter__(self):
+            page = list(page)
+            if page == [None]:
+                await asyncio.sleep(3600)
+            yield FakeAsyncPage(page)
+
+
+def fake_async_service(pages):
+    """Async BlobServiceClient stand-in listing pages"""
+    service = Mock()
+    container = service.get_container_client.return_value
+    container.list_blobs.return_value.by_page.side_effect = (
+        lambda continuation_token=None: FakeAsyncPager(pages, continuation_token)
+    )
+    return service
+
+
+class TestAzureAsyncScanningEdgeCases:
+    """Edge cases for the async (aio) scanner"""
+    
+    @patch('backend.azure_connector.aio_scanner.ClientPool.service_client')
+    def test_async_resume_from_continuation_token(self, mock_service_client):
+        """Test the async scanner marks pages like the sync one and resumes at a token"""
+        from backend.azure_connector.aio_scanner import aiter_azure_blob, ClientPool
+        
+        pages = [
+            [create_mock_blob('a/1.txt', 1), create_mock_blob('a/', 0)],
+            [create_mock_blob('b/2.txt', 2)]
+        ]
+        mock_service_client.return_value = fake_async_service(pages)
+        
+        async def listed(checkpoint):
+            return [f['blob_path'] async for f in aiter_azure_blob('conn', 'box', checkpoint=checkpoint, pool=ClientPool())]
+        
+        checkpoint = FakeCheckpoint()
+        assert asyncio.run(listed(checkpoint)) == ['a/1.txt', 'b/2.txt']
+        assert checkpoint.marks == [
+            {'continuation_token': 't1', 'files_listed': 1, 'finished': False},
+            {'continuation_token': None, 'files_listed': 2, 'finished': True}
+        ]
+        
+        resumed = FakeCheckpoint(checkpoint.marks[0])
+        assert asyncio.run(listed(resumed)) == ['b/2.txt']
+        assert resumed.marks[-1]['files_listed'] == 2
+    
+    @patch('backend.azure_connector.aio_scanner.ClientPool.service_client')
+    def test_cancel_interrupts_page_fetch(self, mock_service_client):
+        """Test cancelling a scan on the loop stops a hung page fetch and commits what was listed"""
+        from backend.azure_connector.aio_scanner import aiter_azure_blob, ScanLoop
+        from backend.pipeline import ingest_async
+        
+        mock_service_client.return_value = fake_async_service([[create_mock_blob('a/1.txt', 1)], [None]])
+        committed = []
+        scan_loop = ScanLoop()
+        
+        async def scan():
+            files = aiter_azure_blob('conn', 'box', pool=scan_loop.pool)
+            await ingest_async('scan', files, lambda scan_id, batch: committed.extend(batch),
+                               get_summary, batch_size=10, flush_interval=3600)
+        
+        try:
+            future = scan_loop.submit('scan', scan())
+            time.sleep(0.2)
+            assert scan_loop.cancel('scan')
+            deadline = time.monotonic() + 5
+            while not committed and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            scan_loop.close()
+        
+        assert future.cancelled()
+        assert [f['blob_path'] for f in committed] == ['a/1.txt']
+        assert not scan_loop.cancel('scan')
+
+
 class TestAzureSummaryEdgeCases:
     """Edge cases for Azure summary generation"""
     
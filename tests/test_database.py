@@ -1,14 +1,36 @@
 """
 Database Tests - EDGE CASES ONLY
 
-8 edge case tests covering database boundary conditions and error scenarios
+46 edge case tests covering database boundary conditions and error scenarios
 """
 
 import pytest
+import asyncio
 import sqlite3
+import csv
+import gzip
+import io
+import json
 import os
 import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
 from backend.local_connector import database as local_db
+from backend.local_connector.scanner import iter_folder, get_summary
+from backend.azure_connector import database as azure_db
+from backend.azure_connector.scanner import iter_azure_blob, get_summary as azure_get_summary
+from backend.shared_connector import database as shared_db
+from backend import aggregates, catalog, columnar, export, hashing, search
+from backend import scheduler as scheduler_module
+from backend.scheduler import ScanScheduler, share_resource
+from backend import scan_state
+from backend.scan_state import SQLiteStateStore
+from backend.pipeline import ingest
+from backend.db import Database, next_cursor
 
 
 @pytest.fixture
@@ -183,3 +205,1363 @@ class TestDatabaseEdgeCases:
         
         # Should return empty list, not error
         assert result == []
+    
+    def test_save_files_batch_is_atomic(self, temp_db_dir):
+        """Test a bad record rolls back the whole batch (single transaction)"""
+        local_db.init_db()
+        
+        scan_id = "atomic-test"
+        local_db.create_scan(scan_id, "Atomic Test", "/atomic")
+        
+        good = {
+            'file_name': 'good.txt',
+            'file_path': '/atomic/good.txt',
+            'file_type': 'Document',
+            'mime_type': 'text/plain',
+            'file_size': 100,
+            'last_modified': '2024-01-01T00:00:00',
+            'storage_type': 'local',
+            'eligible_for_ocr': False
+        }
+        bad = {'file_name': 'bad.txt'}  # Missing required keys
+        
+        with pytest.raises(KeyError):
+            local_db.save_files(scan_id, [good, bad])
+        
+        assert local_db.get_total_files_count(scan_id) == 0
+    
+    def test_keyset_pagination_walks_all_pages(self, temp_db_dir):
+        """Test cursor paging returns every file once, in file_name order, with duplicate names"""
+        local_db.init_db()
+        
+        scan_id = "keyset-test"
+        local_db.create_scan(scan_id, "Keyset Test", "/keyset")
+        
+        # Duplicate names in different folders need the id tiebreaker
+        files = [
+            {
+                'file_name': f'file{i % 9}.txt',
+                'file_path': f'/keyset/dir{i}/file{i % 9}.txt',
+                'file_type': 'text',
+                'mime_type': 'text/plain',
+                'file_size': i,
+                'last_modified': '2024-01-01T00:00:00',
+                'storage_type': 'local',
+                'eligible_for_ocr': False
+            }
+            for i in range(25)
+        ]
+        local_db.save_files(scan_id, files)
+        
+        seen = []
+        cursor = None
+        while True:
+            page = local_db.get_scan_files(scan_id, limit=10, cursor=cursor)
+            seen.extend(page)
+            cursor = next_cursor(page, 10)
+            if cursor is None:
+                break
+        
+        assert len(seen) == 25
+        assert len({f['id'] for f in seen}) == 25
+        assert [f['file_name'] for f in seen] == sorted(f['file_name'] for f in files)
+    
+    def test_invalid_cursor_rejected(self, temp_db_dir):
+        """Test a malformed cursor raises ValueError instead of returning a page"""
+        local_db.init_db()
+        
+        with pytest.raises(ValueError):
+            local_db.get_scan_files("any-scan", cursor="not-a-cursor")
+    
+    def test_scan_listing_uses_index(self, temp_db_dir):
+        """Test per-scan listing is served by the (scan_id, file_name, id) index"""
+        local_db.init_db()
+        
+        conn = sqlite3.connect(local_db.FILES_DB)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM files WHERE scan_id = ? "
+            "AND (file_name, id) > (?, ?) ORDER BY file_name, id LIMIT 100",
+            ("scan", "a", 0)
+        ).fetchall()
+        conn.close()
+        
+        details = ' '.join(row[-1] for row in plan)
+        assert 'idx_catalog_files_scan_name' in details
+        assert 'TEMP B-TREE' not in details
+
+
+def make_local_file(i, file_type='text', size=100, ocr=False):
+    """Helper to create a local file record"""
+    return {
+        'file_name': f'file{i}.{file_type}',
+        'file_path': f'/agg/file{i}.{file_type}',
+        'file_type': file_type,
+        'mime_type': 'application/octet-stream',
+        'file_size': size,
+        'last_modified': '2024-01-01T00:00:00',
+        'storage_type': 'local',
+        'eligible_for_ocr': ocr
+    }
+
+
+class TestScanAggregatesEdgeCases:
+    """Edge cases for materialized per-scan aggregates"""
+    
+    def test_aggregates_accumulate_across_batches(self, temp_db_dir):
+        """Test aggregates add up over several streamed batches"""
+        local_db.init_db()
+        
+        scan_id = "agg-batches"
+        local_db.save_files(scan_id, [make_local_file(i, 'pdf', 2048, True) for i in range(3)])
+        local_db.save_files(scan_id, [make_local_file(i, 'text', 0) for i in range(3, 5)])
+        
+        stats = local_db.get_scan_stats(scan_id)
+        
+        assert stats['total_files'] == 5
+        assert stats['total_size'] == 3 * 2048
+        assert stats['ocr_eligible_count'] == 3
+        assert stats['file_type_distribution'] == {'pdf': 3, 'text': 2}
+        histogram = {b['bucket']: b['file_count'] for b in stats['size_histogram']}
+        assert histogram['0 B'] == 2
+        assert histogram['<= 64 KB'] == 3
+        assert local_db.get_total_files_count(scan_id) == 5
+    
+    def test_aggregates_rebuilt_for_older_scans(self, temp_db_dir):
+        """Test scans written before aggregates existed are rebuilt on first read"""
+        local_db.init_db()
+        
+        scan_id = "agg-legacy"
+        local_db.create_scan(scan_id, scan_id, "/legacy")
+        local_db.save_files(scan_id, [make_local_file(i, 'image', 5000, True) for i in range(4)])
+        expected = local_db.get_scan_stats(scan_id)
+        
+        conn = sqlite3.connect(local_db.FILES_DB)
+        conn.execute("DELETE FROM scan_stats WHERE scan_id = ?", (scan_id,))
+        conn.execute("DELETE FROM scan_type_counts WHERE scan_id = ?", (scan_id,))
+        conn.execute("DELETE FROM scan_size_buckets WHERE scan_id = ?", (scan_id,))
+        conn.commit()
+        conn.close()
+        
+        assert local_db.get_scan_stats(scan_id) == expected
+    
+    def test_aggregates_for_unknown_scan(self, temp_db_dir):
+        """Test unknown scan returns no aggregates and stores no empty row"""
+        local_db.init_db()
+        
+        assert local_db.get_scan_stats("no-such-scan") is None
+        assert local_db.get_total_files_count("no-such-scan") == 0
+        
+        conn = sqlite3.connect(local_db.FILES_DB)
+        count = conn.execute("SELECT COUNT(*) FROM scan_stats").fetchone()[0]
+        conn.close()
+        assert count == 0
+    
+    def test_empty_scan_aggregates_saved_once(self, temp_db_dir):
+        """Test an existing scan with no files gets empty aggregates, rebuilt on the first read only"""
+        local_db.init_db()
+        local_db.create_scan("agg-empty", "agg-empty", "/empty")
+        
+        with patch('backend.aggregates.rebuild', wraps=aggregates.rebuild) as rebuild:
+            for _ in range(3):
+                stats = local_db.get_scan_stats("agg-empty")
+                assert (stats['total_files'], stats['total_size'], stats['file_type_distribution']) == (0, 0, {})
+        assert rebuild.call_count == 1
+        # Files saved later add to the empty row
+        local_db.save_files("agg-empty", [make_local_file(i, 'pdf', 100, True) for i in range(2)])
+        assert local_db.get_total_files_count("agg-empty") == 2
+
+
+def build_tree(root, dirs, files_per_dir, age=3600):
+    """Helper to create dirs subdirectories of files, with mtimes age seconds old"""
+    old = time.time() - age
+    for d in range(dirs):
+        folder = os.path.join(root, f'dir{d}')
+        os.makedirs(folder)
+        for f in range(files_per_dir):
+            open(os.path.join(folder, f'file{d}_{f}.txt'), 'w').close()
+        os.utime(folder, (old, old))
+    os.utime(root, (old, old))
+
+
+def run_local_scan(scan_id, folder, base_scan_id=None, processes=None):
+    """Helper to scan a folder the way the API does, recording its snapshot"""
+    local_db.create_scan(scan_id, scan_id, folder, base_scan_id)
+    snapshots = local_db.open_snapshots(scan_id, base_scan_id)
+    try:
+        records = iter_folder(folder, workers=2, snapshots=snapshots, processes=processes)
+        local_db.save_files(scan_id, list(records))
+        snapshots.commit()
+    finally:
+        snapshots.close()
+    if base_scan_id:
+        local_db.finalize_incremental_scan(scan_id)
+    return snapshots
+
+
+def listed_paths(scan_id, limit=7):
+    """Helper to read every file path of a scan through keyset pages"""
+    paths, cursor = [], None
+    while True:
+        files = local_db.get_scan_files(scan_id, limit=limit, cursor=cursor)
+        paths.extend(f['file_path'] for f in files)
+        cursor = next_cursor(files, limit)
+        if not cursor:
+            return paths
+
+
+class TestIncrementalScanEdgeCases:
+    """Edge cases for incremental re-scans against a base scan's directory snapshot"""
+    
+    def test_unchanged_tree_lists_no_directories(self, temp_db_dir, tmp_path):
+        """Test an unchanged tree is carried forward entirely with identical results"""
+        local_db.init_db()
+        folder = str(tmp_path / "tree")
+        build_tree(folder, 5, 4)
+        
+        run_local_scan("full", folder)
+        snapshots = run_local_scan("incr", folder, base_scan_id="full")
+        
+        assert snapshots.listed_count == 0
+        assert snapshots.carried_count == 6
+        assert listed_paths("incr") == listed_paths("full")
+        assert local_db.get_scan_stats("incr") == local_db.get_scan_stats("full")
+        assert all(f['scan_id'] == "incr" for f in local_db.get_scan_files("incr"))
+    
+    def test_changed_directory_is_relisted(self, temp_db_dir, tmp_path):
+        """Test added and deleted files show up while other directories stay carried"""
+        local_db.init_db()
+        folder = str(tmp_path / "tree")
+        build_tree(folder, 4, 3)
+        run_local_scan("full", folder)
+        
+        changed = os.path.join(folder, 'dir2')
+        os.remove(os.path.join(changed, 'file2_0.txt'))
+        open(os.path.join(changed, 'new.txt'), 'w').close()
+        old = time.time() - 60
+        os.utime(changed, (old, old))
+        
+        snapshots = run_local_scan("incr", folder, base_scan_id="full")
+        # Chain a second incremental scan off the first
+        run_local_scan("incr2", folder, base_scan_id="incr")
+        
+        expected = sorted(
+            os.path.join(root, name) for root, _, names in os.walk(folder) for name in names
+        )
+        assert snapshots.listed_count == 1
+        assert sorted(listed_paths("incr")) == expected
+        assert sorted(listed_paths("incr2")) == expected
+        assert local_db.get_total_files_count("incr") == 12
+        assert local_db.get_total_files_count("incr2") == 12
+    
+    def test_recently_modified_directory_is_relisted(self, temp_db_dir, tmp_path):
+        """Test a directory modified within the mtime race window is never carried"""
+        local_db.init_db()
+        folder = str(tmp_path / "tree")
+        build_tree(folder, 3, 2, age=0)
+        
+        run_local_scan("full", folder)
+        snapshots = run_local_scan("incr", folder, base_scan_id="full")
+        
+        assert snapshots.carried_count == 0
+        assert snapshots.listed_count == 4
+        assert sorted(listed_paths("incr")) == sorted(listed_paths("full"))
+    
+    def test_process_scan_records_snapshot(self, temp_db_dir, tmp_path):
+        """Test a multi-process scan snapshots every directory for incremental scans and resume"""
+        local_db.init_db()
+        folder = str(tmp_path / "tree")
+        build_tree(folder, 3, 2)
+        os.makedirs(os.path.join(folder, 'dir0', 'nested'))
+        open(os.path.join(folder, 'dir0', 'nested', 'deep.txt'), 'w').close()
+        old = time.time() - 3600
+        os.utime(os.path.join(folder, 'dir0', 'nested'), (old, old))
+        os.utime(os.path.join(folder, 'dir0'), (old, old))
+        
+        full = run_local_scan("full", folder, processes=2)
+        snapshots = run_local_scan("incr", folder, base_scan_id="full")
+        
+        assert full.listed_count == 5
+        assert snapshots.listed_count == 0
+        assert snapshots.carried_count == 5
+        assert sorted(listed_paths("incr")) == sorted(listed_paths("full"))
+        # Every directory is finished, so resuming keeps every row
+        assert local_db.prepare_resume("full") == 7
+
+
+class TestScanResumeEdgeCases:
+    """Edge cases for resuming an interrupted scan from its checkpoint"""
+    
+    def test_resume_after_crash_skips_finished_directories(self, temp_db_dir, tmp_path):
+        """Test a scan killed mid-batch resumes from its frontier with no lost or duplicate rows"""
+        local_db.init_db()
+        folder = str(tmp_path / "tree")
+        build_tree(folder, 6, 10)
+        scan_id = "resumed"
+        local_db.create_scan(scan_id, scan_id, folder)
+        
+        saved = []
+        def crashing_save(scan_id, batch):
+            if len(saved) == 3:
+                raise RuntimeError("server killed")
+            local_db.save_files(scan_id, batch)
+            saved.append(len(batch))
+        
+        snapshots = local_db.open_snapshots(scan_id)
+        checkpoint = local_db.open_checkpoint(scan_id, on_commit=[snapshots.commit])
+        with pytest.raises(RuntimeError):
+            ingest(scan_id, iter_folder(folder, workers=1, snapshots=snapshots),
+                   checkpoint.wrap(crashing_save), get_summary, batch_size=7)
+        snapshots.close()
+        
+        kept = local_db.prepare_resume(scan_id)
+        snapshots = local_db.open_snapshots(scan_id, resume=True)
+        checkpoint = local_db.open_checkpoint(scan_id, on_commit=[snapshots.commit])
+        ingest(scan_id, iter_folder(folder, workers=1, snapshots=snapshots),
+               checkpoint.wrap(local_db.save_files), get_summary, batch_size=7)
+        checkpoint.commit()
+        snapshots.close()
+        
+        expected = sorted(
+            os.path.join(root, name) for root, _, names in os.walk(folder) for name in names
+        )
+        # Root and the first two directories were committed before the crash
+        assert kept == 20
+        assert snapshots.listed_count == 4
+        assert sorted(listed_paths(scan_id)) == expected
+        assert local_db.get_total_files_count(scan_id) == 60
+
+
+@pytest.fixture
+def azure_db_dir(tmp_path):
+    """Create temporary Azure database paths"""
+    db_dir = tmp_path / "azure_db"
+    db_dir.mkdir()
+    
+    original_scans_db = azure_db.SCANS_DB
+    original_files_db = azure_db.FILES_DB
+    
+    azure_db.SCANS_DB = str(db_dir / "scanner.db")
+    azure_db.FILES_DB = str(db_dir / "files.db")
+    azure_db.init_db()
+    
+    yield db_dir
+    
+    azure_db.SCANS_DB = original_scans_db
+    azure_db.FILES_DB = original_files_db
+
+
+def make_blob(name, etag, size=10):
+    """Helper to create a listed blob"""
+    return SimpleNamespace(name=name, etag=etag, size=size, last_modified=None)
+
+
+class BlobPager:
+    """Listing pager over pages of 2 blobs, with the next page index as token"""
+    
+    def __init__(self, blobs, token):
+        self.pages = [blobs[i:i + 2] for i in range(0, len(blobs), 2)]
+        self.index = int(token or 0)
+        self.continuation_token = token
+    
+    def __iter__(self):
+        while self.index < len(self.pages):
+            page = self.pages[self.index]
+            self.index += 1
+            self.continuation_token = str(self.index) if self.index < len(self.pages) else None
+            yield iter(page)
+
+
+def run_azure_scan(scan_id, blobs, base_scan_id=None, save_files=None):
+    """Helper to scan a container listing (pages of 2) the way the API does"""
+    container = Mock()
+    container.list_blobs.return_value.by_page.side_effect = (
+        lambda continuation_token=None: BlobPager(blobs, continuation_token)
+    )
+    
+    checkpoint = azure_db.open_checkpoint(scan_id)
+    if checkpoint.state:
+        checkpoint.files_committed = azure_db.prepare_resume(scan_id, checkpoint.state)
+    else:
+        azure_db.create_scan(scan_id, scan_id, 'box', 'acct', base_scan_id)
+    delta = azure_db.open_delta(scan_id, base_scan_id, checkpoint.state.get('last_blob')) if base_scan_id else None
+    if delta:
+        checkpoint.on_commit.append(delta.commit)
+    try:
+        with patch('azure.storage.blob.BlobServiceClient') as client:
+            client.from_connection_string.return_value.get_container_client.return_value = container
+            ingest(scan_id, iter_azure_blob('conn', 'box', checkpoint=checkpoint, delta=delta),
+                   checkpoint.wrap(save_files or azure_db.save_files), azure_get_summary, batch_size=1)
+        if delta:
+            delta.finish()
+        checkpoint.commit()
+    finally:
+        if delta:
+            delta.close()
+    if base_scan_id:
+        azure_db.finalize_delta_scan(scan_id)
+    return delta
+
+
+def azure_listing(scan_id):
+    """Helper to read (blob_path, etag) of a scan's effective files through keyset pages"""
+    listed, cursor = [], None
+    while True:
+        files = azure_db.get_scan_files(scan_id, limit=2, cursor=cursor)
+        listed.extend((f['blob_path'], f['etag']) for f in files)
+        cursor = next_cursor(files, 2)
+        if not cursor:
+            return sorted(listed)
+
+
+class TestAzureDeltaScanEdgeCases:
+    """Edge cases for Azure delta scans (etag change detection against a base scan)"""
+    
+    def test_delta_writes_only_changes(self, azure_db_dir):
+        """Test a delta stores changed and new blobs plus deletions, chained off another delta"""
+        run_azure_scan("full", [make_blob(n, 'e1') for n in ['a.txt', 'b.txt', 'c.txt', 'd.txt']])
+        
+        current = [make_blob('a.txt', 'e1'), make_blob('b.txt', 'e2', 20),
+                   make_blob('d.txt', 'e1'), make_blob('e.txt', 'e1')]
+        delta = run_azure_scan("delta", current, base_scan_id="full")
+        # Second delta off the first: d.txt deleted, nothing else changed
+        delta2 = run_azure_scan("delta2", [current[0], current[1], current[3]], base_scan_id="delta")
+        
+        assert (delta.written_count, delta.unchanged_count, delta.deleted_count) == (2, 2, 1)
+        assert azure_listing("delta") == [('a.txt', 'e1'), ('b.txt', 'e2'), ('d.txt', 'e1'), ('e.txt', 'e1')]
+        assert azure_db.get_scan_stats("delta")['total_size'] == 50
+        assert (delta2.written_count, delta2.unchanged_count, delta2.deleted_count) == (0, 3, 1)
+        assert azure_listing("delta2") == [('a.txt', 'e1'), ('b.txt', 'e2'), ('e.txt', 'e1')]
+        assert azure_db.get_total_files_count("delta2") == 3
+    
+    def test_delta_resume_after_crash(self, azure_db_dir):
+        """Test a delta scan killed mid-listing resumes at its token with no lost or duplicate rows"""
+        run_azure_scan("full", [make_blob(f'{n}.txt', 'e1') for n in 'abcdefgh'])
+        # Every other blob changed, c and f deleted, z added
+        current = [make_blob(f'{n}.txt', 'e2' if i % 2 else 'e1') for i, n in enumerate('abcdefgh') if n not in 'cf']
+        current.append(make_blob('z.txt', 'e1'))
+        
+        saved = []
+        def crashing_save(scan_id, batch):
+            if len(saved) == 2:
+                raise RuntimeError("server killed")
+            azure_db.save_files(scan_id, batch)
+            saved.append(len(batch))
+        
+        with pytest.raises(RuntimeError):
+            run_azure_scan("delta", current, base_scan_id="full", save_files=crashing_save)
+        run_azure_scan("delta", current, base_scan_id="full")
+        
+        expected = [(b.name, b.etag) for b in current]
+        assert azure_listing("delta") == expected
+        assert azure_db.get_total_files_count("delta") == 7
+        conn = sqlite3.connect(azure_db.FILES_DB)
+        deleted = conn.execute("SELECT blob_path FROM azure_deleted WHERE scan_id = 'delta' ORDER BY 1").fetchall()
+        written = conn.execute("SELECT COUNT(*) FROM azure_files WHERE scan_id = 'delta'").fetchone()[0]
+        conn.close()
+        assert deleted == [('c.txt',), ('f.txt',)]
+        assert written == 4
+
+
+@pytest.fixture
+def catalog_db_dir(tmp_path):
+    """Point every connector (and the catalog) at one temporary scanner.db / files.db"""
+    db_dir = tmp_path / "catalog_db"
+    db_dir.mkdir()
+    
+    modules = (local_db, azure_db, shared_db)
+    originals = [(m.SCANS_DB, m.FILES_DB) for m in modules]
+    original_catalog_db = catalog.SCANS_DB
+    
+    for m in modules:
+        m.SCANS_DB = str(db_dir / "scanner.db")
+        m.FILES_DB = str(db_dir / "files.db")
+    catalog.SCANS_DB = str(db_dir / "scanner.db")
+    
+    yield db_dir
+    
+    for m, (scans_db, files_db) in zip(modules, originals):
+        m.SCANS_DB = scans_db
+        m.FILES_DB = files_db
+    catalog.SCANS_DB = original_catalog_db
+
+
+def init_all():
+    """Initialize every connector's tables (and views) like the app does on startup"""
+    local_db.init_db()
+    azure_db.init_db()
+    shared_db.init_db()
+
+
+class TestUnifiedCatalogEdgeCases:
+    """Edge cases for the unified scans / files catalog"""
+    
+    def test_all_sources_listed_by_one_indexed_query(self, catalog_db_dir):
+        """Test scans of every source come back newest first from one index scan, with shared strings stored once"""
+        init_all()
+        local_db.create_scan("local-1", "Local", "/data")
+        azure_db.create_scan("azure-1", "Azure", "container", "account")
+        shared_db.create_scan("shared-1", "Shared", "//server/share", "Share")
+        local_db.create_scan("local-2", "Local again", "/data")
+        
+        local_db.save_files("local-1", [
+            {**make_local_file(i, file_type='Document'), 'file_path': f'/data/docs/file{i}.txt', 'mime_type': 'text/plain'}
+            for i in range(50)
+        ])
+        
+        scans = catalog.get_all_scans()
+        assert [s['id'] for s in scans] == ["local-2", "shared-1", "azure-1", "local-1"]
+        assert [s['storage_type'] for s in scans] == ["local", "shared", "azure", "local"]
+        assert [s['id'] for s in catalog.get_all_scans('local')] == ["local-2", "local-1"]
+        
+        # Per-source views still return the connectors' own columns
+        assert shared_db.get_scan("shared-1")['share_name'] == "Share"
+        assert azure_db.get_scan("azure-1")['container_name'] == "container"
+        
+        conn = sqlite3.connect(catalog.SCANS_DB)
+        plan = ' '.join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM catalog_scans ORDER BY start_time DESC LIMIT 100"
+        ))
+        conn.close()
+        assert 'idx_catalog_scans_start' in plan
+        assert 'TEMP B-TREE' not in plan
+        
+        # 50 rows, but each repeated string is stored once and rows hold its id
+        conn = sqlite3.connect(local_db.FILES_DB)
+        for table in ('catalog_file_types', 'catalog_mime_types', 'catalog_extensions'):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 1
+        # The one directory, plus its ancestors in the tree
+        assert conn.execute("SELECT COUNT(*) FROM catalog_dirs").fetchone()[0] == 3
+        types = conn.execute("SELECT DISTINCT typeof(type_id), typeof(dir_id) FROM catalog_files").fetchall()
+        conn.close()
+        assert types == [('integer', 'integer')]
+        
+        files = local_db.get_scan_files("local-1", limit=1)
+        assert files[0]['file_type'] == 'Document'
+        assert files[0]['parent_dir'] == '/data/docs'
+    
+    def test_legacy_tables_migrated_into_catalog(self, catalog_db_dir):
+        """Test scans and files in the old per-connector tables are moved into the catalog on startup"""
+        conn = sqlite3.connect(catalog.SCANS_DB)
+        conn.execute("CREATE TABLE scans (id TEXT PRIMARY KEY, name TEXT, folder_path TEXT, status TEXT, "
+                     "total_files INTEGER, total_size INTEGER, start_time TEXT, end_time TEXT)")
+        conn.execute("CREATE TABLE shared_scans (id TEXT PRIMARY KEY, scan_name TEXT NOT NULL, share_path TEXT NOT NULL, "
+                     "share_name TEXT NOT NULL, status TEXT DEFAULT 'running', total_files INTEGER, total_size INTEGER, "
+                     "created_at TIMESTAMP, completed_at TIMESTAMP)")
+        conn.execute("INSERT INTO scans VALUES ('old-local', 'Old', '/old', 'completed', 2, 30, '2024-01-01T10:00:00', NULL)")
+        conn.execute("INSERT INTO shared_scans VALUES ('old-shared', 'Old share', '//s/x', 'X', 'completed', 1, 5, "
+                     "'2024-01-01 11:00:00', '2024-01-01 11:05:00')")
+        conn.commit()
+        conn.close()
+        
+        conn = sqlite3.connect(local_db.FILES_DB)
+        conn.execute("CREATE TABLE files (id INTEGER PRIMARY KEY AUTOINCREMENT, scan_id TEXT, file_name TEXT, "
+                     "file_path TEXT, file_type TEXT, mime_type TEXT, file_size INTEGER, last_modified TEXT, "
+                     "storage_type TEXT, eligible_for_ocr BOOLEAN)")
+        conn.executemany(
+            "INSERT INTO files (scan_id, file_name, file_path, file_type, file_size, storage_type) VALUES (?, ?, ?, ?, ?, ?)",
+            [('old-local', 'b.txt', '/old/b.txt', 'Document', 10, 'local'),
+             ('old-local', 'a.txt', '/old/a.txt', 'Document', 20, 'local')]
+        )
+        conn.commit()
+        conn.close()
+        
+        init_all()
+        # A second start finds views, not tables, and moves nothing twice
+        init_all()
+        
+        assert [s['id'] for s in catalog.get_all_scans()] == ["old-shared", "old-local"]
+        assert local_db.get_scan("old-local")['folder_path'] == '/old'
+        assert shared_db.get_scan("old-shared")['completed_at'] == '2024-01-01T11:05:00'
+        
+        files = local_db.get_scan_files("old-local")
+        assert [(f['file_name'], f['file_type'], f['storage_type']) for f in files] == [
+            ('a.txt', 'Document', 'local'), ('b.txt', 'Document', 'local')
+        ]
+        assert local_db.get_scan_stats("old-local")['total_size'] == 30
+        
+        conn = sqlite3.connect(local_db.FILES_DB)
+        kinds = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE name IN ('files', 'shared_scan_files')"))
+        conn.close()
+        assert kinds == {'files': 'view', 'shared_scan_files': 'view'}
+
+
+def make_tree_file(file_path):
+    """Helper to create a local file record at a given path"""
+    return {**make_local_file(0), 'file_name': os.path.basename(file_path), 'file_path': file_path}
+
+
+class TestDirectoryTreeEdgeCases:
+    """Edge cases for the directory tree file rows reference"""
+    
+    def test_paths_rebuilt_from_directory_tree(self, catalog_db_dir):
+        """Test full paths are rebuilt exactly on read, only unrebuildable ones are stored, and directories form a tree"""
+        init_all()
+        local_db.create_scan("local-1", "Local", "/data")
+        paths = ['/data/finance/q1/a.csv', '/data/finance/b.csv', '/data/x.txt', '/root.txt', 'upload.txt']
+        local_db.save_files("local-1", [make_tree_file(p) for p in paths])
+        shared_db.create_scan("shared-1", "Shared", "/mnt/share", "Share")
+        shared_db.save_files("shared-1", [
+            {'file_name': 'c.doc', 'file_path': '/mnt/share/team/c.doc', 'file_size': 1, 'extension': '.doc'}
+        ])
+        
+        files = local_db.get_scan_files("local-1")
+        assert sorted(f['file_path'] for f in files) == sorted(paths)
+        assert shared_db.get_scan_files("shared-1")[0]['file_path'] == '/mnt/share/team/c.doc'
+        
+        conn = sqlite3.connect(local_db.FILES_DB)
+        # A path with no directory to rebuild it from is the only one stored
+        stored = conn.execute("SELECT file_path FROM catalog_files WHERE file_path IS NOT NULL").fetchall()
+        chain = []
+        dir_id = conn.execute("SELECT id FROM catalog_dirs WHERE value = '/data/finance/q1'").fetchone()[0]
+        while dir_id is not None:
+            name, dir_id = conn.execute("SELECT name, parent_id FROM catalog_dirs WHERE id = ?", (dir_id,)).fetchone()
+            chain.append(name)
+        conn.close()
+        assert stored == [('upload.txt',)]
+        assert chain == ['q1', 'finance', 'data', '/']
+    
+    def test_subtree_listing_uses_directory_range(self, catalog_db_dir):
+        """Test listing everything under a directory skips look-alike siblings and seeks the directory index"""
+        init_all()
+        local_db.create_scan("local-1", "Local", "/data")
+        paths = ['/data/finance/a.csv', '/data/finance/q1/b.csv', '/data/finance/q1/deep/c.csv',
+                 '/data/finance2/d.csv', '/data/finance.txt', '/data/hr/e.csv']
+        local_db.save_files("local-1", [make_tree_file(p) for p in paths])
+        
+        under = local_db.get_scan_files("local-1", under='/data/finance')
+        assert [f['file_name'] for f in under] == ['a.csv', 'b.csv', 'c.csv']
+        assert local_db.get_scan_files("local-1", under='/data/finance/') == under
+        assert [f['file_name'] for f in local_db.get_scan_files("local-1", under='/data/finance/q1/deep')] == ['c.csv']
+        
+        # Keyset pages of a subtree
+        first = local_db.get_scan_files("local-1", limit=2, under='/data/finance')
+        rest = local_db.get_scan_files("local-1", limit=2, cursor=next_cursor(first, 2), under='/data/finance')
+        assert first + rest == under
+        
+        sql, params = catalog.subtree_filter("local-1", '/data/finance')
+        conn = sqlite3.connect(local_db.FILES_DB)
+        plan = ' '.join(row[-1] for row in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM files WHERE {sql} ORDER BY file_name, id", params
+        ))
+        conn.close()
+        assert 'SEARCH sd USING COVERING INDEX sqlite_autoindex_catalog_dirs_1 (value>? AND value<?)' in plan
+        assert 'SEARCH sf USING COVERING INDEX idx_catalog_files_scan_dir (scan_id=? AND dir_id=?)' in plan
+
+
+class TestScanExportEdgeCases:
+    """Edge cases for streaming scan exports"""
+    
+    def test_export_streams_every_row_in_chunks(self, catalog_db_dir):
+        """Test CSV and NDJSON exports (gzipped or not) hold every row, in listing order, built a chunk at a time"""
+        init_all()
+        local_db.create_scan("local-1", "Local", "/data")
+        local_db.save_files("local-1", [
+            {**make_local_file(i), 'file_name': f'b"{i:02d}, x.txt', 'file_path': f'/data/b"{i:02d}, x.txt'}
+            for i in range(25)
+        ])
+        expected = local_db.get_scan_files("local-1", limit=100)
+        
+        with patch.object(export, 'EXPORT_CHUNK_ROWS', 10):
+            chunks = list(local_db.export_files("local-1", 'ndjson'))
+            csv_bytes = gzip.decompress(b''.join(local_db.export_files("local-1", 'csv', compress=True)))
+        
+        assert len(chunks) == 3
+        assert [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()] == expected
+        rows = list(csv.DictReader(io.StringIO(csv_bytes.decode('utf-8'))))
+        assert [(r['file_name'], r['file_path'], int(r['id'])) for r in rows] == [
+            (f['file_name'], f['file_path'], f['id']) for f in expected
+        ]
+        
+        # An empty scan still gets a header
+        local_db.create_scan("local-2", "Empty", "/empty")
+        assert b''.join(local_db.export_files("local-2", 'csv')).decode('utf-8').startswith('id,scan_id,file_name')
+    
+    def test_parquet_export_of_delta_scan(self, azure_db_dir):
+        """Test a delta scan exports to Parquet as its merged effective rows, with typed columns"""
+        pq = pytest.importorskip("pyarrow.parquet")
+        run_azure_scan("full", [make_blob(n, 'e1') for n in ['a.txt', 'b.txt', 'c.txt']])
+        run_azure_scan("delta", [make_blob('a.txt', 'e1'), make_blob('b.txt', 'e2', 20), make_blob('d.txt', 'e1')],
+                       base_scan_id="full")
+        
+        with patch.object(export, 'EXPORT_CHUNK_ROWS', 2):
+            data = b''.join(azure_db.export_files("delta", 'parquet'))
+        table = pq.read_table(io.BytesIO(data))
+        
+        assert table.column('blob_path').to_pylist() == ['a.txt', 'b.txt', 'd.txt']
+        assert table.column('etag').to_pylist() == ['e1', 'e2', 'e1']
+        assert set(table.column('scan_id').to_pylist()) == {'delta'}
+        assert str(table.schema.field('file_size').type) == 'int64'
+        assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == 2
+
+
+@pytest.fixture
+def columnar_dir(catalog_db_dir):
+    """Catalog databases plus a temporary snapshot directory"""
+    original = columnar.SNAPSHOT_DIR
+    columnar.SNAPSHOT_DIR = str(catalog_db_dir / "columnar")
+    yield catalog_db_dir
+    columnar.SNAPSHOT_DIR = original
+
+
+class TestColumnarSnapshotEdgeCases:
+    """Edge cases for columnar (Parquet) snapshots of completed scans"""
+    
+    def test_snapshot_aggregates_match_catalog(self, columnar_dir):
+        """Test size by type, largest files and age buckets from a frozen scan agree with the row store"""
+        pytest.importorskip("pyarrow")
+        init_all()
+        now = datetime(2025, 1, 1)
+        local_db.create_scan("local-1", "Local", "/data")
+        local_db.save_files("local-1", [
+            {**make_local_file(i, file_type='pdf' if i % 3 else 'text', size=i * 10),
+             'file_name': f'f{i}.{"pdf" if i % 3 else "TXT"}',
+             'last_modified': (now - timedelta(days=i * 20)).isoformat() if i % 4 else None}
+            for i in range(40)
+        ])
+        
+        with patch.object(export, 'EXPORT_CHUNK_ROWS', 16):
+            snapshot = local_db.freeze_scan("local-1")
+        stats = local_db.get_scan_stats("local-1")
+        
+        assert snapshot['rows'] == 40
+        assert {r['file_type']: (r['file_count'], r['total_size']) for r in columnar.size_by("local-1")} == {
+            ftype: (count, stats['file_type_sizes'][ftype]) for ftype, count in stats['file_type_distribution'].items()
+        }
+        assert [r['extension'] for r in columnar.size_by("local-1", 'extension')] == ['pdf', 'txt']
+        assert [f['file_size'] for f in columnar.largest("local-1", 3)] == [390, 380, 370]
+        
+        ages = {b['bucket']: b['file_count'] for b in columnar.age_histogram("local-1", now)}
+        assert ages['unknown'] == 10
+        assert ages['<= 30 days'] == 1 and ages['> 5 years'] == 0
+        assert sum(ages.values()) == 40
+        
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(columnar.snapshot_path("local-1"))
+        assert str(schema.field('file_type').type) == 'dictionary<values=string, indices=int32, ordered=0>'
+    
+    def test_freeze_endpoint_and_unfrozen_scans(self, columnar_dir):
+        """Test only completed scans can be frozen, analytics need a snapshot, and refreezing replaces it"""
+        pytest.importorskip("pyarrow")
+        from fastapi.testclient import TestClient
+        from backend.app import app
+        client = TestClient(app)
+        init_all()
+        shared_db.create_scan("shared-1", "Shared", "/mnt/share", "Share")
+        shared_db.save_files("shared-1", [
+            {'file_name': f'c{i}.doc', 'file_path': f'/mnt/share/c{i}.doc', 'file_size': i, 'extension': '.DOC'}
+            for i in range(5)
+        ])
+        
+        assert client.post("/api/scan/shared-1/freeze").status_code == 400
+        assert client.get("/api/scan/shared-1/analytics/size").status_code == 404
+        assert client.post("/api/scan/missing/freeze").status_code == 404
+        
+        shared_db.complete_scan("shared-1", 5, 10)
+        assert client.post("/api/scan/shared-1/freeze").json()['rows'] == 5
+        assert client.post("/api/scan/shared-1/freeze").json()['rows'] == 5
+        assert os.listdir(columnar.SNAPSHOT_DIR) == ['shared-1.parquet']
+        
+        response = client.get("/api/scan/shared-1/analytics/size", params={'by': 'extension'})
+        assert response.json()['results'] == [{'extension': 'doc', 'file_count': 5, 'total_size': 10}]
+        assert client.get("/api/scan/shared-1/analytics/size", params={'by': 'owner'}).status_code == 400
+        largest = client.get("/api/scan/shared-1/analytics/largest", params={'n': 2}).json()['results']
+        assert [f['file_path'] for f in largest] == ['/mnt/share/c4.doc', '/mnt/share/c3.doc']
+
+
+def search_names(search_files, scan_id, filters, limit=3):
+    """Helper to read the names a search returns, through keyset pages"""
+    names, cursor = [], None
+    while True:
+        files = search_files(scan_id, filters, limit=limit, cursor=cursor)
+        names.extend(f['file_name'] for f in files)
+        cursor = next_cursor(files, limit)
+        if not cursor:
+            return names
+
+
+class TestServerSideSearchEdgeCases:
+    """Edge cases for server-side file filters and the file name index"""
+    
+    def test_filters_match_whichever_index_drives(self, catalog_db_dir):
+        """Test every filter (alone and combined) gives the same rows from its own index, the name walk, and before or after the name index catches up"""
+        init_all()
+        local_db.create_scan("local-1", "Local", "/data")
+        dirs = ['/data/a', '/data/a/deep', '/data/a-old', '/data/b']
+        records = [
+            {**make_local_file(i, file_type=['pdf', 'text', 'image'][i % 3], size=i * 100, ocr=i % 4 == 0),
+             'file_name': f"{['Report', 'notes', 'IMG'][i % 3]}_{i:02d}.{['PDF', 'txt', 'jpg'][i % 3]}",
+             'file_path': f"{dirs[i % 4]}/{['Report', 'notes', 'IMG'][i % 3]}_{i:02d}.{['PDF', 'txt', 'jpg'][i % 3]}",
+             'last_modified': f'2024-{i % 12 + 1:02d}-15T00:00:00'}
+            for i in range(36)
+        ]
+        local_db.save_files("local-1", records)
+        rows = local_db.get_scan_files("local-1", limit=100)
+        cases = [
+            ({'file_type': 'pdf'}, lambda f: f['file_type'] == 'pdf'),
+            ({'extension': '.PDF'}, lambda f: f['file_name'].endswith('.PDF')),
+            ({'min_size': 1000, 'max_size': 2000}, lambda f: 1000 <= f['file_size'] <= 2000),
+            ({'modified_after': '2024-03', 'modified_before': '2024-05'},
+             lambda f: '2024-03' <= f['last_modified'] <= '2024-05'),
+            ({'ocr': True, 'file_type': 'text'}, lambda f: f['eligible_for_ocr'] and f['file_type'] == 'text'),
+            ({'ocr': False, 'min_size': 3000}, lambda f: not f['eligible_for_ocr'] and f['file_size'] >= 3000),
+            ({'path': '/data/a'}, lambda f: f['file_path'].startswith('/data/a/')),
+            ({'name': 'report_1'}, lambda f: 'report_1' in f['file_name'].lower()),
+            ({'name': 'IMG_?[05].jpg'}, lambda f: f['file_name'][:4] == 'IMG_' and f['file_name'][5] in '05'
+             and f['file_name'].endswith('.jpg') and len(f['file_name']) == 10),
+            ({'name': '_2', 'path': '/data/a', 'max_size': 2500},
+             lambda f: '_2' in f['file_name'] and f['file_path'].startswith('/data/a/') and f['file_size'] <= 2500),
+        ]
+        
+        def check():
+            for filters, keep in cases:
+                expected = [f['file_name'] for f in rows if keep(f)]
+                assert search_names(local_db.search_files, "local-1", filters) == expected, filters
+                # Every filter too broad for its index: walk the name index instead
+                with patch.object(search, 'SELECTIVE_ROWS', 0):
+                    assert search_names(local_db.search_files, "local-1", filters) == expected, filters
+        
+        check()
+        local_db.complete_scan("local-1", 36, 0)
+        conn = sqlite3.connect(local_db.FILES_DB)
+        assert conn.execute("SELECT last_id FROM catalog_names_indexed").fetchone()[0] == max(f['id'] for f in rows)
+        conn.close()
+        check()
+        
+        conn = sqlite3.connect(local_db.FILES_DB)
+        where, params = search._where(conn, "local-1", {'name': 'report_1'}, '/')
+        plan = ' '.join(r[-1] for r in conn.execute(f"EXPLAIN QUERY PLAN SELECT * FROM search_files f WHERE {where}", params))
+        # Deleted rows leave the name index with them
+        conn.execute("DELETE FROM catalog_files WHERE file_name LIKE 'Report_1%'")
+        conn.commit()
+        conn.close()
+        assert 'SCAN catalog_names VIRTUAL TABLE' in plan
+        assert 'SEARCH t USING INTEGER PRIMARY KEY (rowid=?)' in plan
+        assert search_names(local_db.search_files, "local-1", {'name': 'report_1'}) == []
+        with pytest.raises(ValueError):
+            local_db.search_files("local-1", {'owner': 'me'})
+    
+    def test_search_endpoint_across_sources(self, catalog_db_dir):
+        """Test the files endpoint searches a delta scan's effective blobs, with unified fields, and rejects bad input"""
+        from fastapi.testclient import TestClient
+        from backend.app import app
+        client = TestClient(app)
+        init_all()
+        run_azure_scan("full", [make_blob(n, 'e1') for n in ['docs/a.txt', 'docs/b.txt', 'img/c.png']])
+        run_azure_scan("delta", [make_blob('docs/a.txt', 'e1'), make_blob('docs/b.txt', 'e2', 20),
+                                 make_blob('docs/sub/d.txt', 'e1')], base_scan_id="full")
+        
+        response = client.get("/api/scan/delta/files", params={'path': 'docs', 'extension': 'txt'})
+        files = response.json()['files']
+        assert [(f['file_path'], f['file_size'], f['scan_id']) for f in files] == [
+            ('docs/a.txt', 10, 'delta'), ('docs/b.txt', 20, 'delta'), ('docs/sub/d.txt', 10, 'delta')
+        ]
+        assert response.json()['filters'] == {'extension': 'txt', 'path': 'docs'}
+        assert [f['file_name'] for f in client.get("/api/scan/delta/files", params={'name': 'c.png'}).json()['files']] == []
+        assert client.get("/api/scan/full/files", params={'name': '*.png', 'min_size': 10}).json()['returned_count'] == 1
+        
+        assert client.get("/api/scan/missing/files").status_code == 404
+        assert client.get("/api/scan/delta/files", params={'cursor': 'bad'}).status_code == 400
+        assert client.get("/api/scan/delta/files", params={'min_size': -1}).status_code == 422
+
+
+def diff_pages(scan_diff, limit=2, change=None):
+    """Helper to read every change of a diff through cursor pages"""
+    changes, cursor = [], None
+    while True:
+        page, cursor = scan_diff.page(limit, cursor, change)
+        changes.extend((c['change'], c['file_path']) for c in page)
+        if not cursor:
+            return changes
+
+
+class TestScanDiffEdgeCases:
+    """Edge cases for diffs between two scans (merge-join in path order, pages, summary)"""
+    
+    def test_local_diff_of_incremental_scan(self, catalog_db_dir, tmp_path):
+        """Test a full scan diffed against an incremental one finds exactly the added, removed and modified files, page by page"""
+        init_all()
+        folder = str(tmp_path / "tree")
+        build_tree(folder, 4, 3)
+        # Directories sorting between 'dir1' and its files, and a nested one
+        for extra in ('dir1 b', os.path.join('dir1', 'sub')):
+            os.makedirs(os.path.join(folder, extra))
+            open(os.path.join(folder, extra, 'x.txt'), 'w').close()
+        run_local_scan("full", folder)
+        # Browser-style rows with no directory
+        local_db.save_files("full", [{**make_local_file(i), 'file_path': f'file{i}.text'} for i in range(2)])
+        
+        os.remove(os.path.join(folder, 'dir2', 'file2_0.txt'))
+        open(os.path.join(folder, 'dir2', 'new.txt'), 'w').close()
+        with open(os.path.join(folder, 'dir1', 'sub', 'x.txt'), 'w') as f:
+            f.write('changed')
+        run_local_scan("incr", folder, base_scan_id="full")
+        
+        def listing(scan_id):
+            return {f['file_path']: (f['file_size'], f['last_modified'])
+                    for f in local_db.get_scan_files(scan_id, limit=1000)}
+        before, after = listing("full"), listing("incr")
+        expected = sorted(
+            [('added', p) for p in after.keys() - before.keys()]
+            + [('removed', p) for p in before.keys() - after.keys()]
+            + [('modified', p) for p in before.keys() & after.keys() if before[p] != after[p]],
+            key=lambda c: c[1]
+        )
+        scan_diff = local_db.diff_scans("full", "incr")
+        changes = diff_pages(scan_diff)
+        
+        assert sorted(changes, key=lambda c: c[1]) == expected
+        assert ('modified', os.path.join(folder, 'dir1', 'sub', 'x.txt')) in changes
+        assert len(changes) == len(set(changes)) == 5
+        assert diff_pages(scan_diff, limit=1, change='removed') == [c for c in changes if c[0] == 'removed']
+        summary = scan_diff.summary()
+        assert (summary['added'], summary['removed'], summary['modified']) == (1, 3, 1)
+        assert summary['unchanged'] == len(after) - 2
+        assert summary['modified_size_delta'] == 7
+        assert diff_pages(local_db.diff_scans("incr", "incr")) == []
+    
+    def test_diff_endpoint_across_delta_scans(self, catalog_db_dir):
+        """Test the diff endpoints compare Azure delta scans by etag, stream NDJSON, and reject bad input"""
+        from fastapi.testclient import TestClient
+        from backend.app import app
+        client = TestClient(app)
+        init_all()
+        run_azure_scan("full", [make_blob(n, 'e1') for n in ['a.txt', 'b.txt', 'c.txt', 'd/e.txt']])
+        # Same size and mtime, new etag: modified; c.txt deleted; f.txt added
+        run_azure_scan("delta", [make_blob('a.txt', 'e1'), make_blob('b.txt', 'e2'),
+                                 make_blob('d/e.txt', 'e1'), make_blob('f.txt', 'e1', 30)], base_scan_id="full")
+        shared_db.create_scan("shared-1", "Shared", "/mnt/share", "Share")
+        
+        response = client.get("/api/scans/diff", params={'base': 'full', 'target': 'delta', 'limit': 2})
+        body = response.json()
+        assert [(c['change'], c['file_path']) for c in body['changes']] == [('modified', 'b.txt'), ('removed', 'c.txt')]
+        assert (body['changes'][0]['old_etag'], body['changes'][0]['new_etag']) == ('e1', 'e2')
+        rest = client.get("/api/scans/diff", params={'base': 'full', 'target': 'delta', 'cursor': body['next_cursor']})
+        assert [(c['change'], c['file_path']) for c in rest.json()['changes']] == [('added', 'f.txt')]
+        assert rest.json()['next_cursor'] is None
+        
+        streamed = client.get("/api/scans/diff", params={'base': 'full', 'target': 'delta', 'format': 'ndjson'})
+        lines = [json.loads(line) for line in streamed.text.splitlines()]
+        assert streamed.headers['content-type'].startswith('application/x-ndjson')
+        assert [line['file_path'] for line in lines] == ['b.txt', 'c.txt', 'f.txt']
+        summary = client.get("/api/scans/diff/summary", params={'base': 'full', 'target': 'delta'}).json()
+        assert (summary['added'], summary['removed'], summary['modified'], summary['unchanged']) == (1, 1, 1, 2)
+        assert (summary['added_size'], summary['removed_size']) == (30, 10)
+        
+        assert client.get("/api/scans/diff", params={'base': 'full', 'target': 'missing'}).status_code == 404
+        assert client.get("/api/scans/diff", params={'base': 'full', 'target': 'shared-1'}).status_code == 400
+        assert client.get("/api/scans/diff", params={'base': 'full', 'target': 'delta', 'cursor': 'bad'}).status_code == 400
+        assert client.get("/api/scans/diff", params={'base': 'full', 'target': 'delta', 'change': 'moved'}).status_code == 400
+        assert client.get("/api/scans/diff", params={'base': 'full'}).status_code == 422
+
+
+def write_file(path, data):
+    """Helper to write a file's content, creating its directory"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+class TestContentHashingEdgeCases:
+    """Edge cases for content hashing (size, then partial, then full hash) and duplicate groups"""
+    
+    def test_partial_hash_prefilter_finds_duplicates(self, catalog_db_dir, tmp_path):
+        """Test only size and partial-hash collisions are read whole, and an incremental scan reuses carried hashes"""
+        init_all()
+        folder = str(tmp_path / "tree")
+        size = 3 * hashing.PARTIAL_BYTES
+        big = os.urandom(size)
+        write_file(os.path.join(folder, 'a', 'big1.bin'), big)
+        write_file(os.path.join(folder, 'b', 'big2.bin'), big)
+        # Same ends, different middle: the partial hash collides, the full one does not
+        write_file(os.path.join(folder, 'b', 'middle.bin'), big[:size // 2] + bytes([big[size // 2] ^ 1]) + big[size // 2 + 1:])
+        write_file(os.path.join(folder, 'b', 'other.bin'), bytes([big[0] ^ 1]) + big[1:])
+        write_file(os.path.join(folder, 'a', 'small1.txt'), b'same')
+        write_file(os.path.join(folder, 'b', 'small2.txt'), b'same')
+        write_file(os.path.join(folder, 'a', 'unique.txt'), b'unique size')
+        write_file(os.path.join(folder, 'a', 'empty1'), b'')
+        write_file(os.path.join(folder, 'b', 'empty2'), b'')
+        old = time.time() - 3600
+        for d in ('a', 'b', ''):
+            os.utime(os.path.join(folder, d), (old, old))
+        run_local_scan("full", folder)
+        
+        stats = local_db.hash_files("full")
+        assert stats == {'candidates': 6, 'partial_hashed': 4, 'full_hashed': 5,
+                         'bytes_read': 4 * 2 * hashing.PARTIAL_BYTES + 3 * size + 2 * 4, 'errors': 0}
+        duplicates = local_db.find_duplicates("full")
+        assert (duplicates['duplicate_groups'], duplicates['duplicate_files'], duplicates['wasted_bytes']) == (2, 4, size + 4)
+        assert [(g['file_count'], g['wasted_bytes'], [os.path.basename(p) for p in g['file_paths']])
+                for g in duplicates['groups']] == [(2, size, ['big1.bin', 'big2.bin']), (2, 4, ['small1.txt', 'small2.txt'])]
+        
+        # A new copy in a new directory: carried rows keep their hashes
+        write_file(os.path.join(folder, 'c', 'big3.bin'), big)
+        run_local_scan("incr", folder, base_scan_id="full")
+        with patch.object(hashing, 'full_hash', wraps=hashing.full_hash) as full_hash:
+            local_db.hash_files("incr")
+        assert sorted(os.path.basename(call.args[0]) for call in full_hash.call_args_list) == ['big3.bin', 'other.bin']
+        groups = local_db.find_duplicates("incr")['groups']
+        assert [(g['file_count'], g['wasted_bytes']) for g in groups] == [(3, 2 * size), (2, 4)]
+        assert local_db.find_duplicates("full")['groups'][0]['file_count'] == 2
+    
+    def test_hash_and_duplicates_endpoints(self, catalog_db_dir, tmp_path):
+        """Test the hash endpoint needs a completed local or shared scan, skips unreadable files, and duplicates are ranked by wasted bytes"""
+        from fastapi.testclient import TestClient
+        from backend.app import app
+        client = TestClient(app)
+        init_all()
+        paths = [write_file(str(tmp_path / 'share' / name), data) for name, data in [
+            ('x1.doc', b'1' * 100), ('x2.doc', b'1' * 100), ('x3.doc', b'1' * 100),
+            ('y1.doc', b'2' * 500), ('y2.doc', b'2' * 500), ('z.doc', b'3' * 500),
+        ]]
+        shared_db.create_scan("shared-1", "Shared", str(tmp_path / 'share'), "Share")
+        records = [{'file_name': os.path.basename(p), 'file_path': p, 'file_size': os.path.getsize(p), 'extension': '.doc'}
+                   for p in paths]
+        # Listed, then gone before hashing
+        records.append({'file_name': 'gone.doc', 'file_path': str(tmp_path / 'share' / 'gone.doc'),
+                        'file_size': 100, 'extension': '.doc'})
+        shared_db.save_files("shared-1", records)
+        run_azure_scan("full", [make_blob('a.txt', 'e1')])
+        
+        assert client.post("/api/scan/shared-1/hash").status_code == 400
+        shared_db.complete_scan("shared-1", 7, 1700)
+        hashed = client.post("/api/scan/shared-1/hash").json()
+        assert (hashed['candidates'], hashed['full_hashed'], hashed['errors']) == (7, 6, 1)
+        
+        body = client.get("/api/scan/shared-1/duplicates", params={'limit': 1}).json()
+        assert (body['duplicate_groups'], body['duplicate_files'], body['wasted_bytes']) == (2, 5, 700)
+        assert [(g['file_count'], g['wasted_bytes']) for g in body['groups']] == [(2, 500)]
+        assert body['groups'][0]['file_paths'] == paths[3:5]
+        second = client.get("/api/scan/shared-1/duplicates", params={'limit': 1, 'offset': 1}).json()['groups']
+        assert [(g['file_count'], g['wasted_bytes']) for g in second] == [(3, 200)]
+        
+        assert client.post("/api/scan/full/hash").status_code == 400
+        assert client.get("/api/scan/full/duplicates").status_code == 400
+        assert client.post("/api/scan/missing/hash").status_code == 404
+
+
+def wait_for(condition, timeout=5):
+    """Poll until condition() is true (scheduler workers run on their own threads)"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class BlockingJobs:
+    """Scheduler target recording start order; each job runs until released"""
+    
+    def __init__(self):
+        self.started = []
+        self.gates = {}
+    
+    def __call__(self, name):
+        self.started.append(name)
+        self.gates.setdefault(name, threading.Event()).wait(5)
+    
+    def release(self, name):
+        self.gates.setdefault(name, threading.Event()).set()
+
+
+class TestScanSchedulerEdgeCases:
+    """Edge cases for the bounded, prioritized scan job scheduler"""
+    
+    def test_resource_limits_and_priorities(self, tmp_path):
+        """Test a full resource holds back only its own jobs, and higher priority starts first"""
+        jobs = BlockingJobs()
+        scheduler = ScanScheduler(workers=2, limits={'local': 1, 'shared': 2}, db_path=str(tmp_path / "scanner.db"))
+        scheduler.register('job', jobs)
+        try:
+            scheduler.submit('a', 'job', ['a'], 'local')
+            wait_for(lambda: jobs.started == ['a'])
+            scheduler.submit('b', 'job', ['b'], 'local')
+            scheduler.submit('c', 'job', ['c'], 'local', priority=5)
+            scheduler.submit('d', 'job', ['d'], share_resource('\\\\NAS1\\share'))
+            # The second worker skips the local jobs (limit 1) for the share
+            wait_for(lambda: jobs.started == ['a', 'd'])
+            assert scheduler.counts() == {
+                'queued': 2, 'running': 2, 'running_by_resource': {'local': 1, 'shared:nas1': 1}
+            }
+            assert (scheduler.position('c'), scheduler.position('b'), scheduler.position('a')) == (1, 2, None)
+            
+            jobs.release('a')
+            wait_for(lambda: jobs.started == ['a', 'd', 'c'])
+            for name in 'dcb':
+                jobs.release(name)
+            wait_for(lambda: jobs.started == ['a', 'd', 'c', 'b'])
+            wait_for(lambda: scheduler.counts()['running'] == 0)
+        finally:
+            for name in 'abcd':
+                jobs.release(name)
+            scheduler.close()
+    
+    def test_resource_limits_hold_across_processes(self, tmp_path, monkeypatch):
+        """Test a slot taken by one process's scheduler (in-memory jobs too) holds back another's"""
+        monkeypatch.setattr(scheduler_module, 'SLOT_POLL_INTERVAL', 0.05)
+        db_path = str(tmp_path / "scanner.db")
+        jobs = BlockingJobs()
+        first = ScanScheduler(workers=2, limits={'local': 1}, db_path=db_path)
+        second = ScanScheduler(workers=2, limits={'local': 1}, db_path=db_path)
+        first.register('job', jobs)
+        second.register('job', jobs)
+        try:
+            first.submit('a', 'job', ['a'], 'local', persist=False)
+            wait_for(lambda: jobs.started == ['a'])
+            second.submit('b', 'job', ['b'], 'local')
+            time.sleep(0.2)
+            assert jobs.started == ['a']
+            assert second.counts()['queued'] == 1
+            
+            # Freed by the first process: the second takes the slot at its next look
+            jobs.release('a')
+            wait_for(lambda: jobs.started == ['a', 'b'])
+            jobs.release('b')
+            wait_for(lambda: second.counts()['running'] == 0)
+            conn = sqlite3.connect(db_path)
+            assert conn.execute("SELECT COUNT(*) FROM scan_jobs").fetchone()[0] == 0
+            conn.close()
+        finally:
+            for name in 'ab':
+                jobs.release(name)
+            first.close()
+            second.close()
+    
+    def test_future_job_frees_its_worker_and_keeps_its_slot(self, tmp_path):
+        """Test a job returning a future frees the worker at once and holds its resource until done"""
+        jobs = BlockingJobs()
+        futures = {}
+        
+        def start(name):
+            jobs.started.append(name)
+            return futures.setdefault(name, Future())
+        
+        scheduler = ScanScheduler(workers=1, limits={'azure': 1, 'local': 1}, db_path=str(tmp_path / "scanner.db"))
+        scheduler.register('async', start)
+        scheduler.register('job', jobs)
+        try:
+            scheduler.submit('a', 'async', ['a'], 'azure')
+            scheduler.submit('b', 'async', ['b'], 'azure')
+            scheduler.submit('c', 'job', ['c'], 'local')
+            # The only worker runs the local job while 'a' is still running
+            wait_for(lambda: jobs.started == ['a', 'c'])
+            assert scheduler.counts()['running_by_resource'] == {'azure': 1, 'local': 1}
+            jobs.release('c')
+            wait_for(lambda: scheduler.counts()['running'] == 1)
+            assert jobs.started == ['a', 'c']
+            
+            futures['a'].set_exception(RuntimeError("listing failed"))
+            wait_for(lambda: jobs.started == ['a', 'c', 'b'])
+            futures['b'].set_result(None)
+            wait_for(lambda: scheduler.counts()['running'] == 0)
+        finally:
+            jobs.release('c')
+            for future in futures.values():
+                if not future.done():
+                    future.cancel()
+            scheduler.close()
+    
+    def test_queued_jobs_survive_restart(self, tmp_path):
+        """Test queued and running jobs are saved (in-memory ones are not) and cancelled ones are dropped"""
+        db_path = str(tmp_path / "scanner.db")
+        jobs = BlockingJobs()
+        scheduler = ScanScheduler(workers=1, db_path=db_path)
+        scheduler.register('job', jobs)
+        try:
+            scheduler.submit('running', 'job', ['running'], 'local')
+            wait_for(lambda: jobs.started == ['running'])
+            scheduler.submit('queued', 'job', ['queued', {'opt': [1, 2]}], 'local', priority=3)
+            scheduler.submit('secret', 'job', ['secret'], 'azure', persist=False)
+            scheduler.submit('cancelled', 'job', ['cancelled'], 'local')
+            assert scheduler.cancel('cancelled') is True
+            assert scheduler.cancel('running') is False
+            
+            # A new process finds the saved jobs, the running one marked as such
+            saved = ScanScheduler(db_path=db_path).saved_jobs()
+            assert [(job.scan_id, job.kind, job.args, job.resource, job.priority, job.status) for job in saved] == [
+                ('running', 'job', ['running'], 'local', 0, 'running'),
+                ('queued', 'job', ['queued', {'opt': [1, 2]}], 'local', 3, 'queued')
+            ]
+            # A finished job's row is deleted; a job not started before close stays saved
+            scheduler.close()
+            jobs.release('running')
+            wait_for(lambda: scheduler.counts()['running'] == 0)
+            conn = sqlite3.connect(db_path)
+            assert conn.execute("SELECT scan_id FROM scan_jobs ORDER BY seq").fetchall() == [('queued',)]
+            conn.close()
+        finally:
+            jobs.release('running')
+            scheduler.close()
+
+
+class TestScanStateEdgeCases:
+    """Edge cases for the scan state shared by API workers"""
+    
+    def test_stop_and_results_cross_workers(self, tmp_path, monkeypatch):
+        """Test a stop raised through one worker reaches a scan polling through another within the poll interval"""
+        monkeypatch.setattr(scan_state, 'STOP_POLL_INTERVAL', 0.2)
+        db_path = str(tmp_path / "scanner.db")
+        api, runner = SQLiteStateStore(db_path), SQLiteStateStore(db_path)
+        
+        runner.start('scan-1', 'local', 'scanning')
+        assert runner.stop_requested('scan-1') is False
+        assert api.request_stop('scan-1', 'azure') is False
+        assert api.request_stop('missing') is False
+        assert api.request_stop('scan-1', 'local') is True
+        # Cached until the next poll, then seen
+        assert runner.stop_requested('scan-1') is False
+        wait_for(lambda: runner.stop_requested('scan-1'), timeout=1)
+        
+        runner.update('scan-1', status='completed', result={'total_files': 3}, progress={'files_seen': 3})
+        state = api.get('scan-1')
+        assert (state['type'], state['status'], state['stop']) == ('local', 'completed', True)
+        assert (state['result'], state['progress'], state['error']) == ({'total_files': 3}, {'files_seen': 3}, None)
+        assert api.get('missing') is None
+        # Queued again: a fresh run with its flag lowered
+        runner.start('scan-1', 'local', 'queued')
+        assert runner.stop_requested('scan-1') is False
+        assert api.get('scan-1')['result'] is None
+    
+    def test_claim_only_scans_of_gone_workers(self, tmp_path, monkeypatch):
+        """Test an interrupted scan is claimed by exactly one worker, only once its owner stops beating, and never without state"""
+        db_path = str(tmp_path / "scanner.db")
+        first, second = SQLiteStateStore(db_path), SQLiteStateStore(db_path)
+        monkeypatch.setattr(scan_state, 'OWNER', 'worker-a')
+        first.heartbeat()
+        first.start('scan-1', 'shared', 'scanning')
+        # Scans with no state (not run by a worker, e.g. uploads) are never claimed
+        assert first.claim('upload', 'local') is False
+        
+        monkeypatch.setattr(scan_state, 'OWNER', 'worker-b')
+        second.heartbeat()
+        assert second.claim('upload', 'local') is False
+        # Owner alive: not claimed; owner silent for 3 heartbeats: claimed by one worker only
+        assert second.claim('scan-1', 'shared') is False
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute("UPDATE scan_owners SET heartbeat = ? WHERE owner = 'worker-a'",
+                         (time.time() - 3 * scan_state.HEARTBEAT_INTERVAL - 1,))
+        conn.close()
+        assert second.claim('scan-1', 'shared') is True
+        assert second.get('scan-1')['owner'] == 'worker-b'
+        monkeypatch.setattr(scan_state, 'OWNER', 'worker-c')
+        assert first.claim('scan-1', 'shared') is False
+        
+        # An owner that left at shutdown can be taken over at once
+        monkeypatch.setattr(scan_state, 'OWNER', 'worker-b')
+        second.leave()
+        monkeypatch.setattr(scan_state, 'OWNER', 'worker-c')
+        assert first.claim('scan-1', 'shared') is True
+
+
+class TestDatabaseServiceEdgeCases:
+    """Edge cases for the single-writer database service and its read pool"""
+    
+    def test_writes_are_batched_and_fail_alone(self, tmp_path):
+        """Test writes queued behind a slow one commit in one batch, a failing one rolled back alone"""
+        db = Database(str(tmp_path / "files.db"))
+        db.execute("CREATE TABLE items (name TEXT PRIMARY KEY)")
+        gate, started = threading.Event(), threading.Event()
+        
+        def slow(conn):
+            started.set()
+            gate.wait(5)
+            conn.execute("INSERT INTO items VALUES ('slow')")
+        
+        def insert(name):
+            def run(conn):
+                conn.execute("INSERT INTO items VALUES (?)", (name,))
+                # Uncommitted rows of earlier requests are visible: one transaction
+                return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            return run
+        
+        results, errors = {}, {}
+        def writer(name):
+            try:
+                results[name] = db.write(insert(name))
+            except sqlite3.IntegrityError as e:
+                errors[name] = e
+        
+        slow_thread = threading.Thread(target=db.write, args=(slow,))
+        slow_thread.start()
+        assert started.wait(5)
+        threads = [threading.Thread(target=writer, args=(name,)) for name in ('a', 'b', 'slow', 'c')]
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: db._requests.qsize() == 4)
+        gate.set()
+        for thread in [slow_thread] + threads:
+            thread.join(5)
+        
+        # The duplicate failed (and was undone) without losing the others
+        assert set(errors) == {'slow'}
+        assert sorted(results.values()) == [2, 3, 4]
+        with db.read() as conn:
+            assert conn.execute("SELECT name FROM items ORDER BY name").fetchall() == [
+                ('a',), ('b',), ('c',), ('slow',)
+            ]
+        db.close()
+    
+    def test_read_pool_is_bounded_and_query_only(self, tmp_path):
+        """Test read connections are reused up to the pool size, cannot write, and see each commit at once"""
+        db = Database(str(tmp_path / "scanner.db"), pool_size=2)
+        db.execute("CREATE TABLE items (name TEXT)")
+        def read_once():
+            with db.read():
+                pass
+        
+        with db.read() as first, db.read() as second:
+            assert first is not second
+            waiting = threading.Thread(target=read_once)
+            waiting.start()
+            # A third reader waits for a connection to come back
+            waiting.join(0.2)
+            assert waiting.is_alive()
+        waiting.join(5)
+        assert not waiting.is_alive()
+        
+        with db.read(sqlite3.Row) as conn:
+            assert conn in (first, second)
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("INSERT INTO items VALUES ('x')")
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+            db.execute("INSERT INTO items VALUES ('y')")
+            assert dict(conn.execute("SELECT name FROM items").fetchone()) == {'name': 'y'}
+        # Row factories do not outlive their read
+        with db.read() as conn:
+            assert conn.execute("SELECT name FROM items").fetchone() == ('y',)
+        db.close()
+    
+    def test_run_is_bounded_and_keeps_the_loop_free(self, tmp_path):
+        """Test run() awaits blocking calls on at most pool_size threads while the event loop keeps running"""
+        db = Database(str(tmp_path / "files.db"), pool_size=2)
+        lock = threading.Lock()
+        running, peak = [0], [0]
+        def slow(delay):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(delay)
+            with lock:
+                running[0] -= 1
+            return threading.current_thread().name
+        
+        async def main():
+            ticks = [0]
+            async def tick():
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks[0] += 1
+            ticker = asyncio.create_task(tick())
+            names = await asyncio.gather(*(db.run(slow, 0.2) for _ in range(4)))
+            ticker.cancel()
+            return names, ticks[0]
+        
+        names, ticks = asyncio.run(main())
+        assert peak[0] == 2
+        assert all(name.startswith('sqlite-run') for name in names)
+        # Two rounds of 0.2s: the loop ticked all along
+        assert ticks >= 10
+        # Errors reach the awaiting coroutine
+        with pytest.raises(ZeroDivisionError):
+            asyncio.run(db.run(divmod, 1, 0))
+        db.close()
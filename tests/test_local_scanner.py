@@ -1,14 +1,18 @@
 """
 Local Scanner Tests - EDGE CASES ONLY
 
-15 edge case tests covering boundary conditions and error scenarios
+23 edge case tests covering boundary conditions and error scenarios
 """
 
 import pytest
 import os
 import tempfile
 import shutil
-from backend.local_connector.scanner import scan_folder, get_file_type, get_summary
+import sqlite3
+import threading
+from backend.local_connector.scanner import scan_folder, iter_folder, get_file_type, get_summary
+from backend.local_connector.walker import ParallelWalker
+from backend.local_connector import sniffer as content_sniffer
 
 
 @pytest.fixture
@@ -184,6 +188,163 @@ class TestFolderScanningEdgeCases:
         assert len(results) >= 4  # At least the ASCII special chars should work
 
 
+class TestParallelWalkerEdgeCases:
+    """Edge cases for the parallel scandir walker"""
+    
+    def test_deep_tree_matches_os_walk(self, test_data_dir):
+        """Test parallel walk finds exactly the files os.walk finds"""
+        for a in range(5):
+            for b in range(4):
+                folder = os.path.join(test_data_dir, f'a{a}', f'b{b}', 'c')
+                os.makedirs(folder)
+                for i in range(3):
+                    open(os.path.join(folder, f'f{i}.txt'), 'w').close()
+            open(os.path.join(test_data_dir, f'a{a}', 'top.pdf'), 'w').close()
+        
+        expected = {
+            os.path.join(root, name)
+            for root, _, names in os.walk(test_data_dir) for name in names
+        }
+        results = scan_folder(test_data_dir, workers=4)
+        
+        assert len(results) == len(expected) == 65
+        assert {f['file_path'] for f in results} == expected
+    
+    def test_symlinked_directories_not_followed(self, test_data_dir):
+        """Test symlinked directories are not descended into (like os.walk)"""
+        real = os.path.join(test_data_dir, 'real')
+        os.makedirs(real)
+        open(os.path.join(real, 'file.txt'), 'w').close()
+        try:
+            os.symlink(real, os.path.join(test_data_dir, 'link'))
+        except (OSError, NotImplementedError):
+            pytest.skip("Symlinks not supported on this system")
+        
+        results = scan_folder(test_data_dir, workers=2)
+        
+        assert [f['file_path'] for f in results] == [os.path.join(real, 'file.txt')]
+    
+    def test_stop_flag_stops_walker(self, test_data_dir):
+        """Test a raised stop flag lists no directories"""
+        for i in range(10):
+            folder = os.path.join(test_data_dir, f'd{i}')
+            os.makedirs(folder)
+            open(os.path.join(folder, 'f.txt'), 'w').close()
+        
+        walker = ParallelWalker(test_data_dir, workers=4, stop_flag=lambda: True)
+        
+        assert list(walker) == []
+    
+    def test_abandoned_iteration_joins_threads(self, test_data_dir):
+        """Test closing the generator early shuts down every worker thread"""
+        for i in range(20):
+            folder = os.path.join(test_data_dir, f'd{i}')
+            os.makedirs(folder)
+            for j in range(5):
+                open(os.path.join(folder, f'f{j}.txt'), 'w').close()
+        before = threading.active_count()
+        
+        files = iter_folder(test_data_dir, workers=4)
+        next(files)
+        files.close()
+        
+        assert threading.active_count() == before
+
+
+class TestProcessScanEdgeCases:
+    """Edge cases for the multi-process scan mode"""
+    
+    def test_process_mode_matches_thread_mode(self, test_data_dir):
+        """Test process-pool scan returns the same records as the thread walker"""
+        for a in range(6):
+            folder = os.path.join(test_data_dir, f'part{a}', 'nested')
+            os.makedirs(folder)
+            for name in ['scan.pdf', 'photo.JPG', 'notes.txt']:
+                with open(os.path.join(folder, f'{a}_{name}'), 'w') as f:
+                    f.write('x' * a)
+        open(os.path.join(test_data_dir, 'top_level.docx'), 'w').close()
+        
+        threaded = scan_folder(test_data_dir, workers=2, processes=1)
+        multi = scan_folder(test_data_dir, workers=2, processes=3)
+        
+        key = lambda f: f['file_path']
+        assert len(multi) == 19
+        assert sorted(multi, key=key) == sorted(threaded, key=key)
+    
+    def test_process_mode_with_no_subdirectories(self, test_data_dir):
+        """Test process mode on a flat folder (nothing to partition)"""
+        for i in range(5):
+            open(os.path.join(test_data_dir, f'file{i}.txt'), 'w').close()
+        
+        results = scan_folder(test_data_dir, processes=4)
+        
+        assert len(results) == 5
+
+
+class TestContentSniffingEdgeCases:
+    """Edge cases for magic-byte content sniffing"""
+    
+    def test_content_wins_over_missing_or_wrong_extension(self, test_data_dir):
+        """Test extensionless PDFs and renamed images are typed by content, office zips stay office"""
+        files = {
+            'scan_0001': b'%PDF-1.7\n' + b'x' * 100,
+            'photo.txt': b'\x89PNG\r\n\x1a\n' + b'\x00' * 100,
+            'report.docx': b'PK\x03\x04' + b'\x00' * 26 + b'word/document.xml',
+            'notes.txt': b'plain text',
+        }
+        for filename, content in files.items():
+            with open(os.path.join(test_data_dir, filename), 'wb') as f:
+                f.write(content)
+        
+        db_path = os.path.join(test_data_dir, 'sniff.db')
+        conn = sqlite3.connect(db_path)
+        content_sniffer.init_tables(conn.cursor())
+        conn.close()
+        sniffer = content_sniffer.Sniffer(db_path, workers=2)
+        try:
+            results = {file['file_name']: file for file in iter_folder(test_data_dir, workers=2, sniffer=sniffer)}
+        finally:
+            sniffer.close()
+        
+        assert results['scan_0001']['file_type'] == 'pdf'
+        assert results['scan_0001']['mime_type'] == 'application/pdf'
+        assert results['scan_0001']['eligible_for_ocr'] is True
+        assert results['photo.txt']['file_type'] == 'image'
+        assert results['photo.txt']['eligible_for_ocr'] is True
+        assert results['report.docx']['file_type'] == 'office'
+        assert results['notes.txt']['file_type'] == 'text'
+    
+    def test_rescan_reads_only_changed_files(self, test_data_dir):
+        """Test cached (device, inode, mtime, size) rows skip the read until a file changes"""
+        data_dir = os.path.join(test_data_dir, 'data')
+        os.makedirs(data_dir)
+        for i in range(10):
+            with open(os.path.join(data_dir, f'doc{i}'), 'wb') as f:
+                f.write(b'%PDF-1.4 ' + str(i).encode())
+        db_path = os.path.join(test_data_dir, 'sniff.db')
+        conn = sqlite3.connect(db_path)
+        content_sniffer.init_tables(conn.cursor())
+        conn.close()
+        
+        def scan():
+            sniffer = content_sniffer.Sniffer(db_path, workers=2)
+            try:
+                files = list(iter_folder(data_dir, workers=2, sniffer=sniffer))
+                sniffer.commit()
+            finally:
+                sniffer.close()
+            assert all(file['file_type'] == 'pdf' for file in files)
+            return sniffer.counts
+        
+        assert scan() == {'read': 10, 'cached': 0, 'matched': 10, 'errors': 0}
+        assert scan() == {'read': 0, 'cached': 10, 'matched': 0, 'errors': 0}
+        
+        # A rewritten file (new size) is read again
+        with open(os.path.join(data_dir, 'doc3'), 'wb') as f:
+            f.write(b'%PDF-1.4 rewritten')
+        assert scan() == {'read': 1, 'cached': 9, 'matched': 1, 'errors': 0}
+
+
 class TestSummaryEdgeCases:
     """Edge cases for summary generation"""
     
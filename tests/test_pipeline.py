@@ -0,0 +1,149 @@
+"""
+Pipeline Tests - EDGE CASES ONLY
+
+8 edge case tests covering streaming batched ingestion
+"""
+
+import asyncio
+import json
+import pytest
+import time
+from backend import progress as progress_module
+from backend.pipeline import ingest, ingest_async
+from backend.progress import ProgressBus, ScanProgress
+from backend.local_connector.scanner import get_summary
+from backend.shared_connector.scanner import get_summary as shared_get_summary
+
+
+def make_record(i, file_type='text', size=10):
+    """Helper to create a minimal file record"""
+    return {
+        'file_name': f'file{i}.txt',
+        'file_path': f'/data/file{i}.txt',
+        'file_type': file_type,
+        'file_size': size,
+        'eligible_for_ocr': file_type in ['pdf', 'image', 'office']
+    }
+
+
+class TestIngestionEdgeCases:
+    """Edge cases for batched ingestion"""
+
+    def test_batches_are_bounded(self):
+        """Test records are committed in batches no larger than batch_size"""
+        batches = []
+        records = (make_record(i) for i in range(25))
+
+        ingest('scan', records, lambda scan_id, files: batches.append(list(files)),
+               get_summary, batch_size=10, flush_interval=3600)
+
+        assert [len(b) for b in batches] == [10, 10, 5]
+
+    def test_empty_scan_commits_nothing(self):
+        """Test an empty scan never calls save_files"""
+        batches = []
+
+        summary = ingest('scan', iter([]), lambda scan_id, files: batches.append(files), get_summary)
+
+        assert batches == []
+        assert summary['total_files'] == 0
+
+    def test_committed_batches_kept_on_scanner_error(self):
+        """Test batches read before a scanner crash are still committed"""
+        saved = []
+
+        def crashing_scan():
+            for i in range(15):
+                yield make_record(i)
+            raise OSError("share went away")
+
+        with pytest.raises(OSError):
+            ingest('scan', crashing_scan(), lambda scan_id, files: saved.extend(files),
+                   get_summary, batch_size=10, flush_interval=3600)
+
+        assert len(saved) == 15
+
+    def test_summary_matches_whole_scan(self):
+        """Test merged batch summaries equal a summary of the whole list"""
+        records = [make_record(i, ftype, i) for i, ftype in enumerate(['pdf', 'text', 'image'] * 7)]
+
+        summary = ingest('scan', iter(records), lambda scan_id, files: None,
+                         get_summary, batch_size=4)
+
+        assert summary == get_summary(records)
+
+    def test_top_n_applied_to_final_distribution(self):
+        """Test top_n trims the merged distribution, not each batch"""
+        records = [
+            {'file_size': 1, 'extension': f'e{i % 12}'} for i in range(12)
+        ] + [{'file_size': 1, 'extension': 'e0'}] * 5
+
+        summary = ingest('scan', iter(records), lambda scan_id, files: None,
+                         lambda batch: shared_get_summary(batch, top_n=None),
+                         batch_size=3, top_n=10)
+
+        assert len(summary['file_type_distribution']) == 10
+        assert summary['file_type_distribution']['e0'] == 6
+        assert summary['total_files'] == 17
+
+    def test_progress_counts_every_record(self):
+        """Test progress sees every record (not just committed batches) and estimates an ETA"""
+        progress = ScanProgress(expected_files=100)
+        seen = []
+
+        def save_files(scan_id, files):
+            seen.append(progress.files_seen)
+
+        ingest('scan', (make_record(i, size=i) for i in range(25)), save_files,
+               get_summary, batch_size=10, progress=progress)
+
+        # Counted as they arrive: each batch is saved after its records were counted
+        assert seen == [10, 20, 25]
+        snapshot = progress.snapshot()
+        assert snapshot['files_seen'] == 25
+        assert snapshot['bytes_seen'] == sum(range(25))
+        assert snapshot['files_per_second'] > 0
+        assert snapshot['eta_seconds'] is not None
+        # No expected total and no directory counts: no estimate
+        assert ScanProgress().snapshot()['eta_seconds'] is None
+
+
+    def test_finished_scans_are_dropped_after_streaming(self, monkeypatch):
+        """Test a finished scan's progress is dropped after FINISHED_RETAIN, and a stream it was dropped from still ends"""
+        monkeypatch.setattr(progress_module, 'FINISHED_RETAIN', 0.05)
+        bus = ProgressBus()
+        bus.start('done')
+        events = bus.events('done', tick=0.01)
+        bus.publish('done', status='completed', result={'total_files': 0})
+        time.sleep(0.1)
+        bus.start('next')
+        assert bus.get('done') is None and bus.get('next') is not None
+
+        async def read_all():
+            return [block async for block in events]
+        blocks = asyncio.run(read_all())
+        assert len(blocks) == 1 and blocks[0].startswith('event: completed\n')
+        assert json.loads(blocks[0].split('data: ')[1])['result'] == {'total_files': 0}
+
+    def test_scanner_error_kept_when_last_flush_fails(self):
+        """Test the scanner's error is raised, not the error of committing its last batch"""
+        def crashing_scan():
+            for i in range(5):
+                yield make_record(i)
+            raise OSError("share went away")
+
+        async def crashing_aiter():
+            for record in crashing_scan():
+                yield record
+
+        def failing_save(scan_id, files):
+            raise RuntimeError("database is locked")
+
+        with pytest.raises(OSError, match="share went away"):
+            ingest('scan', crashing_scan(), failing_save, get_summary, batch_size=10, flush_interval=3600)
+        with pytest.raises(OSError, match="share went away"):
+            asyncio.run(ingest_async('scan', crashing_aiter(), failing_save, get_summary,
+                                     batch_size=10, flush_interval=3600))
+        # Without a scanner error, a failing commit is raised as before
+        with pytest.raises(RuntimeError):
+            ingest('scan', iter([make_record(0)]), failing_save, get_summary)
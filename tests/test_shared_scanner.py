@@ -1,14 +1,18 @@
 """
 Shared Scanner Tests - EDGE CASES ONLY
 
-10 edge case tests covering shared directory boundary conditions
+12 edge case tests covering shared directory boundary conditions
 """
 
 import pytest
 import os
 import tempfile
 import shutil
-from backend.shared_connector.scanner import scan_shared_directory, get_summary
+import threading
+from unittest.mock import patch
+from backend.shared_connector import walker
+from backend.shared_connector.walker import ShareWalker
+from backend.shared_connector.scanner import scan_shared_directory, iter_shared_directory, get_summary
 
 
 @pytest.fixture
@@ -126,6 +130,96 @@ class TestSharedDirectoryScanningEdgeCases:
             pytest.skip("System cannot handle very long paths")
 
 
+class FakeCheckpoint:
+    """Checkpoint stand-in recording marked states"""
+    
+    def __init__(self, state=None):
+        self.state = state or {}
+        self.marks = []
+    
+    def mark(self, **state):
+        self.marks.append(state)
+
+
+class TestSharedCheckpointEdgeCases:
+    """Edge cases for checkpointed shared directory walks"""
+    
+    def test_resume_skips_finished_directories(self, test_share_dir):
+        """Test a resume from a mid-walk mark yields exactly the rest of the walk"""
+        for d in ['b', 'a', 'a/x', 'c']:
+            os.makedirs(os.path.join(test_share_dir, d), exist_ok=True)
+            for f in ['2.txt', '1.txt']:
+                open(os.path.join(test_share_dir, d, f), 'w').close()
+        
+        checkpoint = FakeCheckpoint()
+        full = [f['file_path'] for f in iter_shared_directory(test_share_dir, 'Share', checkpoint=checkpoint)]
+        
+        assert len(full) == 8
+        assert [m['dirs_done'] for m in checkpoint.marks] == [1, 2, 3, 4, 5]
+        
+        mark = checkpoint.marks[2]
+        resumed = FakeCheckpoint(mark)
+        rest = [f['file_path'] for f in iter_shared_directory(test_share_dir, 'Share', checkpoint=resumed)]
+        
+        assert rest == full[mark['files_listed']:]
+        assert resumed.marks[-1] == checkpoint.marks[-1]
+
+
+class TestSharedWalkerEdgeCases:
+    """Edge cases for the concurrent share walker"""
+    
+    def test_hung_listing_times_out_and_walk_continues(self, test_share_dir):
+        """Test a hung directory listing is retried, then skipped and reported while the walk goes on"""
+        for d in ['a', 'b', 'b/deep', 'c']:
+            os.makedirs(os.path.join(test_share_dir, d))
+            open(os.path.join(test_share_dir, d, 'f.txt'), 'w').close()
+        
+        hung = os.path.join(test_share_dir, 'b')
+        release = threading.Event()
+        list_dir = walker._list_dir
+        
+        def hanging_list_dir(path):
+            if path == hung:
+                release.wait(10)
+            return list_dir(path)
+        
+        errors = []
+        share_walker = ShareWalker(
+            test_share_dir, workers=2, timeout=0.2, retries=1, backoff=0.01, on_error=errors.append
+        )
+        try:
+            with patch.object(walker, '_list_dir', hanging_list_dir):
+                walked = [os.path.relpath(path, test_share_dir) for path, _ in share_walker]
+        finally:
+            release.set()
+        
+        assert walked == ['.', 'a', 'c']
+        assert [(e['path'], e['kind'], e['attempts']) for e in errors] == [(hung, 'timeout', 2)]
+        assert share_walker.hung_threads == 2
+    
+    def test_resume_after_lists_only_unfinished_directories(self, test_share_dir):
+        """Test a resume from last_dir never lists the subtrees finished before it"""
+        for d in ['a/x', 'a/y', 'b', 'c/z']:
+            os.makedirs(os.path.join(test_share_dir, d))
+            open(os.path.join(test_share_dir, d, 'f.txt'), 'w').close()
+        
+        listed = []
+        list_dir = walker._list_dir
+        
+        def recording_list_dir(path):
+            listed.append(os.path.relpath(path, test_share_dir))
+            return list_dir(path)
+        
+        with patch.object(walker, '_list_dir', recording_list_dir):
+            walked = [
+                os.path.relpath(path, test_share_dir)
+                for path, _ in ShareWalker(test_share_dir, workers=1, resume_after=os.path.join(test_share_dir, 'b'))
+            ]
+        
+        assert walked == ['c', os.path.join('c', 'z')]
+        assert sorted(listed) == ['.', 'b', 'c', os.path.join('c', 'z')]
+
+
 class TestSharedSummaryEdgeCases:
     """Edge cases for shared summary generation"""
     
@@ -3,7 +3,7 @@
 const API_URL = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
     ? 'http://localhost:8000/api'
     : `${window.location.protocol}//${window.location.host}/api`;
-let activeScanSessions = {};  // { scan_id: { name, type, files, offset, total, result } }
+let activeScanSessions = {};  // { scan_id: { name, type, files, offset, cursor, total, result } }
 let activeScanId = null;  // Currently viewing
 let currentScanFiles = [];
 let currentStorageType = 'local';
@@ -696,10 +696,61 @@ async function loadScans() {
     }
 }
 
+async function searchFiles() {
+    if (!activeScanId || !activeScanSessions[activeScanId]) return;
+    
+    const session = activeScanSessions[activeScanId];
+    const params = filterParams();
+    
+    // No filters: back to the plain listing already loaded
+    if (!params.toString()) {
+        session.search = null;
+        currentScanFiles = session.files;
+        displayFiles(currentScanFiles);
+        document.getElementById('fileCount').textContent = currentScanFiles.length;
+        document.getElementById('loadMoreBtn').style.display = session.offset >= session.total ? 'none' : 'block';
+        return;
+    }
+    
+    session.search = { params: params.toString(), files: [], cursor: null };
+    await loadSearchPage(session);
+}
+
+async function loadSearchPage(session) {
+    const search = session.search;
+    const cursor = search.cursor ? `&cursor=${encodeURIComponent(search.cursor)}` : '';
+    
+    try {
+        const response = await fetch(`${API_URL}/scan/${activeScanId}/files?limit=${PAGE_SIZE}&${search.params}${cursor}`);
+        const data = await response.json();
+        // A newer search replaced this one while it was loading
+        if (session.search !== search || !data.files) return;
+        
+        search.files = search.files.concat(data.files);
+        search.cursor = data.next_cursor;
+        currentScanFiles = search.files;
+        displayFiles(currentScanFiles);
+        
+        document.getElementById('loadMoreBtn').style.display = search.cursor ? 'block' : 'none';
+        const info = document.getElementById('paginationInfo');
+        if (info) {
+            info.textContent = `Showing ${currentScanFiles.length} matching files`;
+            info.style.display = 'block';
+        }
+        document.getElementById('fileCount').textContent = currentScanFiles.length;
+    } catch (error) {
+        console.error('Error searching files:', error);
+    }
+}
+
 async function loadMoreFiles() {
     if (!activeScanId || !activeScanSessions[activeScanId]) return;
     
     const session = activeScanSessions[activeScanId];
+    if (session.search) {
+        await loadSearchPage(session);
+        return;
+    }
     
     try {
         // Determine which endpoint to use based on storage type
@@ -710,7 +761,9 @@ async function loadMoreFiles() {
             endpoint = `/scan/shared/${activeScanId}`;
         }
         
-        const url = `${API_URL}${endpoint}?limit=${PAGE_SIZE}&offset=${session.offset}`;
+        // Prefer the keyset cursor from the previous page; offset only for the first page
+        const page = session.cursor ? `cursor=${encodeURIComponent(session.cursor)}` : `offset=${session.offset}`;
+        const url = `${API_URL}${endpoint}?limit=${PAGE_SIZE}&${page}`;
         const response = await fetch(url);
         const data = await response.json();
         
@@ -719,8 +772,9 @@ async function loadMoreFiles() {
             currentScanFiles = session.files;
             displayFiles(currentScanFiles);
             
-            // Update offset for next load
+            // Update offset and cursor for next load
             session.offset += data.returned_count;
+            session.cursor = data.next_cursor;
             
             // Show/hide load more button
             const btn = document.getElementById('loadMoreBtn');
@@ -747,120 +801,28 @@ async function loadMoreFiles() {
     }
 }
 
-async function exportJSON() {
+// Exports are streamed by the server (every row, in constant memory), so
+// the browser only follows a download link instead of building the file
+function downloadExport(format) {
     if (!activeScanId || !activeScanSessions[activeScanId]) {
         alert('No scan data to export');
         return;
     }
     
-    const session = activeScanSessions[activeScanId];
+    const a = document.createElement('a');
+    a.href = `${API_URL}/scan/${encodeURIComponent(activeScanId)}/export?format=${format}`;
+    a.download = '';
+    a.click();
     
-    try {
-        showMessage('📦 Fetching all files for export...', 'success');
-        
-        // Determine which endpoint to use
-        let endpoint = `/scan/${activeScanId}`;
-        if (session.type === 'azure') {
-            endpoint = `/scan/azure/${activeScanId}`;
-        } else if (session.type === 'shared') {
-            endpoint = `/scan/shared/${activeScanId}`;
-        }
-        
-        // Fetch ALL files (use high limit to get everything in one request)
-        const url = `${API_URL}${endpoint}?limit=10000&offset=0`;
-        const response = await fetch(url);
-        const data = await response.json();
-        
-        if (!response.ok || !data.files) {
-            throw new Error(data.detail || 'Failed to fetch files');
-        }
-        
-        // Build complete export object
-        const exportData = {
-            success: true,
-            scan_id: activeScanId,
-            scan_name: session.name,
-            scan_type: session.type,
-            total_files: data.files.length,
-            total_size: session.result?.total_size || 0,
-            duration_seconds: session.result?.duration_seconds || 0,
-            file_type_distribution: session.result?.file_type_distribution || {},
-            ocr_eligible_count: session.result?.ocr_eligible_count || 0,
-            all_files: data.files  // ALL files with complete metadata
-        };
-        
-        const jsonStr = JSON.stringify(exportData, null, 2);
-        const blob = new Blob([jsonStr], { type: 'application/json' });
-        const url2 = URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url2;
-        a.download = `scan-${data.files.length}files-${Date.now()}.json`;
-        a.click();
-        URL.revokeObjectURL(url2);
-        
-        showMessage(`✅ Exported all ${data.files.length} files to JSON!`, 'success');
-    } catch (error) {
-        showMessage('❌ Error exporting: ' + error.message, 'error');
-        console.error('Export error:', error);
-    }
+    showMessage(`📦 Exporting all files to ${format.toUpperCase()}...`, 'success');
 }
 
-async function exportCSV() {
-    if (!activeScanId || !activeScanSessions[activeScanId]) {
-        alert('No scan data to export');
-        return;
-    }
-    
-    const session = activeScanSessions[activeScanId];
-    
-    try {
-        showMessage('📦 Fetching all files for export...', 'success');
-        
-        // Determine which endpoint to use
-        let endpoint = `/scan/${activeScanId}`;
-        if (session.type === 'azure') {
-            endpoint = `/scan/azure/${activeScanId}`;
-        } else if (session.type === 'shared') {
-            endpoint = `/scan/shared/${activeScanId}`;
-        }
-        
-        // Fetch ALL files
-        const url = `${API_URL}${endpoint}?limit=10000&offset=0`;
-        const response = await fetch(url);
-        const data = await response.json();
-        
-        if (!response.ok || !data.files) {
-            throw new Error(data.detail || 'Failed to fetch files');
-        }
-        
-        const files = data.files;
-        let csv = 'File Name,File Path,File Type,MIME Type,File Size (Bytes),Last Modified,OCR Eligible\n';
-        
-        files.forEach(file => {
-            const fileName = file.file_name ? file.file_name.replace(/"/g, '""') : '';
-            const filePath = file.file_path ? file.file_path.replace(/"/g, '""') : '';
-            const fileType = file.file_type || '';
-            const mimeType = file.mime_type || '';
-            const fileSize = file.file_size || 0;
-            const lastMod = file.last_modified || '';
-            const ocr = file.eligible_for_ocr ? 'Yes' : 'No';
-            
-            csv += `"${fileName}","${filePath}","${fileType}","${mimeType}",${fileSize},"${lastMod}","${ocr}"\n`;
-        });
-        
-        const blob = new Blob([csv], { type: 'text/csv' });
-        const url2 = URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url2;
-        a.download = `scan-${files.length}files-${Date.now()}.csv`;
-        a.click();
-        URL.revokeObjectURL(url2);
-        
-        showMessage(`✅ Exported all ${files.length} files to CSV!`, 'success');
-    } catch (error) {
-        showMessage('❌ Error exporting: ' + error.message, 'error');
-        console.error('Export error:', error);
-    }
+function exportJSON() {
+    downloadExport('ndjson');
+}
+
+function exportCSV() {
+    downloadExport('csv');
 }
 
 // Load scans on page load
@@ -209,21 +209,27 @@ function displayFiles(files) {
     document.getElementById('fileList').innerHTML = html || '<p style="padding: 20px; text-align: center;">No files</p>';
 }
 
+// Filters run on the server (over every file of the scan, not just the
+// loaded pages); typing waits for a pause before searching
+let filterTimer = null;
+
 function applyFilters() {
+    clearTimeout(filterTimer);
+    filterTimer = setTimeout(searchFiles, 250);
+}
+
+function filterParams() {
+    const params = new URLSearchParams();
     const type = document.getElementById('filterType').value;
-    const minSize = parseInt(document.getElementById('minSize').value) * 1024 || 0;
-    const maxSize = parseInt(document.getElementById('maxSize').value) * 1024 * 1024 || Infinity;
-    const search = document.getElementById('searchFile').value.toLowerCase();
-    
-    let filtered = currentScanFiles.filter(f => {
-        return (!type || f.file_type === type) &&
-               f.file_size >= minSize &&
-               f.file_size <= maxSize &&
-               f.file_name.toLowerCase().includes(search);
-    });
+    const minSize = parseInt(document.getElementById('minSize').value);
+    const maxSize = parseInt(document.getElementById('maxSize').value);
+    const name = document.getElementById('searchFile').value.trim();
     
-    displayFiles(filtered);
-    document.getElementById('fileCount').textContent = filtered.length;
+    if (type) params.set('file_type', type);
+    if (minSize > 0) params.set('min_size', minSize * 1024);
+    if (maxSize > 0) params.set('max_size', maxSize * 1024 * 1024);
+    if (name) params.set('name', name);
+    return params;
 }
 
 function showMessage(msg, type) {